@@ -12,7 +12,6 @@ import json
 import uuid
 import threading
 import socket
-import requests
 import subprocess
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -21,7 +20,8 @@ import azure.cognitiveservices.speech as speechsdk
 # Duck moduler
 from scripts.hardware.duck_beak import Beak, CLOSE_DEG, OPEN_DEG, TRIM_DEG, SERVO_CHANNEL
 from scripts.hardware.rgb_duck import set_blue, off, blink_yellow_purple, pulse_blue, pulse_yellow, stop_blink, set_yellow, blink_yellow
-from src.duck_config import MESSAGES_FILE, OWNER_NAME, OWNER_ALIASES
+from src.duck_http import get_http_client
+from src.duck_config import MESSAGES_FILE, OWNER_NAME, OWNER_ALIASES, PHRASE_CACHE_PRERENDER
 from src.duck_memory import MemoryManager
 from src.duck_user_manager import UserManager
 from src.duck_audio import speak
@@ -32,6 +32,8 @@ from src.duck_event_bus import get_event_bus, Event
 from src.duck_ai import chatgpt_query, generate_message_metadata
 from src.adaptive_greetings import get_adaptive_greeting, get_adaptive_goodbye
 from src.duck_sleep import is_sleeping, get_sleep_status
+from src.duck_tracing import get_tracer
+from src.duck_phrase_cache import get_phrase_cache
 
 # ServiceManager for delt state mellom tjenester
 from src.duck_services import get_services
@@ -106,7 +108,7 @@ def register_with_relay():
         s.close()
         
         # Register with relay
-        response = requests.post(relay_url, json={
+        response = get_http_client().post(relay_url, json={
             'twilio_number': twilio_number,
             'name': duck_name,
             'ip': current_ip
@@ -219,11 +221,217 @@ Skriv et kort, hyggelig svar (maks 160 tegn) ELLER skriv "NO_RESPONSE" hvis samt
         )
 
 
+def _handle_relay_sms(msg):
+    """Behandle én SMS/MMS fra relayen: bildeanalyse, opplesning og svar (kjøres i SMS-poolen)"""
+    from_number = msg.get('from')
+    message_text = msg.get('message')
+    media_url = msg.get('media_url')  # MMS image URL
+    
+    print(f"📱 SMS from {from_number}: {message_text[:50]}...", flush=True)
+    
+    # Check if it's an MMS with image
+    if media_url:
+        print(f"📸 MMS contains image: {media_url}", flush=True)
+        
+        # Process MMS image
+        from src.duck_vision import VisionAnalyzer, VisionConfig
+        from src.duck_memory import MemoryManager
+        
+        # Check if vision is enabled
+        if VisionConfig.ENABLED:
+            try:
+                # Get contact info
+                from src.duck_services import get_services
+                services = get_services()
+                sms_manager = services.get_sms_manager()
+                contact_result = sms_manager.get_contact_by_phone(from_number)
+                
+                sender_name = from_number
+                sender_relation = ""
+                if contact_result.get('status') == 'ok':
+                    contact = contact_result.get('contact')
+                    sender_name = contact.get('name', from_number)
+                    sender_relation = contact.get('relation', '')
+                
+                # Analyze image
+                api_key = os.getenv('OPENAI_API_KEY')
+                vision = VisionAnalyzer(api_key)
+                memory_manager = services.get_memory_manager()
+                
+                analysis = vision.process_mms(
+                    image_url=media_url,
+                    sender_name=sender_name,
+                    message_text=message_text,
+                    memory_manager=memory_manager,
+                    sender_relation=sender_relation
+                )
+                
+                if analysis:
+                    # Announce the image
+                    description = analysis['description']
+                    announcement = f"Jeg fikk et bilde fra {sender_name}! {description}"
+                    
+                    if message_text:
+                        announcement += f" De skrev: {message_text}"
+                    
+                    print(f"🖼️  Image description: {description}", flush=True)
+                    
+                    # Post MMS SMS announcement event
+                    bus = get_event_bus()
+                    bus.post(Event.SMS_ANNOUNCEMENT, announcement)
+                    
+                    # Check if there are people in the image
+                    people_count = 0
+                    desc_lower = description.lower()
+                    if 'person' in desc_lower or 'menneske' in desc_lower or 'mann' in desc_lower or 'kvinne' in desc_lower:
+                        # Extract number of people if mentioned
+                        import re
+                        numbers = re.findall(r'\b(\d+|en|to|tre|fire|fem|seks|sju|åtte|ni|ti)\b', desc_lower)
+                        if numbers:
+                            number_map = {'en': 1, 'to': 2, 'tre': 3, 'fire': 4, 'fem': 5, 
+                                        'seks': 6, 'sju': 7, 'åtte': 8, 'ni': 9, 'ti': 10}
+                            people_count = number_map.get(numbers[0], 0)
+                            if people_count == 0 and numbers[0].isdigit():
+                                people_count = int(numbers[0])
+                    
+                    # If people detected, prepare follow-up question
+                    if people_count > 0:
+                        followup = f" Hvem er de {people_count} personene på bildet?"
+                        # Store for later use in conversation
+                        with open('/tmp/duck_image_followup.txt', 'w', encoding='utf-8') as f:
+                            f.write(f"{analysis['image_id']}|{followup}")
+                
+            except Exception as e:
+                print(f"⚠️ MMS processing failed: {e}", flush=True)
+                import traceback
+                traceback.print_exc()
+        else:
+            print("⚠️ Vision features disabled - skipping image analysis", flush=True)
+    
+    # Forward to SMS handler (for text processing)
+    from src.duck_services import get_services
+    from src.duck_audio import speak
+    
+    services = get_services()
+    sms_manager = services.get_sms_manager()
+    result = sms_manager.handle_incoming_sms(from_number, message_text)
+    
+    # Announce SMS with voice (only if not already announced as MMS)
+    if not media_url and result.get('status') == 'ok':
+        contact = result.get('contact')
+        
+        # Always announce the incoming message first
+        if contact:
+            contact_name = contact.get('name', from_number)
+            announcement = f"Jeg fikk en melding fra {contact_name}, den sier: {message_text}"
+        else:
+            announcement = f"Jeg fikk en melding fra {from_number}, den sier: {message_text}"
+        
+        print(f"🔊 Announcing SMS: {announcement[:50]}...", flush=True)
+        
+        # Post SMS announcement event
+        bus = get_event_bus()
+        bus.post(Event.SMS_ANNOUNCEMENT, announcement)
+        
+        # Send AI-generated response (AI will know if she was fed from context)
+        if result.get('should_respond'):
+            response_result = sms_manager.generate_and_send_response(
+                contact, message_text, fed=result.get('fed', False)
+            )
+            if response_result.get('status') == 'sent':
+                response_text = response_result.get('message', '')
+                print(f"📤 Sent response: {response_text[:50]}...", flush=True)
+                # Post SMS response event
+                bus = get_event_bus()
+                bus.post(Event.SMS_RESPONSE, f"Jeg sendte svar: {response_text}")
+    
+    print(f"✅ SMS processed", flush=True)
+
+
+def _handle_duck_messages(messages, messenger, pending_duck_responses):
+    """Logg meldinger fra andre ender, les dem opp og planlegg svar"""
+    print(f"🦆📬 Received {len(messages)} duck message(s)", flush=True)
+    for msg in messages:
+        from_duck = msg['from_duck']
+        message_text = msg['message']
+        media_url = msg.get('media_url')
+        
+        print(f"   From {from_duck}: {message_text[:50]}...", flush=True)
+        
+        # ALLTID logg mottatte meldinger først (uansett loop)
+        messenger.log_message(
+            from_duck=from_duck,
+            to_duck=os.getenv('DUCK_NAME', 'Duck').lower(),
+            message=message_text,
+            direction='received',
+            initiated=False,
+            tokens_used=len(message_text.split())
+        )
+        print(f"✅ Logged incoming message from {from_duck}", flush=True)
+        
+        # Check for food emojis - Seven kan mate Samantha!
+        from duck_services import get_services
+        from duck_hunger import FOOD_VALUES
+        services = get_services()
+        hunger_manager = services.get_hunger_manager()
+        
+        fed = False
+        food_item_name = None
+        for food_item in FOOD_VALUES.keys():
+            if food_item in message_text:
+                result = hunger_manager.feed(food_item)
+                if result['status'] == 'fed':
+                    fed = True
+                    food_item_name = food_item
+                    print(f"😋 {from_duck} matet meg med {food_item}! Hunger: {result['new_level']}", flush=True)
+                    break
+        
+        # Check for loop BEFORE scheduling response
+        if messenger.detect_loop(from_duck, message_text):
+            print(f"⚠️ Loop detektert med {from_duck}, hopper over SVAR (melding er logget)", flush=True)
+            continue
+        
+        # Random delay før svar (30 sek til 4 min) - legg til i køy
+        import random
+        delay_seconds = random.randint(30, 240)  # 30 sek til 4 min
+        respond_at = datetime.now() + timedelta(seconds=delay_seconds)
+        pending_duck_responses.append((respond_at, from_duck, message_text, media_url, fed, food_item_name))
+        print(f"⏱️ Planlagt svar til {from_duck} om {delay_seconds} sekunder (kl {respond_at.strftime('%H:%M:%S')})", flush=True)
+        
+        # Format announcement for immediate playback
+        announcement = messenger.format_incoming_announcement(from_duck, message_text)
+        
+        print(f"🦆💬 Message from {from_duck}: {message_text[:50]}...", flush=True)
+        
+        # Post duck message event
+        bus = get_event_bus()
+        bus.post(Event.DUCK_MESSAGE, {
+            'announcement': announcement,
+            'from_duck': from_duck,
+            'message': message_text,
+            'media_url': media_url
+        })
+
+
 def sms_polling_loop():
-    """Poll relay for new SMS messages and duck-to-duck messages every 10 seconds"""
+    """
+    Hent SMS og duck-to-duck meldinger fra relayen.
+    
+    Long-poll mot /inbox: relayen holder forespørselen til en melding kommer
+    (levert med én gang) eller SMS_RELAY_LONG_POLL_S går. Eldre relay uten
+    /inbox: /poll og /duck/poll hvert SMS_RELAY_LEGACY_POLL_S.
+    
+    SMS/MMS og planlagte duck-svar behandles i SMS-poolen (duck_sms_pool):
+    parallelt på tvers av avsendere, i rekkefølge per avsender. Løkka henter
+    ikke flere meldinger mens poolen er full.
+    """
     from src.duck_sms import SMSManager
+    from src.duck_sms_pool import get_sms_pool
     from src.duck_messenger import DuckMessenger
-    from src.duck_services import get_services
+    from src.duck_config import (
+        HTTP_CONNECT_TIMEOUT, SMS_RELAY_LONG_POLL_S, SMS_RELAY_READ_MARGIN_S,
+        SMS_RELAY_LEGACY_POLL_S, SMS_RELAY_BACKOFF_MAX_S
+    )
     
     relay_url = os.getenv('SMS_RELAY_URL', 'https://sms-relay.duckberry.no/register')
     base_url = relay_url.replace('/register', '')
@@ -237,6 +445,7 @@ def sms_polling_loop():
     # Initialize managers
     sms_manager = SMSManager()
     messenger = DuckMessenger()
+    sms_pool = get_sms_pool()
     
     # Køy for ventende duck message svar (lagrer når vi skal svare)
     pending_duck_responses = []  # [(respond_at_time, from_duck, message_text, media_url, fed, food_item_name), ...]
@@ -244,234 +453,118 @@ def sms_polling_loop():
     # URL encode the number for SMS polling
     import urllib.parse
     encoded_number = urllib.parse.quote(twilio_number, safe='')
+    inbox_url = f"{base_url}/inbox/{encoded_number}"
+    ack_url = f"{base_url}/ack/{encoded_number}"
     poll_url = f"{base_url}/poll/{encoded_number}"
+    long_poll = True
+    failures = 0
+    
+    def ack_relay(sms_ids=(), duck_ids=()):
+        """Marker meldinger som behandlet og bekreft til relayen (uten ack leveres de på nytt)"""
+        if not sms_ids and not duck_ids:
+            return
+        try:
+            sms_manager.mark_relay_messages_seen(list(sms_ids) + list(duck_ids))
+            get_http_client().post(ack_url, json={
+                'messages': list(sms_ids), 'duck': duck_name.lower(), 'duck_messages': list(duck_ids)
+            }, timeout=5, retries=2, retry_timeouts=True)  # Ack er idempotent
+        except Exception as e:
+            print(f"⚠️ SMS relay ack feilet: {e} (meldingene leveres på nytt og hoppes over)", flush=True)
+    
+    def process_sms(msg, ack):
+        """Jobb i SMS-poolen: behandle meldingen, så ack (også ved feil, ellers kommer den igjen og igjen)"""
+        try:
+            _handle_relay_sms(msg)
+        finally:
+            if ack:
+                ack_relay(sms_ids=[msg['id']])
     
     while True:
-        time.sleep(10)  # Poll every 10 seconds
-        
-        # Sjekk om det er tid til å svare på ventende duck messages
         current_time = datetime.now()
         responses_to_send = [item for item in pending_duck_responses if item[0] <= current_time]
         pending_duck_responses = [item for item in pending_duck_responses if item[0] > current_time]
         
         for respond_at, from_duck, message_text, media_url, fed, food_item_name in responses_to_send:
+            print(f"⏰ Tid til å svare til {from_duck}!", flush=True)
+            # Generate and send response (AI-svaret lages i poolen, ikke i polling-løkka)
+            sms_pool.submit(f"duck:{from_duck}", _send_duck_response, from_duck, message_text, media_url,
+                            messenger, sms_manager, fed, food_item_name)
+        
+        # Backpressure: ikke hent flere meldinger før poolen har plass (de venter i relayen)
+        if not sms_pool.wait_for_capacity(SMS_RELAY_LEGACY_POLL_S):
+            print(f"⏳ SMS-køen er full ({sms_pool.max_queued}) - venter med å hente flere", flush=True)
+            continue
+        
+        sms_messages, duck_messages = [], []
+        if long_poll:
+            # Ikke hold forespørselen lenger enn til neste planlagte svar
+            wait = SMS_RELAY_LONG_POLL_S
+            if pending_duck_responses:
+                next_due = min(item[0] for item in pending_duck_responses)
+                wait = max(1, min(wait, (next_due - datetime.now()).total_seconds()))
+            try:
+                response = get_http_client().get(
+                    inbox_url, params={'duck': duck_name.lower(), 'wait': int(wait)},
+                    timeout=(HTTP_CONNECT_TIMEOUT, wait + SMS_RELAY_READ_MARGIN_S), retries=0
+                )
+                if response.status_code == 404:
+                    if response.headers.get('Content-Type', '').startswith('application/json'):
+                        # Relayen har glemt oss (f.eks. restart) - registrer på nytt
+                        print("⚠️ SMS relay kjenner ikke anda - registrerer på nytt", flush=True)
+                        register_with_relay()
+                    else:
+                        print("ℹ️ SMS relay mangler /inbox - bruker vanlig polling", flush=True)
+                        long_poll = False
+                    time.sleep(SMS_RELAY_LEGACY_POLL_S)
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                sms_messages = data.get('messages', [])
+                duck_messages = data.get('duck_messages', [])
+                failures = 0
+            except Exception as e:
+                failures += 1
+                backoff = min(SMS_RELAY_LEGACY_POLL_S * 2 ** (failures - 1), SMS_RELAY_BACKOFF_MAX_S)
+                print(f"⚠️ SMS long-poll error: {e} (nytt forsøk om {backoff:.0f}s)", flush=True)
+                time.sleep(backoff)
+                continue
+        else:
+            time.sleep(SMS_RELAY_LEGACY_POLL_S)
             try:
-                print(f"⏰ Tid til å svare til {from_duck}!", flush=True)
-                # Generate and send response
-                _send_duck_response(from_duck, message_text, media_url, messenger, sms_manager, fed, food_item_name)
+                # Ingen retries - neste poll kommer uansett om få sekunder
+                response = get_http_client().get(poll_url, timeout=5, retries=0)
+                if response.status_code == 200:
+                    sms_messages = response.json().get('messages', [])
             except Exception as e:
-                print(f"⚠️ Error sending delayed duck response: {e}", flush=True)
+                print(f"⚠️ SMS polling error: {e}", flush=True)
+            duck_messages = sms_manager.poll_duck_messages()
         
-        # 1. Poll for SMS messages
-        try:
-            response = requests.get(poll_url, timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                messages = data.get('messages', [])
-                
-                if messages:
-                    print(f"📨 Received {len(messages)} SMS message(s)", flush=True)
-                    
-                    # Process each message
-                    for msg in messages:
-                        try:
-                            from_number = msg.get('from')
-                            message_text = msg.get('message')
-                            media_url = msg.get('media_url')  # MMS image URL
-                            
-                            print(f"📱 SMS from {from_number}: {message_text[:50]}...", flush=True)
-                            
-                            # Check if it's an MMS with image
-                            if media_url:
-                                print(f"📸 MMS contains image: {media_url}", flush=True)
-                                
-                                # Process MMS image
-                                from src.duck_vision import VisionAnalyzer, VisionConfig
-                                from src.duck_memory import MemoryManager
-                                
-                                # Check if vision is enabled
-                                if VisionConfig.ENABLED:
-                                    try:
-                                        # Get contact info
-                                        from src.duck_services import get_services
-                                        services = get_services()
-                                        sms_manager = services.get_sms_manager()
-                                        contact_result = sms_manager.get_contact_by_phone(from_number)
-                                        
-                                        sender_name = from_number
-                                        sender_relation = ""
-                                        if contact_result.get('status') == 'ok':
-                                            contact = contact_result.get('contact')
-                                            sender_name = contact.get('name', from_number)
-                                            sender_relation = contact.get('relation', '')
-                                        
-                                        # Analyze image
-                                        api_key = os.getenv('OPENAI_API_KEY')
-                                        vision = VisionAnalyzer(api_key)
-                                        memory_manager = services.get_memory_manager()
-                                        
-                                        analysis = vision.process_mms(
-                                            image_url=media_url,
-                                            sender_name=sender_name,
-                                            message_text=message_text,
-                                            memory_manager=memory_manager,
-                                            sender_relation=sender_relation
-                                        )
-                                        
-                                        if analysis:
-                                            # Announce the image
-                                            description = analysis['description']
-                                            announcement = f"Jeg fikk et bilde fra {sender_name}! {description}"
-                                            
-                                            if message_text:
-                                                announcement += f" De skrev: {message_text}"
-                                            
-                                            print(f"🖼️  Image description: {description}", flush=True)
-                                            
-                                            # Post MMS SMS announcement event
-                                            bus = get_event_bus()
-                                            bus.post(Event.SMS_ANNOUNCEMENT, announcement)
-                                            
-                                            # Check if there are people in the image
-                                            people_count = 0
-                                            desc_lower = description.lower()
-                                            if 'person' in desc_lower or 'menneske' in desc_lower or 'mann' in desc_lower or 'kvinne' in desc_lower:
-                                                # Extract number of people if mentioned
-                                                import re
-                                                numbers = re.findall(r'\b(\d+|en|to|tre|fire|fem|seks|sju|åtte|ni|ti)\b', desc_lower)
-                                                if numbers:
-                                                    number_map = {'en': 1, 'to': 2, 'tre': 3, 'fire': 4, 'fem': 5, 
-                                                                'seks': 6, 'sju': 7, 'åtte': 8, 'ni': 9, 'ti': 10}
-                                                    people_count = number_map.get(numbers[0], 0)
-                                                    if people_count == 0 and numbers[0].isdigit():
-                                                        people_count = int(numbers[0])
-                                            
-                                            # If people detected, prepare follow-up question
-                                            if people_count > 0:
-                                                followup = f" Hvem er de {people_count} personene på bildet?"
-                                                # Store for later use in conversation
-                                                with open('/tmp/duck_image_followup.txt', 'w', encoding='utf-8') as f:
-                                                    f.write(f"{analysis['image_id']}|{followup}")
-                                        
-                                    except Exception as e:
-                                        print(f"⚠️ MMS processing failed: {e}", flush=True)
-                                        import traceback
-                                        traceback.print_exc()
-                                else:
-                                    print("⚠️ Vision features disabled - skipping image analysis", flush=True)
-                            
-                            # Forward to SMS handler (for text processing)
-                            from src.duck_services import get_services
-                            from src.duck_audio import speak
-                            
-                            services = get_services()
-                            sms_manager = services.get_sms_manager()
-                            result = sms_manager.handle_incoming_sms(from_number, message_text)
-                            
-                            # Announce SMS with voice (only if not already announced as MMS)
-                            if not media_url and result.get('status') == 'ok':
-                                contact = result.get('contact')
-                                
-                                # Always announce the incoming message first
-                                if contact:
-                                    contact_name = contact.get('name', from_number)
-                                    announcement = f"Jeg fikk en melding fra {contact_name}, den sier: {message_text}"
-                                else:
-                                    announcement = f"Jeg fikk en melding fra {from_number}, den sier: {message_text}"
-                                
-                                print(f"🔊 Announcing SMS: {announcement[:50]}...", flush=True)
-                                
-                                # Post SMS announcement event
-                                bus = get_event_bus()
-                                bus.post(Event.SMS_ANNOUNCEMENT, announcement)
-                                
-                                # Send AI-generated response (AI will know if she was fed from context)
-                                if result.get('should_respond'):
-                                    response_result = sms_manager.generate_and_send_response(
-                                        contact, message_text, fed=result.get('fed', False)
-                                    )
-                                    if response_result.get('status') == 'sent':
-                                        response_text = response_result.get('message', '')
-                                        print(f"📤 Sent response: {response_text[:50]}...", flush=True)
-                                        # Post SMS response event
-                                        bus = get_event_bus()
-                                        bus.post(Event.SMS_RESPONSE, f"Jeg sendte svar: {response_text}")
-                            
-                            print(f"✅ SMS processed", flush=True)
-                        except Exception as msg_error:
-                            print(f"⚠️ Error processing SMS: {msg_error}", flush=True)
-        except Exception as e:
-            print(f"⚠️ SMS polling error: {e}", flush=True)
+        # /inbox leverer minst én gang - hopp over det som allerede er behandlet
+        delivered_sms, delivered_duck = sms_messages, duck_messages
+        if long_poll and (delivered_sms or delivered_duck):
+            sms_messages = sms_manager.filter_new_relay_messages(sms_messages)
+            duck_messages = sms_manager.filter_new_relay_messages(duck_messages)
         
-        # Also poll for duck-to-duck messages
-        try:
-            messages = sms_manager.poll_duck_messages()
-            
-            if messages:
-                print(f"🦆📬 Received {len(messages)} duck message(s)", flush=True)
-                for msg in messages:
-                    from_duck = msg['from_duck']
-                    message_text = msg['message']
-                    media_url = msg.get('media_url')
-                    
-                    print(f"   From {from_duck}: {message_text[:50]}...", flush=True)
-                    
-                    # ALLTID logg mottatte meldinger først (uansett loop)
-                    messenger.log_message(
-                        from_duck=from_duck,
-                        to_duck=os.getenv('DUCK_NAME', 'Duck').lower(),
-                        message=message_text,
-                        direction='received',
-                        initiated=False,
-                        tokens_used=len(message_text.split())
-                    )
-                    print(f"✅ Logged incoming message from {from_duck}", flush=True)
-                    
-                    # Check for food emojis - Seven kan mate Samantha!
-                    from duck_services import get_services
-                    from duck_hunger import FOOD_VALUES
-                    services = get_services()
-                    hunger_manager = services.get_hunger_manager()
-                    
-                    fed = False
-                    food_item_name = None
-                    for food_item in FOOD_VALUES.keys():
-                        if food_item in message_text:
-                            result = hunger_manager.feed(food_item)
-                            if result['status'] == 'fed':
-                                fed = True
-                                food_item_name = food_item
-                                print(f"😋 {from_duck} matet meg med {food_item}! Hunger: {result['new_level']}", flush=True)
-                                break
-                    
-                    # Check for loop BEFORE scheduling response
-                    if messenger.detect_loop(from_duck, message_text):
-                        print(f"⚠️ Loop detektert med {from_duck}, hopper over SVAR (melding er logget)", flush=True)
-                        continue
-                    
-                    # Random delay før svar (30 sek til 4 min) - legg til i køy
-                    import random
-                    delay_seconds = random.randint(30, 240)  # 30 sek til 4 min
-                    respond_at = datetime.now() + timedelta(seconds=delay_seconds)
-                    pending_duck_responses.append((respond_at, from_duck, message_text, media_url, fed, food_item_name))
-                    print(f"⏱️ Planlagt svar til {from_duck} om {delay_seconds} sekunder (kl {respond_at.strftime('%H:%M:%S')})", flush=True)
-                    
-                    # Format announcement for immediate playback
-                    announcement = messenger.format_incoming_announcement(from_duck, message_text)
-                    
-                    print(f"🦆💬 Message from {from_duck}: {message_text[:50]}...", flush=True)
-                    
-                    # Post duck message event
-                    bus = get_event_bus()
-                    bus.post(Event.DUCK_MESSAGE, {
-                        'announcement': announcement,
-                        'from_duck': from_duck,
-                        'message': message_text,
-                        'media_url': media_url
-                    })
-        except Exception as e:
-            print(f"⚠️ Duck message polling error: {e}", flush=True)
+        # 1. SMS messages - til poolen, ack-es når de er behandlet. Kommer en melding
+        #    på nytt mens den fortsatt er i kø, hopper submit over den
+        if sms_messages:
+            print(f"📨 Received {len(sms_messages)} SMS message(s)", flush=True)
+            for msg in sms_messages:
+                sms_pool.submit(msg.get('from') or 'ukjent', process_sms, msg, long_poll and 'id' in msg,
+                                item_id=msg.get('id'))
+        
+        # 2. Duck-to-duck messages (raskt: logg, mat og planlegg svar)
+        if duck_messages:
+            try:
+                _handle_duck_messages(duck_messages, messenger, pending_duck_responses)
+            except Exception as e:
+                print(f"⚠️ Duck message error: {e}", flush=True)
+        
+        # 3. Bekreft duck-meldinger, og SMS som allerede var behandlet (forrige ack gikk tapt)
+        if long_poll and (delivered_sms or delivered_duck):
+            new_sms_ids = {m['id'] for m in sms_messages}
+            ack_relay(sms_ids=[m['id'] for m in delivered_sms if m['id'] not in new_sms_ids],
+                      duck_ids=[m['id'] for m in delivered_duck])
 
 
 def reminder_checker_loop():
@@ -728,11 +821,6 @@ def on_learning_progress(name: str, step: int, total: int, instruction: str):
         print(f"⚠️ Error in learning_progress callback: {e}", flush=True)
 
 
-# Siste stemmegjenkjenning fra Duck-Vision (brukes som fallback ved wake word)
-_last_speaker_name = None
-_last_speaker_confidence = 0.0
-_last_speaker_time = 0.0
-
 # Mid-conversation stemmegjenkjenning
 _conversation_active = False
 _mid_conversation_speaker = None  # Navn gjenkjent under pågående samtale
@@ -745,12 +833,11 @@ _onboarding_voice_event = threading.Event()
 _onboarding_voice_success = False
 
 def on_speaker_recognized(name: str, confidence: float):
-    """Callback når Duck-Vision gjenkjenner en stemme i bakgrunnen"""
-    global _last_speaker_name, _last_speaker_confidence, _last_speaker_time
+    """Callback når Duck-Vision gjenkjenner en stemme i bakgrunnen.
+    
+    Siste stemme lagres i DuckVisionHandler sin presence-modell (brukes som fallback ved wake word).
+    """
     global _mid_conversation_speaker
-    _last_speaker_name = name
-    _last_speaker_confidence = confidence
-    _last_speaker_time = time.time()
     print(f"🔊 Stemme gjenkjent: {name} ({confidence:.0%})", flush=True)
     
     if _conversation_active:
@@ -1036,6 +1123,29 @@ def handle_name_response(user_text: str, speech_config, beak) -> bool:
     return False
 
 
+# Neste generiske hilsen velges på forhånd, så lyden kan pre-rendres mens anda venter
+_next_greeting = None  # (tekst, time på døgnet den ble valgt)
+
+
+def _prepare_next_greeting(speech_config):
+    """Velg neste adaptive hilsen og pre-render den i bakgrunnen."""
+    global _next_greeting
+    greeting = get_adaptive_greeting(user_name="du")
+    _next_greeting = (greeting, datetime.now().hour)
+    get_phrase_cache().prerender([greeting], speech_config)
+
+
+def _take_next_greeting():
+    """Hent forhåndsvalgt hilsen (ny hvis timen har endret seg, f.eks. 'God morgen')."""
+    global _next_greeting
+    if _next_greeting and _next_greeting[1] == datetime.now().hour:
+        greeting = _next_greeting[0]
+    else:
+        greeting = get_adaptive_greeting(user_name="du")
+    _next_greeting = None
+    return greeting
+
+
 def main():
     """Hovedloop for stemmeassistenten"""
     # Rydd opp gammel event-bus ved oppstart
@@ -1112,6 +1222,39 @@ def main():
     hunger_timer_thread.start()
     print("✅ Hunger timer started (Tamagotchi mode activated! 🍪🍕)", flush=True)
     
+    # Forhåndshent strømpriser (dagens, og morgendagens når de er publisert)
+    from src.duck_electricity import start_price_prefetch
+    start_price_prefetch()
+    print("✅ Electricity price prefetch started", flush=True)
+
+    # Nyhetsfeeds hentes i bakgrunnen (betinget GET), nyhetsverktøyene leser lokalt
+    from src.duck_news import start_news_ingester
+    start_news_ingester()
+    print("✅ News ingester started", flush=True)
+
+    # Varm opp tool-cachen før timene der de samme spørsmålene pleier å komme
+    from src.duck_prefetch import start_prefetch_scheduler
+    if start_prefetch_scheduler():
+        print("✅ Tool prefetch scheduler started", flush=True)
+
+    # Avganger fra favorittholdeplassene holdes varme (ENTUR_FAVORITE_STOPS)
+    from src.duck_transport import start_departure_board
+    if start_departure_board():
+        print("✅ Entur departure board started", flush=True)
+
+    # Home Assistant-tilstand speiles over WebSocket (REST brukes hvis den ikke er tilgjengelig)
+    from src.duck_config import ENABLE_HOME_ASSISTANT
+    if ENABLE_HOME_ASSISTANT:
+        from src.duck_ha_mirror import start_ha_mirror
+        if start_ha_mirror():
+            print("✅ Home Assistant WebSocket mirror started", flush=True)
+        else:
+            print("ℹ️ Home Assistant WebSocket mirror disabled (using REST)", flush=True)
+        # Helsesjekk av lokal/cloud-URL, så REST-fallback aldri venter på et endepunkt som er nede
+        from src.duck_homeassistant import start_ha_health_probes
+        if start_ha_health_probes():
+            print("✅ Home Assistant health probes started", flush=True)
+    
     # Initialize 3D printer manager (on-demand monitoring - activated via voice or control panel)
     try:
         from src.duck_prusa import get_prusa_manager
@@ -1131,6 +1274,14 @@ def main():
     speech_config = speechsdk.SpeechConfig(subscription=tts_key, region=tts_region)
     speech_config.speech_synthesis_voice_name = "nb-NO-FinnNeural"
     
+    # Pre-render filler-fraser som maskerer ventetid under trege tools
+    from src.duck_filler import get_filler_speech
+    get_filler_speech().configure(speech_config, beak)
+    
+    # Pre-render faste fraser, neste hilsen og avslutninger i frase-cachen
+    get_phrase_cache().prerender(PHRASE_CACHE_PRERENDER, speech_config, pin=True)
+    _prepare_next_greeting(speech_config)
+    
     # Start Duck-Vision service NOW (after speech_config is available)
     if vision_service:
         try:
@@ -1363,7 +1514,7 @@ def main():
                             set_sleep_led()
                     elif event_type == Event.HUNGER_ANNOUNCEMENT:
                         print(f"😋 [SLEEP MODE] Hunger announcement: {str(data)[:50]}...", flush=True)
-                        speak(data, speech_config, beak)
+                        speak(data, speech_config, beak, cache=True)
                         set_sleep_led()
                     elif event_type == Event.HUNGER_FED:
                         print(f"😋 [SLEEP MODE] Fed from panel: {str(data)[:50]}...", flush=True)
@@ -1385,7 +1536,7 @@ def main():
                                 print(f"⏰ [SLEEP MODE → WAKE] Alarm: {announcement[:50]}...", flush=True)
                             else:
                                 print(f"🔔 [SLEEP MODE] Reminder: {announcement[:50]}...", flush=True)
-                            speak(announcement, speech_config, beak)
+                            speak(announcement, speech_config, beak, cache=True)
                             if not is_alarm:
                                 set_sleep_led()
                     elif event_type == Event.EXTERNAL_MESSAGE:
@@ -1407,7 +1558,7 @@ def main():
                 set_idle_led()  # Gul blinkende hvis hotspot, ellers blå
                 sleep_led_active = False
                 print("⏰ Sleep mode deaktivert - våkner opp", flush=True)
-                speak("Gææææsp! Nå er jeg våken igjen!", speech_config, beak)
+                speak("Gææææsp! Nå er jeg våken igjen!", speech_config, beak, cache=True)
         
         # Sjekk events fra bus UTENFOR sleep mode (før wake word)
         bus = get_event_bus()
@@ -1429,7 +1580,7 @@ def main():
                     if announcement:
                         emoji = "⏰" if is_alarm else "🔔"
                         print(f"{emoji} Reminder announcement: {announcement[:50]}...", flush=True)
-                        speak(announcement, speech_config, beak)
+                        speak(announcement, speech_config, beak, cache=True)
                 elif event_type in (Event.SMS_ANNOUNCEMENT, Event.SMS_RESPONSE, Event.DUCK_MESSAGE,
                                      Event.DUCK_RESPONSE, Event.SONG_ANNOUNCEMENT, Event.HUNGER_ANNOUNCEMENT,
                                      Event.HUNGER_FED, Event.HOTSPOT_ANNOUNCEMENT):
@@ -1438,7 +1589,7 @@ def main():
                     if isinstance(data, dict) and 'response' in data:
                         text = data['response']
                     print(f"📢 Event {event_type.name}: {str(text)[:50]}...", flush=True)
-                    speak(text, speech_config, beak)
+                    speak(text, speech_config, beak, cache=(event_type == Event.HUNGER_ANNOUNCEMENT))
                 elif event_type == Event.EXTERNAL_MESSAGE:
                     # Pass to main loop as external_message
                     pre_wake_event = data
@@ -1447,11 +1598,16 @@ def main():
             except Exception as e:
                 print(f"⚠️ Error handling pre-wake event {event_type}: {e}", flush=True)
         
+        tracer = get_tracer()
         if pre_wake_event:
             external_message = pre_wake_event
         else:
             # Normal wake word detection (nå uten fil-sjekking)
+            wake_wait_start = time.monotonic()
             external_message = wait_for_wake_word()
+            if external_message is None:
+                # Wake-turen måler tiden fra wake word til første "Ja?"/hilsen
+                tracer.begin_turn("wake", idle_ms=round((time.monotonic() - wake_wait_start) * 1000))
         
         # Generer ny session_id for ny samtale
         # Session fortsetter hvis mindre enn 30 min siden siste melding
@@ -1551,7 +1707,7 @@ def main():
             elif external_message.startswith('__HUNGER_ANNOUNCEMENT__'):
                 # Hunger announcement
                 announcement = external_message.replace('__HUNGER_ANNOUNCEMENT__', '', 1)
-                speak(announcement, speech_config, beak)
+                speak(announcement, speech_config, beak, cache=True)
                 continue  # Gå tilbake til wake word
             elif external_message.startswith('__HUNGER_FED__'):
                 # Fed from control panel
@@ -1566,7 +1722,7 @@ def main():
             elif external_message.startswith('__REMINDER__'):
                 # Påminnelse/alarm announcement
                 announcement = external_message.replace('__REMINDER__', '', 1)
-                speak(announcement, speech_config, beak)
+                speak(announcement, speech_config, beak, cache=True)
                 continue  # Gå tilbake til wake word
             elif external_message.startswith('__PLAY_SONG__'):
                 # Spill av en sang
@@ -1597,12 +1753,14 @@ def main():
             # Name mapping for face recognition
             face_name_mapping = dict(OWNER_ALIASES)
             
-            # Sjekk hvem som er der med Duck-Vision (prøver 3 ganger)
+            # Sjekk hvem som er der med Duck-Vision
+            # (svarer umiddelbart fra presence-modellen hvis fersk, ellers aktiv forespørsel)
             vision_recognized = False
             voice_recognized = False
             if vision_service and vision_service.is_connected():
                 try:
-                    found, name, confidence = vision_service.check_person(timeout=2.0)
+                    with tracer.span("person_check"):
+                        found, name, confidence = vision_service.check_person(timeout=2.0)
                     
                     if found and name:
                         # Map face recognition name to memory system name
@@ -1614,9 +1772,10 @@ def main():
                         # Unknown or no person - try voice recognition as fallback
                         voice_recognized = False
                         # Sjekk om vi har en fersk stemmegjenkjenning (siste 30 sek)
-                        if _last_speaker_name and (time.time() - _last_speaker_time) < 30.0:
-                            mapped_voice = face_name_mapping.get(_last_speaker_name, _last_speaker_name)
-                            print(f"🔊 Stemme-fallback: {_last_speaker_name} ({_last_speaker_confidence:.0%}) -> {mapped_voice}", flush=True)
+                        speaker_name, speaker_confidence = vision_service.get_recent_speaker(max_age=30.0)
+                        if speaker_name:
+                            mapped_voice = face_name_mapping.get(speaker_name, speaker_name)
+                            print(f"🔊 Stemme-fallback: {speaker_name} ({speaker_confidence:.0%}) -> {mapped_voice}", flush=True)
                             user_name = mapped_voice
                             voice_recognized = True
                         
@@ -1635,18 +1794,20 @@ def main():
                 recognition_context = f"(Du har nettopp gjenkjent {user_name} på ansiktet. Inkorporer en naturlig, kort hilsen til {user_name} i starten av svaret ditt.)"
                 print(f"🎭 Face recognition: {user_name}", flush=True)
                 # Kort bekreftelse så brukeren vet anda lytter (uten navn - AI inkluderer hilsen)
-                speak("Ja?", speech_config, beak)
+                speak("Ja?", speech_config, beak, cache=True)
             elif voice_recognized:
                 _current_speaker = user_name
                 recognition_context = f"(Du har nettopp gjenkjent {user_name} på stemmen. Inkorporer en naturlig, kort hilsen til {user_name} i starten av svaret ditt.)"
                 print(f"🎭 Voice recognition: {user_name}", flush=True)
                 # Kort bekreftelse så brukeren vet anda lytter (uten navn - AI inkluderer hilsen)
-                speak("Ja?", speech_config, beak)
+                speak("Ja?", speech_config, beak, cache=True)
             else:
                 # Ikke gjenkjent - bruk generisk hilsen
-                greeting_msg = get_adaptive_greeting(user_name="du")
+                greeting_msg = _take_next_greeting()
                 print(f"🎭 Generic greeting (ukjent person): {greeting_msg}", flush=True)
-                speak(greeting_msg, speech_config, beak)
+                speak(greeting_msg, speech_config, beak, cache=True)
+                _prepare_next_greeting(speech_config)
+            tracer.end_turn(recognized=vision_recognized or voice_recognized)
         
         # Reduce boredom when conversation starts
         try:
@@ -1740,7 +1901,9 @@ def main():
             # Sjekk FØRST om stemme ble gjenkjent (f.eks. fra forrige iterasjon)
             _check_mid_conversation_recognition()
             
-            prompt = recognize_speech_from_mic()
+            tracer.begin_turn("voice")
+            with tracer.span("stt"):
+                prompt = recognize_speech_from_mic()
             blink_yellow_purple()  # Start blinking umiddelbart etter STT (Anda tenker!)
             
             # Sjekk IGJEN etter STT - stemmegjenkjenning skjer under lytting
@@ -1749,13 +1912,13 @@ def main():
             if not prompt:
                 no_response_count += 1
                 if no_response_count >= 2:
-                    speak(messages_config['conversation']['no_response_timeout'], speech_config, beak)
+                    speak(messages_config['conversation']['no_response_timeout'], speech_config, beak, cache=True)
                     # Signal samtaleslutt til Duck-Vision
                     _conversation_active = False
                     if vision_service and vision_service.is_connected():
                         vision_service.notify_conversation(False)
                     break
-                speak(messages_config['conversation']['no_response_retry'], speech_config, beak)
+                speak(messages_config['conversation']['no_response_retry'], speech_config, beak, cache=True)
                 continue
             
             # Reset teller når vi får svar
@@ -1913,7 +2076,9 @@ def main():
                 if ai_wants_to_end:
                     print("🔚 AI detekterte samtale-avslutning", flush=True)
                 
-                speak(reply_for_speech, speech_config, beak)  # TTS uten emojis
+                # TTS uten emojis - brukeren kan avbryte (barge-in) med wake word eller tale
+                interrupted = speak(reply_for_speech, speech_config, beak, interruptible=True)
+                tracer.end_turn(interrupted=interrupted)
                 messages.append({"role": "assistant", "content": reply_clean})  # Historikk med emojis
                 
                 # Lagre melding til memory database
@@ -1946,6 +2111,10 @@ def main():
                     if vision_service and vision_service.is_connected():
                         vision_service.notify_conversation(False)
                     break
+                elif interrupted:
+                    # Brukeren avbrøt - rett tilbake til STT (også om svaret var en avslutning)
+                    print("✋ Svar avbrutt av bruker - lytter igjen", flush=True)
+                    continue
                 elif ai_wants_to_end:
                     print("🔚 Samtale avsluttet av AI", flush=True)
                     conversation_ended_naturally = True
@@ -1963,6 +2132,9 @@ def main():
             
             set_idle_led()  # Gul blinkende hvis hotspot, ellers blå
         
+        # Avslutt eventuell åpen tur (break/continue før svaret ble spilt av)
+        tracer.end_turn()
+        
         # Etter samtale: sjekk om vi bør spørre ukjent person om å bli kjent
         # Krav: naturlig samtaleslutt, personen er ukjent, Duck-Vision var tilgjengelig,
         # og minst 3 meldingsutvekslinger (6 meldinger).
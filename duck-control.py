@@ -817,6 +817,33 @@ class DuckControlHandler(BaseHTTPRequestHandler):
             response = api_handlers.handle_system_stats()
             self.send_json_response(response, 200)
         
+        elif self.path == '/api/http/stats':
+            # Delt HTTP-klient i chatgpt-duck: requests/retries/latency per host
+            response = api_handlers.handle_http_stats()
+            self.send_json_response(response, 200)
+        
+        elif self.path == '/api/tools/cache':
+            # Tool-cache: treffrate per tool
+            response = api_handlers.handle_tool_cache_stats()
+            self.send_json_response(response, 200)
+        
+        elif self.path == '/api/sms/queue':
+            # SMS-poolen: kødybde, backpressure og ventetid
+            response = api_handlers.handle_sms_queue_stats()
+            self.send_json_response(response, 200)
+        
+        elif self.path.startswith('/api/latency'):
+            # Latency-tracing: p50/p95 per steg + waterfall (?turns=N)
+            query_params = self.path.split('?')[1] if '?' in self.path else ''
+            turns = 20
+            if 'turns=' in query_params:
+                try:
+                    turns = max(0, min(200, int(query_params.split('turns=')[1].split('&')[0])))
+                except ValueError:
+                    pass
+            response = api_handlers.handle_latency_traces(turns)
+            self.send_json_response(response, 200)
+        
         elif self.path == '/poll':
             # Batch-endpoint: returnerer all polling-data i ett kall
             poll_data = {}
@@ -875,6 +902,9 @@ class DuckControlHandler(BaseHTTPRequestHandler):
             except Exception as e:
                 poll_data['system'] = {}
             
+            # SMS-kø
+            poll_data['sms_queue'] = api_handlers.handle_sms_queue_stats()
+            
             self.send_json_response(poll_data, 200)
         
         else:
@@ -1,32 +1,117 @@
 """
 Duckberry SMS Relay Server
 Routes Twilio SMS webhooks to correct Duck instance based on registry.
-Version: 2.0
+Version: 2.3 - state shared by all gunicorn workers (SQLite), durable queue with acks,
+long-poll (/inbox) and SSE (/stream)
 """
+import json
 import os
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import requests
 from dotenv import load_dotenv
 
+from duck_registry import DuckRegistry
+from message_store import MessageStore
+
 load_dotenv()
 
 app = Flask(__name__)
 
-# Registry: {twilio_number: {name, current_ip, last_heartbeat}}
-DUCK_REGISTRY = {}
-
-# Message queue: {twilio_number: [messages]}
-MESSAGE_QUEUE = {}
-
-# Duck-to-duck message queue: {duck_name: [messages]}
-DUCK_TO_DUCK_QUEUE = {}
-
 # Configuration
 HEARTBEAT_TIMEOUT = int(os.getenv('HEARTBEAT_TIMEOUT_MINUTES', 10))
 DUCK_WEBHOOK_PATH = '/webhook/sms'
 DUCK_PORT = '3000'
 MAX_QUEUE_SIZE = 100  # Max messages per duck
+LONG_POLL_MAX_WAIT = int(os.getenv('LONG_POLL_MAX_WAIT_SECONDS', 60))  # Max hold time for ?wait=
+LONG_POLL_DEFAULT_WAIT = min(55, LONG_POLL_MAX_WAIT)  # /inbox without ?wait=
+SSE_KEEPALIVE = 15  # Seconds between keepalive comments on /stream
+RELAY_DB_PATH = os.getenv('RELAY_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'relay_queue.db'))
+VISIBILITY_TIMEOUT = int(os.getenv('VISIBILITY_TIMEOUT_SECONDS', 120))  # Unacked messages are redelivered after this
+ACKED_RETENTION_HOURS = 24  # Acked ids are remembered this long (deduplicates late retries)
+
+# Shared state - one SQLite file for all workers
+# Registry: {twilio_number: {name, current_ip, last_heartbeat}}
+REGISTRY = DuckRegistry(RELAY_DB_PATH)
+# Durable queue (SMS: 'sms:<twilio_number>', duck-to-duck: 'duck:<duck_name>')
+STORE = MessageStore(RELAY_DB_PATH, visibility_timeout=VISIBILITY_TIMEOUT,
+                     acked_retention=ACKED_RETENTION_HOURS * 3600, max_pending=MAX_QUEUE_SIZE)
+
+# Long-poll/SSE waiters in this worker are woken per mailbox when new messages
+# are committed (by this worker, or by another one via the store's watcher)
+_WAITERS_LOCK = threading.Lock()
+_WAITERS = {}  # {mailbox: set(threading.Event)}
+
+
+def sms_mailbox(twilio_number):
+    return f"sms:{twilio_number}"
+
+
+def duck_mailbox(duck_name):
+    return f"duck:{duck_name}"
+
+
+def _wake_waiters(mailboxes):
+    with _WAITERS_LOCK:
+        for mailbox in mailboxes:
+            for event in _WAITERS.get(mailbox, ()):
+                event.set()
+
+
+STORE.add_listener(_wake_waiters)
+
+
+def wait_for_messages(mailboxes, timeout, ack=False):
+    """
+    Block until at least one of the mailboxes has visible messages, or timeout.
+    Returned messages are leased: the duck must POST /ack/... after processing,
+    otherwise they are delivered again after VISIBILITY_TIMEOUT.
+    
+    Args:
+        mailboxes: ['sms:+47...', 'duck:samantha', ...]
+        timeout: Max seconds to wait (0 = check once)
+        ack: Ack on delivery (at-most-once, legacy /poll endpoints)
+    
+    Returns:
+        {mailbox: [messages]} for the mailboxes that had messages
+    """
+    event = threading.Event()
+    with _WAITERS_LOCK:
+        for mailbox in mailboxes:
+            _WAITERS.setdefault(mailbox, set()).add(event)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            event.clear()  # Before leasing, so an enqueue in between still wakes us
+            found = STORE.lease(mailboxes, ack=ack)
+            left = deadline - time.monotonic()
+            if found or left <= 0:
+                return found
+            # Wake up when a leased message times out and becomes visible again
+            visible_at = STORE.next_visible_at(mailboxes)
+            if visible_at is not None:
+                left = min(left, max(0.05, visible_at - time.time()))
+            event.wait(left)
+    finally:
+        with _WAITERS_LOCK:
+            for mailbox in mailboxes:
+                waiters = _WAITERS.get(mailbox)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del _WAITERS[mailbox]
+
+
+def requested_wait():
+    """?wait=N in seconds, capped at LONG_POLL_MAX_WAIT. 0 (default) = plain poll."""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return 0
+    return max(0, min(wait, LONG_POLL_MAX_WAIT))
 
 
 @app.route('/webhook/sms/<twilio_number>', methods=['POST'])
@@ -56,19 +141,11 @@ def twilio_webhook(twilio_number):
         if media_url:
             print(f"   Media: {media_url}")
         
-        # Look up Duck instance by Twilio number
-        if to_number not in DUCK_REGISTRY:
-            print(f"❌ No Duck registered for {to_number}")
-            return jsonify({
-                'status': 'error',
-                'message': f'No Duck instance registered for {to_number}'
-            }), 404
-        
-        duck = DUCK_REGISTRY[to_number]
-        
-        # Queue message for Duck to poll
-        if to_number not in MESSAGE_QUEUE:
-            MESSAGE_QUEUE[to_number] = []
+        # Look up Duck instance by Twilio number. The message is queued either
+        # way: after a relay restart the duck has not re-registered yet
+        duck = REGISTRY.get(to_number)
+        if duck is None:
+            print(f"⚠️ No Duck registered for {to_number} - queued until it registers")
         
         message = {
             'from': from_number,
@@ -77,21 +154,18 @@ def twilio_webhook(twilio_number):
             'media_url': media_url,  # NEW: MMS support
             'sid': message_sid,
             'timestamp': datetime.now().isoformat(),
-            'id': message_sid  # Unique ID for tracking
         }
         
-        MESSAGE_QUEUE[to_number].append(message)
-        
-        # Limit queue size
-        if len(MESSAGE_QUEUE[to_number]) > MAX_QUEUE_SIZE:
-            MESSAGE_QUEUE[to_number] = MESSAGE_QUEUE[to_number][-MAX_QUEUE_SIZE:]
+        # Queue durably for Duck to fetch (wakes a waiting long-poll/stream).
+        # MessageSid is the idempotency key: Twilio retries are ignored
+        inserted = STORE.enqueue(sms_mailbox(to_number), message_sid or uuid.uuid4().hex, message)
         
-        print(f"✅ SMS queued for {duck['name']} (queue size: {len(MESSAGE_QUEUE[to_number])})")
+        duck_label = duck['name'] if duck else to_number
+        print(f"✅ SMS queued for {duck_label}" if inserted else f"♻️ Duplicate SMS {message_sid} ignored")
         
         return jsonify({
-            'status': 'queued',
-            'duck': duck['name'],
-            'queue_size': len(MESSAGE_QUEUE[to_number])
+            'status': 'queued' if inserted else 'duplicate',
+            'duck': duck['name'] if duck else None
         }), 200
     
     except Exception as e:
@@ -122,11 +196,7 @@ def register_duck():
             }), 400
         
         # Update registry
-        DUCK_REGISTRY[twilio_number] = {
-            'name': name,
-            'current_ip': ip,
-            'last_heartbeat': datetime.now().isoformat()
-        }
+        REGISTRY.register(twilio_number, name, ip)
         
         print(f"✅ Registered {name} ({twilio_number}) at {ip}")
         
@@ -152,9 +222,9 @@ def unregister_duck():
         data = request.json
         twilio_number = data.get('twilio_number')
         
-        if twilio_number in DUCK_REGISTRY:
-            duck_name = DUCK_REGISTRY[twilio_number]['name']
-            del DUCK_REGISTRY[twilio_number]
+        duck = REGISTRY.unregister(twilio_number)
+        if duck is not None:
+            duck_name = duck['name']
             print(f"🔌 Unregistered {duck_name}")
             return jsonify({'status': 'unregistered', 'name': duck_name}), 200
         else:
@@ -170,25 +240,26 @@ def poll_messages(twilio_number):
     """
     Duck polls for new messages.
     Returns all pending messages and clears the queue.
+    With ?wait=N the request is held until a message arrives or N seconds pass.
     """
     try:
         # Check if Duck is registered
-        if twilio_number not in DUCK_REGISTRY:
+        duck = REGISTRY.get(twilio_number)
+        if duck is None:
             return jsonify({
                 'status': 'error',
                 'message': 'Not registered'
             }), 404
         
         # Update heartbeat
-        DUCK_REGISTRY[twilio_number]['last_heartbeat'] = datetime.now().isoformat()
+        REGISTRY.touch(twilio_number, duck)
         
-        # Get pending messages
-        messages = MESSAGE_QUEUE.get(twilio_number, [])
+        # Get pending messages (acked on delivery - use /inbox for at-least-once)
+        found = wait_for_messages([sms_mailbox(twilio_number)], requested_wait(), ack=True)
+        messages = found.get(sms_mailbox(twilio_number), [])
         
         if messages:
-            print(f"📬 {DUCK_REGISTRY[twilio_number]['name']} polling: {len(messages)} message(s)")
-            # Clear queue after retrieval
-            MESSAGE_QUEUE[twilio_number] = []
+            print(f"📬 {duck['name']} polling: {len(messages)} message(s)")
         
         return jsonify({
             'status': 'ok',
@@ -218,6 +289,7 @@ def duck_send_message():
         to_duck = data.get('to_duck')
         message_body = data.get('message')
         media_url = data.get('media_url')
+        message_id = data.get('id') or f"duck_{uuid.uuid4().hex}"  # Idempotency key from sender
         
         if not all([from_duck, to_duck, message_body]):
             return jsonify({
@@ -225,33 +297,25 @@ def duck_send_message():
                 'message': 'Missing required fields: from_duck, to_duck, message'
             }), 400
         
-        # Initialize queue for recipient duck if needed
-        if to_duck not in DUCK_TO_DUCK_QUEUE:
-            DUCK_TO_DUCK_QUEUE[to_duck] = []
-        
         # Create message
         duck_message = {
             'from_duck': from_duck,
             'to_duck': to_duck,
             'message': message_body,
             'media_url': media_url,
-            'timestamp': datetime.now().isoformat(),
-            'id': f"duck_{datetime.now().timestamp()}"
+            'timestamp': datetime.now().isoformat()
         }
         
-        DUCK_TO_DUCK_QUEUE[to_duck].append(duck_message)
-        
-        # Limit queue size
-        if len(DUCK_TO_DUCK_QUEUE[to_duck]) > MAX_QUEUE_SIZE:
-            DUCK_TO_DUCK_QUEUE[to_duck] = DUCK_TO_DUCK_QUEUE[to_duck][-MAX_QUEUE_SIZE:]
+        inserted = STORE.enqueue(duck_mailbox(to_duck), message_id, duck_message)
         
-        print(f"🦆➡️🦆 Duck message: {from_duck} → {to_duck} (queue: {len(DUCK_TO_DUCK_QUEUE[to_duck])})")
+        print(f"🦆➡️🦆 Duck message: {from_duck} → {to_duck}" if inserted
+              else f"♻️ Duplicate duck message {message_id} ignored")
         
         return jsonify({
-            'status': 'queued',
+            'status': 'queued' if inserted else 'duplicate',
             'from': from_duck,
             'to': to_duck,
-            'queue_size': len(DUCK_TO_DUCK_QUEUE[to_duck])
+            'id': message_id
         }), 200
     
     except Exception as e:
@@ -264,15 +328,15 @@ def duck_poll_messages(duck_name):
     """
     Duck polls for messages from other ducks.
     Returns all pending duck-to-duck messages and clears the queue.
+    With ?wait=N the request is held until a message arrives or N seconds pass.
     """
     try:
-        # Get pending duck messages
-        messages = DUCK_TO_DUCK_QUEUE.get(duck_name, [])
+        # Get pending duck messages (acked on delivery - use /inbox for at-least-once)
+        found = wait_for_messages([duck_mailbox(duck_name)], requested_wait(), ack=True)
+        messages = found.get(duck_mailbox(duck_name), [])
         
         if messages:
             print(f"🦆📬 {duck_name} polling: {len(messages)} duck message(s)")
-            # Clear queue after retrieval
-            DUCK_TO_DUCK_QUEUE[duck_name] = []
         
         return jsonify({
             'status': 'ok',
@@ -285,27 +349,148 @@ def duck_poll_messages(duck_name):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/inbox/<twilio_number>', methods=['GET'])
+def inbox(twilio_number):
+    """
+    Long-poll for SMS and duck-to-duck messages in one request.
+    Held until a message arrives or ?wait=N seconds pass (default 55).
+    Query: duck=<duck_name> to include duck-to-duck messages.
+    Returns: {status, messages, duck_messages, count}
+    
+    Messages are leased, not removed: POST /ack/<twilio_number> after
+    processing, or they are delivered again after VISIBILITY_TIMEOUT.
+    """
+    try:
+        duck = REGISTRY.get(twilio_number)
+        if duck is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Not registered'
+            }), 404
+        
+        REGISTRY.touch(twilio_number, duck)
+        
+        duck_name = request.args.get('duck')
+        mailboxes = [sms_mailbox(twilio_number)]
+        if duck_name:
+            mailboxes.append(duck_mailbox(duck_name))
+        wait = requested_wait() if 'wait' in request.args else LONG_POLL_DEFAULT_WAIT
+        found = wait_for_messages(mailboxes, wait)
+        
+        # Heartbeat also when the request ends (a long-poll can outlast it)
+        duck = REGISTRY.get(twilio_number)
+        if duck:
+            REGISTRY.touch(twilio_number, duck)
+        
+        messages = found.get(sms_mailbox(twilio_number), [])
+        duck_messages = found.get(duck_mailbox(duck_name), [])
+        if messages or duck_messages:
+            print(f"📬 {duck['name'] if duck else twilio_number} inbox: "
+                  f"{len(messages)} SMS, {len(duck_messages)} duck message(s)")
+        
+        return jsonify({
+            'status': 'ok',
+            'messages': messages,
+            'duck_messages': duck_messages,
+            'count': len(messages) + len(duck_messages)
+        }), 200
+    
+    except Exception as e:
+        print(f"❌ Inbox error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/stream/<twilio_number>', methods=['GET'])
+def stream(twilio_number):
+    """
+    Server-Sent Events stream per duck.
+    Events: "sms" and "duck" (data = message JSON), keepalive comments
+    every SSE_KEEPALIVE seconds. Query: duck=<duck_name>.
+    Messages are leased when written to the stream; ack them with
+    POST /ack/<twilio_number> like /inbox.
+    """
+    if REGISTRY.get(twilio_number) is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Not registered'
+        }), 404
+    
+    duck_name = request.args.get('duck')
+    mailboxes = [sms_mailbox(twilio_number)]
+    if duck_name:
+        mailboxes.append(duck_mailbox(duck_name))
+    
+    def events():
+        print(f"📡 Stream opened for {twilio_number}")
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                duck = REGISTRY.get(twilio_number)
+                if duck is None:
+                    return  # Unregistered - end the stream
+                REGISTRY.touch(twilio_number, duck)
+                found = wait_for_messages(mailboxes, SSE_KEEPALIVE)
+                if not found:
+                    yield ": keepalive\n\n"
+                    continue
+                for mailbox, messages in found.items():
+                    event_name = mailbox.split(':', 1)[0]
+                    for message in messages:
+                        yield f"event: {event_name}\nid: {message['id']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            print(f"📡 Stream closed for {twilio_number}")
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/ack/<twilio_number>', methods=['POST'])
+def ack_messages(twilio_number):
+    """
+    Duck confirms processed messages from /inbox or /stream.
+    POST body: {
+        "messages": ["SM123", ...],        # SMS ids
+        "duck": "samantha",
+        "duck_messages": ["duck_ab12", ...]
+    }
+    """
+    try:
+        data = request.json or {}
+        acked = STORE.ack(sms_mailbox(twilio_number), data.get('messages', []))
+        if data.get('duck'):
+            acked += STORE.ack(duck_mailbox(data['duck']), data.get('duck_messages', []))
+        return jsonify({'status': 'ok', 'acked': acked}), 200
+    
+    except Exception as e:
+        print(f"❌ Ack error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @app.route('/status', methods=['GET'])
 def status():
     """
     View current registry status.
     """
     registry_status = {}
+    registry = REGISTRY.all()
+    pending = STORE.pending_counts()
     
-    for number, duck in DUCK_REGISTRY.items():
+    for number, duck in registry.items():
         registry_status[number] = {
             'name': duck['name'],
             'ip': duck['current_ip'],
             'last_heartbeat': duck['last_heartbeat'],
             'online': is_duck_online(duck),
-            'pending_messages': len(MESSAGE_QUEUE.get(number, [])),
-            'pending_duck_messages': len(DUCK_TO_DUCK_QUEUE.get(duck['name'], []))
+            'pending_messages': pending.get(sms_mailbox(number), 0),
+            'pending_duck_messages': pending.get(duck_mailbox(duck['name'].lower()), 0)
         }
     
     return jsonify({
         'status': 'ok',
         'registry': registry_status,
-        'registered_ducks': len(DUCK_REGISTRY)
+        'registered_ducks': len(registry),
+        'queue': dict(STORE.stats),  # Counters of the worker that answered
+        'worker_pid': os.getpid()
     }), 200
 
 
@@ -317,7 +502,7 @@ def health():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'registered_ducks': len(DUCK_REGISTRY)
+        'registered_ducks': REGISTRY.count()
     }), 200
 
 
@@ -352,7 +537,7 @@ def index():
         <p>Registered Ducks: {}</p>
     </body>
     </html>
-    """.format(len(DUCK_REGISTRY))
+    """.format(REGISTRY.count())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,95 @@
+"""
+Duck registry for the SMS relay, shared by all workers through SQLite.
+
+The registry used to be a dict in one Flask process: with several gunicorn
+workers a duck registered in one worker got 404 from the others. It now
+lives in the same database file as the message queue.
+
+- Lookups by Twilio number use the primary key (no scans), one indexed read
+  per request.
+- Heartbeats are only written when the stored one is older than
+  heartbeat_resolution, so long-polls do not turn every request into a
+  write (online status is measured in minutes).
+
+Usage:
+    registry = DuckRegistry('relay_queue.db')
+    registry.register('+4790000000', 'Samantha', '192.168.1.50')
+    duck = registry.get('+4790000000')   # {name, current_ip, last_heartbeat} or None
+    registry.touch('+4790000000', duck)
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from message_store import connect
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ducks (
+        twilio_number TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        current_ip TEXT,
+        last_heartbeat TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+
+class DuckRegistry:
+    """{twilio_number: {name, current_ip, last_heartbeat}} in SQLite."""
+
+    def __init__(self, path, heartbeat_resolution=30):
+        self.path = path
+        self.heartbeat_resolution = timedelta(seconds=heartbeat_resolution)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _duck(row):
+        return {'name': row['name'], 'current_ip': row['current_ip'], 'last_heartbeat': row['last_heartbeat']}
+
+    def get(self, twilio_number):
+        """Registry entry for a Twilio number, or None."""
+        row = self._conn().execute("""
+            SELECT name, current_ip, last_heartbeat FROM ducks WHERE twilio_number = ?
+        """, (twilio_number,)).fetchone()
+        return self._duck(row) if row else None
+
+    def register(self, twilio_number, name, ip):
+        self._conn().execute("""
+            INSERT INTO ducks (twilio_number, name, current_ip, last_heartbeat) VALUES (?, ?, ?, ?)
+            ON CONFLICT (twilio_number) DO UPDATE SET
+                name = excluded.name, current_ip = excluded.current_ip, last_heartbeat = excluded.last_heartbeat
+        """, (twilio_number, name, ip, datetime.now().isoformat()))
+
+    def unregister(self, twilio_number):
+        """Remove an entry. Returns the removed entry, or None if not registered."""
+        duck = self.get(twilio_number)
+        if duck is not None:
+            self._conn().execute("DELETE FROM ducks WHERE twilio_number = ?", (twilio_number,))
+        return duck
+
+    def touch(self, twilio_number, duck):
+        """Update the heartbeat of an entry from get() (skipped if it is recent)."""
+        now = datetime.now()
+        if now - datetime.fromisoformat(duck['last_heartbeat']) < self.heartbeat_resolution:
+            return
+        self._conn().execute("UPDATE ducks SET last_heartbeat = ? WHERE twilio_number = ?",
+                             (now.isoformat(), twilio_number))
+        duck['last_heartbeat'] = now.isoformat()
+
+    def all(self):
+        """{twilio_number: entry} for /status."""
+        rows = self._conn().execute("""
+            SELECT twilio_number, name, current_ip, last_heartbeat FROM ducks ORDER BY twilio_number
+        """).fetchall()
+        return {row['twilio_number']: self._duck(row) for row in rows}
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM ducks").fetchone()[0]
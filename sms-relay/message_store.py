@@ -0,0 +1,337 @@
+"""
+Durable message queue for the SMS relay (SQLite in WAL mode).
+
+The old queues were in-memory dicts cleared on poll: a relay restart lost
+everything queued, and so did a duck crashing between poll and processing.
+
+- Each message is a row keyed by mailbox ('sms:<twilio_number>' or
+  'duck:<duck_name>') and an idempotency key (Twilio MessageSid, or the id
+  the sending duck chose). UNIQUE(mailbox, idem_key) turns Twilio webhook
+  retries and resent duck messages into no-ops.
+- lease() hands out the oldest visible messages of a mailbox (in seq order)
+  and hides them for the visibility timeout. A duck acks what it has
+  processed; anything not acked in time is delivered again (at-least-once).
+- Acked rows are kept as tombstones for ACKED_RETENTION so late retries are
+  still deduplicated, then pruned.
+- Concurrent enqueues are group-committed by one writer thread: one
+  transaction per batch, and enqueue() returns once its batch is on disk.
+- Dequeue uses a partial index over unacked rows (mailbox, visible_at). An
+  empty mailbox is checked with a plain read; the write lock is only taken
+  when there is something to lease.
+- Several processes (gunicorn workers) can share the file. A watcher thread
+  checks PRAGMA data_version and notifies listeners about messages committed
+  by other processes, so a long-poll in one worker wakes on a webhook that
+  landed in another.
+
+Usage:
+    store = MessageStore('relay_queue.db')
+    store.enqueue('sms:+4790000000', 'SM123', {'from': '+47...', 'message': 'Hei'})
+    leased = store.lease(['sms:+4790000000'])   # {mailbox: [message, ...]}
+    store.ack('sms:+4790000000', ['SM123'])
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS messages (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        mailbox TEXT NOT NULL,
+        idem_key TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        visible_at REAL NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        acked_at REAL,
+        UNIQUE (mailbox, idem_key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_pending
+        ON messages (mailbox, visible_at) WHERE acked_at IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_messages_acked
+        ON messages (acked_at) WHERE acked_at IS NOT NULL;
+"""
+
+
+def connect(path):
+    """SQLite connection for the relay's shared state (WAL, autocommit)."""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Survives process crashes; fsync per checkpoint
+    return conn
+
+
+class _Write:
+    """One enqueue request waiting for the writer thread."""
+    __slots__ = ('rows', 'done', 'inserted', 'error')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.inserted = []
+        self.error = None
+
+
+class MessageStore:
+    """SQLite-backed mailboxes with leases, acks and idempotency keys."""
+
+    def __init__(self, path, visibility_timeout=120, acked_retention=24 * 3600,
+                 max_pending=100, batch_size=500, prune_interval=300, watch_interval=0.05):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.acked_retention = acked_retention
+        self.max_pending = max_pending  # Per mailbox; oldest are dropped beyond this
+        self.batch_size = batch_size
+        self.prune_interval = prune_interval
+        self.watch_interval = watch_interval  # Seconds between checks for other processes' commits
+        self._local = threading.local()
+        self._pending = queue.Queue()
+        self._listeners = []
+        self._watcher = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'duplicates': 0, 'dropped': 0, 'batches': 0,
+                      'leased': 0, 'redelivered': 0, 'acked': 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True, name="relay-store-writer")
+        self._writer.start()
+
+    def _conn(self):
+        """One connection per thread (WAL lets readers run beside the writer)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def add_listener(self, callback):
+        """callback(mailboxes) is called after new messages are committed (by any process)."""
+        self._listeners.append(callback)
+        if self._watcher is None and self.watch_interval:
+            self._watcher = threading.Thread(target=self._watch_loop, daemon=True, name="relay-store-watcher")
+            self._watcher.start()
+
+    def _notify(self, mailboxes):
+        for callback in self._listeners:
+            try:
+                callback(mailboxes)
+            except Exception as e:
+                print(f"⚠️ Queue listener failed: {e}")
+
+    def _watch_loop(self):
+        """Notify about messages committed by other processes sharing the file."""
+        conn = self._conn()
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages").fetchone()[0]
+        version = None
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                # data_version changes when another connection commits - a cheap no-op check otherwise
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == version:
+                    continue
+                version = current
+                rows = conn.execute("SELECT seq, mailbox FROM messages WHERE seq > ?", (last_seq,)).fetchall()
+            except sqlite3.Error as e:
+                print(f"⚠️ Queue watcher failed: {e}")
+                continue
+            if rows:
+                last_seq = max(row['seq'] for row in rows)
+                self._notify({row['mailbox'] for row in rows})
+
+    # ── Enqueue (group commit) ───────────────────────────────
+
+    def enqueue(self, mailbox, idem_key, message):
+        """
+        Store one message durably.
+
+        Returns:
+            True if stored, False if the idempotency key was already seen
+        """
+        return self.enqueue_many([(mailbox, idem_key, message)])[0]
+
+    def enqueue_many(self, items):
+        """
+        Store several messages in the same transaction.
+
+        Args:
+            items: [(mailbox, idem_key, message_dict), ...]
+
+        Returns:
+            [inserted: bool, ...] in the same order
+        """
+        now = time.time()
+        rows = [(mailbox, str(idem_key), json.dumps(dict(message, id=str(idem_key))), now)
+                for mailbox, idem_key, message in items]
+        write = _Write(rows)
+        self._pending.put(write)
+        write.done.wait()
+        if write.error:
+            raise write.error
+        return write.inserted
+
+    def _writer_loop(self):
+        last_prune = time.time()
+        while True:
+            try:
+                first = self._pending.get(timeout=self.prune_interval)
+            except queue.Empty:
+                first = None
+            batch = [first] if first else []
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+            if time.time() - last_prune >= self.prune_interval:
+                last_prune = time.time()
+                try:
+                    self.prune()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Queue prune failed: {e}")
+
+    def _write_batch(self, batch):
+        conn = self._conn()
+        mailboxes = set()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for write in batch:
+                write.inserted = []
+                for row in write.rows:
+                    cursor = conn.execute("""
+                        INSERT OR IGNORE INTO messages (mailbox, idem_key, payload, created_at)
+                        VALUES (?, ?, ?, ?)
+                    """, row)
+                    write.inserted.append(cursor.rowcount == 1)
+                    if cursor.rowcount == 1:
+                        mailboxes.add(row[0])
+            dropped = sum(self._trim(conn, mailbox) for mailbox in mailboxes)
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for write in batch:
+                write.error = e
+                write.done.set()
+            return
+        inserted = sum(sum(write.inserted) for write in batch)
+        rows = sum(len(write.rows) for write in batch)
+        self._count(enqueued=inserted, duplicates=rows - inserted, dropped=dropped, batches=1)
+        for write in batch:
+            write.done.set()
+        if mailboxes:
+            self._notify(mailboxes)
+
+    def _trim(self, conn, mailbox):
+        """Drop the oldest unacked messages beyond max_pending (kept as tombstones)."""
+        row = conn.execute("""
+            SELECT seq FROM messages WHERE mailbox = ? AND acked_at IS NULL
+            ORDER BY seq DESC LIMIT 1 OFFSET ?
+        """, (mailbox, self.max_pending)).fetchone()
+        if row is None:
+            return 0
+        return conn.execute("""
+            UPDATE messages SET acked_at = ? WHERE mailbox = ? AND acked_at IS NULL AND seq <= ?
+        """, (time.time(), mailbox, row['seq'])).rowcount
+
+    # ── Dequeue ──────────────────────────────────────────────
+
+    def lease(self, mailboxes, limit=100, visibility_timeout=None, ack=False):
+        """
+        Hand out the oldest visible messages and hide them until acked.
+
+        Args:
+            mailboxes: Mailboxes to read from
+            limit: Max messages in total
+            visibility_timeout: Seconds before unacked messages are redelivered
+            ack: Ack immediately (at-most-once, for the legacy poll endpoints)
+
+        Returns:
+            {mailbox: [message, ...]} for mailboxes that had messages
+        """
+        if not mailboxes:
+            return {}
+        now = time.time()
+        hidden_until = now + (self.visibility_timeout if visibility_timeout is None else visibility_timeout)
+        placeholders = ",".join("?" * len(mailboxes))
+        select = f"""
+            SELECT seq, mailbox, payload, attempts FROM messages
+            WHERE mailbox IN ({placeholders}) AND acked_at IS NULL AND visible_at <= ?
+            ORDER BY seq LIMIT ?
+        """
+        conn = self._conn()
+        # Empty mailboxes (most long-poll checks) are answered without the write lock
+        if not conn.execute(select, (*mailboxes, now, 1)).fetchall():
+            return {}
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(select, (*mailboxes, now, limit)).fetchall()
+            if rows:
+                seqs = [row['seq'] for row in rows]
+                marks = ",".join("?" * len(seqs))
+                if ack:
+                    conn.execute(f"UPDATE messages SET acked_at = ?, attempts = attempts + 1 WHERE seq IN ({marks})",
+                                 (now, *seqs))
+                else:
+                    conn.execute(f"UPDATE messages SET visible_at = ?, attempts = attempts + 1 WHERE seq IN ({marks})",
+                                 (hidden_until, *seqs))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        found = {}
+        for row in rows:
+            found.setdefault(row['mailbox'], []).append(json.loads(row['payload']))
+        self._count(leased=len(rows), redelivered=sum(1 for row in rows if row['attempts'] > 0),
+                    acked=len(rows) if ack else 0)
+        return found
+
+    def ack(self, mailbox, ids):
+        """Mark messages as processed. Returns how many were still pending."""
+        if not ids:
+            return 0
+        ids = [str(i) for i in ids]
+        placeholders = ",".join("?" * len(ids))
+        acked = self._conn().execute(f"""
+            UPDATE messages SET acked_at = ?
+            WHERE mailbox = ? AND acked_at IS NULL AND idem_key IN ({placeholders})
+        """, (time.time(), mailbox, *ids)).rowcount
+        self._count(acked=acked)
+        return acked
+
+    def next_visible_at(self, mailboxes):
+        """When the earliest leased message in these mailboxes becomes visible again (or None)."""
+        if not mailboxes:
+            return None
+        placeholders = ",".join("?" * len(mailboxes))
+        row = self._conn().execute(f"""
+            SELECT MIN(visible_at) AS visible_at FROM messages
+            WHERE mailbox IN ({placeholders}) AND acked_at IS NULL
+        """, tuple(mailboxes)).fetchone()
+        return row['visible_at']
+
+    def pending_counts(self):
+        """{mailbox: unacked messages} (leased ones included)."""
+        rows = self._conn().execute("""
+            SELECT mailbox, COUNT(*) AS pending FROM messages WHERE acked_at IS NULL GROUP BY mailbox
+        """).fetchall()
+        return {row['mailbox']: row['pending'] for row in rows}
+
+    def prune(self):
+        """Delete tombstones older than the retention window."""
+        cutoff = time.time() - self.acked_retention
+        return self._conn().execute(
+            "DELETE FROM messages WHERE acked_at IS NOT NULL AND acked_at < ?", (cutoff,)
+        ).rowcount
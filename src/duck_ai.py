@@ -6,7 +6,7 @@ Handles ChatGPT queries, function calling, and tool integrations.
 import os
 import json
 import sqlite3
-import requests
+import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
@@ -17,9 +17,17 @@ from src.duck_config import (
     LOCATIONS_FILE, PERSONALITIES_FILE, DUCK_IDENTITY_FILE,
     OPENAI_API_KEY_ENV, HA_TOKEN_ENV, HA_URL_ENV,
     DB_PATH, BASE_PATH, MUSIKK_DIR, DUCK_NAME as CONFIG_DUCK_NAME,
-    OWNER_NAME, OWNER_ALIASES
+    OWNER_NAME, OWNER_ALIASES, HTTP_CONNECT_TIMEOUT, HTTP_LLM_READ_TIMEOUT,
+    HTTP_RETRY_STATUSES_API,
+    TURN_BUDGET_S, TURN_BUDGET_SMS_S, TURN_LLM_RESERVE_S, TOOL_MIN_BUDGET_S
 )
+from src.duck_http import get_http_client
+from src.duck_deadline import deadline_at
 from src.duck_settings import get_settings
+from src.duck_tracing import get_tracer
+from src.duck_filler import get_filler_speech
+from src.duck_tool_cache import get_tool_cache
+from src.duck_prefetch import record_tool_call
 from src.duck_tools import get_weather, control_hue_lights, get_ip_address_tool, get_netatmo_temperature
 from src.duck_homeassistant import control_tv, control_ac, get_ac_temperature, control_vacuum, launch_tv_app, control_twinkly, get_email_status, get_calendar_events, create_calendar_event, manage_todo, get_teams_status, get_teams_chat, activate_scene, control_blinds, trigger_backup
 from src.duck_electricity import format_price_response
@@ -617,7 +625,8 @@ def _build_system_prompt(user_manager, memory_manager, hunger_manager, sms_manag
             else:
                 user_query = ""
             # Send med current_user for å filtrere minner og meldinger
-            context = memory_manager.build_context_for_ai(user_query, recent_messages=3, user_name=current_user['username'])
+            with get_tracer().span("build_context_for_ai"):
+                context = memory_manager.build_context_for_ai(user_query, recent_messages=3, user_name=current_user['username'])
             
             # Bygg memory section
             memory_section = "\n\n### Ditt Minne ###\n"
@@ -1508,6 +1517,11 @@ def _get_all_function_tools():
                             "type": "integer",
                             "description": "Antall nyheter (default 5, max 15)",
                             "default": 5
+                        },
+                        "since_last": {
+                            "type": "boolean",
+                            "description": "True når brukeren spør hva som er nytt siden sist ('noe nytt siden i stad?'). Gir bare saker som har kommet siden kategorien sist ble lest opp.",
+                            "default": False
                         }
                     },
                     "required": []
@@ -1532,6 +1546,11 @@ def _get_all_function_tools():
                             "type": "integer",
                             "description": "Antall overskrifter (default 5, max 15)",
                             "default": 5
+                        },
+                        "since_last": {
+                            "type": "boolean",
+                            "description": "True når brukeren spør hva som er nytt siden sist. Gir bare saker som har kommet siden kilden sist ble lest opp.",
+                            "default": False
                         }
                     },
                     "required": []
@@ -1676,591 +1695,584 @@ def _get_all_function_tools():
     ]
 
 
-def _handle_tool_calls(tool_calls, final_messages, source, source_user_id, sms_manager, vision_service=None):
+def _execute_tool(function_name, function_args, sms_manager, vision_service=None):
     """
-    Håndterer alle tool calls fra ChatGPT ved å kalle riktig funksjon og legge til resultatet i messages.
+    Kjør én tool-funksjon og returner resultatet.
     
     Args:
-        tool_calls: Liste med tool call objects fra ChatGPT
-        final_messages: Messages-liste å legge til resultater i
-        source: "voice" eller "sms"
-        source_user_id: ID på bruker (for SMS autorisation)
+        function_name: Navnet på funksjonen ChatGPT vil kalle
+        function_args: Parsede argumenter fra tool call
         sms_manager: SMSManager instans
         vision_service: DuckVisionService instans (for Duck-Vision kamera)
     
     Returns:
-        bool: True hvis samtalen skal tvinges avsluttet (f.eks. enable_sleep_mode)
+        tuple: (result, force_end) der force_end=True tvinger samtalen avsluttet
     """
     force_end = False
-    for tool_call in tool_calls:
-        function_name = tool_call["function"]["name"]
-        function_args = json.loads(tool_call["function"]["arguments"])
-        
-        print(f"ChatGPT kaller funksjon: {function_name} med args: {function_args}", flush=True)
+    
+    if function_name == "get_weather":
+        location = function_args.get("location", "")
         
-        # Sjekk autorisation for smart home-kommandoer via SMS
-        if not _check_sms_authorization(function_name, source, source_user_id, sms_manager, tool_call, final_messages):
-            continue
+        # Hvis ingen lokasjon oppgitt, bruk Andas nåværende lokasjon
+        if not location:
+            try:
+                conn = get_db().connection()
+                c = conn.cursor()
+                c.execute("SELECT value FROM profile_facts WHERE key = 'duck_current_location' LIMIT 1")
+                row = c.fetchone()
+                if row:
+                    location = row[0]
+                    print(f"Bruker Andas nåværende lokasjon: {location}", flush=True)
+                else:
+                    location = "Stavanger"  # Fallback
+                    print("Ingen duck_current_location funnet, bruker Stavanger som fallback", flush=True)
+            except Exception as e:
+                print(f"Feil ved henting av duck_current_location: {e}, bruker Stavanger", flush=True)
+                location = "Stavanger"
         
-        # Kall faktisk funksjon
-        if function_name == "get_weather":
-            location = function_args.get("location", "")
+        timeframe = function_args.get("timeframe", "now")
+        result = get_weather(location, timeframe)
+    elif function_name == "control_hue_lights":
+        action = function_args.get("action")
+        room = function_args.get("room")
+        brightness = function_args.get("brightness")
+        color = function_args.get("color")
+        result = control_hue_lights(action, room, brightness, color)
+    elif function_name == "control_beak":
+        from src.duck_audio import control_beak
+        enabled = function_args.get("enabled")
+        beak_result = control_beak(enabled)
+        result = beak_result.get("status", "error") if isinstance(beak_result, dict) else str(beak_result)
+    elif function_name == "get_ip_address":
+        result = get_ip_address_tool()
+    elif function_name == "get_netatmo_temperature":
+        room_name = function_args.get("room_name")
+        result = get_netatmo_temperature(room_name)
+    elif function_name == "control_tv":
+        action = function_args.get("action")
+        result = control_tv(action)
+    elif function_name == "switch_network":
+        # Bytt nettverk - koble fra WiFi og start hotspot
+        try:
+            from src.duck_event_bus import get_event_bus, Event
+            bus = get_event_bus()
+            bus.post(Event.SWITCH_NETWORK, 'SWITCH')
             
-            # Hvis ingen lokasjon oppgitt, bruk Andas nåværende lokasjon
-            if not location:
-                try:
-                    conn = get_db().connection()
-                    c = conn.cursor()
-                    c.execute("SELECT value FROM profile_facts WHERE key = 'duck_current_location' LIMIT 1")
-                    row = c.fetchone()
-                    if row:
-                        location = row[0]
-                        print(f"Bruker Andas nåværende lokasjon: {location}", flush=True)
+            result = "OK, jeg starter hotspot nå. Koble til ChatGPT-Duck med passord kvakkkvakk for å velge nytt nettverk."
+        except Exception as e:
+            result = f"Kunne ikke starte hotspot: {e}"
+    elif function_name == "launch_tv_app":
+        app_name = function_args.get("app_name")
+        result = launch_tv_app(app_name)
+    elif function_name == "control_ac":
+        action = function_args.get("action")
+        temperature = function_args.get("temperature")
+        mode = function_args.get("mode")
+        result = control_ac(action, temperature, mode)
+    elif function_name == "get_ac_temperature":
+        temp_type = function_args.get("temp_type", "both")
+        result = get_ac_temperature(temp_type)
+    elif function_name == "control_vacuum":
+        action = function_args.get("action")
+        result = control_vacuum(action)
+    elif function_name == "control_twinkly":
+        action = function_args.get("action")
+        brightness = function_args.get("brightness")
+        mode = function_args.get("mode")
+        result = control_twinkly(action, brightness, mode)
+    elif function_name == "control_blinds":
+        location = function_args.get("location")
+        action = function_args.get("action")
+        position = function_args.get("position")
+        section = function_args.get("section")
+        result = control_blinds(location, action, position, section)
+    elif function_name == "get_electricity_price":
+        timeframe = function_args.get("timeframe", "now")
+        result = format_price_response(timeframe, region='NO2')
+    elif function_name == "trigger_backup":
+        print("🔧 TOOL CALL: trigger_backup()", flush=True)
+        result = trigger_backup()
+        print(f"🔧 TOOL RESULT: {result}", flush=True)
+    elif function_name == "get_email_status":
+        action = function_args.get("action", "summary")
+        print(f"🔧 TOOL CALL: get_email_status(action='{action}')", flush=True)
+        result = get_email_status(action)
+        print(f"🔧 TOOL RESULT: {result[:200] if len(result) > 200 else result}", flush=True)
+    elif function_name == "get_calendar_events":
+        action = function_args.get("action", "next")
+        result = get_calendar_events(action)
+    elif function_name == "create_calendar_event":
+        summary = function_args.get("summary")
+        start_datetime = function_args.get("start_datetime")
+        end_datetime = function_args.get("end_datetime")
+        description = function_args.get("description")
+        location = function_args.get("location")
+        result = create_calendar_event(summary, start_datetime, end_datetime, description, location)
+    elif function_name == "manage_todo":
+        action = function_args.get("action", "list")
+        item = function_args.get("item")
+        result = manage_todo(action, item)
+    elif function_name == "get_teams_status":
+        result = get_teams_status()
+    elif function_name == "get_teams_chat":
+        result = get_teams_chat()
+    elif function_name == "look_around":
+        # Use Duck-Vision camera to see what's in the room (IMX500 - quick)
+        if not vision_service or not vision_service.is_connected():
+            result = "Kameraet er ikke tilgjengelig for øyeblikket"
+        else:
+            result = vision_service.look_around(timeout=10.0)
+            if not result:
+                result = "Jeg fikk ikke svar fra kameraet (timeout)"
+    elif function_name == "analyze_scene":
+        # Use Duck-Vision OpenAI Vision for deep scene analysis
+        question = function_args.get("question")
+        if not vision_service or not vision_service.is_connected():
+            result = "Kameraet er ikke tilgjengelig for øyeblikket"
+        else:
+            result = vision_service.analyze_scene(question=question, timeout=15.0)
+            if not result or "timeout" in result.lower():
+                result = "Jeg fikk ikke svar fra OpenAI Vision (kan ta 5-10 sekunder)"
+    elif function_name == "send_sms":
+        contact_name = function_args.get("contact_name", "")
+        message = function_args.get("message", "")
+        
+        if not sms_manager:
+            result = "SMS-funksjonalitet er ikke tilgjengelig"
+        elif not contact_name or not message:
+            result = "Må oppgi både kontaktnavn og melding"
+        else:
+            # Finn kontakt
+            try:
+                conn = get_db().connection()
+                c = conn.cursor()
+                c.execute("SELECT * FROM sms_contacts WHERE name = ? AND enabled = 1", (contact_name,))
+                contact = c.fetchone()
+                
+                if contact:
+                    contact_dict = dict(contact)
+                    send_result = sms_manager.send_sms(contact_dict['phone'], message)
+                    
+                    if send_result['status'] == 'sent':
+                        result = f"✅ SMS sendt til {contact_name}: {message}"
                     else:
-                        location = "Stavanger"  # Fallback
-                        print("Ingen duck_current_location funnet, bruker Stavanger som fallback", flush=True)
-                except Exception as e:
-                    print(f"Feil ved henting av duck_current_location: {e}, bruker Stavanger", flush=True)
-                    location = "Stavanger"
-            
-            timeframe = function_args.get("timeframe", "now")
-            result = get_weather(location, timeframe)
-        elif function_name == "control_hue_lights":
-            action = function_args.get("action")
-            room = function_args.get("room")
-            brightness = function_args.get("brightness")
-            color = function_args.get("color")
-            result = control_hue_lights(action, room, brightness, color)
-        elif function_name == "control_beak":
-            from src.duck_audio import control_beak
-            enabled = function_args.get("enabled")
-            beak_result = control_beak(enabled)
-            result = beak_result.get("status", "error") if isinstance(beak_result, dict) else str(beak_result)
-        elif function_name == "get_ip_address":
-            result = get_ip_address_tool()
-        elif function_name == "get_netatmo_temperature":
-            room_name = function_args.get("room_name")
-            result = get_netatmo_temperature(room_name)
-        elif function_name == "control_tv":
-            action = function_args.get("action")
-            result = control_tv(action)
-        elif function_name == "switch_network":
-            # Bytt nettverk - koble fra WiFi og start hotspot
+                        result = f"❌ Kunne ikke sende SMS til {contact_name}: {send_result.get('error', 'Ukjent feil')}"
+                else:
+                    result = f"Fant ingen kontakt med navn '{contact_name}'"
+            except Exception as e:
+                result = f"Feil ved sending av SMS: {e}"
+    elif function_name == "send_duck_message":
+        duck_name = function_args.get("duck_name", "")
+        message = function_args.get("message", "")
+        
+        if not sms_manager:
+            result = "Duck messaging er ikke tilgjengelig"
+        elif not duck_name or not message:
+            result = "Må oppgi både andenavn og melding"
+        else:
             try:
-                from src.duck_event_bus import get_event_bus, Event
-                bus = get_event_bus()
-                bus.post(Event.SWITCH_NETWORK, 'SWITCH')
+                # Import duck_messenger for token validation
+                from src.duck_messenger import DuckMessenger
+                duck_messenger = DuckMessenger(sms_manager.db_path)
+                
+                # Voice command is user-initiated, so skip token validation
+                # (user explicitly asked to send message)
+                
+                # Send via SMS relay
+                send_result = sms_manager.send_duck_message(duck_name, message)
+                print(f"🔧 send_duck_message result: {send_result}", flush=True)
                 
-                result = "OK, jeg starter hotspot nå. Koble til ChatGPT-Duck med passord kvakkkvakk for å velge nytt nettverk."
+                if send_result['status'] == 'sent':
+                    # Set result FIRST (before logging which might fail)
+                    result = f"✅ Melding sendt til {duck_name}: {message}"
+                    
+                    # Log in database (non-critical)
+                    try:
+                        duck_messenger.log_message(
+                            from_duck=CONFIG_DUCK_NAME.lower(),
+                            to_duck=duck_name.lower(),
+                            message=message,
+                            direction='sent',
+                            initiated=True,
+                            tokens_used=len(message.split())
+                        )
+                    except Exception as log_err:
+                        print(f"⚠️ Duck message sent OK but logging failed: {log_err}", flush=True)
+                else:
+                    result = f"❌ Kunne ikke sende melding til {duck_name}: {send_result.get('error', 'Ukjent feil')}"
             except Exception as e:
-                result = f"Kunne ikke starte hotspot: {e}"
-        elif function_name == "launch_tv_app":
-            app_name = function_args.get("app_name")
-            result = launch_tv_app(app_name)
-        elif function_name == "control_ac":
-            action = function_args.get("action")
-            temperature = function_args.get("temperature")
-            mode = function_args.get("mode")
-            result = control_ac(action, temperature, mode)
-        elif function_name == "get_ac_temperature":
-            temp_type = function_args.get("temp_type", "both")
-            result = get_ac_temperature(temp_type)
-        elif function_name == "control_vacuum":
-            action = function_args.get("action")
-            result = control_vacuum(action)
-        elif function_name == "control_twinkly":
-            action = function_args.get("action")
-            brightness = function_args.get("brightness")
-            mode = function_args.get("mode")
-            result = control_twinkly(action, brightness, mode)
-        elif function_name == "control_blinds":
-            location = function_args.get("location")
-            action = function_args.get("action")
-            position = function_args.get("position")
-            section = function_args.get("section")
-            result = control_blinds(location, action, position, section)
-        elif function_name == "get_electricity_price":
-            timeframe = function_args.get("timeframe", "now")
-            result = format_price_response(timeframe, region='NO2')
-        elif function_name == "trigger_backup":
-            print("🔧 TOOL CALL: trigger_backup()", flush=True)
-            result = trigger_backup()
-            print(f"🔧 TOOL RESULT: {result}", flush=True)
-        elif function_name == "get_email_status":
-            action = function_args.get("action", "summary")
-            print(f"🔧 TOOL CALL: get_email_status(action='{action}')", flush=True)
-            result = get_email_status(action)
-            print(f"🔧 TOOL RESULT: {result[:200] if len(result) > 200 else result}", flush=True)
-        elif function_name == "get_calendar_events":
-            action = function_args.get("action", "next")
-            result = get_calendar_events(action)
-        elif function_name == "create_calendar_event":
-            summary = function_args.get("summary")
-            start_datetime = function_args.get("start_datetime")
-            end_datetime = function_args.get("end_datetime")
-            description = function_args.get("description")
-            location = function_args.get("location")
-            result = create_calendar_event(summary, start_datetime, end_datetime, description, location)
-        elif function_name == "manage_todo":
-            action = function_args.get("action", "list")
-            item = function_args.get("item")
-            result = manage_todo(action, item)
-        elif function_name == "get_teams_status":
-            result = get_teams_status()
-        elif function_name == "get_teams_chat":
-            result = get_teams_chat()
-        elif function_name == "look_around":
-            # Use Duck-Vision camera to see what's in the room (IMX500 - quick)
-            if not vision_service or not vision_service.is_connected():
-                result = "Kameraet er ikke tilgjengelig for øyeblikket"
-            else:
-                result = vision_service.look_around(timeout=10.0)
-                if not result:
-                    result = "Jeg fikk ikke svar fra kameraet (timeout)"
-        elif function_name == "analyze_scene":
-            # Use Duck-Vision OpenAI Vision for deep scene analysis
-            question = function_args.get("question")
-            if not vision_service or not vision_service.is_connected():
-                result = "Kameraet er ikke tilgjengelig for øyeblikket"
-            else:
-                result = vision_service.analyze_scene(question=question, timeout=15.0)
-                if not result or "timeout" in result.lower():
-                    result = "Jeg fikk ikke svar fra OpenAI Vision (kan ta 5-10 sekunder)"
-        elif function_name == "send_sms":
-            contact_name = function_args.get("contact_name", "")
-            message = function_args.get("message", "")
-            
-            if not sms_manager:
-                result = "SMS-funksjonalitet er ikke tilgjengelig"
-            elif not contact_name or not message:
-                result = "Må oppgi både kontaktnavn og melding"
-            else:
-                # Finn kontakt
-                try:
-                    conn = get_db().connection()
-                    c = conn.cursor()
-                    c.execute("SELECT * FROM sms_contacts WHERE name = ? AND enabled = 1", (contact_name,))
+                import traceback
+                print(f"❌ Duck message exception: {e}", flush=True)
+                traceback.print_exc()
+                result = f"Feil ved sending av duck message: {e}"
+    elif function_name == "get_recent_sms":
+        contact_name = function_args.get("contact_name", "").strip()
+        limit = function_args.get("limit", 5)
+        
+        # Begrens til maks 20 meldinger
+        if limit > 20:
+            limit = 20
+        
+        if not sms_manager:
+            result = "SMS-funksjonalitet er ikke tilgjengelig"
+        else:
+            try:
+                from datetime import datetime
+                conn = get_db().connection()
+                c = conn.cursor()
+                
+                # Hvis kontaktnavn er spesifisert, finn contact_id
+                contact_id = None
+                if contact_name:
+                    c.execute("SELECT id, name FROM sms_contacts WHERE name = ?", (contact_name,))
                     contact = c.fetchone()
-                    
                     if contact:
-                        contact_dict = dict(contact)
-                        send_result = sms_manager.send_sms(contact_dict['phone'], message)
-                        
-                        if send_result['status'] == 'sent':
-                            result = f"✅ SMS sendt til {contact_name}: {message}"
-                        else:
-                            result = f"❌ Kunne ikke sende SMS til {contact_name}: {send_result.get('error', 'Ukjent feil')}"
+                        contact_id = contact['id']
+                        actual_name = contact['name']
                     else:
                         result = f"Fant ingen kontakt med navn '{contact_name}'"
-                except Exception as e:
-                    result = f"Feil ved sending av SMS: {e}"
-        elif function_name == "send_duck_message":
-            duck_name = function_args.get("duck_name", "")
-            message = function_args.get("message", "")
-            
-            if not sms_manager:
-                result = "Duck messaging er ikke tilgjengelig"
-            elif not duck_name or not message:
-                result = "Må oppgi både andenavn og melding"
-            else:
-                try:
-                    # Import duck_messenger for token validation
-                    from src.duck_messenger import DuckMessenger
-                    duck_messenger = DuckMessenger(sms_manager.db_path)
-                    
-                    # Voice command is user-initiated, so skip token validation
-                    # (user explicitly asked to send message)
-                    
-                    # Send via SMS relay
-                    send_result = sms_manager.send_duck_message(duck_name, message)
-                    print(f"🔧 send_duck_message result: {send_result}", flush=True)
-                    
-                    if send_result['status'] == 'sent':
-                        # Set result FIRST (before logging which might fail)
-                        result = f"✅ Melding sendt til {duck_name}: {message}"
-                        
-                        # Log in database (non-critical)
-                        try:
-                            duck_messenger.log_message(
-                                from_duck=CONFIG_DUCK_NAME.lower(),
-                                to_duck=duck_name.lower(),
-                                message=message,
-                                direction='sent',
-                                initiated=True,
-                                tokens_used=len(message.split())
-                            )
-                        except Exception as log_err:
-                            print(f"⚠️ Duck message sent OK but logging failed: {log_err}", flush=True)
+                        return result, force_end
+                
+                # Hent SMS-er
+                if contact_id:
+                    query = """
+                        SELECT s.direction, s.message, s.timestamp, c.name
+                        FROM sms_history s
+                        LEFT JOIN sms_contacts c ON s.contact_id = c.id
+                        WHERE s.contact_id = ?
+                        ORDER BY s.timestamp DESC
+                        LIMIT ?
+                    """
+                    c.execute(query, (contact_id, limit))
+                else:
+                    query = """
+                        SELECT s.direction, s.message, s.timestamp, c.name
+                        FROM sms_history s
+                        LEFT JOIN sms_contacts c ON s.contact_id = c.id
+                        ORDER BY s.timestamp DESC
+                        LIMIT ?
+                    """
+                    c.execute(query, (limit,))
+                
+                messages = c.fetchall()
+                
+                if not messages:
+                    if contact_name:
+                        result = f"Ingen SMS-historikk funnet med {actual_name}"
                     else:
-                        result = f"❌ Kunne ikke sende melding til {duck_name}: {send_result.get('error', 'Ukjent feil')}"
-                except Exception as e:
-                    import traceback
-                    print(f"❌ Duck message exception: {e}", flush=True)
-                    traceback.print_exc()
-                    result = f"Feil ved sending av duck message: {e}"
-        elif function_name == "get_recent_sms":
-            contact_name = function_args.get("contact_name", "").strip()
-            limit = function_args.get("limit", 5)
-            
-            # Begrens til maks 20 meldinger
-            if limit > 20:
-                limit = 20
-            
-            if not sms_manager:
-                result = "SMS-funksjonalitet er ikke tilgjengelig"
-            else:
-                try:
-                    from datetime import datetime
-                    conn = get_db().connection()
-                    c = conn.cursor()
-                    
-                    # Hvis kontaktnavn er spesifisert, finn contact_id
-                    contact_id = None
+                        result = "Ingen SMS-historikk funnet"
+                else:
+                    # Formater meldingene
+                    result_lines = []
                     if contact_name:
-                        c.execute("SELECT id, name FROM sms_contacts WHERE name = ?", (contact_name,))
-                        contact = c.fetchone()
-                        if contact:
-                            contact_id = contact['id']
-                            actual_name = contact['name']
-                        else:
-                            result = f"Fant ingen kontakt med navn '{contact_name}'"
-                            continue
-                    
-                    # Hent SMS-er
-                    if contact_id:
-                        query = """
-                            SELECT s.direction, s.message, s.timestamp, c.name
-                            FROM sms_history s
-                            LEFT JOIN sms_contacts c ON s.contact_id = c.id
-                            WHERE s.contact_id = ?
-                            ORDER BY s.timestamp DESC
-                            LIMIT ?
-                        """
-                        c.execute(query, (contact_id, limit))
+                        result_lines.append(f"📱 SMS-historikk med {actual_name} (siste {len(messages)}):\n")
                     else:
-                        query = """
-                            SELECT s.direction, s.message, s.timestamp, c.name
-                            FROM sms_history s
-                            LEFT JOIN sms_contacts c ON s.contact_id = c.id
-                            ORDER BY s.timestamp DESC
-                            LIMIT ?
-                        """
-                        c.execute(query, (limit,))
+                        result_lines.append(f"📱 Siste {len(messages)} SMS-er:\n")
                     
-                    messages = c.fetchall()
-                    
-                    if not messages:
-                        if contact_name:
-                            result = f"Ingen SMS-historikk funnet med {actual_name}"
-                        else:
-                            result = "Ingen SMS-historikk funnet"
-                    else:
-                        # Formater meldingene
-                        result_lines = []
-                        if contact_name:
-                            result_lines.append(f"📱 SMS-historikk med {actual_name} (siste {len(messages)}):\n")
-                        else:
-                            result_lines.append(f"📱 Siste {len(messages)} SMS-er:\n")
+                    for msg in messages:
+                        timestamp = msg['timestamp']
+                        # Parse timestamp og formater
+                        try:
+                            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+                            time_str = dt.strftime("%d.%m kl %H:%M")
+                        except:
+                            time_str = timestamp[:16]  # Fallback
                         
-                        for msg in messages:
-                            timestamp = msg['timestamp']
-                            # Parse timestamp og formater
-                            try:
-                                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                                time_str = dt.strftime("%d.%m kl %H:%M")
-                            except:
-                                time_str = timestamp[:16]  # Fallback
-                            
-                            direction = "➡️" if msg['direction'] == 'outbound' else "⬅️"
-                            name = msg['name'] or "Ukjent"
-                            text = msg['message'] or "(tom melding)"
-                            
-                            result_lines.append(f"{direction} {time_str} ({name}): {text}")
+                        direction = "➡️" if msg['direction'] == 'outbound' else "⬅️"
+                        name = msg['name'] or "Ukjent"
+                        text = msg['message'] or "(tom melding)"
                         
-                        result = "\n".join(result_lines)
-                except Exception as e:
-                    result = f"Feil ved henting av SMS-historikk: {e}"
-        elif function_name == "activate_scene":
-            scene_name = function_args.get("scene_name", "")
-            result = activate_scene(scene_name)
-        elif function_name == "enable_sleep_mode":
-            duration_str = function_args.get("duration", "")
-            # Parser norske varigheter til minutter
-            duration_minutes = _parse_duration(duration_str)
-            if duration_minutes > 0:
-                sleep_result = enable_sleep(duration_minutes)
-                if sleep_result.get('success'):
-                    end_time = sleep_result.get('end_time_formatted', '')
-                    # Legg til [AVSLUTT] og sett force_end for å tvinge avslutning
-                    # (AI-modellen dropper ofte [AVSLUTT] fra sitt endelige svar)
-                    force_end = True
-                    result = f"OK, jeg går i dvale i {duration_minutes} minutter (til {end_time}). Du kan våkne meg via SMS eller kontrollpanelet. God film! 🎬🦆 [AVSLUTT]"
-                else:
-                    result = f"Kunne ikke aktivere sleep mode: {sleep_result.get('error', 'Ukjent feil')}"
-            else:
-                result = f"Kunne ikke forstå varigheten '{duration_str}'. Prøv f.eks. '30 minutter', '1 time', '2 timer'."
-        elif function_name == "disable_sleep_mode":
-            sleep_result = disable_sleep()
-            if sleep_result.get('was_sleeping'):
-                result = "Jeg er våken igjen! 😊🦆 Hva kan jeg hjelpe deg med?"
-            else:
-                result = "Jeg sov ikke, men jeg er her! 🦆"
-        elif function_name == "check_3d_printer":
-            from src.duck_prusa import get_prusa_manager
-            prusa = get_prusa_manager()
-            if not prusa.is_configured():
-                result = "3D-printeren er ikke konfigurert. Be Osmund om å sette opp PRUSALINK_API_KEY og PRUSALINK_HOST i .env filen."
-            elif not prusa.is_monitoring:
-                result = "3D-printeren er ikke skrudd på. Bruk toggle_3d_printer for å skru den på først."
-            else:
-                status = prusa.get_printer_status()
-                if status:
-                    result = prusa.get_human_readable_status(status)
-                else:
-                    result = "Kunne ikke hente status fra 3D-printeren. Sjekk at den er på og koblet til nettverket."
-        elif function_name == "toggle_3d_printer":
-            from src.duck_prusa import toggle_3d_printer as _toggle_printer
-            from src.duck_event_bus import get_event_bus, Event
-            action = function_args.get("action", "on")
-            
-            # Set up callbacks for print finished/failed events
-            def _on_print_finished(job_name):
-                try:
-                    message = f"🖨️ 3D-printen din er ferdig! {job_name} er klar til å plukkes opp."
-                    bus = get_event_bus()
-                    bus.post(Event.PRUSA_ANNOUNCEMENT, message)
-                except Exception as e:
-                    print(f"⚠️ Prusa callback feilet: {e}", flush=True)
-            
-            result = _toggle_printer(
-                action, 
-                on_print_finished=_on_print_finished,
-                on_print_failed=lambda job: print(f"⚠️ Prusa: Print feilet - {job}", flush=True)
-            )
-        elif function_name == "web_search":
-            query = function_args.get("query", "")
-            count = function_args.get("count", 5)
-            result = web_search(query, count)
-        elif function_name == "get_nrk_news":
-            category = function_args.get("category", "toppsaker")
-            count = function_args.get("count", 5)
-            result = get_nrk_news(category, count)
-        elif function_name == "get_news_headlines":
-            source = function_args.get("source", "vg")
-            count = function_args.get("count", 5)
-            result = get_news_headlines(source, count)
-        elif function_name == "get_departures":
-            stop_name = function_args.get("stop_name", "")
-            count = function_args.get("count", 8)
-            transport_mode = function_args.get("transport_mode", None)
-            result = get_departures(stop_name, count, transport_mode)
-        elif function_name == "plan_journey":
-            from_place = function_args.get("from_place", "")
-            to_place = function_args.get("to_place", "")
-            count = function_args.get("count", 3)
-            result = plan_journey(from_place, to_place, count)
-        elif function_name == "wikipedia_lookup":
-            query = function_args.get("query", "")
-            sentences = function_args.get("sentences", 5)
-            language = function_args.get("language", "no")
-            result = wikipedia_lookup(query, sentences, language)
-        elif function_name == "get_football_info":
-            query_type = function_args.get("query_type", "standings")
-            team_name = function_args.get("team_name", "")
-            count = function_args.get("count", 10)
-            # Hvis team_name er oppgitt, bruk alltid lag-oppslag uansett query_type
-            if team_name:
-                result = get_pl_matches(match_type=team_name, count=count)
-            elif query_type == "standings":
-                result = get_pl_standings(top_n=min(count, 20))
-            elif query_type == "recent":
-                result = get_pl_matches(match_type="recent", count=count)
-            elif query_type == "upcoming":
-                result = get_pl_matches(match_type="upcoming", count=count)
-            else:
-                result = get_pl_standings()
-        elif function_name == "get_olympics_medals":
-            top_n = function_args.get("top_n", 15)
-            country = function_args.get("country", None)
-            detail_level = function_args.get("detail_level", "table")
-            if detail_level == "details" and country:
-                result = get_olympics_medal_details(country=country)
-            else:
-                result = get_olympics_medals(top_n=top_n, country=country)
-        elif function_name == "set_led_color":
-            color = function_args.get("color", "")
-            color_map = {
-                "rød": (1, 0, 0),
-                "grønn": (0, 1, 0),
-                "blå": (0, 0, 1),
-                "gul": (1, 1, 0),
-                "lilla": (1, 0, 1),
-                "oransje": (1, 0.5, 0),
-                "rosa": (1, 0.2, 0.6),
-                "hvit": (1, 1, 1),
-                "cyan": (0, 1, 1)
-            }
-            
-            if color in color_map:
-                from scripts.hardware.rgb_duck import set_color
-                r, g, b = color_map[color]
-                set_color(r, g, b)
-                result = f"LED satt til {color} 💡🦆"
-            else:
-                result = f"Ukjent farge: {color}"
-        elif function_name == "update_duck_location":
-            location = function_args.get("location", "").strip()
-            if location:
-                try:
-                    conn = get_db().connection()
-                    c = conn.cursor()
-                    
-                    # Sjekk om duck_current_location finnes
-                    c.execute("SELECT COUNT(*) FROM profile_facts WHERE key = 'duck_current_location'")
-                    exists = c.fetchone()[0] > 0
-                    
-                    if exists:
-                        c.execute("""
-                            UPDATE profile_facts 
-                            SET value = ?, confidence = 1.0, source = 'user', last_updated = datetime('now')
-                            WHERE key = 'duck_current_location'
-                        """, (location,))
-                    else:
-                        c.execute("""
-                            INSERT INTO profile_facts (key, value, topic, confidence, source, last_updated)
-                            VALUES ('duck_current_location', ?, 'location', 1.0, 'user', datetime('now'))
-                        """, (location,))
+                        result_lines.append(f"{direction} {time_str} ({name}): {text}")
                     
-                    conn.commit()
-                    result = f"OK, jeg er nå i {location}! 📍🦆"
-                except Exception as e:
-                    result = f"Kunne ikke oppdatere lokasjon: {e}"
+                    result = "\n".join(result_lines)
+            except Exception as e:
+                result = f"Feil ved henting av SMS-historikk: {e}"
+    elif function_name == "activate_scene":
+        scene_name = function_args.get("scene_name", "")
+        result = activate_scene(scene_name)
+    elif function_name == "enable_sleep_mode":
+        duration_str = function_args.get("duration", "")
+        # Parser norske varigheter til minutter
+        duration_minutes = _parse_duration(duration_str)
+        if duration_minutes > 0:
+            sleep_result = enable_sleep(duration_minutes)
+            if sleep_result.get('success'):
+                end_time = sleep_result.get('end_time_formatted', '')
+                # Legg til [AVSLUTT] og sett force_end for å tvinge avslutning
+                # (AI-modellen dropper ofte [AVSLUTT] fra sitt endelige svar)
+                force_end = True
+                result = f"OK, jeg går i dvale i {duration_minutes} minutter (til {end_time}). Du kan våkne meg via SMS eller kontrollpanelet. God film! 🎬🦆 [AVSLUTT]"
             else:
-                result = "Ingen lokasjon oppgitt"
-        elif function_name == "sing_song":
-            song_name = function_args.get("song_name", "").strip()
-            
-            # Mapping av sangnavn til mapper
-            song_map = {
-                "pink pony club": "Chapell Roan - Pink Pony Club",
-                "chappell roan": "Chapell Roan - Pink Pony Club",
-                "still alive": "Portal 2 - Still Alive",
-                "portal": "Portal 2 - Still Alive",
-                "her kommer vinteren": "Jokke og Valentinerene - Her kommer vinteren",
-                "jokke": "Jokke og Valentinerene - Her kommer vinteren",
-                "vinteren": "Jokke og Valentinerene - Her kommer vinteren",
-                "hun er fri": "Raga Rockers - Hun er fri",
-                "raga rockers": "Raga Rockers - Hun er fri",
-                "me to går alltid aleina": "Mods - Me to går alltid aleina",
-                "mods": "Mods - Me to går alltid aleina",
-                "take on me": "A-ha - Take on me",
-                "a-ha": "A-ha - Take on me",
-                "aha": "A-ha - Take on me",
-                "touch me": "Samantha Fox - Touch me",
-                "samantha fox": "Samantha Fox - Touch me",
-                "ducktales": "Ducktales - Tema",
-                "duck tales": "Ducktales - Tema",
-                "the duck song": "The Duck - The duck song",
-                "duck song": "The Duck - The duck song",
-                "fate of ophelia": "Taylor Swift - Fate of Ophelia",
-                "taylor swift": "Taylor Swift - Fate of Ophelia",
-            }
-            
-            # Finn riktig mappe
-            import os
-            import random
-            musikk_dir = MUSIKK_DIR
-            song_folder = None
-            
-            if song_name:
-                # Prøv å finne sangen basert på navn
-                song_lower = song_name.lower()
-                if song_lower in song_map:
-                    song_folder = os.path.join(musikk_dir, song_map[song_lower])
-                else:
-                    # Prøv å finne delvis match
-                    for key, folder_name in song_map.items():
-                        if key in song_lower or song_lower in key:
-                            song_folder = os.path.join(musikk_dir, folder_name)
-                            break
-            
-            if not song_folder or not os.path.exists(song_folder):
-                # Velg en tilfeldig sang
-                available_songs = [d for d in os.listdir(musikk_dir) 
-                                 if os.path.isdir(os.path.join(musikk_dir, d)) and 
-                                 os.path.exists(os.path.join(musikk_dir, d, "duck_mix.wav"))]
-                if available_songs:
-                    random_song = random.choice(available_songs)
-                    song_folder = os.path.join(musikk_dir, random_song)
-                    result = f"🎵 SANG VALGT: {random_song}. Si KORT 'Nå synger jeg {random_song}!' + [AVSLUTT]. IKKE spør om mer."
-                    force_end = True
+                result = f"Kunne ikke aktivere sleep mode: {sleep_result.get('error', 'Ukjent feil')}"
+        else:
+            result = f"Kunne ikke forstå varigheten '{duration_str}'. Prøv f.eks. '30 minutter', '1 time', '2 timer'."
+    elif function_name == "disable_sleep_mode":
+        sleep_result = disable_sleep()
+        if sleep_result.get('was_sleeping'):
+            result = "Jeg er våken igjen! 😊🦆 Hva kan jeg hjelpe deg med?"
+        else:
+            result = "Jeg sov ikke, men jeg er her! 🦆"
+    elif function_name == "check_3d_printer":
+        from src.duck_prusa import get_prusa_manager
+        prusa = get_prusa_manager()
+        if not prusa.is_configured():
+            result = "3D-printeren er ikke konfigurert. Be Osmund om å sette opp PRUSALINK_API_KEY og PRUSALINK_HOST i .env filen."
+        elif prusa.is_powering_on:
+            result = "3D-printeren holder på å starte opp. Jeg sier fra når den er klar."
+        elif not prusa.is_monitoring:
+            result = "3D-printeren er ikke skrudd på. Bruk toggle_3d_printer for å skru den på først."
+        else:
+            # Siste kjente status fra overvåkingen - ingen nettverk
+            status = prusa.current_status()
+            if status:
+                result = prusa.get_human_readable_status(status)
+            else:
+                result = "Kunne ikke hente status fra 3D-printeren. Sjekk at den er på og koblet til nettverket."
+    elif function_name == "toggle_3d_printer":
+        from src.duck_prusa import toggle_3d_printer as _toggle_printer
+        from src.duck_event_bus import get_event_bus, Event
+        action = function_args.get("action", "on")
+        
+        # Set up callbacks for print finished/failed events
+        def _on_print_finished(job_name):
+            try:
+                message = f"🖨️ 3D-printen din er ferdig! {job_name} er klar til å plukkes opp."
+                bus = get_event_bus()
+                bus.post(Event.PRUSA_ANNOUNCEMENT, message)
+            except Exception as e:
+                print(f"⚠️ Prusa callback feilet: {e}", flush=True)
+        
+        result = _toggle_printer(
+            action, 
+            on_print_finished=_on_print_finished,
+            on_print_failed=lambda job: print(f"⚠️ Prusa: Print feilet - {job}", flush=True)
+        )
+    elif function_name == "web_search":
+        query = function_args.get("query", "")
+        count = function_args.get("count", 5)
+        result = web_search(query, count)
+    elif function_name == "get_nrk_news":
+        category = function_args.get("category", "toppsaker")
+        count = function_args.get("count", 5)
+        since_last = function_args.get("since_last", False)
+        result = get_nrk_news(category, count, since_last)
+    elif function_name == "get_news_headlines":
+        news_source = function_args.get("source", "vg")
+        count = function_args.get("count", 5)
+        since_last = function_args.get("since_last", False)
+        result = get_news_headlines(news_source, count, since_last)
+    elif function_name == "get_departures":
+        stop_name = function_args.get("stop_name", "")
+        count = function_args.get("count", 8)
+        transport_mode = function_args.get("transport_mode", None)
+        result = get_departures(stop_name, count, transport_mode)
+    elif function_name == "plan_journey":
+        from_place = function_args.get("from_place", "")
+        to_place = function_args.get("to_place", "")
+        count = function_args.get("count", 3)
+        result = plan_journey(from_place, to_place, count)
+    elif function_name == "wikipedia_lookup":
+        query = function_args.get("query", "")
+        sentences = function_args.get("sentences", 5)
+        language = function_args.get("language", "no")
+        result = wikipedia_lookup(query, sentences, language)
+    elif function_name == "get_football_info":
+        query_type = function_args.get("query_type", "standings")
+        team_name = function_args.get("team_name", "")
+        count = function_args.get("count", 10)
+        # Hvis team_name er oppgitt, bruk alltid lag-oppslag uansett query_type
+        if team_name:
+            result = get_pl_matches(match_type=team_name, count=count)
+        elif query_type == "standings":
+            result = get_pl_standings(top_n=min(count, 20))
+        elif query_type == "recent":
+            result = get_pl_matches(match_type="recent", count=count)
+        elif query_type == "upcoming":
+            result = get_pl_matches(match_type="upcoming", count=count)
+        else:
+            result = get_pl_standings()
+    elif function_name == "get_olympics_medals":
+        top_n = function_args.get("top_n", 15)
+        country = function_args.get("country", None)
+        detail_level = function_args.get("detail_level", "table")
+        if detail_level == "details" and country:
+            result = get_olympics_medal_details(country=country)
+        else:
+            result = get_olympics_medals(top_n=top_n, country=country)
+    elif function_name == "set_led_color":
+        color = function_args.get("color", "")
+        color_map = {
+            "rød": (1, 0, 0),
+            "grønn": (0, 1, 0),
+            "blå": (0, 0, 1),
+            "gul": (1, 1, 0),
+            "lilla": (1, 0, 1),
+            "oransje": (1, 0.5, 0),
+            "rosa": (1, 0.2, 0.6),
+            "hvit": (1, 1, 1),
+            "cyan": (0, 1, 1)
+        }
+        
+        if color in color_map:
+            from scripts.hardware.rgb_duck import set_color
+            r, g, b = color_map[color]
+            set_color(r, g, b)
+            result = f"LED satt til {color} 💡🦆"
+        else:
+            result = f"Ukjent farge: {color}"
+    elif function_name == "update_duck_location":
+        location = function_args.get("location", "").strip()
+        if location:
+            try:
+                conn = get_db().connection()
+                c = conn.cursor()
+                
+                # Sjekk om duck_current_location finnes
+                c.execute("SELECT COUNT(*) FROM profile_facts WHERE key = 'duck_current_location'")
+                exists = c.fetchone()[0] > 0
+                
+                if exists:
+                    c.execute("""
+                        UPDATE profile_facts 
+                        SET value = ?, confidence = 1.0, source = 'user', last_updated = datetime('now')
+                        WHERE key = 'duck_current_location'
+                    """, (location,))
                 else:
-                    result = "Fant ingen sanger å synge 😢"
-                    song_folder = None
+                    c.execute("""
+                        INSERT INTO profile_facts (key, value, topic, confidence, source, last_updated)
+                        VALUES ('duck_current_location', ?, 'location', 1.0, 'user', datetime('now'))
+                    """, (location,))
+                
+                conn.commit()
+                result = f"OK, jeg er nå i {location}! 📍🦆"
+            except Exception as e:
+                result = f"Kunne ikke oppdatere lokasjon: {e}"
+        else:
+            result = "Ingen lokasjon oppgitt"
+    elif function_name == "sing_song":
+        song_name = function_args.get("song_name", "").strip()
+        
+        # Mapping av sangnavn til mapper
+        song_map = {
+            "pink pony club": "Chapell Roan - Pink Pony Club",
+            "chappell roan": "Chapell Roan - Pink Pony Club",
+            "still alive": "Portal 2 - Still Alive",
+            "portal": "Portal 2 - Still Alive",
+            "her kommer vinteren": "Jokke og Valentinerene - Her kommer vinteren",
+            "jokke": "Jokke og Valentinerene - Her kommer vinteren",
+            "vinteren": "Jokke og Valentinerene - Her kommer vinteren",
+            "hun er fri": "Raga Rockers - Hun er fri",
+            "raga rockers": "Raga Rockers - Hun er fri",
+            "me to går alltid aleina": "Mods - Me to går alltid aleina",
+            "mods": "Mods - Me to går alltid aleina",
+            "take on me": "A-ha - Take on me",
+            "a-ha": "A-ha - Take on me",
+            "aha": "A-ha - Take on me",
+            "touch me": "Samantha Fox - Touch me",
+            "samantha fox": "Samantha Fox - Touch me",
+            "ducktales": "Ducktales - Tema",
+            "duck tales": "Ducktales - Tema",
+            "the duck song": "The Duck - The duck song",
+            "duck song": "The Duck - The duck song",
+            "fate of ophelia": "Taylor Swift - Fate of Ophelia",
+            "taylor swift": "Taylor Swift - Fate of Ophelia",
+        }
+        
+        # Finn riktig mappe
+        import os
+        import random
+        musikk_dir = MUSIKK_DIR
+        song_folder = None
+        
+        if song_name:
+            # Prøv å finne sangen basert på navn
+            song_lower = song_name.lower()
+            if song_lower in song_map:
+                song_folder = os.path.join(musikk_dir, song_map[song_lower])
             else:
-                song_display = os.path.basename(song_folder)
-                result = f"🎵 SANG VALGT: {song_display}. Si KORT 'Nå synger jeg {song_display}!' + [AVSLUTT]. IKKE spør om mer."
+                # Prøv å finne delvis match
+                for key, folder_name in song_map.items():
+                    if key in song_lower or song_lower in key:
+                        song_folder = os.path.join(musikk_dir, folder_name)
+                        break
+        
+        if not song_folder or not os.path.exists(song_folder):
+            # Velg en tilfeldig sang
+            available_songs = [d for d in os.listdir(musikk_dir) 
+                             if os.path.isdir(os.path.join(musikk_dir, d)) and 
+                             os.path.exists(os.path.join(musikk_dir, d, "duck_mix.wav"))]
+            if available_songs:
+                random_song = random.choice(available_songs)
+                song_folder = os.path.join(musikk_dir, random_song)
+                result = f"🎵 SANG VALGT: {random_song}. Si KORT 'Nå synger jeg {random_song}!' + [AVSLUTT]. IKKE spør om mer."
                 force_end = True
-            
-            # Spill sangen via event bus
-            if song_folder and os.path.exists(song_folder):
-                try:
-                    from src.duck_event_bus import get_event_bus, Event
-                    bus = get_event_bus()
-                    bus.post(Event.PLAY_SONG, {'path': song_folder, 'announce': False})
-                    print(f"✅ Sang queued for playback (no announce): {song_folder}", flush=True)
-                except Exception as e:
-                    result = f"Kunne ikke queue sangen: {e}"
-        elif function_name == "check_face_recognition":
-            # Sjekk om personen er registrert med face recognition
-            if vision_service and vision_service.is_connected():
-                try:
-                    found, name, confidence = vision_service.check_person(timeout=2.0)
-                    
-                    # Name mapping
-                    face_name_mapping = dict(OWNER_ALIASES)
-                    
-                    if found and name:
-                        mapped_name = face_name_mapping.get(name, name)
-                        result = f"recognized:{mapped_name}:{confidence:.2%}"
-                        print(f"✅ Face recognition check: Recognized {name} → {mapped_name} ({confidence:.2%})", flush=True)
-                    elif found and not name:
-                        result = "unknown_person"
-                        print(f"👤 Face recognition check: Unknown person detected", flush=True)
-                    else:
-                        result = "no_person"
-                        print(f"👁️ Face recognition check: No person detected", flush=True)
-                except Exception as e:
-                    result = f"error:{str(e)}"
-                    print(f"⚠️ Face recognition check error: {e}", flush=True)
             else:
-                result = "error:Vision system not available"
-                print(f"⚠️ Face recognition check: Duck-Vision not connected", flush=True)
-        elif function_name == "start_face_learning":
-            # Start face learning workflow
-            name = function_args.get("name", "").strip()
-            
-            # Set global flag to trigger learning workflow
-            import chatgpt_voice
-            chatgpt_voice._waiting_for_name = True
-            
-            if name:
-                # Name already provided - skip to confirmation
-                chatgpt_voice._pending_person_name = name
-                result = f"learning_started_with_name:{name}"
-                print(f"✅ Face learning started with name: {name}", flush=True)
-            else:
-                # Will ask for name
-                result = "learning_started_ask_name"
-                print(f"✅ Face learning started - will ask for name", flush=True)
-        elif function_name == "get_technical_info":
-            # Returnerer detaljert teknisk info on-demand (spart fra system prompt)
+                result = "Fant ingen sanger å synge 😢"
+                song_folder = None
+        else:
+            song_display = os.path.basename(song_folder)
+            result = f"🎵 SANG VALGT: {song_display}. Si KORT 'Nå synger jeg {song_display}!' + [AVSLUTT]. IKKE spør om mer."
+            force_end = True
+        
+        # Spill sangen via event bus
+        if song_folder and os.path.exists(song_folder):
             try:
-                primary = None
-                if 'user_manager' in dir():
-                    pass  # user_manager not available in this scope
-                creator_name = OWNER_NAME  # From config
-                result = f"""Andas tekniske oppbygning:
+                from src.duck_event_bus import get_event_bus, Event
+                bus = get_event_bus()
+                bus.post(Event.PLAY_SONG, {'path': song_folder, 'announce': False})
+                print(f"✅ Sang queued for playback (no announce): {song_folder}", flush=True)
+            except Exception as e:
+                result = f"Kunne ikke queue sangen: {e}"
+    elif function_name == "check_face_recognition":
+        # Sjekk om personen er registrert med face recognition
+        if vision_service and vision_service.is_connected():
+            try:
+                found, name, confidence = vision_service.check_person(timeout=2.0)
+                
+                # Name mapping
+                face_name_mapping = dict(OWNER_ALIASES)
+                
+                if found and name:
+                    mapped_name = face_name_mapping.get(name, name)
+                    result = f"recognized:{mapped_name}:{confidence:.2%}"
+                    print(f"✅ Face recognition check: Recognized {name} → {mapped_name} ({confidence:.2%})", flush=True)
+                elif found and not name:
+                    result = "unknown_person"
+                    print(f"👤 Face recognition check: Unknown person detected", flush=True)
+                else:
+                    result = "no_person"
+                    print(f"👁️ Face recognition check: No person detected", flush=True)
+            except Exception as e:
+                result = f"error:{str(e)}"
+                print(f"⚠️ Face recognition check error: {e}", flush=True)
+        else:
+            result = "error:Vision system not available"
+            print(f"⚠️ Face recognition check: Duck-Vision not connected", flush=True)
+    elif function_name == "start_face_learning":
+        # Start face learning workflow
+        name = function_args.get("name", "").strip()
+        
+        # Set global flag to trigger learning workflow
+        import chatgpt_voice
+        chatgpt_voice._waiting_for_name = True
+        
+        if name:
+            # Name already provided - skip to confirmation
+            chatgpt_voice._pending_person_name = name
+            result = f"learning_started_with_name:{name}"
+            print(f"✅ Face learning started with name: {name}", flush=True)
+        else:
+            # Will ask for name
+            result = "learning_started_ask_name"
+            print(f"✅ Face learning started - will ask for name", flush=True)
+    elif function_name == "get_technical_info":
+        # Returnerer detaljert teknisk info on-demand (spart fra system prompt)
+        try:
+            primary = None
+            if 'user_manager' in dir():
+                pass  # user_manager not available in this scope
+            creator_name = OWNER_NAME  # From config
+            result = f"""Andas tekniske oppbygning:
 
 Hardware (kroppen din):
 - Raspberry Pi 4 (hjernen) med Linux
@@ -2295,72 +2307,130 @@ Musikk: Pink Pony Club, Still Alive, Her kommer vinteren, Hun er fri, Me to går
 Skapt av {creator_name} fra bunnen av som hobbyprojekt!
 
 Viktig: Snakk om dette som kroppen din, ikke "systemet". Si "nebbet mitt" ikke "servoen"."""
-            except Exception as e:
-                result = f"Kunne ikke hente teknisk info: {e}"
-        elif function_name == "set_reminder":
-            try:
-                from src.duck_reminders import ReminderManager, REMINDER_TYPE_ALARM, REMINDER_TYPE_NORMAL
-                reminder_mgr = ReminderManager()
-                
-                message = function_args.get('message', '')
-                time_desc = function_args.get('time_description', '')
-                is_alarm = function_args.get('is_alarm', False)
-                reminder_type = REMINDER_TYPE_ALARM if is_alarm else REMINDER_TYPE_NORMAL
-                
-                # Parse tidsbeskrivelse
-                remind_at = reminder_mgr.parse_time_description(time_desc)
-                
-                if remind_at is None:
-                    result = f"Kunne ikke forstå tidspunktet '{time_desc}'. Prøv f.eks. 'om 30 minutter', 'klokka 14', 'i morgen klokka 7'."
-                else:
-                    set_result = reminder_mgr.set_reminder(
-                        message=message,
-                        remind_at=remind_at,
-                        reminder_type=reminder_type,
-                        user_name=OWNER_NAME
-                    )
-                    type_name = "alarm" if is_alarm else "påminnelse"
-                    result = f"✅ {type_name.capitalize()} satt! Jeg minner deg på '{message}' kl {set_result['remind_at_formatted']}."
-                    if is_alarm:
-                        result += " Alarmen vil vekke meg fra sovemodus hvis jeg sover."
-            except Exception as e:
-                result = f"Feil ved setting av påminnelse: {e}"
-                import traceback
-                traceback.print_exc()
-        elif function_name == "cancel_reminder":
-            try:
-                from src.duck_reminders import ReminderManager
-                reminder_mgr = ReminderManager()
-                
-                reminder_id = function_args.get('reminder_id')
-                cancel_result = reminder_mgr.cancel_reminder(reminder_id)
-                
-                if cancel_result['status'] == 'cancelled':
-                    result = f"✅ Påminnelse avbrutt: '{cancel_result['message']}'"
-                else:
-                    result = f"Fant ingen aktiv påminnelse med ID {reminder_id}"
-            except Exception as e:
-                result = f"Feil ved avbryting: {e}"
-        elif function_name == "list_reminders":
-            try:
-                from src.duck_reminders import ReminderManager
-                reminder_mgr = ReminderManager()
-                
-                pending = reminder_mgr.get_pending_reminders()
-                
-                if not pending:
-                    result = "Du har ingen aktive påminnelser eller alarmer."
-                else:
-                    lines = [f"Du har {len(pending)} aktiv(e) påminnelse(r):"]
-                    for r in pending:
-                        remind_time = datetime.fromisoformat(r['remind_at']).strftime('%d.%m kl %H:%M')
-                        type_icon = "⏰" if r['reminder_type'] == 'alarm' else "🔔"
-                        lines.append(f"  {type_icon} ID {r['id']}: '{r['message']}' - {remind_time}")
-                    result = "\n".join(lines)
-            except Exception as e:
-                result = f"Feil ved henting av påminnelser: {e}"
-        else:
-            result = "Ukjent funksjon"
+        except Exception as e:
+            result = f"Kunne ikke hente teknisk info: {e}"
+    elif function_name == "set_reminder":
+        try:
+            from src.duck_reminders import ReminderManager, REMINDER_TYPE_ALARM, REMINDER_TYPE_NORMAL
+            reminder_mgr = ReminderManager()
+            
+            message = function_args.get('message', '')
+            time_desc = function_args.get('time_description', '')
+            is_alarm = function_args.get('is_alarm', False)
+            reminder_type = REMINDER_TYPE_ALARM if is_alarm else REMINDER_TYPE_NORMAL
+            
+            # Parse tidsbeskrivelse
+            remind_at = reminder_mgr.parse_time_description(time_desc)
+            
+            if remind_at is None:
+                result = f"Kunne ikke forstå tidspunktet '{time_desc}'. Prøv f.eks. 'om 30 minutter', 'klokka 14', 'i morgen klokka 7'."
+            else:
+                set_result = reminder_mgr.set_reminder(
+                    message=message,
+                    remind_at=remind_at,
+                    reminder_type=reminder_type,
+                    user_name=OWNER_NAME
+                )
+                type_name = "alarm" if is_alarm else "påminnelse"
+                result = f"✅ {type_name.capitalize()} satt! Jeg minner deg på '{message}' kl {set_result['remind_at_formatted']}."
+                if is_alarm:
+                    result += " Alarmen vil vekke meg fra sovemodus hvis jeg sover."
+        except Exception as e:
+            result = f"Feil ved setting av påminnelse: {e}"
+            import traceback
+            traceback.print_exc()
+    elif function_name == "cancel_reminder":
+        try:
+            from src.duck_reminders import ReminderManager
+            reminder_mgr = ReminderManager()
+            
+            reminder_id = function_args.get('reminder_id')
+            cancel_result = reminder_mgr.cancel_reminder(reminder_id)
+            
+            if cancel_result['status'] == 'cancelled':
+                result = f"✅ Påminnelse avbrutt: '{cancel_result['message']}'"
+            else:
+                result = f"Fant ingen aktiv påminnelse med ID {reminder_id}"
+        except Exception as e:
+            result = f"Feil ved avbryting: {e}"
+    elif function_name == "list_reminders":
+        try:
+            from src.duck_reminders import ReminderManager
+            reminder_mgr = ReminderManager()
+            
+            pending = reminder_mgr.get_pending_reminders()
+            
+            if not pending:
+                result = "Du har ingen aktive påminnelser eller alarmer."
+            else:
+                lines = [f"Du har {len(pending)} aktiv(e) påminnelse(r):"]
+                for r in pending:
+                    remind_time = datetime.fromisoformat(r['remind_at']).strftime('%d.%m kl %H:%M')
+                    type_icon = "⏰" if r['reminder_type'] == 'alarm' else "🔔"
+                    lines.append(f"  {type_icon} ID {r['id']}: '{r['message']}' - {remind_time}")
+                result = "\n".join(lines)
+        except Exception as e:
+            result = f"Feil ved henting av påminnelser: {e}"
+    else:
+        result = "Ukjent funksjon"
+    
+    return result, force_end
+
+
+def _handle_tool_calls(tool_calls, final_messages, source, source_user_id, sms_manager, vision_service=None):
+    """
+    Håndterer alle tool calls fra ChatGPT ved å kalle riktig funksjon og legge til resultatet i messages.
+    
+    Args:
+        tool_calls: Liste med tool call objects fra ChatGPT
+        final_messages: Messages-liste å legge til resultater i
+        source: "voice" eller "sms"
+        source_user_id: ID på bruker (for SMS autorisation)
+        sms_manager: SMSManager instans
+        vision_service: DuckVisionService instans (for Duck-Vision kamera)
+    
+    Returns:
+        bool: True hvis samtalen skal tvinges avsluttet (f.eks. enable_sleep_mode)
+    """
+    force_end = False
+    for tool_call in tool_calls:
+        function_name = tool_call["function"]["name"]
+        function_args = json.loads(tool_call["function"]["arguments"])
+        
+        print(f"ChatGPT kaller funksjon: {function_name} med args: {function_args}", flush=True)
+        
+        # Sjekk autorisation for smart home-kommandoer via SMS
+        if not _check_sms_authorization(function_name, source, source_user_id, sms_manager, tool_call, final_messages):
+            continue
+        
+        # Brukes til å lære når på døgnet toolet pleier å trengs (duck_prefetch)
+        record_tool_call(function_name, function_args, source)
+        
+        # Forventet tregt tool i stemmesamtale: spill en filler-frase mens det kjører
+        # (ikke når resultatet allerede ligger i tool-cachen)
+        filler = get_filler_speech()
+        tool_cache = get_tool_cache()
+        if source == "voice" and not tool_cache.peek(function_name, function_args) and filler.maybe_play(function_name):
+            get_tracer().mark("filler_audio", tool=function_name)
+        
+        # Kall faktisk funksjon (målt som eget steg i turens trace)
+        tool_start = time.monotonic()
+        cache_status = None
+        with get_tracer().span("tool", tool=function_name):
+            if tool_cache.cacheable(function_name):
+                # Cachebare tools er rene oppslag (aldri force_end)
+                result, cache_status = tool_cache.call(
+                    function_name, function_args,
+                    lambda: _execute_tool(function_name, function_args, sms_manager, vision_service)[0]
+                )
+                tool_force_end = False
+                get_tracer().mark("tool_cache", tool=function_name, status=cache_status)
+            else:
+                result, tool_force_end = _execute_tool(function_name, function_args, sms_manager, vision_service)
+        if cache_status in (None, 'miss'):
+            # Cache-treff sier ingenting om hvor tregt toolet er
+            filler.stats.record(function_name, (time.monotonic() - tool_start) * 1000)
+        force_end = force_end or tool_force_end
         
         # Legg til tool result for denne funksjonen
         print(f"📤 Tool '{function_name}' result: {result[:200] if isinstance(result, str) else result}", flush=True)
@@ -2374,6 +2444,15 @@ Viktig: Snakk om dette som kroppen din, ikke "systemet". Si "nebbet mitt" ikke "
     return force_end
 
 
+def _tool_deadline(turn_start, source):
+    """
+    Frist (time.monotonic()) for tools i denne turen: turbudsjettet minus
+    reserven til siste LLM-runde, men alltid minst TOOL_MIN_BUDGET_S fra nå.
+    """
+    budget = TURN_BUDGET_SMS_S if source == "sms" else TURN_BUDGET_S
+    return max(turn_start + budget - TURN_LLM_RESERVE_S, time.monotonic() + TOOL_MIN_BUDGET_S)
+
+
 def chatgpt_query(messages, api_key, model=None, memory_manager=None, user_manager=None, sms_manager=None, hunger_manager=None, vision_service=None, source=None, source_user_id=None, enable_tools=True):
     """
     Spør ChatGPT med full kontekst, memory system, perspektiv-håndtering og tools.
@@ -2393,6 +2472,7 @@ def chatgpt_query(messages, api_key, model=None, memory_manager=None, user_manag
     Returns:
         tuple: (reply_text, is_thank_you) eller bare reply_text
     """
+    turn_start = time.monotonic()
     if model is None:
         model = get_settings().model
     
@@ -2415,17 +2495,20 @@ def chatgpt_query(messages, api_key, model=None, memory_manager=None, user_manag
         "Content-Type": "application/json"
     }
     
+    tracer = get_tracer()
+    
     # Bygg system prompt med _build_system_prompt()
-    system_content = _build_system_prompt(
-        user_manager=user_manager,
-        memory_manager=memory_manager,
-        hunger_manager=hunger_manager,
-        sms_manager=sms_manager,
-        model=model,
-        messages=messages,
-        current_user=current_user,
-        primary_user=primary_user
-    )
+    with tracer.span("build_system_prompt"):
+        system_content = _build_system_prompt(
+            user_manager=user_manager,
+            memory_manager=memory_manager,
+            hunger_manager=hunger_manager,
+            sms_manager=sms_manager,
+            model=model,
+            messages=messages,
+            current_user=current_user,
+            primary_user=primary_user
+        )
     
     if source == "sms":
         print(f"📋 System prompt bygget for SMS (inkluderer personlighet, lengde: {len(system_content)} tegn)", flush=True)
@@ -2445,21 +2528,12 @@ def chatgpt_query(messages, api_key, model=None, memory_manager=None, user_manag
         data["tools"] = tools
         data["tool_choice"] = "auto"  # La modellen velge når den skal bruke tools
     
-    response = requests.post(url, headers=headers, json=data)
-    
-    # Retry-logikk for API-feil (429 rate limit, 500+ server errors)
-    max_retries = 3
-    for attempt in range(max_retries):
-        if response.ok:
-            break
-        if response.status_code in (429, 500, 502, 503) and attempt < max_retries - 1:
-            import time as _time
-            wait = 2 ** attempt  # 1s, 2s, 4s
-            print(f"⚠️ OpenAI API {response.status_code}, retry {attempt+1}/{max_retries} om {wait}s...", flush=True)
-            _time.sleep(wait)
-            response = requests.post(url, headers=headers, json=data)
-        else:
-            break
+    # Pooled keep-alive-tilkobling; retry med jitter ved 429/5xx håndteres av klienten (ikke ved timeout)
+    http = get_http_client()
+    llm_timeout = (HTTP_CONNECT_TIMEOUT, HTTP_LLM_READ_TIMEOUT)
+    with tracer.span("llm_round", round=1):
+        response = http.post(url, headers=headers, json=data, retries=2, timeout=llm_timeout,
+                             retry_statuses=HTTP_RETRY_STATUSES_API)
     
     response.raise_for_status()
     response_data = response.json()
@@ -2474,28 +2548,18 @@ def chatgpt_query(messages, api_key, model=None, memory_manager=None, user_manag
         # Legg til assistant message først
         final_messages.append(message)
         
-        # Håndter alle tool calls
-        force_end = _handle_tool_calls(tool_calls, final_messages, source, source_user_id, sms_manager, vision_service)
+        # Håndter alle tool calls (innenfor turens tidsbudsjett)
+        with deadline_at(_tool_deadline(turn_start, source)):
+            force_end = _handle_tool_calls(tool_calls, final_messages, source, source_user_id, sms_manager, vision_service)
         
         # Loop for å håndtere kjede av tool calls (maks 5 runder)
         max_tool_rounds = 5
         for tool_round in range(max_tool_rounds):
             # Kall API igjen med all tool data
             data["messages"] = final_messages
-            response2 = requests.post(url, headers=headers, json=data)
-            
-            # Retry for tool follow-up call
-            for attempt in range(max_retries):
-                if response2.ok:
-                    break
-                if response2.status_code in (429, 500, 502, 503) and attempt < max_retries - 1:
-                    import time as _time
-                    wait = 2 ** attempt
-                    print(f"⚠️ OpenAI API {response2.status_code} (tool follow-up runde {tool_round+1}), retry {attempt+1}/{max_retries} om {wait}s...", flush=True)
-                    _time.sleep(wait)
-                    response2 = requests.post(url, headers=headers, json=data)
-                else:
-                    break
+            with tracer.span("llm_round", round=tool_round + 2):
+                response2 = http.post(url, headers=headers, json=data, retries=2, timeout=llm_timeout,
+                                      retry_statuses=HTTP_RETRY_STATUSES_API)
             
             # Bedre error-håndtering for debugging
             if not response2.ok:
@@ -2512,7 +2576,8 @@ def chatgpt_query(messages, api_key, model=None, memory_manager=None, user_manag
             if message2.get("tool_calls"):
                 print(f"🔗 Chained tool call (runde {tool_round+2}): {[tc['function']['name'] for tc in message2['tool_calls']]}", flush=True)
                 final_messages.append(message2)
-                force_end2 = _handle_tool_calls(message2["tool_calls"], final_messages, source, source_user_id, sms_manager, vision_service)
+                with deadline_at(_tool_deadline(turn_start, source)):
+                    force_end2 = _handle_tool_calls(message2["tool_calls"], final_messages, source, source_user_id, sms_manager, vision_service)
                 force_end = force_end or force_end2
                 continue  # Gå til neste runde
             else:
@@ -3,9 +3,9 @@ Duck AI Response Generator
 Centralized logic for generating AI responses with different contexts.
 """
 import os
-import requests
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
+from src.duck_http import get_http_client
 
 load_dotenv()
 
@@ -75,7 +75,7 @@ Kommenter bildet kort og naturlig. Hvis det er et bilde av deg, gjenkjenn deg se
 Svar kort (1-2 setninger)."""
         
         try:
-            response = requests.post(
+            response = get_http_client().post(
                 'https://api.openai.com/v1/chat/completions',
                 headers={
                     'Authorization': f'Bearer {self.api_key}',
@@ -134,7 +134,7 @@ Svar kort (1-2 setninger)."""
             user_prompt = user_query
         
         try:
-            response = requests.post(
+            response = get_http_client().post(
                 'https://api.openai.com/v1/chat/completions',
                 headers={
                     'Authorization': f'Bearer {self.api_key}',
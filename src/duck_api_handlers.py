@@ -772,6 +772,13 @@ class DuckAPIHandlers:
             
             monitoring = prusa.is_monitoring
             
+            if prusa.is_powering_on:
+                return {
+                    'status': 'starting',
+                    'monitoring': False,
+                    'message': 'Printeren starter opp...'
+                }
+            
             if not monitoring:
                 return {
                     'status': 'off',
@@ -779,7 +786,7 @@ class DuckAPIHandlers:
                     'message': 'Printeren er avslått. Skru den på for å se status.'
                 }
             
-            printer_status = prusa.get_printer_status()
+            printer_status = prusa.current_status()
             
             if not printer_status:
                 return {
@@ -848,6 +855,48 @@ class DuckAPIHandlers:
                 'message': f'Feil: {str(e)}'
             }
     
+    def handle_latency_traces(self, turns: int = 20) -> Dict[str, Any]:
+        """Per-stage p50/p95 latency and a waterfall of the last N voice turns"""
+        try:
+            from src.duck_tracing import load_recent_traces, compute_stage_stats
+            # Percentiler over et større vindu enn waterfallen
+            traces = load_recent_traces(limit=max(turns, 200))
+            return {
+                'status': 'success',
+                'turns_analyzed': len(traces),
+                'stages': compute_stage_stats(traces),
+                'waterfall': traces[-turns:] if turns > 0 else []
+            }
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+    
+    def handle_http_stats(self) -> Dict[str, Any]:
+        """Per-host request counters and latency histograms from the shared HTTP client"""
+        try:
+            return {'status': 'success', 'hosts': self._get_remote_stats('/http-stats')}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+    
+    def handle_tool_cache_stats(self) -> Dict[str, Any]:
+        """Per-tool hit rates from the tool result cache"""
+        try:
+            return dict(self._get_remote_stats('/tool-cache-stats'), status='success')
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+    
+    def handle_sms_queue_stats(self) -> Dict[str, Any]:
+        """Queue depth, backpressure and wait times from the inbound SMS worker pool"""
+        try:
+            return dict(self._get_remote_stats('/sms-queue-stats'), status='success')
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+    
+    def _get_remote_stats(self, path: str) -> dict:
+        """Hent statistikk fra chatgpt-duck sin interne API (samme server som settings)."""
+        url = SETTINGS_API_URL.rsplit('/', 1)[0] + path
+        with urllib.request.urlopen(url, timeout=2) as resp:
+            return json.loads(resp.read().decode())
+    
     def _read_temp_file(self, filename: str, default: str = '') -> str:
         """Read value from /tmp file (legacy, used for non-settings files)"""
         filepath = Path('/tmp') / filename
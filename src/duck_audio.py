@@ -18,9 +18,12 @@ import azure.cognitiveservices.speech as speechsdk
 
 from src.duck_config import (
     DEFAULT_VOICE, FADE_MS, BEAK_CHUNK_MS, BEAK_PRE_START_MS,
-    TTS_ENGINE, OPENAI_TTS_VOICE, OPENAI_TTS_MODEL, DUCK_PITCH_OCTAVES
+    TTS_ENGINE, OPENAI_TTS_VOICE, OPENAI_TTS_MODEL, DUCK_PITCH_OCTAVES,
+    PLAYBACK_POLL_S, BACKGROUND_PLAYBACK_MAX_WAIT_S, BARGE_IN_ENABLED
 )
 from src.duck_settings import get_settings
+from src.duck_tracing import get_tracer
+from src.duck_phrase_cache import get_phrase_cache
 
 
 def find_usb_microphone():
@@ -109,32 +112,62 @@ def control_beak(enabled):
         return {"status": "error", "error": str(e)}
 
 
-def speak(text, speech_config, beak):
+def speak(text, speech_config, beak, cache=False, interruptible=False):
     """
     Konverter tekst til tale ved hjelp av Azure TTS.
     Kontrollerer nebbet eller LED basert på lydamplitude.
+    
+    Args:
+        cache: Lagre ferdig lyd i frase-cachen (for korte fraser som gjentas).
+               Oppslag i cachen gjøres alltid.
+        interruptible: Lytt etter barge-in (wake word/tale) under avspilling
+    
+    Returns:
+        bool: True hvis brukeren avbrøt avspillingen (barge-in)
     """
     # La gul/lilla blinking fortsette under TTS-prosessering
     # set_red() vil stoppe blinking når lyden starter
     
     # Mute Duck-Vision mikrofon mens Samantha snakker
+    _notify_vision_speaking(True)
+    
+    try:
+        return _speak_internal(text, speech_config, beak, cache, interruptible)
+    finally:
+        # Unmute Duck-Vision mikrofon når Samantha er ferdig
+        _notify_vision_speaking(False)
+
+
+_speaking_lock = threading.Lock()
+_speaking_count = 0
+
+
+def is_speaking():
+    """True mens anda snakker (vanlig tale eller bakgrunnsfrase)."""
+    return _speaking_count > 0
+
+
+def _notify_vision_speaking(speaking):
+    """
+    Mute/unmute Duck-Vision mikrofon mens anda snakker.
+    Referansetelt, så en filler-frase som slutter ikke unmuter midt i vanlig tale.
+    """
+    global _speaking_count
+    with _speaking_lock:
+        if speaking:
+            _speaking_count += 1
+            if _speaking_count > 1:
+                return
+        else:
+            _speaking_count = max(0, _speaking_count - 1)
+            if _speaking_count > 0:
+                return
     try:
         from src.duck_services import get_services
         vision_svc = get_services().get_vision_service()
-        vision_svc.notify_speaking(True)
+        vision_svc.notify_speaking(speaking)
     except Exception:
         pass
-    
-    try:
-        _speak_internal(text, speech_config, beak)
-    finally:
-        # Unmute Duck-Vision mikrofon når Samantha er ferdig
-        try:
-            from src.duck_services import get_services
-            vision_svc = get_services().get_vision_service()
-            vision_svc.notify_speaking(False)
-        except Exception:
-            pass
 
 
 def _synthesize_azure(text, speech_config, voice_name, rate_str):
@@ -206,20 +239,73 @@ def _synthesize_openai(text, speed_factor=1.0):
         return None, False
 
 
-def _speak_internal(text, speech_config, beak):
+def _speak_internal(text, speech_config, beak, cache=False, interruptible=False):
     """Internal TTS implementation. Supports Azure and OpenAI TTS engines."""
+    # Hent alle TTS-settings atomisk fra DuckSettings
+    tts = get_settings().get_tts_settings()
+    
+    # Ferdig andifisert lyd fra frase-cachen (millisekunder, virker uten nett)
+    phrase_cache = get_phrase_cache()
+    rendered = phrase_cache.get(clean_markdown_for_tts(text), tts)
+    if rendered is not None:
+        print(f"⚡ Frase-cache treff: {text[:40]}", flush=True)
+        get_tracer().mark("phrase_cache_hit")
+    else:
+        rendered = render_speech(text, speech_config, tts)
+        if rendered is None:
+            return False
+        if cache:
+            phrase_cache.put(clean_markdown_for_tts(text), tts, *rendered)
+    samples, framerate = rendered
+    
+    # Aldri snakk oppå en filler-frase som fortsatt spilles
+    wait_for_background_playback()
+    volume_gain = _volume_gain(tts)
+    
+    if not (interruptible and BARGE_IN_ENABLED):
+        _play_samples(samples, framerate, beak, tts['beak_enabled'], volume_gain)
+        return False
+    
+    # Barge-in: lytt på mikrofonen med det som spilles som ekko-referanse
+    from src.duck_barge_in import BargeInDetector
+    stop_event = threading.Event()
+    detector = BargeInDetector(samples * volume_gain, framerate, stop_event)
+    try:
+        _play_samples(samples, framerate, beak, tts['beak_enabled'], volume_gain,
+                      stop_event=stop_event, on_playback_start=detector.start)
+    finally:
+        detector.stop()
+    if detector.triggered:
+        get_tracer().mark("barge_in", reason=detector.reason)
+    return detector.triggered
+
+
+def _volume_gain(tts):
+    """Konverter volume_value (0-100) til gain multiplier (0.0-2.0, hvor 1.0 = normal)."""
+    return tts['volume'] / 50.0
+
+
+def render_speech(text, speech_config, tts=None):
+    """
+    Syntetiser og andifiser tekst uten å spille den av.
+    
+    Args:
+        tts: TTS-settings fra DuckSettings.get_tts_settings() (hentes hvis None)
+    
+    Returns:
+        tuple: (samples, framerate) eller None hvis syntesen feilet
+    """
     # Fjern Markdown-formatering før TTS
     text = clean_markdown_for_tts(text)
     
-    # Hent alle TTS-settings atomisk fra DuckSettings
-    tts = get_settings().get_tts_settings()
+    if tts is None:
+        tts = get_settings().get_tts_settings()
     voice_name = tts['voice']
     beak_enabled = tts['beak_enabled']
     speed_value = tts['speed']
     volume_value = tts['volume']
     
-    # Konverter volume_value (0-100) til gain multiplier (0.0-2.0, hvor 1.0 = normal)
-    volume_gain = volume_value / 50.0
+    volume_gain = _volume_gain(tts)
     
     # Konverter speed_value (0-100) til rate percentage
     # 0 = -50%, 50 = 0%, 100 = +50%
@@ -242,17 +328,22 @@ def _speak_internal(text, speech_config, beak):
         openai_speed = max(0.25, min(4.0, openai_speed))  # Clamp til OpenAI-grenser
         
         print(f"Bruker OpenAI TTS: voice={OPENAI_TTS_VOICE}, Nebbet: {'på' if beak_enabled else 'av'}, Hastighet: {openai_speed:.2f}x (kompensert for {DUCK_PITCH_OCTAVES} okt pitch), Volum: {volume_value}% (gain: {volume_gain:.2f})", flush=True)
-        wav_path, success = _synthesize_openai(text, speed_factor=openai_speed)
+        with get_tracer().span("tts_synthesis", engine='openai', chars=len(text)):
+            wav_path, success = _synthesize_openai(text, speed_factor=openai_speed)
     else:
         print(f"Bruker Azure TTS: voice={voice_name}, Nebbet: {'på' if beak_enabled else 'av'}, Hastighet: {rate_str}, Volum: {volume_value}% (gain: {volume_gain:.2f})", flush=True)
-        wav_path, success = _synthesize_azure(text, speech_config, voice_name, rate_str)
+        with get_tracer().span("tts_synthesis", engine='azure', chars=len(text)):
+            wav_path, success = _synthesize_azure(text, speech_config, voice_name, rate_str)
     
     if not success or not wav_path:
         print("TTS-syntese feilet.", flush=True)
-        return
+        return None
     
     try:
-        _process_and_play(wav_path, beak, beak_enabled, volume_gain)
+        dsp_start = time.monotonic()
+        samples, framerate = _process_audio(wav_path)
+        get_tracer().record_span("dsp", dsp_start)
+        return samples, framerate
     finally:
         # Rydd opp WAV-fil
         try:
@@ -262,8 +353,14 @@ def _speak_internal(text, speech_config, beak):
             pass
 
 
-def _process_and_play(wav_path, beak, beak_enabled, volume_gain):
-    """Andifiser og spill av WAV-fil med nebb/LED-synkronisering."""
+def _process_audio(wav_path):
+    """
+    Andifiser WAV-fil (normalisering, pitch-shift, fade).
+    Volum legges på ved avspilling, så resultatet kan caches uavhengig av volum.
+    
+    Returns:
+        tuple: (samples, framerate) - float32 mono samples i 48 kHz
+    """
     # Last inn original lyd
     sound = AudioSegment.from_wav(wav_path)
     
@@ -303,15 +400,6 @@ def _process_and_play(wav_path, beak, beak_enabled, volume_gain):
         print(f"Peak: {peak:.2f} - normaliserer for å unngå clipping", flush=True)
         samples = samples / peak * 0.95
     
-    # Anvend volum (gain multiplier fra volume_value)
-    samples = samples * volume_gain
-    
-    # Sjekk igjen for clipping etter volum
-    peak_after = np.max(np.abs(samples))
-    if peak_after > 1.0:
-        print(f"Clipping detektert ({peak_after:.2f}) - reduserer volum", flush=True)
-        samples = np.clip(samples, -0.99, 0.99)
-    
     # Legg til fade-in/fade-out for å redusere knepp ved start/slutt
     if FADE_MS > 0:
         fade_samples = int(framerate * FADE_MS / 1000.0)
@@ -332,8 +420,41 @@ def _process_and_play(wav_path, beak, beak_enabled, volume_gain):
         samples = resample(samples, num_samples_new)
         framerate = target_rate
     
+    return samples, framerate
+
+
+def _apply_volume(samples, volume_gain):
+    """Anvend volum (gain multiplier fra volume_value) og klipp til ±0.99."""
+    samples = samples * volume_gain
+    
+    # Sjekk igjen for clipping etter volum
+    peak_after = np.max(np.abs(samples)) if len(samples) else 0.0
+    if peak_after > 1.0:
+        print(f"Clipping detektert ({peak_after:.2f}) - reduserer volum", flush=True)
+        samples = np.clip(samples, -0.99, 0.99)
+    return samples
+
+
+
+
+def _play_samples(samples, framerate, beak, beak_enabled, volume_gain=1.0, stop_event=None, on_playback_start=None):
+    """
+    Spill av andifiserte samples med aplay og nebb/LED-synkronisering.
+    
+    Args:
+        volume_gain: Volum-multiplikator (1.0 = normal)
+        stop_event: Valgfri threading.Event - avbryter avspillingen når den settes
+        on_playback_start: Kalles rett etter at aplay er startet (f.eks. barge-in)
+    
+    Returns:
+        bool: True hvis avspillingen gikk til slutt uten å bli avbrutt
+    """
+    tracer = get_tracer()
+    samples = _apply_volume(samples, volume_gain)
+    
     # Bruk aplay med dmixer (definert i ~/.asoundrc) for click/pop reduction
     stream_started = False
+    interrupted = False
     
     try:
         # Konverter float32 samples til int16 og lag stereo
@@ -411,20 +532,36 @@ def _process_and_play(wav_path, beak, beak_enabled, volume_gain):
             process = subprocess.Popen(['aplay', '-q', tmpwav.name], 
                                       stdout=subprocess.PIPE, 
                                       stderr=subprocess.PIPE)
+            playback_start = time.monotonic()
+            tracer.mark("first_audio")
+            if on_playback_start:
+                on_playback_start()
             
             # Vent på at aplay er ferdig (med timeout)
             # Beregn forventet varighet basert på lydlengde + 5 sekunder buffer
             expected_duration = len(samples) / framerate
             timeout = expected_duration + 5.0
+            deadline = playback_start + timeout
             
-            try:
-                process.wait(timeout=timeout)
-                stream_started = True
-            except subprocess.TimeoutExpired:
-                print(f"⚠️ aplay timeout etter {timeout:.1f}s - dreper prosess", flush=True)
-                process.kill()
-                process.wait()  # Vent på at den faktisk dør
-                stream_started = False
+            while True:
+                try:
+                    process.wait(timeout=PLAYBACK_POLL_S if stop_event else timeout)
+                    stream_started = True
+                    break
+                except subprocess.TimeoutExpired:
+                    if stop_event is not None and stop_event.is_set():
+                        interrupted = True
+                        process.kill()
+                        process.wait()
+                        break
+                    if stop_event is None or time.monotonic() >= deadline:
+                        print(f"⚠️ aplay timeout etter {timeout:.1f}s - dreper prosess", flush=True)
+                        process.kill()
+                        process.wait()  # Vent på at den faktisk dør
+                        stream_started = False
+                        break
+            
+            tracer.record_span("playback", playback_start)
             
             # Stopp nebb/LED-thread
             control_stop.set()
@@ -434,7 +571,7 @@ def _process_and_play(wav_path, beak, beak_enabled, volume_gain):
             
             if process.returncode == 0:
                 stream_started = True
-            elif process.returncode != -9:  # -9 = SIGKILL (vår timeout)
+            elif process.returncode != -9:  # -9 = SIGKILL (vår timeout/avbrudd)
                 try:
                     stderr = process.stderr.read().decode()
                     if stderr:
@@ -445,8 +582,92 @@ def _process_and_play(wav_path, beak, beak_enabled, volume_gain):
     except Exception as e:
         print(f"dmixer playback error: {e}")
     
-    if not stream_started:
+    if not stream_started and not interrupted:
         print("Kunne ikke starte lydstrøm. Avslutter tale-funksjon uten å spille av.")
     
     if beak:  # Kun hvis servo er tilgjengelig
         beak.open_pct(0.05)  # Minst 5% åpen når ferdig
+    
+    return stream_started and not interrupted
+
+
+# ═══════════════════════════════════════════════════════════════
+# Bakgrunnsavspilling (filler-fraser mens trege tools kjører)
+# ═══════════════════════════════════════════════════════════════
+
+_background_lock = threading.Lock()
+_background_thread = None
+_background_stop = threading.Event()
+
+
+def play_in_background(samples, framerate, beak, beak_enabled=None, on_finished=None):
+    """
+    Spill av ferdig prosesserte samples i en bakgrunnstråd.
+    
+    Brukes for korte filler-fraser. Vanlig tale (speak) venter automatisk
+    til bakgrunnsavspillingen er ferdig, så de aldri overlapper.
+    
+    Args:
+        on_finished: Kalles når avspillingen er ferdig (ikke ved avbrudd),
+                     før ventende tale slippes til
+    
+    Returns:
+        bool: False hvis noe allerede spilles i bakgrunnen
+    """
+    global _background_thread
+    tts = get_settings().get_tts_settings()
+    if beak_enabled is None:
+        beak_enabled = tts['beak_enabled']
+    
+    with _background_lock:
+        if _background_thread is not None and _background_thread.is_alive():
+            return False
+        _background_stop.clear()
+        _background_thread = threading.Thread(
+            target=_play_background,
+            args=(samples, framerate, beak, beak_enabled, _volume_gain(tts), _background_stop, on_finished),
+            daemon=True,
+            name="duck-background-playback"
+        )
+        _background_thread.start()
+        return True
+
+
+def _play_background(samples, framerate, beak, beak_enabled, volume_gain, stop_event, on_finished):
+    _notify_vision_speaking(True)
+    try:
+        completed = _play_samples(samples, framerate, beak, beak_enabled, volume_gain, stop_event)
+        if completed and on_finished:
+            on_finished()
+    except Exception as e:
+        print(f"⚠️ Bakgrunnsavspilling feilet: {e}", flush=True)
+    finally:
+        _notify_vision_speaking(False)
+
+
+def is_background_playing():
+    """True hvis en bakgrunnsavspilling pågår."""
+    thread = _background_thread
+    return thread is not None and thread.is_alive()
+
+
+def wait_for_background_playback(timeout=BACKGROUND_PLAYBACK_MAX_WAIT_S):
+    """
+    Vent til bakgrunnsavspilling er ferdig. Avbryter den hvis den
+    fortsatt spiller etter `timeout` sekunder.
+    """
+    thread = _background_thread
+    if thread is None or not thread.is_alive():
+        return
+    thread.join(timeout=timeout)
+    if thread.is_alive():
+        stop_background_playback()
+
+
+def stop_background_playback():
+    """Avbryt pågående bakgrunnsavspilling umiddelbart."""
+    thread = _background_thread
+    if thread is None or not thread.is_alive():
+        return
+    _background_stop.set()
+    thread.join(timeout=1.0)
@@ -0,0 +1,215 @@
+"""
+Barge-in — la brukeren avbryte anda mens den snakker.
+
+Mens speak() spiller av et svar, lytter BargeInDetector på USB-mikrofonen.
+Andas egen stemme lekker inn i mikrofonen, så vi trekker fra forventet ekko:
+energien i referansesignalet (samplene som spilles av akkurat nå) ganget med
+en lært koblingsfaktor høyttaler → mikrofon. Det som er igjen er brukerens tale.
+
+Avbrudd utløses av:
+- Wake word (Porcupine/OpenWakeWord, samme modell som wake word-loopen) når
+  mikrofonen samtidig er over forventet ekko
+- Vedvarende tale-energi over ekkoet i BARGE_IN_SUSTAIN_MS
+
+Ved avbrudd settes stopp-signalet til _play_samples(), som dreper aplay innen
+PLAYBACK_POLL_S (50 ms) og lukker nebbet.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+import sounddevice as sd
+
+from src.duck_config import (
+    WAKE_WORD_ENGINE, WAKE_WORD_MODEL_PATH, WAKE_WORD_SENSITIVITY, WAKE_WORD_THRESHOLD,
+    DUCK_NAME, BARGE_IN_BLOCK_MS, BARGE_IN_SUSTAIN_MS, BARGE_IN_ENERGY_THRESHOLD,
+    BARGE_IN_ECHO_MARGIN, BARGE_IN_GRACE_MS, BARGE_IN_REFERENCE_WINDOW_MS
+)
+
+MIC_SAMPLE_RATE = 48000
+DOWNSAMPLE_RATIO = 3  # 48 kHz -> 16 kHz for wake word-modellene
+
+# Koblingsfaktor høyttaler → mikrofon (RMS-forhold), lært på tvers av avspillinger
+_coupling = None
+_coupling_lock = threading.Lock()
+
+# Wake word-modellen lastes én gang og gjenbrukes
+_wake_probe = None
+_wake_probe_lock = threading.Lock()
+_wake_probe_failed = False
+
+
+def _create_wake_word_probe() -> Optional[Callable[[np.ndarray], bool]]:
+    """
+    Lag en wake word-sjekk som tar 16 kHz int16-samples og returnerer True ved treff.
+    Returnerer None hvis modellen ikke kan lastes (barge-in bruker da kun energi).
+    """
+    try:
+        if WAKE_WORD_ENGINE == 'openwakeword':
+            from openwakeword.model import Model
+            model = Model(wakeword_model_paths=[WAKE_WORD_MODEL_PATH])
+            frame_length = 1280  # 80 ms @ 16 kHz
+
+            def predict(frame):
+                prediction = model.predict(frame)
+                return prediction.get(DUCK_NAME, 0.0) >= WAKE_WORD_THRESHOLD
+        else:
+            import pvporcupine
+            access_key = os.getenv('PICOVOICE_API_KEY')
+            if not access_key or not os.path.exists(WAKE_WORD_MODEL_PATH):
+                return None
+            porcupine = pvporcupine.create(
+                access_key=access_key,
+                keyword_paths=[WAKE_WORD_MODEL_PATH],
+                sensitivities=[WAKE_WORD_SENSITIVITY]
+            )
+            frame_length = porcupine.frame_length
+
+            def predict(frame):
+                return porcupine.process(frame) >= 0
+    except Exception as e:
+        print(f"⚠️ Barge-in: wake word-modell utilgjengelig, bruker kun energi ({e})", flush=True)
+        return None
+
+    buffer = np.zeros(0, dtype=np.int16)
+
+    def probe(pcm_16k: np.ndarray) -> bool:
+        nonlocal buffer
+        buffer = np.concatenate([buffer, pcm_16k])
+        hit = False
+        while len(buffer) >= frame_length:
+            frame, buffer = buffer[:frame_length], buffer[frame_length:]
+            hit = predict(frame) or hit
+        return hit
+
+    def reset():
+        nonlocal buffer
+        buffer = np.zeros(0, dtype=np.int16)
+
+    probe.reset = reset
+    return probe
+
+
+def _get_wake_word_probe():
+    global _wake_probe, _wake_probe_failed
+    if _wake_probe is None and not _wake_probe_failed:
+        with _wake_probe_lock:
+            if _wake_probe is None and not _wake_probe_failed:
+                _wake_probe = _create_wake_word_probe()
+                _wake_probe_failed = _wake_probe is None
+    return _wake_probe
+
+
+class BargeInDetector:
+    """
+    Lytter etter brukertale under avspilling av `reference` og setter
+    `stop_event` når brukeren avbryter.
+
+    Bruk:
+        detector = BargeInDetector(samples, framerate, stop_event)
+        _play_samples(..., stop_event=stop_event, on_playback_start=detector.start)
+        detector.stop()
+        if detector.triggered: ...
+    """
+
+    def __init__(self, reference: np.ndarray, framerate: int, stop_event: threading.Event, device=None):
+        self.stop_event = stop_event
+        self.triggered = False
+        self.reason = None
+        self._device = device
+        self._done = threading.Event()
+        self._thread = None
+        self._start_time = None
+
+        # Referanse-energi per blokk (samme oppløsning som mikrofonblokkene)
+        block = max(1, int(framerate * BARGE_IN_BLOCK_MS / 1000.0))
+        n_blocks = max(1, int(np.ceil(len(reference) / block)))
+        padded = np.zeros(n_blocks * block, dtype=np.float32)
+        padded[:len(reference)] = reference
+        self._ref_rms = np.sqrt(np.mean(padded.reshape(n_blocks, block) ** 2, axis=1))
+        self._ref_window = max(1, int(BARGE_IN_REFERENCE_WINDOW_MS / BARGE_IN_BLOCK_MS))
+
+    def start(self):
+        self._start_time = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="barge-in")
+        self._thread.start()
+
+    def stop(self):
+        """Stopp lyttingen og lukk mikrofonen (før STT åpner den igjen)."""
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _expected_echo(self, elapsed_s: float) -> float:
+        """Høyeste referanse-energi rundt nåværende avspillingsposisjon."""
+        idx = int(elapsed_s * 1000 / BARGE_IN_BLOCK_MS)
+        lo = max(0, idx - self._ref_window)
+        hi = min(len(self._ref_rms), idx + self._ref_window + 1)
+        if lo >= hi:
+            return 0.0
+        return float(np.max(self._ref_rms[lo:hi]))
+
+    def _trigger(self, reason: str):
+        self.triggered = True
+        self.reason = reason
+        self.stop_event.set()
+        print(f"✋ Barge-in ({reason}) - stopper avspilling", flush=True)
+
+    def _run(self):
+        global _coupling
+        block_size = int(MIC_SAMPLE_RATE * BARGE_IN_BLOCK_MS / 1000.0)
+        sustain_blocks = max(1, int(BARGE_IN_SUSTAIN_MS / BARGE_IN_BLOCK_MS))
+        grace_s = BARGE_IN_GRACE_MS / 1000.0
+        probe = _get_wake_word_probe()
+        if probe is not None:
+            probe.reset()  # Ikke la lyd fra forrige avspilling henge igjen
+
+        with _coupling_lock:
+            coupling = _coupling
+        ratios = []
+        above = 0
+
+        try:
+            if self._device is None:
+                from src.duck_audio import find_usb_microphone
+                self._device = find_usb_microphone()
+            with sd.RawInputStream(samplerate=MIC_SAMPLE_RATE, blocksize=block_size,
+                                   dtype='int16', channels=1, device=self._device) as stream:
+                while not self._done.is_set() and not self.stop_event.is_set():
+                    data, _ = stream.read(block_size)
+                    pcm = np.frombuffer(data, dtype=np.int16)
+                    mic_rms = float(np.sqrt(np.mean((pcm.astype(np.float32) / 32768.0) ** 2)))
+                    elapsed = time.monotonic() - self._start_time
+                    ref_rms = self._expected_echo(elapsed)
+
+                    # Første del av avspillingen: lær koblingsfaktoren (ingen avbrudd)
+                    if elapsed < grace_s:
+                        if ref_rms > 0.01:
+                            ratios.append(mic_rms / ref_rms)
+                        continue
+                    if ratios:
+                        measured = float(np.median(ratios))
+                        coupling = measured if coupling is None else 0.8 * coupling + 0.2 * measured
+                        ratios = []
+
+                    echo = (coupling or 0.0) * ref_rms * BARGE_IN_ECHO_MARGIN
+                    residual = mic_rms - echo
+                    above = above + 1 if residual > BARGE_IN_ENERGY_THRESHOLD else 0
+
+                    if probe is not None and probe(pcm[::DOWNSAMPLE_RATIO]) and residual > 0:
+                        self._trigger("wake word")
+                        break
+                    if above >= sustain_blocks:
+                        self._trigger("tale")
+                        break
+        except Exception as e:
+            print(f"⚠️ Barge-in lytting feilet: {e}", flush=True)
+            return
+
+        # Husk koblingen til neste avspilling (kun fra avspillinger uten avbrudd)
+        if coupling is not None and not self.triggered:
+            with _coupling_lock:
+                _coupling = coupling
@@ -0,0 +1,275 @@
+"""
+Circuit breakers og endepunktvalg for integrasjoner.
+
+En tjeneste som er nede kostet tidligere full timeout på hver stemme-tur
+(HA lokal 3 s + cloud 10 s, MET, Entur, NRK, Netatmo ...). Nå har hver
+host en CircuitBreaker som DuckHttpClient sjekker før hvert kall:
+
+- closed: kall går som normalt; CIRCUIT_FAILURE_THRESHOLD feil på rad → open
+- open: kall feiler umiddelbart med CircuitOpenError (tool-cachen svarer da
+  med siste kjente resultat); etter CIRCUIT_RESET_TIMEOUT_S → half-open
+- half-open: ett prøvekall slippes gjennom; lykkes det → closed, ellers open
+  igjen med dobbel pause (maks CIRCUIT_RESET_MAX_S)
+- Latency-EWMA per host brukes til adaptive timeouts
+
+EndpointSelector velger mellom alternative endepunkter for samme tjeneste
+(HA lokal/cloud) ut fra breaker-tilstand, og kan kjøre helsesjekker i
+bakgrunnen så en tjeneste som kommer tilbake oppdages uten at en bruker
+må vente på prøvekallet.
+
+Bruk:
+    from src.duck_circuit import get_breaker, EndpointSelector
+
+    breaker = get_breaker("https://api.met.no")
+    if breaker.allow():
+        ...  # breaker.record_success(ms) / breaker.record_failure()
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from src.duck_config import (
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT_S, CIRCUIT_RESET_MAX_S, CIRCUIT_EWMA_ALPHA,
+    CIRCUIT_TIMEOUT_FACTOR, CIRCUIT_MIN_TIMEOUT_S, HEALTH_PROBE_INTERVAL_S
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Kallet ble ikke forsøkt fordi hosten regnes som nede."""
+
+
+def host_key(url: str) -> str:
+    """https://api.met.no/weatherapi/... → https://api.met.no"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitBreaker:
+    """Breaker for én host med latency-EWMA. Trådsikker."""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout_s: float = CIRCUIT_RESET_TIMEOUT_S):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = reset_timeout_s
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._ewma_ms: Optional[float] = None
+        self._opens = 0
+
+    def _current_state(self) -> str:
+        """Tilstand med open → half-open når pausen er over. Kalles med lock."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self._open_for:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    @property
+    def ewma_ms(self) -> Optional[float]:
+        with self._lock:
+            return self._ewma_ms
+
+    def allow(self) -> bool:
+        """Skal et kall forsøkes nå? I half-open slippes kun ett prøvekall om gangen."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            now = time.monotonic()
+            # Et prøvekall som aldri rapporterte tilbake blokkerer ikke for alltid
+            if state == HALF_OPEN and (not self._trial_in_flight or now - self._trial_started > self.reset_timeout_s):
+                self._trial_in_flight = True
+                self._trial_started = now
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        """Sekunder til neste prøvekall (0 hvis ikke open)."""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self._open_for - (time.monotonic() - self._opened_at))
+
+    def record_success(self, latency_ms: float = None):
+        with self._lock:
+            if latency_ms is not None:
+                self._ewma_ms = latency_ms if self._ewma_ms is None else \
+                    CIRCUIT_EWMA_ALPHA * latency_ms + (1 - CIRCUIT_EWMA_ALPHA) * self._ewma_ms
+            recovered = self._state != CLOSED
+            self._state = CLOSED
+            self._failures = 0
+            self._open_for = self.reset_timeout_s
+            self._trial_in_flight = False
+        if recovered:
+            print(f"✅ Circuit {self.name}: svarer igjen (closed)", flush=True)
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            self._trial_in_flight = False
+            if state == HALF_OPEN:
+                # Prøvekallet feilet - vent dobbelt så lenge neste gang
+                self._open_for = min(self._open_for * 2, CIRCUIT_RESET_MAX_S)
+            elif state == OPEN or self._failures < self.failure_threshold:
+                return
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._opens += 1
+            open_for = self._open_for
+        print(f"⚡ Circuit {self.name}: nede, nye kall feiler raskt i {open_for:.0f}s (open)", flush=True)
+
+    def timeout_for(self, max_timeout: float) -> float:
+        """Adaptiv timeout: EWMA × CIRCUIT_TIMEOUT_FACTOR, innenfor [CIRCUIT_MIN_TIMEOUT_S, max_timeout]."""
+        ewma = self.ewma_ms
+        if ewma is None:
+            return max_timeout
+        return min(max_timeout, max(CIRCUIT_MIN_TIMEOUT_S, ewma / 1000 * CIRCUIT_TIMEOUT_FACTOR))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'opens': self._opens,
+                'retry_in_s': round(max(0.0, self._open_for - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else 0.0,
+                'ewma_ms': round(self._ewma_ms, 1) if self._ewma_ms is not None else None,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Hent (eller opprett) breakeren for en host/tjeneste."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def drop_breaker(name: str):
+    """
+    Glem breakeren for en host (DuckHttpClient kaster sessionen for hosten).
+    En host som er nede (open/half-open) beholdes, så den fortsatt feiler raskt.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is not None and breaker.state == CLOSED:
+            del _breakers[name]
+
+
+def find_breaker(name: str) -> Optional[CircuitBreaker]:
+    """Breakeren for en host hvis den finnes (oppretter ikke)."""
+    with _breakers_lock:
+        return _breakers.get(name)
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.to_dict() for name, breaker in sorted(breakers.items())}
+
+
+class EndpointSelector:
+    """
+    Velger blant alternative endepunkter (i prioritert rekkefølge) for én
+    tjeneste. Deler breakere med DuckHttpClient (én per host).
+    """
+
+    _STATE_RANK = {CLOSED: 0, HALF_OPEN: 1}
+
+    def __init__(self, name: str, endpoints: List[Tuple[str, str]],
+                 probe: Callable[[str, float], bool] = None,
+                 probe_interval_s: float = HEALTH_PROBE_INTERVAL_S):
+        """
+        Args:
+            name: Tjenestenavn (for logging)
+            endpoints: [(label, base_url), ...] i foretrukket rekkefølge
+            probe: probe(base_url, timeout) → True hvis endepunktet svarer
+            probe_interval_s: Hvor ofte bakgrunnssjekken kjører
+        """
+        self.name = name
+        self.endpoints = [(label, url) for label, url in endpoints if url]
+        self.probe = probe
+        self.probe_interval_s = probe_interval_s
+        self._thread = None
+        self._stop = threading.Event()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        return get_breaker(host_key(url))
+
+    def candidates(self) -> List[Tuple[str, str]]:
+        """Endepunkter som kan forsøkes nå: closed før half-open, open utelates."""
+        ranked = []
+        for order, (label, url) in enumerate(self.endpoints):
+            rank = self._STATE_RANK.get(self.breaker(url).state)
+            if rank is not None:
+                ranked.append((rank, order, label, url))
+        return [(label, url) for _, _, label, url in sorted(ranked)]
+
+    def best(self) -> Optional[Tuple[str, str]]:
+        candidates = self.candidates()
+        return candidates[0] if candidates else None
+
+    def timeout_for(self, url: str, max_timeout: float) -> float:
+        return self.breaker(url).timeout_for(max_timeout)
+
+    # ── Helsesjekk i bakgrunnen ──────────────────────────────
+
+    def probe_once(self):
+        """Sjekk alle endepunkter og oppdater breakerne (også open - det er hele poenget)."""
+        for label, url in self.endpoints:
+            breaker = self.breaker(url)
+            start = time.monotonic()
+            try:
+                ok = self.probe(url, self.timeout_for(url, 5.0))
+            except Exception:
+                ok = False
+            if ok:
+                breaker.record_success((time.monotonic() - start) * 1000)
+            else:
+                breaker.record_failure()
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            self.probe_once()
+            self._stop.wait(self.probe_interval_s)
+
+    def start_probes(self) -> bool:
+        if self.probe is None or not self.endpoints:
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._probe_loop, daemon=True,
+                                            name=f"health-probe-{self.name}")
+            self._thread.start()
+        return True
+
+    def stop_probes(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {label: dict(self.breaker(url).to_dict(), url=url) for label, url in self.endpoints}
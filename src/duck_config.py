@@ -85,6 +85,12 @@ SAMANTHA_IDENTITY_FILE = DUCK_IDENTITY_FILE
 # Database path
 DB_PATH = os.path.join(BASE_PATH, "duck_memory.db")
 
+# Latency-tracing (én JSON-linje per stemme-tur, roteres automatisk)
+LOGS_DIR = os.path.join(BASE_PATH, "logs")
+TRACE_FILE = os.path.join(LOGS_DIR, "turn_traces.jsonl")
+TRACE_FILE_MAX_BYTES = 2 * 1024 * 1024  # 2 MB per fil
+TRACE_FILE_BACKUPS = 1
+
 # Wake word path (backward compat)
 WAKE_WORD_PATH = WAKE_WORD_MODEL_PATH
 
@@ -139,12 +145,133 @@ FADE_MS = 150  # 150ms fade in/out
 BEAK_CHUNK_MS = 30  # Hvor ofte nebbet oppdateres (mindre = mer responsivt)
 BEAK_PRE_START_MS = 0  # Start nebb før aplay (negativ = etter aplay starter)
 
+# Avspilling som kan avbrytes (filler-fraser) sjekker stopp-signal så ofte
+PLAYBACK_POLL_S = 0.05
+# Maks tid vanlig tale venter på en bakgrunnsfrase før den avbrytes
+BACKGROUND_PLAYBACK_MAX_WAIT_S = 4.0
+
+# ============ Barge-in (avbryt anda mens den snakker) ============
+BARGE_IN_ENABLED = os.getenv('BARGE_IN_ENABLED', 'true').lower() == 'true'
+BARGE_IN_BLOCK_MS = 20  # Mikrofonblokk (og oppløsning på referanse-energi)
+BARGE_IN_SUSTAIN_MS = 300  # Hvor lenge tale over ekkoet må vare før avbrudd
+BARGE_IN_ENERGY_THRESHOLD = float(os.getenv('BARGE_IN_ENERGY_THRESHOLD', '0.03'))  # RMS over forventet ekko
+BARGE_IN_ECHO_MARGIN = 1.5  # Sikkerhetsmargin på forventet ekko fra egen stemme
+BARGE_IN_GRACE_MS = 400  # Start av avspilling: lær ekko-koblingen, ingen avbrudd
+BARGE_IN_REFERENCE_WINDOW_MS = 60  # ± vindu rundt avspillingsposisjon (dekker lydforsinkelse)
+
+# ============ Phrase Cache (ferdig andifisert lyd på disk) ============
+# Korte, gjentatte fraser ("Ja?", hilsener, påminnelser) caches som PCM,
+# nøklet på hash(tekst, stemme, hastighet, pitch, engine)
+PHRASE_CACHE_DIR = os.path.join(BASE_PATH, "cache", "phrases")
+PHRASE_CACHE_MAX_BYTES = int(os.getenv('PHRASE_CACHE_MAX_MB', '64')) * 1024 * 1024
+# Fraser som alltid pre-rendres ved oppstart og etter stemmebytte
+PHRASE_CACHE_PRERENDER = [
+    "Ja?",
+    "Gææææsp! Nå er jeg våken igjen!",
+]
+
+# ============ Filler Speech (latency-maskering) ============
+# Korte fraser som spilles mens et tool som forventes å være tregt kjører
+FILLER_ENABLED = os.getenv('FILLER_ENABLED', 'true').lower() == 'true'
+FILLER_THRESHOLD_MS = int(os.getenv('FILLER_THRESHOLD_MS', '1500'))  # Forventet tool-tid før filler spilles
+FILLER_LATENCY_WINDOW = 20  # Antall siste kall per tool i rullende statistikk
+FILLER_MIN_SAMPLES = 3  # Minimum målinger før statistikken overstyrer startverdiene
+FILLER_PHRASES = [
+    "La meg sjekke...",
+    "Et øyeblikk...",
+    "Vent litt, jeg ser etter...",
+    "Hmm, la meg finne ut av det...",
+]
+# Startverdier (ms) for tools vi vet er trege, før vi har egne målinger
+FILLER_TOOL_PRIORS_MS = {
+    "web_search": 4000,
+    "plan_journey": 2500,
+    "get_olympics_medal_details": 3000,
+    "analyze_scene": 5000,
+}
+
+# ============ Tool Result Cache ============
+# Identiske tool-kall (samme tool + normaliserte args) gjenbruker resultatet
+TOOL_CACHE_ENABLED = os.getenv('TOOL_CACHE_ENABLED', 'true').lower() == 'true'
+TOOL_CACHE_PERSIST = os.getenv('TOOL_CACHE_PERSIST', 'true').lower() == 'true'  # Overlever restart (SQLite)
+TOOL_CACHE_MAX_ENTRIES = 256
+# tool → (ttl_s, stale_s). Innenfor ttl: treff. Innenfor ttl + stale: svar
+# umiddelbart med gammelt resultat og oppdater i bakgrunnen.
+# get_weather bruker MET sin Expires-header, get_electricity_price timen/døgnet.
+# Nyhetsverktøyene leser fra den lokale RSS-butikken (duck_news) og caches ikke.
+TOOL_CACHE_TTLS = {
+    "get_weather": (1800, 1800),
+    "get_electricity_price": (3600, 120),
+    "get_football_info": (600, 1800),
+    "get_olympics_medals": (600, 1800),
+    "wikipedia_lookup": (86400, 6 * 86400),
+    "get_departures": (30, 30),
+    "get_netatmo_temperature": (120, 300),  # Modulene rapporterer hvert ~5. min
+}
+# Tool-resultater som starter slik er feilmeldinger eller "fant ikke"-svar og
+# caches ikke (ellers huskes f.eks. en bom i wikipedia_lookup i opptil 7 dager)
+TOOL_CACHE_ERROR_PREFIXES = ("❌", "Beklager", "Kunne ikke", "Feil ved", "Fant ingen", "Fant ikke", "Ingen")
+# Når et tool feiler (f.eks. åpen circuit breaker) svares det med siste kjente
+# resultat hvis det ikke er mer enn så gammelt utover stale-vinduet.
+# tool → sekunder; 0 (eller mangler) = ingen reserve. Tidsrelative svar
+# ("om 4 min", "prisen nå") blir feil etter kort tid og skal heller gi feilen.
+TOOL_CACHE_FALLBACK_MAX_AGE_S = {
+    "get_weather": 6 * 3600,
+    "get_electricity_price": 0,  # Gjelder timen/døgnet det ble hentet for
+    "get_football_info": 6 * 3600,
+    "get_olympics_medals": 6 * 3600,
+    "wikipedia_lookup": 6 * 3600,
+    "get_departures": 0,  # "om N min" er feil etter noen minutter
+    "get_netatmo_temperature": 3600,
+}
+
+# ============ Prefetch (forhåndsvarming av tool-cachen) ============
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true'
+PREFETCH_LEAD_S = 10 * 60  # Varm opp så lenge før timen der kallene pleier å komme
+PREFETCH_HISTORY_DAYS = 28  # Tool-kall fra så mange dager tilbake teller
+PREFETCH_MIN_DAYS = 3  # Kallet må ha skjedd i samme time på minst så mange dager
+PREFETCH_MAX_PER_HOUR = 6  # Tak på forhåndshentinger per klokketime (høflig mot API-ene)
+PREFETCH_SPACING_S = 5  # Pause mellom forhåndshentinger
+PREFETCH_CALL_BUDGET_S = 10  # Tidsfrist per forhåndshenting
+PREFETCH_CHECK_INTERVAL_S = 60
+
+# ============ Sportsdata (parsede OL- og fotballtabeller) ============
+OLYMPICS_REVISION_CHECK_S = 300  # Sjekk Wikipedia-revisjonen maks så ofte
+FOOTBALL_STANDINGS_REFRESH_S = 600  # football-data.org har ingen revisjon - hent på nytt etter dette
+SPORTS_CACHE_MAX_STALE_S = 6 * 3600  # Feiler oppdateringen, brukes forrige data bare så lenge etter siste sjekk
+
+# ============ Wikipedia-cache ============
+WIKI_CACHE_TTL_S = 7 * 86400  # Artikkelsammendrag endres sjelden
+WIKI_CACHE_NEGATIVE_TTL_S = 86400  # Hvor lenge "fant ingen artikkel" huskes
+WIKI_CACHE_MAX_ENTRIES = 256  # I minnet (LRU); SQLite har alt innenfor TTL
+
+# ============ Nyheter (RSS-innhenting) ============
+NEWS_POLL_INTERVAL_S = 10 * 60  # Alle feeds sjekkes så ofte (betinget GET - uendret feed gir 304)
+NEWS_POLL_SPACING_S = 1.0  # Pause mellom feeds i samme runde
+NEWS_STALE_S = 30 * 60  # Eldre enn dette: nyhetsverktøyet henter feeden selv før det svarer
+NEWS_RETENTION_DAYS = 7  # Saker som er ute av feeden slettes etter så mange dager
+
+# ============ Geocoding ============
+GEOCODE_FUZZY_CUTOFF = 0.85  # Likhet (0-1) for å godta feilstavede stedsnavn fra STT
+GEOCODE_NEGATIVE_TTL_S = 7 * 86400  # Hvor lenge "fant ikke stedet" huskes
+NOMINATIM_MIN_INTERVAL_S = 1.0  # Nominatim usage policy: maks 1 request/s
+
 # Music directory
 MUSIKK_DIR = os.path.join(BASE_PATH, "musikk")
 
 # Music directory
 MUSIKK_DIR = os.path.join(BASE_PATH, "musikk")
 
+# ============ Entur (kollektivtransport) ============
+ENTUR_STOP_TTL_S = 30 * 86400  # Holdeplass-IDer endres nesten aldri
+ENTUR_STOP_NEGATIVE_TTL_S = 86400  # Hvor lenge "fant ingen holdeplass" huskes
+# Favorittholdeplasser (kommaseparert) holdes varme i bakgrunnen
+ENTUR_FAVORITE_STOPS = [s.strip() for s in os.getenv('ENTUR_FAVORITE_STOPS', '').split(',') if s.strip()]
+ENTUR_BOARD_ACTIVE_HOURS = (6, 23)  # Oppdater favorittene fra kl. 06 til 23
+ENTUR_BOARD_REFRESH_S = 60
+ENTUR_BOARD_MAX_AGE_S = 120  # Eldre tavle brukes ikke - da spørres Entur direkte
+ENTUR_BOARD_DEPARTURES = 20  # Avganger som hentes per favoritt
+
 # ============ Porcupine Configuration ============
 PORCUPINE_ACCESS_KEY_ENV = "PORCUPINE_ACCESS_KEY"
 
@@ -155,9 +282,80 @@ AZURE_SPEECH_REGION_ENV = "AZURE_SPEECH_REGION"
 # ============ OpenAI Configuration ============
 OPENAI_API_KEY_ENV = "OPENAI_API_KEY"
 
+# ============ HTTP Client (delt, pooled) ============
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))  # Sekunder
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '15'))  # Sekunder
+HTTP_LLM_READ_TIMEOUT = float(os.getenv('HTTP_LLM_READ_TIMEOUT', '60'))  # Chat completions kan ta lang tid
+HTTP_POOL_MAXSIZE = 4  # Samtidige keep-alive-tilkoblinger per host
+HTTP_MAX_SESSIONS = 32  # Minst brukte host-sessions lukkes over dette
+HTTP_MAX_RETRIES = 2  # Ekstra forsøk ved tilkoblingsfeil/502-504 (kun idempotente kall, ellers opt-in)
+HTTP_BACKOFF_BASE_S = 0.5  # Backoff: base * 2^forsøk, med full jitter
+HTTP_BACKOFF_MAX_S = 8.0
+# Standard: bare feil der kallet aldri nådde tjenesten (tilkoblingsfeil, gateway).
+# Read timeouts prøves ikke på nytt - et tool med 10 s timeout ville ellers
+# holdt en stemme-tur i 30 s+. Kall som tåler det, sender retry_timeouts=True.
+HTTP_RETRY_STATUSES = (502, 503, 504)
+HTTP_RETRY_STATUSES_API = (429, 500, 502, 503, 504)  # API-er med rate limit (OpenAI), opt-in per kall
+HTTP_LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# ============ Circuit breakers og tidsfrist per tur ============
+CIRCUIT_FAILURE_THRESHOLD = 3  # Feil på rad før en host regnes som nede (open)
+CIRCUIT_RESET_TIMEOUT_S = 15.0  # Pause før ett prøvekall slippes gjennom (half-open)
+CIRCUIT_RESET_MAX_S = 300.0  # Pausen dobles hver gang prøvekallet feiler, opp til dette
+CIRCUIT_EWMA_ALPHA = 0.2  # Vekt på siste måling i latency-EWMA per host
+CIRCUIT_TIMEOUT_FACTOR = 4.0  # Adaptiv timeout for endepunkter: EWMA × faktor (innenfor konfigurert maks)
+CIRCUIT_MIN_TIMEOUT_S = 1.0
+HEALTH_PROBE_INTERVAL_S = 30.0  # Bakgrunnssjekk av endepunkter (f.eks. HA lokal/cloud)
+# Tidsbudsjett for én tur i chatgpt_query. Tools får det som er igjen minus
+# reserven til siste LLM-runde; HTTP-timeouts kappes automatisk til fristen.
+TURN_BUDGET_S = float(os.getenv('TURN_BUDGET_S', '25'))
+TURN_BUDGET_SMS_S = float(os.getenv('TURN_BUDGET_SMS_S', '90'))
+TURN_LLM_RESERVE_S = 8.0
+TOOL_MIN_BUDGET_S = 1.0  # Senere tools får alltid minst dette (cache-treff er gratis)
+
+# ============ Philips Hue ============
+HUE_INVENTORY_TTL_S = 600  # Lys/rom-oversikten fra broen oppdateres så ofte (i bakgrunnen)
+HUE_MAX_PARALLEL = 4  # Samtidige PUT-er når enkeltlys må styres hver for seg
+
+# ============ Netatmo ============
+NETATMO_TOKEN_MARGIN_S = 120  # Forny access token så lenge før det utløper
+NETATMO_TOPOLOGY_TTL_S = 6 * 3600  # Hjem/rom/moduler (homesdata) endres sjelden
+NETATMO_READ_TIMEOUT_S = 8.0
+NETATMO_MAX_PARALLEL = 4  # Samtidige homestatus-kall (ett per hjem)
+# Netatmo roterer refresh token ved hver fornyelse - det nye lagres her og
+# brukes foran NETATMO_REFRESH_TOKEN i .env ved oppstart
+NETATMO_TOKEN_FILE = os.path.join(CONFIG_DIR, "netatmo_token.json")
+
+# ============ 3D-printer (PrusaLink) ============
+PRUSA_POLL_IDLE_S = 300  # Printeren er på, men skriver ikke ut
+PRUSA_POLL_PRINTING_S = 60
+PRUSA_NEAR_END_S = 600  # Siste del av en print (time_remaining) ...
+PRUSA_POLL_NEAR_END_S = 15  # ... polles tett, så "ferdig" meldes raskt
+PRUSA_BACKOFF_BASE_S = 30  # Printeren svarer ikke: dobles per feil ...
+PRUSA_BACKOFF_MAX_S = 600  # ... opp til dette
+PRUSA_BOOT_POLL_S = 5  # Hvor ofte oppstartsjobben sjekker om PrusaLink svarer
+PRUSA_BOOT_TIMEOUT_S = 180  # Gi opp å vente på oppstart etter så lenge
+
+# ============ SMS-relay (levering av SMS og duck-meldinger) ============
+SMS_RELAY_LONG_POLL_S = 55  # Relayen holder /inbox til en melding kommer eller så lenge
+SMS_RELAY_READ_MARGIN_S = 10  # Read-timeout = ventetid + margin
+SMS_RELAY_LEGACY_POLL_S = 10  # Eldre relay uten /inbox: vanlig polling
+SMS_RELAY_BACKOFF_MAX_S = 60  # Relayen svarer ikke: vent opptil så lenge mellom forsøk
+SMS_WORKERS = 4  # Innkommende SMS/MMS fra ulike avsendere behandles parallelt (én avsender i rekkefølge)
+SMS_QUEUE_MAX = 32  # Meldinger i kø/under behandling før pollingen venter (backpressure)
+
 # ============ Home Assistant Configuration ============
 HA_TOKEN_ENV = "HA_TOKEN"
 HA_URL_ENV = "HA_URL"
+# WebSocket-speil av HA-tilstand (krever websocket-client, ellers brukes REST)
+HA_WS_ENABLED = os.getenv('HA_WS_ENABLED', 'true').lower() == 'true'
+HA_WS_CONNECT_TIMEOUT_S = 5.0
+HA_WS_PING_INTERVAL_S = 30.0  # Ping når det har vært stille så lenge; ingen svar → ny tilkobling
+HA_WS_CALL_TIMEOUT_S = 5.0  # Maks ventetid på svar for call_service over socketen
+HA_WS_RECONNECT_MAX_S = 60.0  # Backoff mellom tilkoblingsforsøk (dobles fra 1 s)
+# Domener som speiles (sensorer, kalender, to-do, AC, TV, lys, gardiner ...)
+HA_MIRROR_DOMAINS = ('sensor', 'binary_sensor', 'calendar', 'todo', 'climate', 'media_player',
+                     'light', 'cover', 'vacuum', 'select', 'scene')
 
 # ============ Memory System Configuration ============
 # Hvor mange facts embedding-søk skal returnere
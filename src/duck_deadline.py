@@ -0,0 +1,64 @@
+"""
+Tidsfrist per tur — ingen tool skal kunne dra en stemme-tur over budsjettet.
+
+chatgpt_query setter en frist (thread-local) rundt tool-kjøringen. Koden som
+venter på nettverk (DuckHttpClient) kapper timeouts til tiden som er igjen og
+kaster DeadlineExceeded når fristen er passert. DeadlineExceeded arver fra
+requests.Timeout, så eksisterende `except requests.exceptions.RequestException`
+i tools fanger den uten endringer.
+
+Bruk:
+    from src.duck_deadline import deadline_at, remaining
+
+    with deadline_at(time.monotonic() + 10):
+        ...                # remaining() → sekunder igjen, ellers None
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+
+_local = threading.local()
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Turens tidsbudsjett er brukt opp."""
+
+
+@contextmanager
+def deadline_at(deadline: float):
+    """
+    Sett frist (time.monotonic()-tid) for koden i blokken. Nøstede frister
+    kan bare stramme inn, aldri forlenge en ytre frist.
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining() -> Optional[float]:
+    """Sekunder igjen til fristen i denne tråden, eller None uten frist."""
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline(what: str = "kallet"):
+    """Kast DeadlineExceeded hvis fristen allerede er passert."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Tidsfristen for turen er brukt opp før {what}")
+
+
+def clamp_timeout(timeout, budget: float):
+    """Kapp en requests-timeout (sekunder eller (connect, read)) til budsjettet."""
+    if isinstance(timeout, tuple):
+        return tuple(min(t, budget) if t is not None else budget for t in timeout)
+    return budget if timeout is None else min(timeout, budget)
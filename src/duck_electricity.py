@@ -4,11 +4,15 @@ Henter strømpriser fra hvakosterstrommen.no API og beregner faktisk forbrukerpr
 med strømstøtte og mva.
 """
 
-import requests
 import os
+import json
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
+from src.duck_database import get_db
+from src.duck_http import get_http_client
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +34,13 @@ REGIONS = {
 
 DEFAULT_REGION = os.getenv('ELECTRICITY_REGION', 'NO2')
 
+# Prisbutikk og forhåndshenting
+PRICE_API_URL = "https://www.hvakosterstrommen.no/api/v1/prices/{date}_{region}.json"
+TOMORROW_PRICES_HOUR = int(os.getenv('ELECTRICITY_TOMORROW_HOUR', '13'))  # Day-ahead-priser publiseres etter ca. kl 13
+PREFETCH_INTERVAL_S = 30 * 60  # Sjekk om noe mangler hver halvtime
+PREFETCH_RETRY_S = 5 * 60  # Raskere nytt forsøk når henting feilet (f.eks. ikke publisert ennå)
+PRICE_RETENTION_DAYS = 30  # Eldre priser slettes fra SQLite
+
 
 def calculate_consumer_price(spot_price: float, include_subsidy: bool = True) -> Dict:
     """
@@ -62,9 +73,139 @@ def calculate_consumer_price(spot_price: float, include_subsidy: bool = True) ->
     }
 
 
+class PriceStore:
+    """
+    Lokal lagring av day-ahead-priser i SQLite, nøklet på (region, dato).
+    Prisene for en dag endres ikke etter publisering, så hver dag lastes ned
+    én gang - av forhåndshentingen eller ved første spørsmål - og alle
+    prisfunksjonene regner deretter på lagrede data (fungerer også uten nett).
+    Singleton — bruk get_price_store() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self._memo: Dict[tuple, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self._download_lock = threading.Lock()  # Samtidige spørsmål gir én nedlasting
+        self._init_database()
+
+    @classmethod
+    def get_instance(cls) -> 'PriceStore':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _init_database(self):
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    CREATE TABLE IF NOT EXISTS electricity_prices (
+                        region TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        prices TEXT NOT NULL,
+                        fetched_at TEXT NOT NULL,
+                        PRIMARY KEY (region, date)
+                    )
+                """)
+        except Exception as e:
+            print(f"⚠️ Kunne ikke opprette electricity_prices: {e}", flush=True)
+
+    def get(self, region: str, date_str: str) -> Optional[List[Dict]]:
+        """Lagrede priser for (region, YYYY-MM-DD), uten nettverk."""
+        key = (region, date_str)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        try:
+            with get_db().cursor() as c:
+                c.execute("SELECT prices FROM electricity_prices WHERE region = ? AND date = ?", (region, date_str))
+                row = c.fetchone()
+        except Exception as e:
+            print(f"⚠️ Kunne ikke lese lagrede strømpriser: {e}", flush=True)
+            return None
+        if row is None:
+            return None
+        prices = json.loads(row['prices'])
+        with self._lock:
+            self._memo[key] = prices
+        return prices
+
+    def fetch(self, region: str, date: datetime) -> Optional[List[Dict]]:
+        """Priser for en dag: fra lagring, ellers lastet ned og lagret."""
+        date_str = date.strftime("%Y-%m-%d")
+        prices = self.get(region, date_str)
+        if prices is not None:
+            return prices
+        with self._download_lock:
+            prices = self.get(region, date_str)  # Kan ha blitt hentet mens vi ventet
+            if prices is not None:
+                return prices
+            url = PRICE_API_URL.format(date=date.strftime("%Y/%m-%d"), region=region)
+            response = get_http_client().get(url, timeout=5)
+            response.raise_for_status()
+            prices = response.json()
+            if not prices:
+                return None
+            with get_db().cursor() as c:
+                c.execute("""
+                    INSERT OR REPLACE INTO electricity_prices (region, date, prices, fetched_at)
+                    VALUES (?, ?, ?, ?)
+                """, (region, date_str, json.dumps(prices), datetime.now().isoformat()))
+            with self._lock:
+                self._memo[(region, date_str)] = prices
+            print(f"⚡ Lagret strømpriser for {region} {date_str} ({len(prices)} perioder)", flush=True)
+            return prices
+
+    def prune(self):
+        """Slett gamle priser fra SQLite og minnet."""
+        cutoff = (datetime.now() - timedelta(days=PRICE_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        with self._lock:
+            for key in [k for k in self._memo if k[1] < cutoff]:
+                del self._memo[key]
+        try:
+            with get_db().cursor() as c:
+                c.execute("DELETE FROM electricity_prices WHERE date < ?", (cutoff,))
+        except Exception as e:
+            print(f"⚠️ Kunne ikke rydde gamle strømpriser: {e}", flush=True)
+
+    def prefetch_loop(self, region: str = DEFAULT_REGION):
+        """
+        Bakgrunnsløkke: sørg for at dagens priser - og morgendagens når de er
+        publisert - ligger lagret. Prøver igjen oftere når henting feiler.
+        """
+        while True:
+            ok = True
+            now = datetime.now()
+            days = [now] + ([now + timedelta(days=1)] if now.hour >= TOMORROW_PRICES_HOUR else [])
+            for day in days:
+                try:
+                    ok = self.fetch(region, day) is not None and ok
+                except Exception as e:
+                    print(f"⚠️ Forhåndshenting av strømpriser for {day.strftime('%Y-%m-%d')} feilet: {e}", flush=True)
+                    ok = False
+            self.prune()
+            time.sleep(PREFETCH_INTERVAL_S if ok else PREFETCH_RETRY_S)
+
+
+def get_price_store() -> PriceStore:
+    """Hent singleton PriceStore-instansen."""
+    return PriceStore.get_instance()
+
+
+def start_price_prefetch(region: str = DEFAULT_REGION) -> threading.Thread:
+    """Start forhåndshenting av strømpriser i en daemon-tråd (kalles fra chatgpt_voice.main)."""
+    thread = threading.Thread(target=get_price_store().prefetch_loop, args=(region,),
+                              daemon=True, name="electricity-prefetch")
+    thread.start()
+    return thread
+
+
 def fetch_prices(region: str = DEFAULT_REGION, date: Optional[datetime] = None) -> Optional[List[Dict]]:
     """
-    Hent strømpriser fra API.
+    Hent strømpriser (fra lokal prisbutikk, lastes ned første gang).
     
     Args:
         region: Prisområde (NO1-NO5)
@@ -76,14 +217,8 @@ def fetch_prices(region: str = DEFAULT_REGION, date: Optional[datetime] = None)
     if date is None:
         date = datetime.now()
     
-    # Format: YYYY/MM-DD_REGION.json
-    date_str = date.strftime("%Y/%m-%d")
-    url = f"https://www.hvakosterstrommen.no/api/v1/prices/{date_str}_{region}.json"
-    
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return response.json()
+        return get_price_store().fetch(region, date)
     except Exception as e:
         print(f"❌ Feil ved henting av strømpriser: {e}", flush=True)
         return None
@@ -0,0 +1,213 @@
+"""
+Filler-tale — maskerer ventetid mens trege tools kjører.
+
+Tool-motoren (duck_ai._handle_tool_calls) måler hvor lang tid hvert tool bruker.
+Når et kall forventes å ta lengre tid enn FILLER_THRESHOLD_MS, spilles en kort,
+ferdig rendret frase ("La meg sjekke...") i bakgrunnen mens toolet kjører.
+
+- Forventet tid = median av siste FILLER_LATENCY_WINDOW kall (startverdier
+  fra FILLER_TOOL_PRIORS_MS og turn_traces.jsonl før vi har nok egne målinger)
+- Frasene rendres (TTS + andifisering, via frase-cachen) på forhånd og byttes
+  når stemmeinnstillingene endres, så avspilling starter umiddelbart
+- Variantene roteres, og vanlig tale venter alltid til filleren er ferdig
+  (se duck_audio.wait_for_background_playback)
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from src.duck_config import (
+    TTS_ENGINE, FILLER_ENABLED, FILLER_THRESHOLD_MS, FILLER_LATENCY_WINDOW,
+    FILLER_MIN_SAMPLES, FILLER_PHRASES, FILLER_TOOL_PRIORS_MS
+)
+from src.duck_settings import get_settings
+
+# Ikke spill ny filler hvis forrige ble spilt for under så mange sekunder siden
+# (f.eks. flere trege tools i samme tur)
+FILLER_COOLDOWN_S = 8.0
+
+
+class ToolLatencyStats:
+    """Rullende latency-statistikk per tool (thread-safe)."""
+
+    def __init__(self, window: int = FILLER_LATENCY_WINDOW):
+        self._window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._seeded = False
+
+    def record(self, tool: str, duration_ms: float):
+        with self._lock:
+            self._samples.setdefault(tool, deque(maxlen=self._window)).append(duration_ms)
+
+    def expected_ms(self, tool: str) -> Optional[float]:
+        """
+        Forventet varighet for neste kall. Median av siste målinger når vi
+        har nok av dem, ellers startverdi for kjente trege tools (eller None).
+        """
+        self._seed_from_traces()
+        with self._lock:
+            samples = list(self._samples.get(tool, ()))
+        if len(samples) >= FILLER_MIN_SAMPLES:
+            return statistics.median(samples)
+        return FILLER_TOOL_PRIORS_MS.get(tool)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Median/maks per tool (for debugging og kontrollpanel)."""
+        with self._lock:
+            items = {tool: list(values) for tool, values in self._samples.items()}
+        return {
+            tool: {
+                'count': len(values),
+                'median_ms': round(statistics.median(values), 1),
+                'max_ms': round(max(values), 1),
+            }
+            for tool, values in items.items() if values
+        }
+
+    def _seed_from_traces(self):
+        """Fyll statistikken fra lagrede tool-spans ved første bruk etter oppstart."""
+        if self._seeded:
+            return
+        with self._lock:
+            if self._seeded:
+                return
+            self._seeded = True
+        try:
+            from src.duck_tracing import load_recent_traces
+            traces = load_recent_traces(limit=200)
+        except Exception as e:
+            print(f"⚠️ Kunne ikke lese tool-latency fra traces: {e}", flush=True)
+            return
+        with self._lock:
+            for trace in traces:
+                for span in trace.get('spans', []):
+                    tool = span.get('attrs', {}).get('tool')
+                    if span.get('name') == 'tool' and tool:
+                        self._samples.setdefault(tool, deque(maxlen=self._window)).append(span['duration_ms'])
+
+
+class FillerSpeech:
+    """
+    Ferdig rendrede filler-fraser som spilles mens trege tools kjører.
+    Singleton — bruk get_filler_speech() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self.stats = ToolLatencyStats()
+        self._speech_config = None
+        self._beak = None
+        self._rendered = {}  # tekst → (samples, framerate)
+        self._rendered_key = None
+        self._render_lock = threading.Lock()
+        self._rendering = False
+        self._next_index = 0
+        self._last_played = 0.0
+
+    @classmethod
+    def get_instance(cls) -> 'FillerSpeech':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def configure(self, speech_config, beak):
+        """Sett TTS-config og nebb (fra chatgpt_voice.main) og start pre-rendering."""
+        self._speech_config = speech_config
+        self._beak = beak
+        if FILLER_ENABLED:
+            self._start_render()
+
+    # ── Rendering ────────────────────────────────────────────
+
+    @staticmethod
+    def _settings_key():
+        """Rendret lyd avhenger av engine, stemme og hastighet (volum legges på ved avspilling)."""
+        tts = get_settings().get_tts_settings()
+        return (TTS_ENGINE, tts['voice'], tts['speed'])
+
+    def _start_render(self):
+        with self._render_lock:
+            if self._rendering:
+                return
+            self._rendering = True
+        threading.Thread(target=self._render_all, daemon=True, name="filler-render").start()
+
+    def _render_all(self):
+        from src.duck_phrase_cache import get_phrase_cache
+        try:
+            key = self._settings_key()
+            tts = get_settings().get_tts_settings()
+            rendered = {}
+            for phrase in FILLER_PHRASES:
+                # Via frase-cachen: overlever restart og fungerer uten nett
+                result = get_phrase_cache().get_or_render(phrase, self._speech_config, tts)
+                if result is not None:
+                    rendered[phrase] = result
+            with self._render_lock:
+                self._rendered = rendered
+                self._rendered_key = key
+            print(f"✅ Filler-fraser rendret: {len(rendered)}/{len(FILLER_PHRASES)}", flush=True)
+        except Exception as e:
+            print(f"⚠️ Kunne ikke rendre filler-fraser: {e}", flush=True)
+        finally:
+            with self._render_lock:
+                self._rendering = False
+
+    def _next_phrase(self):
+        """Neste rendrede variant (roterer), eller None hvis ingen er klare."""
+        with self._render_lock:
+            if self._rendered_key != self._settings_key():
+                stale = True
+            else:
+                stale = False
+                for _ in range(len(FILLER_PHRASES)):
+                    phrase = FILLER_PHRASES[self._next_index % len(FILLER_PHRASES)]
+                    self._next_index += 1
+                    if phrase in self._rendered:
+                        return phrase, self._rendered[phrase]
+        if stale:
+            # Stemmeinnstillingene er endret - rendre på nytt i bakgrunnen
+            self._start_render()
+        return None
+
+    # ── Avspilling ───────────────────────────────────────────
+
+    def maybe_play(self, tool: str) -> bool:
+        """
+        Spill en filler hvis `tool` forventes å være tregt.
+        Returnerer umiddelbart - avspillingen skjer i bakgrunnen.
+        """
+        if not FILLER_ENABLED or self._speech_config is None:
+            return False
+
+        expected = self.stats.expected_ms(tool)
+        if expected is None or expected < FILLER_THRESHOLD_MS:
+            return False
+        if time.monotonic() - self._last_played < FILLER_COOLDOWN_S:
+            return False
+
+        phrase = self._next_phrase()
+        if phrase is None:
+            return False
+        text, (samples, framerate) = phrase
+
+        from src.duck_audio import play_in_background
+        from scripts.hardware.rgb_duck import blink_yellow_purple
+        # Etter filleren: fortsett "tenker"-blinkingen til svaret er klart
+        if not play_in_background(samples, framerate, self._beak, on_finished=blink_yellow_purple):
+            return False
+        self._last_played = time.monotonic()
+        print(f"🗣️ Filler for {tool} (forventet {expected:.0f}ms): {text}", flush=True)
+        return True
+
+
+def get_filler_speech() -> FillerSpeech:
+    """Hent singleton FillerSpeech-instansen."""
+    return FillerSpeech.get_instance()
@@ -1,12 +1,18 @@
 """
 Premier League data fra football-data.org API
 Gir tabell, resultater og kommende kamper for Samantha/Anda.
+
+Tabellen ligger parset i sportsdata-cachen (FOOTBALL_STANDINGS_REFRESH_S),
+og deles mellom tabellspørsmål og lagoppslag.
 """
 
 import requests
 import json
 import logging
 from datetime import datetime, timezone, timedelta
+from src.duck_config import FOOTBALL_STANDINGS_REFRESH_S
+from src.duck_http import get_http_client
+from src.duck_sports_cache import get_sports_cache
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +51,27 @@ def _short_name(full_name: str) -> str:
     return TEAM_NAMES_NO.get(full_name, full_name)
 
 
+def _load_standings(_revision=None) -> dict:
+    """Hent PL-tabellen og behold TOTAL-tabellen (ikke HOME/AWAY)."""
+    resp = get_http_client().get(
+        f"{BASE_URL}/competitions/PL/standings",
+        headers=HEADERS,
+        timeout=10
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    total = next(s for s in data["standings"] if s["type"] == "TOTAL")
+    return {
+        "matchday": data.get("season", {}).get("currentMatchday", "?"),
+        "table": total["table"],
+    }
+
+
+def _get_standings() -> dict:
+    """Parset PL-tabell {'matchday', 'table'} (football-data.org har ingen revisjon - hentes etter intervall)."""
+    return get_sports_cache().get("football:pl_standings", None, _load_standings, FOOTBALL_STANDINGS_REFRESH_S)
+
+
 def get_pl_standings(top_n: int = 20) -> str:
     """Hent Premier League-tabellen.
     
@@ -55,21 +82,9 @@ def get_pl_standings(top_n: int = 20) -> str:
         Formatert tabellstreng for AI-kontekst
     """
     try:
-        resp = requests.get(
-            f"{BASE_URL}/competitions/PL/standings",
-            headers=HEADERS,
-            timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        
-        season = data.get("season", {})
-        matchday = season.get("currentMatchday", "?")
-        
-        standings = data["standings"]
-        # Finn TOTAL-tabellen (ikke HOME/AWAY)
-        total = next(s for s in standings if s["type"] == "TOTAL")
-        table = total["table"][:top_n]
+        standings = _get_standings()
+        matchday = standings["matchday"]
+        table = standings["table"][:top_n]
         
         lines = [f"Premier League tabell (runde {matchday}):", ""]
         lines.append(f"{'#':>2}  {'Lag':<20} {'K':>3} {'V':>3} {'U':>3} {'T':>3} {'MF':>4} {'P':>3}")
@@ -126,7 +141,7 @@ def get_pl_matches(match_type: str = "recent", count: int = 10) -> str:
 
 def _get_recent_results(count: int) -> str:
     """Hent siste spilte kamper."""
-    resp = requests.get(
+    resp = get_http_client().get(
         f"{BASE_URL}/competitions/PL/matches",
         headers=HEADERS,
         params={"status": "FINISHED", "limit": count},
@@ -167,7 +182,7 @@ def _get_recent_results(count: int) -> str:
 
 def _get_upcoming_matches(count: int) -> str:
     """Hent kommende kamper."""
-    resp = requests.get(
+    resp = get_http_client().get(
         f"{BASE_URL}/competitions/PL/matches",
         headers=HEADERS,
         params={"status": "SCHEDULED,TIMED", "limit": count},
@@ -210,19 +225,13 @@ def _get_team_matches(team_name: str, count: int) -> str:
     
     # Søk i alle kjente lag
     team_id = None
+    table = None
     for full_name, short_name in TEAM_NAMES_NO.items():
         if (team_name_lower in full_name.lower() or 
             team_name_lower in short_name.lower()):
-            # Hent lag-ID fra standings
-            resp = requests.get(
-                f"{BASE_URL}/competitions/PL/standings",
-                headers=HEADERS,
-                timeout=10
-            )
-            resp.raise_for_status()
-            standings = resp.json()["standings"]
-            total = next(s for s in standings if s["type"] == "TOTAL")
-            for entry in total["table"]:
+            # Hent lag-ID fra den cachede tabellen
+            table = table or _get_standings()["table"]
+            for entry in table:
                 if entry["team"]["name"] == full_name:
                     team_id = entry["team"]["id"]
                     team_display = short_name
@@ -238,7 +247,7 @@ def _get_team_matches(team_name: str, count: int) -> str:
     date_from = (now - timedelta(days=30)).strftime("%Y-%m-%d")
     date_to = (now + timedelta(days=30)).strftime("%Y-%m-%d")
     
-    resp = requests.get(
+    resp = get_http_client().get(
         f"{BASE_URL}/teams/{team_id}/matches",
         headers=HEADERS,
         params={"competitions": "PL", "dateFrom": date_from, "dateTo": date_to},
@@ -256,7 +265,7 @@ def _get_team_matches(team_name: str, count: int) -> str:
     # Finn lagets tabellposisjon
     team_pos = None
     team_points = None
-    for entry in total["table"]:
+    for entry in table:
         if entry["team"]["id"] == team_id:
             team_pos = entry["position"]
             team_points = entry["points"]
@@ -0,0 +1,246 @@
+"""
+Geocoder — stedsnavn → koordinater uten unødvendige nettverkskall.
+
+Tidligere leste get_coordinates() config/locations.json på nytt for hvert
+værspørsmål, og alt som ikke sto der gikk til Nominatim uten å bli husket.
+
+- locations.json lastes én gang til en normalisert indeks, og lastes på nytt
+  når filens mtime endres
+- Normalisering håndterer æøå-varianter (Tromsø/Tromso/Tromsoe, Ålesund/
+  Aalesund) og "kommune"/"sentrum"-suffiks
+- Feilstavinger fra STT fanges opp med fuzzy-match mot de lokale stedene
+  (GEOCODE_FUZZY_CUTOFF), men først når verken cachen eller Nominatim
+  fant stedet - ellers blir ekte steder som Kristiansund og Berge gjort om
+  til Kristiansand og Bergen
+- Nominatim-svar lagres i SQLite (geocode_cache), også "fant ikke" i
+  GEOCODE_NEGATIVE_TTL_S, og kall begrenses til 1 per sekund
+
+Bruk:
+    from src.duck_geocoder import get_geocoder
+
+    coords = get_geocoder().geocode("Sokndal")  # (lat, lon, beskrivelse) eller None
+"""
+
+import difflib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from src.duck_config import (
+    LOCATIONS_FILE, GEOCODE_FUZZY_CUTOFF, GEOCODE_NEGATIVE_TTL_S, NOMINATIM_MIN_INTERVAL_S
+)
+from src.duck_database import get_db
+from src.duck_http import get_http_client
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {
+    'User-Agent': 'ChatGPTDuck/2.1.2 (contact: github.com/osmund/chatgpt-and)'
+}
+
+# Ord som ikke endrer hvilket sted det er snakk om
+_NOISE_WORDS = {'kommune', 'sentrum', 'by', 'i', 'norge'}
+_FOLD = str.maketrans({'æ': 'a', 'ø': 'o', 'å': 'a', 'é': 'e', 'è': 'e', 'ü': 'u', 'ö': 'o', 'ä': 'a'})
+
+Coordinates = Tuple[float, float, str]
+
+
+def normalize_place(name: str) -> str:
+    """
+    Løs nøkkel for et stedsnavn: små bokstaver, uten æøå, aa/ae/oe slått
+    sammen og uten støyord. "Tromsø", "Tromso" og "tromsoe" gir samme nøkkel.
+    """
+    text = name.lower().strip()
+    text = text.replace('aa', 'å').replace('ae', 'æ').replace('oe', 'ø')
+    text = text.translate(_FOLD)
+    words = re.findall(r'[a-z0-9]+', text)
+    # "Hauge i Dalane" skal beholde "i" - fjern kun støyord i enden
+    while len(words) > 1 and words[-1] in _NOISE_WORDS:
+        words.pop()
+    return ' '.join(words)
+
+
+class Geocoder:
+    """
+    Stedsoppslag med lokal indeks og persistent Nominatim-cache.
+    Singleton — bruk get_geocoder() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, locations_file: str = None):
+        self.locations_file = locations_file or LOCATIONS_FILE
+        self._lock = threading.Lock()
+        self._index: Dict[str, Coordinates] = {}
+        self._index_mtime = None
+        self._memo: Dict[str, Optional[Coordinates]] = {}  # Nominatim-svar denne kjøringen
+        self._nominatim_lock = threading.Lock()
+        self._last_nominatim = 0.0
+        self._init_database()
+
+    @classmethod
+    def get_instance(cls) -> 'Geocoder':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _init_database(self):
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    CREATE TABLE IF NOT EXISTS geocode_cache (
+                        query TEXT PRIMARY KEY,
+                        found INTEGER NOT NULL,
+                        lat REAL,
+                        lon REAL,
+                        display_name TEXT,
+                        fetched_at REAL NOT NULL
+                    )
+                """)
+        except Exception as e:
+            print(f"⚠️ Geocoder: kunne ikke opprette geocode_cache: {e}", flush=True)
+
+    # ── Lokal indeks (locations.json) ────────────────────────
+
+    def _refresh_index(self):
+        """Last locations.json på nytt hvis filen er endret."""
+        try:
+            mtime = os.path.getmtime(self.locations_file)
+        except OSError:
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self.locations_file, 'r', encoding='utf-8') as f:
+                locations = json.load(f).get('locations', {})
+        except (OSError, ValueError) as e:
+            print(f"Kunne ikke lese locations-fil: {e}", flush=True)
+            return
+        index = {}
+        for key, loc in locations.items():
+            coords = (loc['lat'], loc['lon'], loc.get('description', loc.get('name', key)))
+            for alias in [key, loc.get('name', '')] + loc.get('aliases', []):
+                if alias:
+                    index[normalize_place(alias)] = coords
+        with self._lock:
+            self._index = index
+            self._index_mtime = mtime
+        print(f"📍 Lastet {len(locations)} lokale steder fra locations.json", flush=True)
+
+    def _lookup_local(self, key: str) -> Optional[Coordinates]:
+        self._refresh_index()
+        with self._lock:
+            return self._index.get(key)
+
+    def _lookup_fuzzy(self, key: str) -> Optional[Coordinates]:
+        """Nærmeste lokale sted for en feilstaving fra STT ("Sokndall", "Egersunn")."""
+        with self._lock:
+            close = difflib.get_close_matches(key, list(self._index), n=1, cutoff=GEOCODE_FUZZY_CUTOFF)
+            return self._index[close[0]] if close else None
+
+    # ── Nominatim med persistent cache ───────────────────────
+
+    def _lookup_cached(self, key: str) -> Tuple[bool, Optional[Coordinates]]:
+        """(funnet_i_cache, koordinater). Negative svar utløper etter GEOCODE_NEGATIVE_TTL_S."""
+        with self._lock:
+            if key in self._memo:
+                return True, self._memo[key]
+        try:
+            with get_db().cursor() as c:
+                c.execute("SELECT found, lat, lon, display_name, fetched_at FROM geocode_cache WHERE query = ?", (key,))
+                row = c.fetchone()
+        except Exception as e:
+            print(f"⚠️ Geocoder: kunne ikke lese cache: {e}", flush=True)
+            return False, None
+        if row is None:
+            return False, None
+        if not row['found']:
+            if time.time() - row['fetched_at'] > GEOCODE_NEGATIVE_TTL_S:
+                return False, None
+            coords = None
+        else:
+            coords = (row['lat'], row['lon'], row['display_name'])
+        with self._lock:
+            self._memo[key] = coords
+        return True, coords
+
+    def _store(self, key: str, coords: Optional[Coordinates]):
+        with self._lock:
+            self._memo[key] = coords
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    INSERT OR REPLACE INTO geocode_cache (query, found, lat, lon, display_name, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (key, 1 if coords else 0, coords[0] if coords else None,
+                      coords[1] if coords else None, coords[2] if coords else None, time.time()))
+        except Exception as e:
+            print(f"⚠️ Geocoder: kunne ikke lagre cache: {e}", flush=True)
+
+    def _query_nominatim(self, location_name: str) -> Optional[Coordinates]:
+        """Søk via Nominatim (maks 1 request/s). Kaster ved nettverksfeil."""
+        with self._nominatim_lock:
+            wait = NOMINATIM_MIN_INTERVAL_S - (time.monotonic() - self._last_nominatim)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = get_http_client().get(NOMINATIM_URL, params={
+                    'q': f"{location_name}, Norge",
+                    'format': 'json',
+                    'limit': 1
+                }, headers=NOMINATIM_HEADERS, timeout=5)
+            finally:
+                self._last_nominatim = time.monotonic()
+        response.raise_for_status()
+        data = response.json()
+        if not data:
+            return None
+        return float(data[0]['lat']), float(data[0]['lon']), data[0].get('display_name', location_name)
+
+    # ── Offentlig API ────────────────────────────────────────
+
+    def geocode(self, location_name: str) -> Optional[Coordinates]:
+        """
+        Finn koordinater for et stedsnavn: lokal indeks → SQLite-cache →
+        Nominatim → fuzzy-match mot lokal indeks.
+
+        Returns:
+            (lat, lon, beskrivelse) eller None
+        """
+        key = normalize_place(location_name or '')
+        if not key:
+            return None
+
+        local = self._lookup_local(key)
+        if local is not None:
+            print(f"📍 Bruker lokal koordinat for {local[2]}", flush=True)
+            return local
+
+        cached, coords = self._lookup_cached(key)
+        if not cached:
+            try:
+                coords = self._query_nominatim(location_name)
+            except Exception as e:
+                # Nettverksfeil huskes ikke - prøv igjen neste gang
+                print(f"Geocoding feil for '{location_name}': {e}", flush=True)
+            else:
+                self._store(key, coords)
+                if coords:
+                    print(f"📍 Bruker Nominatim for {location_name}", flush=True)
+        if coords:
+            return coords
+
+        fuzzy = self._lookup_fuzzy(key)
+        if fuzzy is not None:
+            print(f"📍 Fant ikke '{location_name}' - bruker nærmeste lokale sted {fuzzy[2]} (fuzzy-match)",
+                  flush=True)
+        return fuzzy
+
+
+def get_geocoder() -> Geocoder:
+    """Hent singleton Geocoder-instansen."""
+    return Geocoder.get_instance()
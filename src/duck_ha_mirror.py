@@ -0,0 +1,318 @@
+"""
+HomeAssistantMirror — speil av Home Assistant-tilstand over WebSocket API.
+
+Tidligere gjorde hvert HA-spørsmål (e-post, Teams, kalender, AC-temperatur,
+to-do) egne REST-kall, ofte etter at _get_working_ha_url() først hadde
+prøvd lokal (2 s) og så cloud (5 s). Speilet holder i stedet én
+WebSocket-tilkobling åpen i en bakgrunnstråd:
+
+- Autentiserer én gang, henter alle tilstander (get_states) og abonnerer
+  på state_changed, så entitetene i HA_MIRROR_DOMAINS alltid er oppdatert
+  i minnet - lese-tools svarer på mikrosekunder
+- Service-kall (call_service) sendes over samme socket
+- Prøver lokal URL først, deretter cloud; ny tilkobling med eksponentiell
+  backoff (maks HA_WS_RECONNECT_MAX_S) og ping når det er stille
+- Uten websocket-client, eller mens speilet ikke er tilkoblet, returnerer
+  get_state()/call_service() None og duck_homeassistant bruker REST
+
+Bruk:
+    from src.duck_ha_mirror import get_ha_mirror, start_ha_mirror
+
+    start_ha_mirror()  # Fra chatgpt_voice.main
+    state = get_ha_mirror().get_state("sensor.m365_teams_status")  # dict eller None
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+from src.duck_config import (
+    HA_WS_ENABLED, HA_WS_CONNECT_TIMEOUT_S, HA_WS_PING_INTERVAL_S, HA_WS_CALL_TIMEOUT_S,
+    HA_WS_RECONNECT_MAX_S, HA_MIRROR_DOMAINS
+)
+
+
+def _ws_url(base_url: str) -> str:
+    """http://host:8123 → ws://host:8123/api/websocket (https → wss)."""
+    base = base_url.rstrip('/')
+    if base.startswith('https://'):
+        base = 'wss://' + base[len('https://'):]
+    elif base.startswith('http://'):
+        base = 'ws://' + base[len('http://'):]
+    return f"{base}/api/websocket"
+
+
+class _PendingCall:
+    __slots__ = ('event', 'message')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.message = None
+
+
+class HomeAssistantMirror:
+    """
+    WebSocket-klient som speiler HA-entiteter i minnet.
+    Singleton — bruk get_ha_mirror() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, local_url: str, cloud_url: str, token: str, domains=HA_MIRROR_DOMAINS):
+        self.endpoints = [(label, url) for label, url in (('lokal', local_url), ('cloud', cloud_url)) if url]
+        self.token = token
+        self.domains = tuple(domains)
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, _PendingCall] = {}
+        self._next_id = 1
+        self._states_id = None
+        self._ws = None
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.endpoint = None  # 'lokal' eller 'cloud' når tilkoblet
+        self._stats = {'connects': 0, 'events': 0, 'service_calls': 0, 'last_event': None}
+
+    @classmethod
+    def get_instance(cls) -> 'HomeAssistantMirror':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    from src.duck_homeassistant import HA_LOCAL_URL, HA_CLOUD_URL, HA_TOKEN
+                    cls._instance = cls(HA_LOCAL_URL, HA_CLOUD_URL, HA_TOKEN)
+        return cls._instance
+
+    @staticmethod
+    def available() -> bool:
+        return HA_WS_ENABLED and websocket is not None
+
+    # ── Livssyklus ───────────────────────────────────────────
+
+    def start(self) -> bool:
+        """Start bakgrunnstråden. Returnerer False hvis speilet ikke kan brukes."""
+        if not self.available() or not self.token or not self.endpoints:
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="ha-mirror")
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        return self._connected.wait(timeout)
+
+    def is_connected(self) -> bool:
+        return self._connected.is_set()
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            for label, url in self.endpoints:
+                if self._stop.is_set():
+                    break
+                try:
+                    ws = websocket.create_connection(_ws_url(url), timeout=HA_WS_CONNECT_TIMEOUT_S)
+                except Exception as e:
+                    print(f"⚠️ HA WebSocket ({label}): kunne ikke koble til: {e}", flush=True)
+                    continue
+                try:
+                    if self._authenticate(ws):
+                        delay = 1.0
+                        self._session(ws, label)
+                        break  # Mistet tilkoblingen - start på nytt fra lokal
+                except Exception as e:
+                    if not self._stop.is_set():
+                        print(f"⚠️ HA WebSocket ({label}): {e}", flush=True)
+                finally:
+                    self._disconnect(ws)
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, HA_WS_RECONNECT_MAX_S)
+
+    def _authenticate(self, ws) -> bool:
+        msg = json.loads(ws.recv())
+        if msg.get('type') != 'auth_required':
+            raise ConnectionError(f"uventet melding før auth: {msg.get('type')}")
+        ws.send(json.dumps({'type': 'auth', 'access_token': self.token}))
+        msg = json.loads(ws.recv())
+        if msg.get('type') != 'auth_ok':
+            print(f"❌ HA WebSocket: autentisering feilet ({msg.get('message', msg.get('type'))})", flush=True)
+            return False
+        return True
+
+    def _session(self, ws, label: str):
+        """Abonner, hent snapshot og les meldinger til tilkoblingen dør."""
+        ws.settimeout(HA_WS_PING_INTERVAL_S)
+        self._ws = ws
+        self.endpoint = label
+        # Abonner før snapshot: hendelser mellom de to går ikke tapt
+        self._send({'type': 'subscribe_events', 'event_type': 'state_changed'})
+        self._states_id = self._send({'type': 'get_states'})
+        awaiting_pong = False
+        while not self._stop.is_set():
+            try:
+                raw = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                if awaiting_pong:
+                    raise ConnectionError("ingen pong - kobler til på nytt")
+                self._send({'type': 'ping'})
+                awaiting_pong = True
+                continue
+            if not raw:
+                raise ConnectionError("tilkoblingen ble lukket")
+            awaiting_pong = False
+            self._handle(json.loads(raw))
+
+    def _disconnect(self, ws):
+        was_connected = self._connected.is_set()
+        self._connected.clear()
+        self._ws = None
+        self.endpoint = None
+        try:
+            ws.close()
+        except Exception:
+            pass
+        # Ventende service-kall får ikke svar på denne tilkoblingen
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for call in pending.values():
+            call.event.set()
+        if was_connected and not self._stop.is_set():
+            print("⚠️ HA WebSocket: frakoblet, bruker REST til speilet er tilbake", flush=True)
+
+    # ── Meldinger ────────────────────────────────────────────
+
+    def _send(self, payload: Dict[str, Any], pending: _PendingCall = None) -> int:
+        with self._send_lock:
+            ws = self._ws
+            if ws is None:
+                raise ConnectionError("ikke tilkoblet")
+            msg_id = self._next_id
+            self._next_id += 1
+            if pending is not None:
+                with self._lock:
+                    self._pending[msg_id] = pending
+            ws.send(json.dumps(dict(payload, id=msg_id)))
+            return msg_id
+
+    def _handle(self, msg: Dict[str, Any]):
+        kind = msg.get('type')
+        if kind == 'event':
+            data = msg.get('event', {}).get('data', {})
+            self._apply(data.get('entity_id'), data.get('new_state'))
+        elif kind == 'result':
+            if msg.get('id') == self._states_id:
+                self._load_snapshot(msg.get('result') or [])
+                return
+            with self._lock:
+                call = self._pending.pop(msg.get('id'), None)
+            if call is not None:
+                call.message = msg
+                call.event.set()
+
+    def _mirrored(self, entity_id: str) -> bool:
+        return bool(entity_id) and entity_id.split('.', 1)[0] in self.domains
+
+    def _apply(self, entity_id: str, new_state: Optional[Dict[str, Any]]):
+        if not self._mirrored(entity_id):
+            return
+        with self._lock:
+            if new_state is None:
+                self._states.pop(entity_id, None)  # Entiteten er fjernet
+            else:
+                self._states[entity_id] = new_state
+            self._stats['events'] += 1
+            self._stats['last_event'] = time.time()
+
+    def _load_snapshot(self, states):
+        snapshot = {s['entity_id']: s for s in states if self._mirrored(s.get('entity_id'))}
+        with self._lock:
+            self._states = snapshot
+            self._stats['connects'] += 1
+        self._connected.set()
+        print(f"✅ HA WebSocket ({self.endpoint}): speiler {len(snapshot)} entiteter", flush=True)
+
+    # ── Offentlig API ────────────────────────────────────────
+
+    def get_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Siste kjente tilstand for en entitet (samme format som REST /api/states).
+
+        Returns:
+            dict, eller None hvis speilet ikke er tilkoblet eller entiteten ikke speiles
+        """
+        if not self._connected.is_set():
+            return None
+        with self._lock:
+            return self._states.get(entity_id)
+
+    def call_service(self, domain: str, service: str, entity_id: str = None,
+                     data: Dict[str, Any] = None, timeout: float = HA_WS_CALL_TIMEOUT_S) -> Optional[Dict[str, Any]]:
+        """
+        Kall en HA-service over socketen.
+
+        Returns:
+            HA sitt result-svar ({'success': bool, 'error': {...}}), eller None hvis
+            speilet ikke er tilkoblet (kalleren bruker da REST)
+        """
+        if not self._connected.is_set():
+            return None
+        payload = {'type': 'call_service', 'domain': domain, 'service': service, 'service_data': data or {}}
+        if entity_id:
+            payload['target'] = {'entity_id': entity_id}
+        call = _PendingCall()
+        try:
+            msg_id = self._send(payload, pending=call)
+        except Exception:
+            return None  # Tilkoblingen døde akkurat nå - ikke sendt, trygt å bruke REST
+        with self._lock:
+            self._stats['service_calls'] += 1
+        if not call.event.wait(timeout):
+            with self._lock:
+                self._pending.pop(msg_id, None)
+            # Kallet kan være utført - ikke send det på nytt via REST
+            return {'success': False, 'error': {'code': 'timeout', 'message': f"ingen svar etter {timeout:.0f}s"}}
+        if call.message is None:
+            return {'success': False, 'error': {'code': 'disconnected', 'message': "tilkoblingen ble brutt"}}
+        return call.message
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            last_event = self._stats['last_event']
+            return {
+                'available': self.available(),
+                'connected': self._connected.is_set(),
+                'endpoint': self.endpoint,
+                'entities': len(self._states),
+                'connects': self._stats['connects'],
+                'events': self._stats['events'],
+                'service_calls': self._stats['service_calls'],
+                'last_event_age_s': round(time.time() - last_event, 1) if last_event else None,
+            }
+
+
+def get_ha_mirror() -> HomeAssistantMirror:
+    """Hent singleton HomeAssistantMirror-instansen."""
+    return HomeAssistantMirror.get_instance()
+
+
+def start_ha_mirror() -> bool:
+    """Start WebSocket-speilet (kalles fra chatgpt_voice.main). False = bruker kun REST."""
+    return get_ha_mirror().start()
@@ -1,12 +1,18 @@
 """
 Home Assistant Integration for Duck Assistant
-Kontroller enheter via Home Assistant REST API
+Kontroller enheter via Home Assistant REST API.
+Lesing og service-kall går via WebSocket-speilet (duck_ha_mirror) når det
+er tilkoblet, ellers REST med lokal → cloud fallback. Hvilken URL som
+brukes styres av circuit breakers og helsesjekk i bakgrunnen (duck_circuit).
 """
 
 import requests
 import os
 import subprocess
 from dotenv import load_dotenv
+from src.duck_http import get_http_client
+from src.duck_ha_mirror import get_ha_mirror
+from src.duck_circuit import EndpointSelector
 
 load_dotenv()
 
@@ -18,6 +24,29 @@ HA_TOKEN = os.getenv('HA_TOKEN', '')
 # Global cache for aktiv URL (oppdateres ved fallback)
 _active_ha_url = HA_LOCAL_URL
 
+# Timeout per endepunkt: maks for lesing (adaptiv ut fra målt latency, se duck_circuit),
+# fast for service-kall som HA kan bruke lang tid på
+HA_ENDPOINT_TIMEOUTS = {'lokal': 3, 'cloud': 10}
+
+
+def _probe_ha(base_url, timeout):
+    """Helsesjekk av ett HA-endepunkt (går utenom circuit breakeren)."""
+    response = get_http_client().get(f"{base_url}/api/", headers={"Authorization": f"Bearer {HA_TOKEN}"},
+                                     timeout=timeout, retries=0, circuit=False)
+    return response.ok
+
+
+# Lokal først (rask), cloud som reserve. Endepunkter som er nede hoppes over.
+_ha_endpoints = EndpointSelector('homeassistant', [('lokal', HA_LOCAL_URL), ('cloud', HA_CLOUD_URL)],
+                                 probe=_probe_ha)
+
+
+def start_ha_health_probes():
+    """Start helsesjekk av lokal/cloud-URL i bakgrunnen (kalles fra chatgpt_voice.main)."""
+    if not HA_TOKEN:
+        return False
+    return _ha_endpoints.start_probes()
+
 
 def get_ha_url():
     """
@@ -30,41 +59,96 @@ def get_ha_url():
 
 def _get_working_ha_url():
     """
-    Test og returner en fungerende HA URL (lokal først, deretter cloud).
+    Returner en fungerende HA URL (lokal først, deretter cloud) uten prøvekall:
+    WebSocket-speilets endepunkt, ellers det beste endepunktet som ikke er nede.
     Oppdaterer også _active_ha_url cache.
     """
     global _active_ha_url
-    
-    headers = {"Authorization": f"Bearer {HA_TOKEN}"}
-    
-    # Test lokal først
-    test_url_local = f"{HA_LOCAL_URL}/api/"
-    if _try_ha_request(test_url_local, method='get', headers=headers, timeout=2):
+
+    # WebSocket-speilet vet allerede hvilken URL som svarer - ingen prøvekall
+    endpoint = get_ha_mirror().endpoint
+    if endpoint == 'lokal':
         _active_ha_url = HA_LOCAL_URL
         return HA_LOCAL_URL
-    
-    # Fallback til cloud
-    if HA_CLOUD_URL:
-        test_url_cloud = f"{HA_CLOUD_URL}/api/"
-        if _try_ha_request(test_url_cloud, method='get', headers=headers, timeout=5):
-            _active_ha_url = HA_CLOUD_URL
-            print(f"🌍 Byttet til HA Cloud", flush=True)
-            return HA_CLOUD_URL
-    
-    return HA_LOCAL_URL  # Fallback til lokal selv om den feiler
+    if endpoint == 'cloud':
+        _active_ha_url = HA_CLOUD_URL
+        return HA_CLOUD_URL
+
+    best = _ha_endpoints.best()
+    if best is None:
+        return HA_LOCAL_URL  # Alle nede - kallet feiler raskt via breakeren
+    if best[1] != _active_ha_url and best[0] == 'cloud':
+        print(f"🌍 Byttet til HA Cloud", flush=True)
+    _active_ha_url = best[1]
+    return best[1]
 
 
-def _try_ha_request(url, method='get', headers=None, json=None, timeout=3):
-    """Helper for å prøve HA request med gitt URL"""
+def _try_ha_request(url, method='get', headers=None, json=None, timeout=3, **kwargs):
+    """
+    Helper for å prøve HA request med gitt URL
+
+    Returns:
+        (response, error) - response er None ved feil, error er exceptionen
+    """
     try:
-        if method == 'get':
-            response = requests.get(url, headers=headers, timeout=timeout)
-        else:
-            response = requests.post(url, headers=headers, json=json, timeout=timeout)
+        # Ingen retries her - kalleren faller tilbake til neste URL (lokal → cloud)
+        response = get_http_client().request(method, url, headers=headers, json=json, timeout=timeout,
+                                             retries=0, **kwargs)
         response.raise_for_status()
-        return response
-    except requests.exceptions.RequestException:
-        return None
+        return response, None
+    except requests.exceptions.RequestException as e:
+        return None, e
+
+
+def _ha_request(method, path, **kwargs):
+    """
+    REST-kall mot HA: prøver endepunktene som ikke er nede (lokal → cloud).
+
+    Lesing (GET) bruker adaptiv timeout per endepunkt og prøver neste
+    endepunkt ved alle feil. Service-kall (POST) kan ta lang tid i HA
+    (scripts, covers, støvsuger), så de får fast timeout fra
+    HA_ENDPOINT_TIMEOUTS, og går bare videre til neste endepunkt når
+    tilkoblingen feilet - ellers kan handlingen ha blitt utført, og et
+    nytt kall via cloud ville kjørt den to ganger.
+
+    Returns:
+        (response, label) eller (None, error) hvis ingen svarte
+    """
+    global _active_ha_url
+    
+    is_read = method.lower() == 'get'
+    headers = {"Authorization": f"Bearer {HA_TOKEN}"}
+    error = None
+    for label, base in _ha_endpoints.candidates():
+        timeout = HA_ENDPOINT_TIMEOUTS[label]
+        if is_read:
+            timeout = _ha_endpoints.timeout_for(base, timeout)
+        response, error = _try_ha_request(f"{base}{path}", method=method, headers=headers, timeout=timeout,
+                                          **kwargs)
+        if response:
+            if base != _active_ha_url and label == 'cloud':
+                print(f"🌍 Bruker HA Cloud (lokal ikke tilgjengelig)", flush=True)
+            _active_ha_url = base
+            return response, label
+        if not is_read and not isinstance(error, requests.exceptions.ConnectionError):
+            print(f"⚠️ HA {method.upper()} {path} via {label} feilet ({type(error).__name__}) - "
+                  f"prøver ikke {'neste endepunkt' if label == 'lokal' else 'igjen'}", flush=True)
+            break
+    return None, error
+
+
+def _get_state(entity_id):
+    """
+    Hent state-objektet for en entitet: fra WebSocket-speilet hvis tilkoblet,
+    ellers via REST. Kaster requests-exceptions ved feil.
+    """
+    state = get_ha_mirror().get_state(entity_id)
+    if state is not None:
+        return state
+    response, _ = _ha_request('get', f"/api/states/{entity_id}")
+    if response is None:
+        raise requests.exceptions.ConnectionError("Home Assistant ikke tilgjengelig (lokal og cloud)")
+    return response.json()
 
 
 def call_ha_service(domain, service, entity_id=None, data=None):
@@ -80,39 +164,33 @@ def call_ha_service(domain, service, entity_id=None, data=None):
     Returns:
         dict: Response fra HA eller feilmelding
     """
-    global _active_ha_url
-    
     if not HA_TOKEN:
         return "Home Assistant token mangler i .env (HA_TOKEN)"
     
-    headers = {
-        "Authorization": f"Bearer {HA_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {}
     if entity_id:
         payload['entity_id'] = entity_id
     if data:
         payload.update(data)
     
-    # Prøv lokal URL først (rask)
-    url_local = f"{HA_LOCAL_URL}/api/services/{domain}/{service}"
-    response = _try_ha_request(url_local, method='post', headers=headers, json=payload, timeout=3)
-    
+    # Over WebSocket-speilet hvis tilkoblet (ingen ny HTTP-request)
+    mirror = get_ha_mirror()
+    result = mirror.call_service(domain, service, entity_id, data)
+    if result is not None:
+        if result.get('success'):
+            return f"✅ {service} utført på {entity_id or 'alle enheter'} ({mirror.endpoint or 'websocket'})"
+        error = result.get('error') or {}
+        return f"❌ Home Assistant: {service} feilet ({error.get('message', 'ukjent feil')})"
+    
+    # REST: lokal først (rask), cloud hvis lokal feiler eller er nede
+    response, result = _ha_request('post', f"/api/services/{domain}/{service}", json=payload)
     if response:
-        _active_ha_url = HA_LOCAL_URL  # Oppdater cache
-        return f"✅ {service} utført på {entity_id or 'alle enheter'} (lokal)"
-    
-    # Fallback til cloud URL hvis lokal feiler
-    if HA_CLOUD_URL:
-        url_cloud = f"{HA_CLOUD_URL}/api/services/{domain}/{service}"
-        response = _try_ha_request(url_cloud, method='post', headers=headers, json=payload, timeout=10)
-        
-        if response:
-            _active_ha_url = HA_CLOUD_URL  # Oppdater cache
-            print(f"🌍 Bruker HA Cloud (lokal ikke tilgjengelig)", flush=True)
-            return f"✅ {service} utført på {entity_id or 'alle enheter'} (cloud)"
+        return f"✅ {service} utført på {entity_id or 'alle enheter'} ({result})"
+    if isinstance(result, requests.exceptions.Timeout) and \
+            not isinstance(result, requests.exceptions.ConnectionError):
+        return f"❌ Home Assistant svarte ikke i tide på {service} - det kan likevel ha blitt utført"
+    if isinstance(result, requests.exceptions.HTTPError):
+        return f"❌ Home Assistant: {service} feilet ({result.response.status_code})"
     
     return f"❌ Home Assistant ikke tilgjengelig (prøvde lokal og cloud)"
 
@@ -210,23 +288,16 @@ def get_ac_temperature(temp_type="both"):
     inside_entity = "sensor.thordis_mor_inside_temperature"
     outside_entity = "sensor.thordis_mor_outside_temperature"
     
-    url_base = f"{_get_working_ha_url()}/api/states/"
-    headers = {"Authorization": f"Bearer {HA_TOKEN}"}
-    
     try:
         result = []
         
         if temp_type in ["inside", "both"]:
-            response = requests.get(url_base + inside_entity, headers=headers, timeout=5)
-            if response.ok:
-                inside_temp = response.json().get('state', 'N/A')
-                result.append(f"Inne: {inside_temp}°C")
+            inside_temp = _get_state(inside_entity).get('state', 'N/A')
+            result.append(f"Inne: {inside_temp}°C")
         
         if temp_type in ["outside", "both"]:
-            response = requests.get(url_base + outside_entity, headers=headers, timeout=5)
-            if response.ok:
-                outside_temp = response.json().get('state', 'N/A')
-                result.append(f"Ute: {outside_temp}°C")
+            outside_temp = _get_state(outside_entity).get('state', 'N/A')
+            result.append(f"Ute: {outside_temp}°C")
         
         return ", ".join(result) if result else "Kunne ikke hente temperatur"
         
@@ -287,13 +358,9 @@ def get_email_status(action="summary"):
         return "Home Assistant token mangler"
     
     entity = "sensor.m365_mail_mail"
-    url = f"{_get_working_ha_url()}/api/states/{entity}"
-    headers = {"Authorization": f"Bearer {HA_TOKEN}"}
     
     try:
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
+        data = _get_state(entity)
         
         total_count = data.get('state', '0')
         emails = data.get('attributes', {}).get('data', [])
@@ -369,14 +436,7 @@ def get_calendar_events(action="next", calendar="calendar.m365_calendar_calendar
         
         # For "current", use state API to check if we're in a meeting right now
         if action == "current":
-            response = requests.get(
-                f"{_get_working_ha_url()}/api/states/{calendar}",
-                headers={"Authorization": f"Bearer {HA_TOKEN}"}
-            )
-            if response.status_code != 200:
-                return f"❌ Kunne ikke hente kalender: {response.status_code}"
-            
-            data = response.json()
+            data = _get_state(calendar)
             state = data.get("state")
             attributes = data.get("attributes", {})
             
@@ -413,7 +473,7 @@ def get_calendar_events(action="next", calendar="calendar.m365_calendar_calendar
             
             # Use Calendar Events API
             calendar_id = calendar.replace('calendar.', '')  # Remove "calendar." prefix
-            response = requests.get(
+            response = get_http_client().get(
                 f"{_get_working_ha_url()}/api/calendars/{calendar}",
                 headers={"Authorization": f"Bearer {HA_TOKEN}"},
                 params={'start': start_str, 'end': end_str}
@@ -535,15 +595,9 @@ def manage_todo(action="list", item=None, todo_list="todo.m365_todo_tasks"):
     try:
         if action == "list":
             # Hent alle items fra state attributes
-            response = requests.get(
-                f"{_get_working_ha_url()}/api/states/{todo_list}",
-                headers={"Authorization": f"Bearer {HA_TOKEN}"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                state = data.get("state", "0")
-                return f"Handlelisten har {state} items"
+            data = _get_state(todo_list)
+            state = data.get("state", "0")
+            return f"Handlelisten har {state} items"
         
         elif action == "add" and item:
             # Legg til item
@@ -593,29 +647,21 @@ def manage_todo(action="list", item=None, todo_list="todo.m365_todo_tasks"):
 def get_teams_status():
     """Hent Teams-status"""
     try:
-        response = requests.get(
-            f"{_get_working_ha_url()}/api/states/sensor.m365_teams_status",
-            headers={"Authorization": f"Bearer {HA_TOKEN}"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            status = data.get("state", "Ukjent")
-            
-            # Oversett status til norsk
-            status_map = {
-                "Available": "Tilgjengelig",
-                "Busy": "Opptatt",
-                "DoNotDisturb": "Ikke forstyrr",
-                "BeRightBack": "Straks tilbake",
-                "Away": "Borte",
-                "Offline": "Frakoblet"
-            }
-            
-            norwegian_status = status_map.get(status, status)
-            return f"Teams-status: {norwegian_status}"
+        data = _get_state("sensor.m365_teams_status")
+        status = data.get("state", "Ukjent")
+        
+        # Oversett status til norsk
+        status_map = {
+            "Available": "Tilgjengelig",
+            "Busy": "Opptatt",
+            "DoNotDisturb": "Ikke forstyrr",
+            "BeRightBack": "Straks tilbake",
+            "Away": "Borte",
+            "Offline": "Frakoblet"
+        }
         
-        return f"❌ Kunne ikke hente Teams-status: {response.status_code}"
+        norwegian_status = status_map.get(status, status)
+        return f"Teams-status: {norwegian_status}"
     except Exception as e:
         return f"❌ Feil ved henting av Teams-status: {str(e)}"
 
@@ -623,31 +669,23 @@ def get_teams_status():
 def get_teams_chat():
     """Hent siste Teams-melding"""
     try:
-        response = requests.get(
-            f"{_get_working_ha_url()}/api/states/sensor.m365_teams_chat",
-            headers={"Authorization": f"Bearer {HA_TOKEN}"}
-        )
+        data = _get_state("sensor.m365_teams_chat")
+        attributes = data.get("attributes", {})
         
-        if response.status_code == 200:
-            data = response.json()
-            attributes = data.get("attributes", {})
-            
-            from_name = attributes.get("from_display_name", "Ukjent")
-            content = attributes.get("content", "")
-            importance = attributes.get("importance", "normal")
-            
-            # Rens HTML-tags fra innhold
-            import re
-            clean_content = re.sub(r'<[^>]+>', '', content)
-            clean_content = clean_content.replace('&nbsp;', ' ').strip()
-            
-            if clean_content:
-                importance_str = " (viktig!)" if importance == "high" else ""
-                return f"Siste Teams-melding{importance_str}:\nFra: {from_name}\n{clean_content}"
-            else:
-                return "Ingen Teams-meldinger funnet"
+        from_name = attributes.get("from_display_name", "Ukjent")
+        content = attributes.get("content", "")
+        importance = attributes.get("importance", "normal")
+        
+        # Rens HTML-tags fra innhold
+        import re
+        clean_content = re.sub(r'<[^>]+>', '', content)
+        clean_content = clean_content.replace('&nbsp;', ' ').strip()
         
-        return f"❌ Kunne ikke hente Teams-chat: {response.status_code}"
+        if clean_content:
+            importance_str = " (viktig!)" if importance == "high" else ""
+            return f"Siste Teams-melding{importance_str}:\nFra: {from_name}\n{clean_content}"
+        else:
+            return "Ingen Teams-meldinger funnet"
     except Exception as e:
         return f"❌ Feil ved henting av Teams-chat: {str(e)}"
 
@@ -725,7 +763,7 @@ def create_movie_scene():
             "Content-Type": "application/json"
         }
         
-        response = requests.post(
+        response = get_http_client().post(
             f"{_get_working_ha_url()}/api/services/scene/create",
             headers=headers,
             json=scene_data,
@@ -783,7 +821,7 @@ def create_goodnight_scene():
             "Content-Type": "application/json"
         }
         
-        response = requests.post(
+        response = get_http_client().post(
             f"{_get_working_ha_url()}/api/services/scene/create",
             headers=headers,
             json=scene_data,
@@ -825,32 +863,11 @@ def control_blinds(action, room=None, position=None):
 
 def get_ha_state(entity_id):
     """Hent tilstand for en enhet fra HA med smart fallback"""
-    global _active_ha_url
-    
     if not HA_TOKEN:
         return "Home Assistant token mangler"
     
-    headers = {"Authorization": f"Bearer {HA_TOKEN}"}
-    
-    # Prøv lokal først
-    url_local = f"{HA_LOCAL_URL}/api/states/{entity_id}"
-    response = _try_ha_request(url_local, method='get', headers=headers, timeout=3)
-    
-    if not response and HA_CLOUD_URL:
-        # Fallback til cloud
-        url_cloud = f"{HA_CLOUD_URL}/api/states/{entity_id}"
-        response = _try_ha_request(url_cloud, method='get', headers=headers, timeout=10)
-        if response:
-            _active_ha_url = HA_CLOUD_URL
-            print(f"🌍 Bruker HA Cloud for state query", flush=True)
-    else:
-        _active_ha_url = HA_LOCAL_URL
-    
-    if not response:
-        return f"❌ Kunne ikke hente state for {entity_id}"
-    
     try:
-        data = response.json()
+        data = _get_state(entity_id)
         state = data.get('state', 'unknown')
         attrs = data.get('attributes', {})
         
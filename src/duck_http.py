@@ -0,0 +1,306 @@
+"""
+DuckHttpClient — delt HTTP-klient med pooled tilkoblinger per host.
+
+Alle integrasjoner (OpenAI, MET, Home Assistant, Entur, NRK, Wikipedia,
+football-data, SMS-relay ...) går gjennom denne i stedet for bare
+requests.get/post. Det gir:
+
+- Én requests.Session per host med keep-alive, så TCP + TLS-handshaken
+  (100–300 ms på Pi) bare gjøres én gang per host
+- Konsistente connect/read-timeouts (HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT)
+- Retry med eksponentiell backoff og full jitter ved tilkoblingsfeil og
+  502/503/504 (respekterer Retry-After). Idempotente metoder retries
+  automatisk, POST kun med retries=N. Read timeouts og 429/500 bare når
+  kalleren ber om det (retry_timeouts, retry_statuses)
+- Circuit breaker per host (duck_circuit): en host som er nede feiler
+  raskt med CircuitOpenError i stedet for å koste full timeout hver tur
+- Tidsfrist per tur (duck_deadline): timeouts kappes til tiden som er igjen,
+  og det prøves ikke på nytt når ventetiden ville sprengt fristen
+- Tellere og latency-histogram per host (vises i kontrollpanelet)
+
+Bruk:
+    from src.duck_http import get_http_client
+
+    http = get_http_client()
+    response = http.get(url, params={...})
+    response = http.post(url, json=data, retries=3, timeout=(3.05, 60),
+                         retry_statuses=HTTP_RETRY_STATUSES_API)
+
+Returnerer vanlige requests.Response-objekter og kaster de samme
+exceptions som requests, så eksisterende feilhåndtering fungerer uendret.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.duck_config import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_MAXSIZE, HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE_S, HTTP_BACKOFF_MAX_S, HTTP_RETRY_STATUSES, HTTP_LATENCY_BUCKETS_MS,
+    HTTP_MAX_SESSIONS
+)
+from src.duck_circuit import CLOSED, CircuitOpenError, drop_breaker, find_breaker, get_breaker
+from src.duck_deadline import DeadlineExceeded, clamp_timeout, remaining
+
+_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+
+class _HostStats:
+    """Tellere og latency-histogram for én host (oppdateres med klientens lock)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.status = {}  # '2xx' → antall
+        self.buckets = [0] * (len(HTTP_LATENCY_BUCKETS_MS) + 1)  # Siste = over største grense
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float, status_code: Optional[int]):
+        self.requests += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        for i, limit in enumerate(HTTP_LATENCY_BUCKETS_MS):
+            if duration_ms <= limit:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        if status_code is None:
+            self.errors += 1
+        else:
+            key = f"{status_code // 100}xx"
+            self.status[key] = self.status.get(key, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={limit}ms" for limit in HTTP_LATENCY_BUCKETS_MS] + [f">{HTTP_LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'status': dict(self.status),
+            'avg_ms': round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            'max_ms': round(self.max_ms, 1),
+            'histogram': dict(zip(labels, self.buckets)),
+        }
+
+
+class DuckHttpClient:
+    """
+    Pooled HTTP-klient med én Session per host.
+    Singleton — bruk get_http_client() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self._sessions: 'OrderedDict[str, requests.Session]' = OrderedDict()  # Minst brukt først
+        self._stats: Dict[str, _HostStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'DuckHttpClient':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # ── Sessions ─────────────────────────────────────────────
+
+    @staticmethod
+    def _new_session() -> requests.Session:
+        session = requests.Session()
+        # urllib3 håndterer kun tilkoblingsfeil (f.eks. en keep-alive-tilkobling
+        # serveren har lukket). Status-retries gjøres i request() med jitter.
+        # read=False: read timeouts kastes som ReadTimeout (med read=0 blir de
+        # MaxRetryError → ConnectionError, og kan ikke skilles fra tilkoblingsfeil)
+        retry = Retry(total=1, connect=1, read=False, status=0, redirect=3, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _session_for(self, host_key: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host_key)
+            if session is None:
+                session = self._new_session()
+                self._sessions[host_key] = session
+                self._stats.setdefault(host_key, _HostStats())
+                # Engangs-hosts (f.eks. artikler fra web_search) skal ikke holde tilkoblinger,
+                # statistikk eller breakere for alltid
+                while len(self._sessions) > HTTP_MAX_SESSIONS:
+                    evicted_host, evicted = self._sessions.popitem(last=False)
+                    evicted.close()
+                    self._stats.pop(evicted_host, None)
+                    drop_breaker(evicted_host)
+            else:
+                self._sessions.move_to_end(host_key)
+            return session
+
+    # ── Requests ─────────────────────────────────────────────
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[requests.Response]) -> float:
+        """Ventetid før neste forsøk: Retry-After hvis satt, ellers full jitter."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), HTTP_BACKOFF_MAX_S)
+                except ValueError:
+                    pass  # HTTP-dato - bruk vanlig backoff
+        return random.uniform(0, min(HTTP_BACKOFF_MAX_S, HTTP_BACKOFF_BASE_S * (2 ** attempt)))
+
+    def request(self, method: str, url: str, retries: int = None, timeout=None,
+                circuit: bool = True, retry_statuses=None, retry_timeouts: bool = False,
+                **kwargs) -> requests.Response:
+        """
+        Utfør et HTTP-kall via pooled session for hosten.
+
+        Args:
+            method: HTTP-metode
+            url: Full URL
+            retries: Antall ekstra forsøk ved tilkoblingsfeil og retry_statuses.
+                     Default HTTP_MAX_RETRIES for idempotente metoder, 0 for POST/PATCH.
+            timeout: Sekunder eller (connect, read). Default (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+            circuit: False for helsesjekker som skal nå hosten selv om breakeren er åpen
+            retry_statuses: Statuskoder som prøves på nytt. Default HTTP_RETRY_STATUSES (502/503/504)
+            retry_timeouts: Prøv også på nytt etter read timeout (kun for kall utenfor stemme-turen)
+            **kwargs: Sendes videre til requests (params, json, data, headers, auth ...)
+
+        Returns:
+            requests.Response fra siste forsøk (status sjekkes av kalleren)
+
+        Raises:
+            CircuitOpenError: Hosten regnes som nede (arver fra requests.ConnectionError)
+            DeadlineExceeded: Turens tidsfrist er brukt opp (arver fra requests.Timeout)
+        """
+        method = method.upper()
+        if retries is None:
+            retries = HTTP_MAX_RETRIES if method in _IDEMPOTENT_METHODS else 0
+        if timeout is None:
+            timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        if retry_statuses is None:
+            retry_statuses = HTTP_RETRY_STATUSES
+
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+        session = self._session_for(host_key)
+        breaker = get_breaker(host_key) if circuit else None
+
+        # Breakeren får ett utfall per logisk kall (etter siste forsøk), ikke ett per retry:
+        # ellers åpner ett kall med retries=2 kretsen alene (CIRCUIT_FAILURE_THRESHOLD=3)
+        last_failed = False
+        for attempt in range(retries + 1):
+            budget = remaining()
+            attempt_timeout = timeout
+            if budget is not None:
+                if budget <= 0:
+                    if last_failed:
+                        self._record(breaker, failed=True)
+                    raise DeadlineExceeded(f"Tidsfristen for turen er brukt opp ({parts.netloc})")
+                attempt_timeout = clamp_timeout(timeout, budget)
+            if attempt == 0 and breaker is not None and not breaker.allow():
+                raise CircuitOpenError(
+                    f"{parts.netloc} svarer ikke (circuit open, nytt forsøk om {breaker.retry_in():.0f}s)")
+
+            start = time.monotonic()
+            try:
+                response = session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._observe(host_key, start, None)
+                left = remaining()
+                if budget is not None and left is not None and left < 0.1:
+                    # Timeout fordi vi kappet til turens frist sier ingenting om hosten
+                    if last_failed:
+                        self._record(breaker, failed=True)
+                    raise DeadlineExceeded(f"Tidsfristen for turen gikk ut under kall til {parts.netloc}") from e
+                last_failed = True
+                wait = self._backoff(attempt, None)
+                # ConnectTimeout er også en ConnectionError; en ren read timeout kan ha nådd tjenesten
+                retryable = isinstance(e, requests.ConnectionError) or retry_timeouts
+                if (not retryable or attempt >= retries or not self._time_left_for(wait)
+                        or self._gave_up(breaker)):
+                    self._record(breaker, failed=True)
+                    raise
+                print(f"⚠️ HTTP {parts.netloc}: nettverksfeil, retry {attempt+1}/{retries} om {wait:.1f}s", flush=True)
+            else:
+                duration_ms = self._observe(host_key, start, response.status_code)
+                last_failed = response.status_code >= 500
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    self._record(breaker, last_failed, duration_ms)
+                    return response
+                wait = self._backoff(attempt, response)
+                if not self._time_left_for(wait) or self._gave_up(breaker):
+                    self._record(breaker, last_failed, duration_ms)
+                    return response
+                print(f"⚠️ HTTP {parts.netloc}: {response.status_code}, retry {attempt+1}/{retries} om {wait:.1f}s", flush=True)
+                response.close()  # Frigjør tilkoblingen til poolen
+            with self._lock:
+                self._stats.setdefault(host_key, _HostStats()).retries += 1
+            time.sleep(wait)
+
+    @staticmethod
+    def _record(breaker, failed: bool, duration_ms: float = None):
+        """Utfallet av et logisk kall (alle forsøk) til breakeren."""
+        if breaker is None:
+            return
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success(duration_ms)
+
+    @staticmethod
+    def _time_left_for(wait: float) -> bool:
+        """Er det tid til å vente `wait` sekunder og prøve igjen innenfor turens frist?"""
+        budget = remaining()
+        return budget is None or wait < budget
+
+    @staticmethod
+    def _gave_up(breaker) -> bool:
+        """Breakeren åpnet under retries - ikke fortsett å hamre på hosten."""
+        return breaker is not None and breaker.state != CLOSED
+
+    def _observe(self, host_key: str, start: float, status_code: Optional[int]) -> float:
+        duration_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._stats.setdefault(host_key, _HostStats()).observe(duration_ms, status_code)
+        return duration_ms
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    # ── Statistikk ───────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Tellere, latency-histogram og circuit breaker-tilstand per host."""
+        with self._lock:
+            hosts = {host: stats.to_dict() for host, stats in sorted(self._stats.items())}
+        for host, host_stats in hosts.items():
+            breaker = find_breaker(host)  # Hosts kalt med circuit=False har ingen
+            host_stats['circuit'] = breaker.to_dict() if breaker is not None else None
+        return hosts
+
+
+def get_http_client() -> DuckHttpClient:
+    """Hent singleton DuckHttpClient-instansen."""
+    return DuckHttpClient.get_instance()
@@ -0,0 +1,202 @@
+"""
+HueClient — Philips Hue-styring med cachet oversikt og gruppe-kommandoer.
+
+Tidligere hentet control_hue_lights hele /lights (full tilstand for hver
+pære) ved hvert kall, og sendte så én PUT per lys etter hverandre - åtte
+pærer i stua ga åtte rundturer og lys som skrudde seg på ett og ett.
+
+- Oversikten over lys og rom/soner (/lights + /groups) caches og oppdateres
+  i bakgrunnen etter HUE_INVENTORY_TTL_S
+- Et rom eller en sone styres med ett groups/<id>/action-kall (alle lys
+  skifter samtidig), "alle lys" med gruppe 0
+- Må enkeltlys styres (navn som ikke er et rom), sendes PUT-ene samtidig
+  (HUE_MAX_PARALLEL)
+
+Bruk:
+    from src.duck_hue import get_hue_client
+
+    hue = get_hue_client()
+    target = hue.resolve("stue")          # HueTarget eller None
+    ok_names = hue.apply(target, {'on': True, 'bri': 127})
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from src.duck_config import HUE_INVENTORY_TTL_S, HUE_MAX_PARALLEL
+from src.duck_deadline import deadline_at, remaining
+from src.duck_http import get_http_client
+
+_put_pool = ThreadPoolExecutor(max_workers=HUE_MAX_PARALLEL, thread_name_prefix="hue-put")
+
+# Gruppetyper som tilsvarer et rom (Entertainment/LightGroup er tekniske grupper)
+_ROOM_TYPES = ('Room', 'Zone')
+
+
+class HueTarget:
+    """Hva en kommando skal gå til: én bridge-gruppe eller en liste enkeltlys."""
+    __slots__ = ('group_id', 'light_ids', 'names')
+
+    def __init__(self, group_id: Optional[str], light_ids: List[str], names: List[str]):
+        self.group_id = group_id
+        self.light_ids = light_ids
+        self.names = names
+
+
+class HueClient:
+    """
+    Klient for Hue-broen med cachet lys/rom-oversikt.
+    Singleton — bruk get_hue_client() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, bridge_ip: str = None, api_key: str = None):
+        self.bridge_ip = bridge_ip or os.getenv("HUE_BRIDGE_IP")
+        self.api_key = api_key or os.getenv("HUE_API_KEY")
+        self._lock = threading.Lock()
+        self._lights: Dict[str, str] = {}  # light_id → navn
+        self._groups: Dict[str, Dict[str, Any]] = {}  # group_id → {'name', 'type', 'lights'}
+        self._loaded_at = 0.0
+        self._refreshing = False
+
+    @classmethod
+    def get_instance(cls) -> 'HueClient':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def is_configured(self) -> bool:
+        return bool(self.bridge_ip and self.api_key)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.bridge_ip}/api/{self.api_key}"
+
+    # ── Oversikt (lys og rom) ────────────────────────────────
+
+    def _load_inventory(self):
+        """Hent lys og grupper fra broen. Kaster ved nettverksfeil."""
+        http = get_http_client()
+        lights_resp = http.get(f"{self.base_url}/lights", timeout=5)
+        lights_resp.raise_for_status()
+        groups_resp = http.get(f"{self.base_url}/groups", timeout=5)
+        groups_resp.raise_for_status()
+        lights = {lid: data.get('name', lid) for lid, data in lights_resp.json().items()}
+        groups = {
+            gid: {'name': data.get('name', gid), 'type': data.get('type'), 'lights': data.get('lights', [])}
+            for gid, data in groups_resp.json().items()
+        }
+        with self._lock:
+            self._lights = lights
+            self._groups = groups
+            self._loaded_at = time.monotonic()
+        print(f"💡 Hue: {len(lights)} lys, {sum(g['type'] in _ROOM_TYPES for g in groups.values())} rom/soner", flush=True)
+
+    def _refresh_in_background(self):
+        try:
+            self._load_inventory()
+        except Exception as e:
+            print(f"⚠️ Hue: kunne ikke oppdatere lysoversikt: {e}", flush=True)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_inventory(self):
+        """Første gang: hent synkront. Etter TTL: bruk gammel oversikt og oppdater i bakgrunnen."""
+        with self._lock:
+            loaded = self._loaded_at > 0
+            expired = time.monotonic() - self._loaded_at > HUE_INVENTORY_TTL_S
+            if loaded and expired and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True, name="hue-inventory").start()
+        if not loaded:
+            self._load_inventory()
+
+    def invalidate(self):
+        """Glem oversikten (f.eks. når broen sier at et lys ikke finnes lenger)."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def light_names(self) -> List[str]:
+        self._ensure_inventory()
+        with self._lock:
+            return list(self._lights.values())
+
+    def room_names(self) -> List[str]:
+        self._ensure_inventory()
+        with self._lock:
+            return [g['name'] for g in self._groups.values() if g['type'] in _ROOM_TYPES]
+
+    def resolve(self, room: str = None) -> Optional[HueTarget]:
+        """
+        Finn hva et romnavn betyr: et Hue-rom/sone (én gruppe-kommando), ellers
+        lys med navnet i seg (samme match som før), None hvis ingenting passer.
+        Uten rom: gruppe 0 (alle lys).
+        """
+        self._ensure_inventory()
+        with self._lock:
+            if not room:
+                return HueTarget('0', list(self._lights), list(self._lights.values()))
+            room_lower = room.lower().strip()
+            rooms = [(gid, g) for gid, g in self._groups.items() if g['type'] in _ROOM_TYPES]
+            match = next((item for item in rooms if item[1]['name'].lower() == room_lower), None) or \
+                next((item for item in rooms if room_lower in item[1]['name'].lower()), None)
+            if match:
+                gid, group = match
+                return HueTarget(gid, list(group['lights']),
+                                 [self._lights.get(lid, lid) for lid in group['lights']])
+            light_ids = [lid for lid, name in self._lights.items() if room_lower in name.lower()]
+            if not light_ids:
+                return None
+            return HueTarget(None, light_ids, [self._lights[lid] for lid in light_ids])
+
+    # ── Kommandoer ───────────────────────────────────────────
+
+    def _put(self, path: str, state: Dict[str, Any]) -> bool:
+        """PUT til broen. Hue svarer 200 også ved feil - se etter 'success' i svaret."""
+        resp = get_http_client().put(f"{self.base_url}/{path}", json=state, timeout=5)
+        resp.raise_for_status()
+        body = resp.json()
+        errors = [item['error'] for item in body if 'error' in item]
+        if errors:
+            print(f"⚠️ Hue {path}: {errors[0].get('description')}", flush=True)
+            if any(err.get('type') == 3 for err in errors):  # Ressursen finnes ikke
+                self.invalidate()
+        return any('success' in item for item in body)
+
+    def _put_light(self, light_id: str, state: Dict[str, Any], deadline: Optional[float]) -> bool:
+        try:
+            if deadline is None:
+                return self._put(f"lights/{light_id}/state", state)
+            with deadline_at(deadline):  # Turens frist gjelder også i pool-trådene
+                return self._put(f"lights/{light_id}/state", state)
+        except Exception as e:
+            print(f"Feil ved kontroll av lys {light_id}: {e}", flush=True)
+            return False
+
+    def apply(self, target: HueTarget, state: Dict[str, Any]) -> List[str]:
+        """
+        Send state til målet. Gruppe: ett action-kall. Enkeltlys: samtidige PUT-er.
+
+        Returns:
+            Navn på lysene som ble styrt
+        """
+        if target.group_id is not None:
+            if self._put(f"groups/{target.group_id}/action", state):
+                return target.names
+            return []
+        left = remaining()
+        deadline = time.monotonic() + left if left is not None else None
+        futures = [_put_pool.submit(self._put_light, lid, state, deadline) for lid in target.light_ids]
+        return [name for name, future in zip(target.names, futures) if future.result()]
+
+
+def get_hue_client() -> HueClient:
+    """Hent singleton HueClient-instansen."""
+    return HueClient.get_instance()
@@ -16,11 +16,13 @@ from dataclasses import dataclass, asdict
 from pathlib import Path
 import math
 import pickle
+from collections import deque
 import numpy as np
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
 from src.duck_database import get_db
+from src.duck_tracing import get_tracer
 from src.duck_config import (
     DB_PATH as DEFAULT_DB_PATH,
     MEMORY_EMBEDDING_SEARCH_LIMIT,
@@ -129,8 +131,11 @@ class Message:
 
 class MemoryMetrics:
     """Performance metrics"""
+    # Begrenset vindu - listen vokste ubegrenset i en langtkjørende prosess
+    MAX_LATENCY_SAMPLES = 500
+    
     def __init__(self):
-        self.search_latency: List[float] = []
+        self.search_latency = deque(maxlen=self.MAX_LATENCY_SAMPLES)
         self.cache_hits = 0
         self.cache_misses = 0
         self.memory_extractions = 0
@@ -1492,20 +1497,24 @@ class MemoryManager:
         max_facts = int(settings.get('max_context_facts', 100))
         
         
+        tracer = get_tracer()
+        
         # 1. Generer embedding ÉN gang (brukes for både facts og memories)
-        query_embedding = self.generate_embedding(query)
+        with tracer.span("context.embedding"):
+            query_embedding = self.generate_embedding(query)
         
         # 2. Søk etter relevante facts basert på query (EMBEDDING SEARCH)
-        searched_facts = self.search_by_embedding(query, limit=embedding_limit, query_embedding=query_embedding)
-        
-        # 3. Ekspander med relaterte facts
-        expanded_facts = self._expand_related_facts(searched_facts)
-        
-        # 4. Hvis vi fremdeles har få facts, legg til frekvente
-        if len(expanded_facts) < expand_threshold:
-            frequent_facts = self.get_top_facts_cached(limit=frequent_limit)
-        else:
-            frequent_facts = []
+        with tracer.span("context.fact_search"):
+            searched_facts = self.search_by_embedding(query, limit=embedding_limit, query_embedding=query_embedding)
+            
+            # 3. Ekspander med relaterte facts
+            expanded_facts = self._expand_related_facts(searched_facts)
+            
+            # 4. Hvis vi fremdeles har få facts, legg til frekvente
+            if len(expanded_facts) < expand_threshold:
+                frequent_facts = self.get_top_facts_cached(limit=frequent_limit)
+            else:
+                frequent_facts = []
         
         # 5. Kombiner og dedupliser
         seen_keys = set()
@@ -1529,16 +1538,17 @@ class MemoryManager:
         # 6. Relevant memories (gjenbruker samme embedding - spar 1 API-kall)
         # Søk i ALLE minner, men boost minner om personen vi snakker med
         conn = self._get_connection()  # Re-open connection
-        relevant_memories = self.search_memories_by_embedding(
-            query, 
-            limit=MEMORY_LIMIT, 
-            threshold=MEMORY_THRESHOLD, 
-            user_name=None,  # Søk i alle minner
-            boost_user=user_name,  # Men boost minner om denne personen
-            query_embedding=query_embedding,  # Gjenbruk embedding (spar 1 API-kall)
-            touch=False,  # Ikke oppdater last_accessed i sanntid (ytelse)
-            return_scores=True  # Returner ekte similarity scores
-        )
+        with tracer.span("context.memory_search"):
+            relevant_memories = self.search_memories_by_embedding(
+                query, 
+                limit=MEMORY_LIMIT, 
+                threshold=MEMORY_THRESHOLD, 
+                user_name=None,  # Søk i alle minner
+                boost_user=user_name,  # Men boost minner om denne personen
+                query_embedding=query_embedding,  # Gjenbruk embedding (spar 1 API-kall)
+                touch=False,  # Ikke oppdater last_accessed i sanntid (ytelse)
+                return_scores=True  # Returner ekte similarity scores
+            )
         
         # 7. Recent topics
         topic_stats = self.get_topic_stats(limit=5)
@@ -18,9 +18,9 @@ import sys
 import os
 import json
 import time
-import requests
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from src.duck_http import get_http_client
 from src.duck_memory import MemoryManager
 
 # Flush stdout for journalctl
@@ -193,7 +193,7 @@ Returner JSON:
 """
     
     try:
-        response = requests.post(
+        response = get_http_client().post(
             'https://api.openai.com/v1/chat/completions',
             headers={'Authorization': f'Bearer {OPENAI_API_KEY}'},
             json={
@@ -27,8 +27,9 @@ import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
-import requests
 from src.duck_memory import MemoryManager, ProfileFact, Memory
+from src.duck_config import HTTP_CONNECT_TIMEOUT, HTTP_RETRY_STATUSES_API
+from src.duck_http import get_http_client
 import sys
 
 # Flush stdout for journalctl
@@ -45,7 +46,6 @@ CHECK_INTERVAL = 5        # Sjekk hver 5. sekund
 BATCH_SIZE = 5            # Prosesser opptil 5 meldinger per batch
 MAX_BACKOFF = 300          # Maks 5 min mellom retries ved vedvarende feil
 MAX_API_RETRIES = 3        # Antall retries for API-kall
-API_RETRY_BASE = 2         # Base for exponential backoff (2, 4, 8 sek)
 
 # Topics som aldri gir noe nyttig fra LLM-extraction
 TRIVIAL_TOPICS = {'time', 'weather', 'lights', 'tv', 'ac', 'vacuum', 'music', 'twinkly', 'backup'}
@@ -139,45 +139,21 @@ class MemoryExtractor:
             "response_format": {"type": "json_object"}
         }
 
-        last_error = None
-        for attempt in range(MAX_API_RETRIES):
-            try:
-                response = requests.post(url, headers=headers, json=data, timeout=30)
-
-                # Rate limit — vent og prøv igjen
-                if response.status_code == 429:
-                    retry_after = int(response.headers.get('Retry-After', API_RETRY_BASE ** (attempt + 1)))
-                    print(f"  ⏳ Rate limited, venter {retry_after}s...", flush=True)
-                    time.sleep(retry_after)
-                    continue
-
-                # Server error — retry
-                if response.status_code >= 500:
-                    wait = API_RETRY_BASE ** (attempt + 1)
-                    print(f"  ⏳ Server error {response.status_code}, retry om {wait}s...", flush=True)
-                    time.sleep(wait)
-                    continue
-
-                response.raise_for_status()
-
-                content = response.json()["choices"][0]["message"]["content"]
-                result = json.loads(content)
-                self.extraction_count += 1
-                return result
-
-            except requests.exceptions.Timeout:
-                last_error = "Timeout"
-                wait = API_RETRY_BASE ** (attempt + 1)
-                print(f"  ⏳ API timeout, retry {attempt+1}/{MAX_API_RETRIES} om {wait}s...", flush=True)
-                time.sleep(wait)
-            except Exception as e:
-                last_error = str(e)
-                if attempt < MAX_API_RETRIES - 1:
-                    wait = API_RETRY_BASE ** (attempt + 1)
-                    print(f"  ⏳ API feil: {e}, retry om {wait}s...", flush=True)
-                    time.sleep(wait)
-
-        print(f"❌ API-kall feilet etter {MAX_API_RETRIES} forsøk: {last_error}", flush=True)
+        try:
+            # Delt pooled klient: retry med jitter ved 429/5xx/timeout (respekterer Retry-After)
+            response = get_http_client().post(
+                url, headers=headers, json=data,
+                retries=MAX_API_RETRIES - 1, timeout=(HTTP_CONNECT_TIMEOUT, 30),
+                retry_statuses=HTTP_RETRY_STATUSES_API, retry_timeouts=True  # Bakgrunnsjobb - ingen venter
+            )
+            response.raise_for_status()
+
+            content = response.json()["choices"][0]["message"]["content"]
+            result = json.loads(content)
+            self.extraction_count += 1
+            return result
+        except Exception as e:
+            print(f"❌ API-kall feilet etter {MAX_API_RETRIES} forsøk: {e}", flush=True)
         return {'profile_facts': [], 'memories': [], 'topics': [], 'importance': 1}
 
     def extract_from_conversation(self, user_text: str, ai_response: str, context: List[tuple] = None) -> Dict:
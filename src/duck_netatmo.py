@@ -0,0 +1,223 @@
+"""
+NetatmoClient — Netatmo-oppslag med cachet token og topologi.
+
+Tidligere byttet get_netatmo_temperature refresh token mot et nytt access
+token ved hvert spørsmål (uten timeout), hentet homesdata og så homestatus
+for ett hjem om gangen - minst tre rundturer, og Netatmo begrenser
+token-fornyelser.
+
+- Access token caches til NETATMO_TOKEN_MARGIN_S før det utløper, og
+  fornyes bak en lås (samtidige kall venter på samme fornyelse)
+- Netatmo roterer refresh token ved fornyelse og det gamle slutter å
+  virke. Det nye skrives atomisk til NETATMO_TOKEN_FILE og brukes foran
+  NETATMO_REFRESH_TOKEN fra .env etter omstart
+- Hjem, rom og moduler (homesdata) caches i NETATMO_TOPOLOGY_TTL_S
+- homestatus for alle hjem hentes samtidig med timeout
+- Selve tool-svaret caches i tool-cachen (get_netatmo_temperature)
+
+Bruk:
+    from src.duck_netatmo import get_netatmo_client
+
+    readings = get_netatmo_client().read_rooms()
+    # [{'room': 'Stue', 'temperature': 21.5, 'humidity': 40, 'co2': 612}, ...]
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from src.duck_config import (
+    HTTP_CONNECT_TIMEOUT, NETATMO_TOKEN_MARGIN_S, NETATMO_TOPOLOGY_TTL_S,
+    NETATMO_READ_TIMEOUT_S, NETATMO_MAX_PARALLEL, NETATMO_TOKEN_FILE
+)
+from src.duck_deadline import deadline_at, remaining
+from src.duck_http import get_http_client
+
+TOKEN_URL = "https://api.netatmo.com/oauth2/token"
+HOMESDATA_URL = "https://api.netatmo.com/api/homesdata"
+HOMESTATUS_URL = "https://api.netatmo.com/api/homestatus"
+
+_status_pool = ThreadPoolExecutor(max_workers=NETATMO_MAX_PARALLEL, thread_name_prefix="netatmo-status")
+
+
+class NetatmoClient:
+    """
+    Klient for Netatmo Energy/Weather API med token- og topologi-cache.
+    Singleton — bruk get_netatmo_client() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, client_id: str = None, client_secret: str = None, refresh_token: str = None,
+                 token_file: str = NETATMO_TOKEN_FILE):
+        self.client_id = client_id or os.getenv("NETATMO_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("NETATMO_CLIENT_SECRET")
+        self.token_file = Path(token_file)
+        # Sist roterte token fra fila er nyere enn det i .env
+        self._refresh_token = refresh_token or self._load_refresh_token() or os.getenv("NETATMO_REFRESH_TOKEN")
+        self._token_lock = threading.Lock()
+        self._access_token: Optional[str] = None
+        self._token_expires = 0.0
+        self._topology_lock = threading.Lock()
+        self._homes: Optional[List[Dict[str, Any]]] = None
+        self._homes_loaded = 0.0
+
+    @classmethod
+    def get_instance(cls) -> 'NetatmoClient':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def is_configured(self) -> bool:
+        return bool(self.client_id and self.client_secret and self._refresh_token)
+
+    @staticmethod
+    def _timeout():
+        return (HTTP_CONNECT_TIMEOUT, NETATMO_READ_TIMEOUT_S)
+
+    # ── Token ────────────────────────────────────────────────
+
+    def _load_refresh_token(self) -> Optional[str]:
+        if not self.token_file.exists():
+            return None
+        try:
+            return json.loads(self.token_file.read_text()).get("refresh_token")
+        except Exception as e:
+            print(f"⚠️ Netatmo: kunne ikke lese {self.token_file}: {e}", flush=True)
+            return None
+
+    def _save_refresh_token_locked(self):
+        """Skriv refresh token til token-fila. MÅ kalles med self._token_lock holdt."""
+        try:
+            self.token_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.token_file.with_suffix('.tmp')
+            tmp.write_text(json.dumps({"refresh_token": self._refresh_token}))
+            os.chmod(tmp, 0o600)  # Hemmelighet - bare eieren
+            tmp.replace(self.token_file)  # Atomisk rename
+        except Exception as e:
+            print(f"⚠️ Netatmo: kunne ikke lagre refresh token: {e}", flush=True)
+
+    def _token(self) -> str:
+        """Gyldig access token. Fornyes bare når det er i ferd med å utløpe."""
+        if self._access_token and time.monotonic() < self._token_expires:
+            return self._access_token
+        with self._token_lock:
+            # En annen tråd kan ha fornyet mens vi ventet på låsen
+            if self._access_token and time.monotonic() < self._token_expires:
+                return self._access_token
+            response = get_http_client().post(TOKEN_URL, data={
+                "grant_type": "refresh_token",
+                "refresh_token": self._refresh_token,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret
+            }, timeout=self._timeout())
+            response.raise_for_status()
+            data = response.json()
+            self._access_token = data["access_token"]
+            # Netatmo roterer refresh token - det gamle virker ikke etter omstart
+            rotated = data.get("refresh_token")
+            if rotated and rotated != self._refresh_token:
+                self._refresh_token = rotated
+                self._save_refresh_token_locked()
+            expires_in = float(data.get("expires_in", 10800))
+            self._token_expires = time.monotonic() + max(0.0, expires_in - NETATMO_TOKEN_MARGIN_S)
+            print(f"🔑 Netatmo: nytt access token (gyldig {expires_in / 60:.0f} min)", flush=True)
+            return self._access_token
+
+    def _invalidate_token(self):
+        with self._token_lock:
+            self._access_token = None
+            self._token_expires = 0.0
+
+    def _post(self, url: str, **kwargs) -> Dict[str, Any]:
+        """POST med token. Ved 401/403 (token trukket tilbake) fornyes det én gang."""
+        for attempt in range(2):
+            response = get_http_client().post(url, headers={"Authorization": f"Bearer {self._token()}"},
+                                              timeout=self._timeout(), **kwargs)
+            if response.status_code in (401, 403) and attempt == 0:
+                self._invalidate_token()
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    # ── Topologi (hjem, rom, moduler) ────────────────────────
+
+    def homes(self) -> List[Dict[str, Any]]:
+        """Hjem med rom og modul-IDer fra homesdata (cachet)."""
+        with self._topology_lock:
+            if self._homes is not None and time.monotonic() - self._homes_loaded < NETATMO_TOPOLOGY_TTL_S:
+                return self._homes
+            data = self._post(HOMESDATA_URL)
+            self._homes = [
+                {
+                    'id': home['id'],
+                    'name': home.get('name', 'Hjem'),
+                    'rooms': [{'name': room.get('name', 'Ukjent rom'), 'module_ids': room.get('module_ids', [])}
+                              for room in home.get('rooms', [])],
+                }
+                for home in data.get('body', {}).get('homes', [])
+            ]
+            self._homes_loaded = time.monotonic()
+            return self._homes
+
+    # ── Status ───────────────────────────────────────────────
+
+    def _home_status(self, home_id: str, deadline: Optional[float]) -> Dict[str, Any]:
+        if deadline is None:
+            return self._post(HOMESTATUS_URL, json={"home_id": home_id})
+        with deadline_at(deadline):  # Turens frist gjelder også i pool-trådene
+            return self._post(HOMESTATUS_URL, json={"home_id": home_id})
+
+    def read_rooms(self) -> List[Dict[str, Any]]:
+        """
+        Målinger per rom for alle hjem (homestatus hentes samtidig).
+
+        Returns:
+            Liste med {'room', 'temperature', 'humidity', 'co2'} (None der modulen ikke måler)
+
+        Raises:
+            requests.RequestException hvis token/topologi ikke kan hentes eller alle hjem feiler
+        """
+        homes = self.homes()
+        if not homes:
+            return []
+        left = remaining()
+        deadline = time.monotonic() + left if left is not None else None
+        futures = [(home, _status_pool.submit(self._home_status, home['id'], deadline)) for home in homes]
+
+        readings = []
+        errors = []
+        for home, future in futures:
+            try:
+                status = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Netatmo: homestatus for {home['name']} feilet: {e}", flush=True)
+                errors.append(e)
+                continue
+            modules = {m['id']: m for m in status.get('body', {}).get('home', {}).get('modules', [])}
+            for room in home['rooms']:
+                for module_id in room['module_ids']:
+                    module = modules.get(module_id)
+                    if module and ("temperature" in module or "humidity" in module or "co2" in module):
+                        readings.append({
+                            'room': room['name'],
+                            'temperature': module.get('temperature'),
+                            'humidity': module.get('humidity'),
+                            'co2': module.get('co2'),
+                        })
+        if errors and len(errors) == len(homes):
+            raise errors[0]
+        return readings
+
+
+def get_netatmo_client() -> NetatmoClient:
+    """Hent singleton NetatmoClient-instansen."""
+    return NetatmoClient.get_instance()
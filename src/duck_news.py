@@ -2,12 +2,30 @@
 Duck News Module
 Henter nyheter fra NRK via RSS feeds.
 Gratis, ingen API-nøkkel nødvendig.
+
+- NewsStore henter alle feeds i bakgrunnen (NEWS_POLL_INTERVAL_S) med
+  ETag/If-Modified-Since, så en uendret feed koster et 304-svar
+- Sakene lagres deduplisert i SQLite (news_items) med rekkefølgen i feeden
+  og publiseringstid, og nyhetsverktøyene er lokale spørringer
+- "Hva er nytt siden sist" (since_last) viser saker som har dukket opp
+  siden forrige gang feeden ble lest opp
 """
 
+import json
+import threading
+import time
 import requests
 import xml.etree.ElementTree as ET
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+from src.duck_config import NEWS_POLL_INTERVAL_S, NEWS_POLL_SPACING_S, NEWS_STALE_S, NEWS_RETENTION_DAYS
+from src.duck_database import get_db
+from src.duck_http import get_http_client
+
+FEED_HEADERS = {
+    'User-Agent': 'ChatGPTDuck/2.1 (Samantha; +https://github.com/osmund/chatgpt-and)'
+}
 
 
 # NRK RSS feeds - kategorier
@@ -78,13 +96,14 @@ def _parse_pub_date(pub_date_str: str) -> Optional[str]:
         return pub_date_str
 
 
-def get_nrk_news(category: str = 'toppsaker', count: int = 5) -> str:
+def get_nrk_news(category: str = 'toppsaker', count: int = 5, since_last: bool = False) -> str:
     """
-    Hent nyheter fra NRK RSS feed.
+    Hent nyheter fra NRK RSS feed (fra den lokale nyhetsbutikken).
 
     Args:
         category: Nyhetskategori (toppsaker, sport, kultur, norge, urix, etc.)
         count: Antall nyheter å hente (default 5, max 15)
+        since_last: Bare saker som er nye siden kategorien sist ble lest opp
 
     Returns:
         Formatert streng med nyheter
@@ -93,40 +112,29 @@ def get_nrk_news(category: str = 'toppsaker', count: int = 5) -> str:
     url = NRK_FEEDS.get(resolved, NRK_FEEDS['toppsaker'])
 
     try:
-        headers = {
-            'User-Agent': 'ChatGPTDuck/2.1 (Samantha; +https://github.com/osmund/chatgpt-and)'
-        }
-
-        print(f"📰 Henter NRK nyheter: {resolved} ({url})", flush=True)
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.content)
-        channel = root.find('channel')
-
-        if channel is None:
-            return "❌ Kunne ikke parse NRK RSS-feed"
-
-        items = channel.findall('item')
+        print(f"📰 Henter NRK nyheter: {resolved}", flush=True)
         count = min(count, 15)
-        items = items[:count]
+        items, last_read = get_news_store().read(f"nrk:{resolved}", url, count, since_last)
+
+        if since_last and last_read and not items:
+            return f"Ingen nye saker i NRK {resolved.capitalize()} siden sist ({_format_read_time(last_read)})."
 
         if not items:
             return f"Fant ingen nyheter i kategorien {resolved}"
 
         # Bygg resultat
         category_label = resolved.capitalize()
-        results = [f"📰 NRK {category_label} ({len(items)} saker):\n"]
+        if since_last and last_read:
+            results = [f"📰 NRK {category_label} - nytt siden {_format_read_time(last_read)} ({len(items)} saker):\n"]
+        else:
+            results = [f"📰 NRK {category_label} ({len(items)} saker):\n"]
 
         for i, item in enumerate(items, 1):
-            title_el = item.find('title')
-            desc_el = item.find('description')
-            pub_date_el = item.find('pubDate')
-            categories = [c.text for c in item.findall('category') if c.text]
+            categories = item['categories']
 
-            title = title_el.text if title_el is not None else 'Ingen tittel'
-            desc = desc_el.text if desc_el is not None else ''
-            pub_date = _parse_pub_date(pub_date_el.text) if pub_date_el is not None else ''
+            title = item['title'] or 'Ingen tittel'
+            desc = item['description']
+            pub_date = _parse_pub_date(item['pub_date']) if item['pub_date'] else ''
 
             results.append(f"{i}. {title}")
 
@@ -197,13 +205,14 @@ SOURCE_ALIASES = {
 }
 
 
-def get_news_headlines(source: str = 'vg', count: int = 5) -> str:
+def get_news_headlines(source: str = 'vg', count: int = 5, since_last: bool = False) -> str:
     """
-    Hent nyhetsoverskrifter fra norske aviser (VG, Aftenposten).
+    Hent nyhetsoverskrifter fra norske aviser (VG, Aftenposten), fra den lokale nyhetsbutikken.
 
     Args:
         source: Kilde - 'vg' eller 'aftenposten'
         count: Antall overskrifter (default 5, max 15)
+        since_last: Bare saker som er nye siden kilden sist ble lest opp
 
     Returns:
         Formatert streng med nyhetsoverskrifter
@@ -222,39 +231,26 @@ def get_news_headlines(source: str = 'vg', count: int = 5) -> str:
     emoji = source_info['emoji']
 
     try:
-        headers = {
-            'User-Agent': 'ChatGPTDuck/2.1 (Samantha; +https://github.com/osmund/chatgpt-and)'
-        }
-
-        print(f"{emoji} Henter nyheter fra {name}: {url}", flush=True)
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.content)
-        channel = root.find('channel')
-
-        if channel is None:
-            return f"❌ Kunne ikke parse {name} RSS-feed"
-
-        items = channel.findall('item')
+        print(f"{emoji} Henter nyheter fra {name}", flush=True)
         count = min(count, 15)
-        items = items[:count]
+        items, last_read = get_news_store().read(src, url, count, since_last)
+
+        if since_last and last_read and not items:
+            return f"Ingen nye saker fra {name} siden sist ({_format_read_time(last_read)})."
 
         if not items:
             return f"Fant ingen nyheter fra {name}"
 
-        results = [f"{emoji} {name} - Siste nytt ({len(items)} saker):\n"]
+        if since_last and last_read:
+            results = [f"{emoji} {name} - nytt siden {_format_read_time(last_read)} ({len(items)} saker):\n"]
+        else:
+            results = [f"{emoji} {name} - Siste nytt ({len(items)} saker):\n"]
 
         for i, item in enumerate(items, 1):
-            title_el = item.find('title')
-            desc_el = item.find('description')
-            pub_date_el = item.find('pubDate')
-            category_el = item.find('category')
-
-            title = title_el.text.strip() if title_el is not None and title_el.text else 'Ingen tittel'
-            desc = desc_el.text.strip() if desc_el is not None and desc_el.text else ''
-            pub_date = _parse_pub_date(pub_date_el.text) if pub_date_el is not None and pub_date_el.text else ''
-            category = category_el.text.strip() if category_el is not None and category_el.text else ''
+            title = item['title'] or 'Ingen tittel'
+            desc = item['description']
+            pub_date = _parse_pub_date(item['pub_date']) if item['pub_date'] else ''
+            category = item['categories'][0] if item['categories'] else ''
 
             results.append(f"{i}. {title}")
 
@@ -289,3 +285,263 @@ def get_news_headlines(source: str = 'vg', count: int = 5) -> str:
     except Exception as e:
         print(f"❌ Uventet feil i get_news_headlines ({name}): {e}", flush=True)
         return f"❌ Kunne ikke hente nyheter fra {name}: {str(e)}"
+
+
+# === Lokal nyhetsbutikk (bakgrunnsinnhenting av RSS) ===
+
+def _all_feeds() -> Dict[str, str]:
+    """Alle feeds som hentes i bakgrunnen: {feed-nøkkel: url}."""
+    feeds = {f"nrk:{category}": url for category, url in NRK_FEEDS.items()}
+    feeds.update({key: info['url'] for key, info in NEWS_SOURCES.items()})
+    return feeds
+
+
+def _format_read_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('kl. %H:%M')
+
+
+def _text(item, tag: str) -> str:
+    el = item.find(tag)
+    return el.text.strip() if el is not None and el.text else ''
+
+
+def _parse_feed(content: bytes) -> List[Dict[str, Any]]:
+    """Parse RSS til saker i feedens rekkefølge. Kaster ET.ParseError."""
+    root = ET.fromstring(content)
+    channel = root.find('channel')
+    if channel is None:
+        raise ET.ParseError("RSS-feeden mangler <channel>")
+
+    items = []
+    for item in channel.findall('item'):
+        title = _text(item, 'title')
+        link = _text(item, 'link')
+        pub_date = _text(item, 'pubDate')
+        try:
+            published_at = parsedate_to_datetime(pub_date).astimezone(timezone.utc).isoformat() if pub_date else None
+        except (TypeError, ValueError):
+            published_at = None
+        items.append({
+            'guid': _text(item, 'guid') or link or title,
+            'title': title,
+            'description': _text(item, 'description'),
+            'link': link,
+            'categories': [c.text.strip() for c in item.findall('category') if c.text],
+            'pub_date': pub_date,
+            'published_at': published_at,
+        })
+    return items
+
+
+class NewsStore:
+    """
+    RSS-saker i SQLite, hentet i bakgrunnen med betinget GET.
+    Singleton — bruk get_news_store() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._feed_locks: Dict[str, threading.Lock] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._init_database()
+
+    @classmethod
+    def get_instance(cls) -> 'NewsStore':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _init_database(self):
+        with get_db().cursor() as c:
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS news_feeds (
+                    feed TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_at REAL NOT NULL,
+                    last_read_at REAL
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS news_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    feed TEXT NOT NULL,
+                    guid TEXT NOT NULL,
+                    title TEXT,
+                    description TEXT,
+                    link TEXT,
+                    categories TEXT,
+                    pub_date TEXT,
+                    published_at TEXT,
+                    position INTEGER,
+                    in_feed INTEGER NOT NULL DEFAULT 1,
+                    first_seen REAL NOT NULL,
+                    UNIQUE(feed, guid)
+                )
+            """)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_news_items_published ON news_items(feed, published_at)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_news_items_first_seen ON news_items(feed, first_seen)")
+
+    def _feed_lock(self, feed: str) -> threading.Lock:
+        with self._lock:
+            return self._feed_locks.setdefault(feed, threading.Lock())
+
+    @staticmethod
+    def _feed_state(feed: str):
+        with get_db().cursor() as c:
+            c.execute("SELECT etag, last_modified, checked_at, last_read_at FROM news_feeds WHERE feed = ?", (feed,))
+            return c.fetchone()
+
+    # ── Innhenting ───────────────────────────────────────────
+
+    def refresh(self, feed: str, url: str) -> bool:
+        """
+        Hent feeden med ETag/If-Modified-Since og lagre sakene.
+
+        Returns:
+            True hvis feeden var endret (False ved 304)
+
+        Raises:
+            requests.RequestException ved nettverksfeil, ET.ParseError ved ugyldig RSS
+        """
+        with self._feed_lock(feed):
+            state = self._feed_state(feed)
+            headers = dict(FEED_HEADERS)
+            if state and state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state and state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+
+            response = get_http_client().get(url, headers=headers, timeout=10)
+            now = time.time()
+            if response.status_code == 304:
+                with get_db().cursor() as c:
+                    c.execute("UPDATE news_feeds SET checked_at = ? WHERE feed = ?", (now, feed))
+                return False
+            response.raise_for_status()
+            items = _parse_feed(response.content)
+
+            with get_db().cursor() as c:
+                # Sakene som ikke lenger er i feeden beholdes for "nytt siden sist" til de ryddes
+                c.execute("UPDATE news_items SET in_feed = 0 WHERE feed = ?", (feed,))
+                for position, item in enumerate(items):
+                    c.execute("""
+                        INSERT INTO news_items (feed, guid, title, description, link, categories,
+                                                pub_date, published_at, position, in_feed, first_seen)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                        ON CONFLICT(feed, guid) DO UPDATE SET
+                            title = excluded.title, description = excluded.description,
+                            categories = excluded.categories, pub_date = excluded.pub_date,
+                            published_at = excluded.published_at, position = excluded.position, in_feed = 1
+                    """, (feed, item['guid'], item['title'], item['description'], item['link'],
+                          json.dumps(item['categories'], ensure_ascii=False), item['pub_date'],
+                          item['published_at'], position, now))
+                c.execute("""
+                    INSERT INTO news_feeds (feed, url, etag, last_modified, checked_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(feed) DO UPDATE SET
+                        url = excluded.url, etag = excluded.etag,
+                        last_modified = excluded.last_modified, checked_at = excluded.checked_at
+                """, (feed, url, response.headers.get('ETag'), response.headers.get('Last-Modified'), now))
+            return True
+
+    def prune(self):
+        """Slett saker som har vært ute av feeden lenger enn NEWS_RETENTION_DAYS."""
+        cutoff = time.time() - NEWS_RETENTION_DAYS * 86400
+        try:
+            with get_db().cursor() as c:
+                c.execute("DELETE FROM news_items WHERE in_feed = 0 AND first_seen < ?", (cutoff,))
+        except Exception as e:
+            print(f"⚠️ Nyheter: kunne ikke rydde gamle saker: {e}", flush=True)
+
+    def poll_loop(self):
+        """Bakgrunnsløkke: sjekk alle feeds hvert NEWS_POLL_INTERVAL_S."""
+        while not self._stop.is_set():
+            changed = 0
+            for feed, url in _all_feeds().items():
+                if self._stop.is_set():
+                    return
+                try:
+                    changed += self.refresh(feed, url)
+                except Exception as e:
+                    print(f"⚠️ Nyheter: henting av {feed} feilet: {e}", flush=True)
+                self._stop.wait(NEWS_POLL_SPACING_S)
+            self.prune()
+            if changed:
+                print(f"📰 Nyheter: {changed} feeds oppdatert", flush=True)
+            self._stop.wait(NEWS_POLL_INTERVAL_S)
+
+    def start(self) -> threading.Thread:
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.poll_loop, daemon=True, name="news-ingester")
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    # ── Oppslag ──────────────────────────────────────────────
+
+    def read(self, feed: str, url: str, count: int, since_last: bool = False):
+        """
+        Saker fra butikken. Er feeden ikke sjekket på NEWS_STALE_S, hentes den
+        først (betinget GET); feiler det, brukes det som allerede er lagret.
+
+        Returns:
+            (saker, forrige lesetidspunkt eller None). Med since_last: sakene
+            som er nye siden forrige lesing, nyeste først
+
+        Raises:
+            requests.RequestException / ET.ParseError hvis ingenting er lagret og henting feiler
+        """
+        state = self._feed_state(feed)
+        if state is None or time.time() - state['checked_at'] > NEWS_STALE_S:
+            try:
+                self.refresh(feed, url)
+            except Exception as e:
+                if state is None:
+                    raise
+                print(f"⚠️ Nyheter: {feed} kunne ikke oppdateres ({e}), bruker lagrede saker", flush=True)
+        last_read = state['last_read_at'] if state else None
+
+        with get_db().cursor() as c:
+            if since_last and last_read:
+                c.execute("""
+                    SELECT title, description, categories, pub_date FROM news_items
+                    WHERE feed = ? AND first_seen > ?
+                    ORDER BY published_at DESC LIMIT ?
+                """, (feed, last_read, count))
+            else:
+                c.execute("""
+                    SELECT title, description, categories, pub_date FROM news_items
+                    WHERE feed = ? AND in_feed = 1
+                    ORDER BY position LIMIT ?
+                """, (feed, count))
+            rows = c.fetchall()
+            c.execute("UPDATE news_feeds SET last_read_at = ? WHERE feed = ?", (time.time(), feed))
+
+        items = [{
+            'title': row['title'],
+            'description': row['description'] or '',
+            'categories': json.loads(row['categories'] or '[]'),
+            'pub_date': row['pub_date'],
+        } for row in rows]
+        return items, last_read
+
+
+def get_news_store() -> NewsStore:
+    """Hent singleton NewsStore-instansen."""
+    return NewsStore.get_instance()
+
+
+def start_news_ingester() -> threading.Thread:
+    """Start bakgrunnsinnhenting av alle nyhetsfeeds (kalles fra chatgpt_voice.main)."""
+    return get_news_store().start()
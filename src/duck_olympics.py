@@ -2,11 +2,17 @@
 OL-medaljeoversikt fra Wikipedia.
 Parser strukturerte medaljedata fra Wikipedia sin medaljetabell.
 Oppdateres i nær-sanntid av Wikipedia-redaktører under pågående OL.
+
+Parsede tabeller ligger i sportsdata-cachen sammen med sidens revisjon.
+Wikitexten lastes bare ned og parses på nytt når revisjonen er endret, og
+spørsmål om et annet land besvares fra de parsede dataene.
 """
 
 import re
-import requests
 import logging
+from src.duck_config import OLYMPICS_REVISION_CHECK_S
+from src.duck_http import get_http_client
+from src.duck_sports_cache import get_sports_cache
 
 logger = logging.getLogger(__name__)
 
@@ -87,24 +93,16 @@ def get_olympics_medals(top_n: int = 15, country: str = None) -> str:
         Formatert medaljetabell for AI-kontekst
     """
     try:
-        # Finn riktig Wikipedia-side for pågående/siste OL
-        page_title = _find_olympics_medal_page()
-        if not page_title:
+        # Parset medaljetabell for pågående/siste OL (lastes bare på nytt ved ny revisjon)
+        medal_table = _get_medal_table()
+        if not medal_table:
             return "Kunne ikke finne OL-medaljetabell på Wikipedia."
         
-        # Hent wikitext for medal table-seksjonen
-        wikitext = _get_medal_table_wikitext(page_title)
-        if not wikitext:
-            return "Kunne ikke hente medaljedata fra Wikipedia."
-        
-        # Parse medaljedata
-        medals = _parse_medal_data(wikitext)
+        page_title = medal_table["page_title"]
+        medals = medal_table["medals"]
         if not medals:
             return "Ingen medaljedata funnet ennå. OL har kanskje ikke startet?"
         
-        # Sorter: gull først, så sølv, så bronse, så totalt
-        medals.sort(key=lambda m: (-m["gold"], -m["silver"], -m["bronze"]))
-        
         # Finn OL-navn fra sidetittel
         olympics_name = _extract_olympics_name(page_title)
         
@@ -157,44 +155,93 @@ def get_olympics_medals(top_n: int = 15, country: str = None) -> str:
         return f"Kunne ikke hente OL-medaljeoversikt: {e}"
 
 
-def _find_olympics_medal_page() -> str:
-    """Finn riktig Wikipedia-side for pågående/nylige OL."""
+def _medal_page_candidates() -> list:
+    """Mulige medaljetabell-sider, pågående år først, deretter forrige."""
     from datetime import datetime
     
     year = datetime.now().year
-    
-    # Prøv pågående år først, deretter forrige
-    candidates = [
+    return [
         f"{year} Winter Olympics medal table",
         f"{year} Summer Olympics medal table",
         f"{year - 1} Winter Olympics medal table",
         f"{year - 1} Summer Olympics medal table",
     ]
+
+
+def _page_revisions(titles: list) -> dict:
+    """Siste revisjon for sidene som finnes, i ett kall: {tittel: lastrevid}. Kaster ved nettverksfeil."""
+    resp = get_http_client().get(WIKI_API, params={
+        "action": "query",
+        "titles": "|".join(titles),
+        "prop": "info",
+        "format": "json",
+        "formatversion": "2",
+    }, headers=HEADERS, timeout=5)
+    resp.raise_for_status()
+    pages = resp.json().get("query", {}).get("pages", [])
+    return {page["title"]: str(page["lastrevid"]) for page in pages
+            if not page.get("missing") and "lastrevid" in page}
+
+
+def _medal_table_revision() -> str:
+    """Revisjon som 'tittel#lastrevid', så et nytt OL også gir ny revisjon. None hvis ingen side finnes."""
+    candidates = _medal_page_candidates()
+    revisions = _page_revisions(candidates)
+    title = next((t for t in candidates if t in revisions), None)
+    return f"{title}#{revisions[title]}" if title else None
+
+
+def _load_medal_table(revision: str) -> dict:
+    """Last ned og parse medaljetabellen for en revisjon."""
+    if revision is None:
+        return None
+    page_title = revision.rsplit("#", 1)[0]
+    wikitext = _get_medal_table_wikitext(page_title)
+    if not wikitext:
+        raise ValueError(f"tom wikitext for {page_title}")
+    medals = _parse_medal_data(wikitext)
+    # Sorter: gull først, så sølv, så bronse
+    medals.sort(key=lambda m: (-m["gold"], -m["silver"], -m["bronze"]))
+    return {"page_title": page_title, "medals": medals}
+
+
+def _get_medal_table() -> dict:
+    """Parset medaljetabell {'page_title', 'medals'} fra sportsdata-cachen, None hvis ingen side finnes."""
+    return get_sports_cache().get("olympics:medals", _medal_table_revision, _load_medal_table,
+                                  OLYMPICS_REVISION_CHECK_S)
+
+
+def _get_medal_winners(page_title: str) -> list:
+    """Alle medaljevinnere (alle land) fra 'List of ... medal winners', cachet per revisjon."""
+    winners_page = "List of " + page_title.replace("medal table", "medal winners")
     
-    for title in candidates:
-        try:
-            resp = requests.get(WIKI_API, params={
-                "action": "query",
-                "titles": title,
-                "format": "json",
-            }, headers=HEADERS, timeout=5)
-            data = resp.json()
-            pages = data.get("query", {}).get("pages", {})
-            # Sjekk at siden finnes (ikke -1)
-            for page_id, page in pages.items():
-                if page_id != "-1":
-                    return title
-        except Exception:
-            continue
+    def check_revision():
+        revision = _page_revisions([winners_page]).get(winners_page)
+        return f"{winners_page}#{revision}" if revision else None
     
-    return None
+    def load(revision):
+        if revision is None:
+            return None
+        resp = get_http_client().get(WIKI_API, params={
+            "action": "parse",
+            "page": winners_page,
+            "prop": "wikitext",
+            "format": "json",
+        }, headers=HEADERS, timeout=15)
+        resp.raise_for_status()
+        wikitext = resp.json().get("parse", {}).get("wikitext", {}).get("*", "")
+        if not wikitext:
+            return None
+        return _parse_medal_winners(wikitext)
+    
+    return get_sports_cache().get("olympics:winners", check_revision, load, OLYMPICS_REVISION_CHECK_S)
 
 
 def _get_medal_table_wikitext(page_title: str) -> str:
     """Hent wikitext for medal table-seksjonen."""
     try:
         # Finn seksjonsnummer for "Medal table"
-        resp = requests.get(WIKI_API, params={
+        resp = get_http_client().get(WIKI_API, params={
             "action": "parse",
             "page": page_title,
             "prop": "sections",
@@ -213,7 +260,7 @@ def _get_medal_table_wikitext(page_title: str) -> str:
             section_idx = 0
         
         # Hent wikitext for den seksjonen
-        resp = requests.get(WIKI_API, params={
+        resp = get_http_client().get(WIKI_API, params={
             "action": "parse",
             "page": page_title,
             "prop": "wikitext",
@@ -278,13 +325,10 @@ def get_olympics_medal_details(country: str = "Norge") -> str:
         Formatert liste med medaljevinnere per øvelse
     """
     try:
-        page_title = _find_olympics_medal_page()
-        if not page_title:
+        medal_table = _get_medal_table()
+        if not medal_table:
             return "Kunne ikke finne OL-medaljetabell."
-        
-        # Finn winners-siden
-        winners_page = page_title.replace("medal table", "medal winners")
-        winners_page = "List of " + winners_page
+        page_title = medal_table["page_title"]
         
         # Finn IOC-kode(r) for landet
         country_lower = country.lower()
@@ -303,22 +347,12 @@ def get_olympics_medal_details(country: str = "Norge") -> str:
             # Prøv med koden direkte
             target_codes.add(country.upper())
         
-        # Hent wikitext
-        resp = requests.get(WIKI_API, params={
-            "action": "parse",
-            "page": winners_page,
-            "prop": "wikitext",
-            "format": "json",
-        }, headers=HEADERS, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        wikitext = data.get("parse", {}).get("wikitext", {}).get("*", "")
-        
-        if not wikitext:
+        # Alle lands medaljevinnere er parset og cachet - filtrer på landet
+        all_winners = _get_medal_winners(page_title)
+        if not all_winners:
             return f"Kunne ikke hente medaljevinnere fra Wikipedia."
         
-        # Parse medaljister fra wikitext
-        medal_winners = _parse_medal_winners(wikitext, target_codes)
+        medal_winners = _winners_for_codes(all_winners, target_codes)
         
         if not medal_winners:
             return f"Ingen medaljevinnere funnet for {country} ennå."
@@ -363,8 +397,21 @@ def get_olympics_medal_details(country: str = "Norge") -> str:
         return f"Kunne ikke hente medaljedetaljer: {e}"
 
 
-def _parse_medal_winners(wikitext: str, target_codes: set) -> list:
-    """Parse medaljevinnere fra Wikipedia 'List of medal winners' wikitext.
+def _winners_for_codes(winners: list, target_codes: set) -> list:
+    """Medaljevinnere for gitte IOC-koder, med utøvernavn som i tabellen."""
+    result = []
+    for winner in winners:
+        names = [name for name, code in winner["athletes"] if code in target_codes]
+        if names:
+            result.append(dict(winner, athletes=names))
+    return result
+
+
+def _parse_medal_winners(wikitext: str) -> list:
+    """Parse medaljevinnere (alle land) fra Wikipedia 'List of medal winners' wikitext.
+    
+    Utøvere returneres som [navn, IOC-kode], så listen kan filtreres per land
+    uten å parse på nytt (se _winners_for_codes).
     
     Wikitext tabellformat:
     - Rad separator: |-
@@ -390,7 +437,7 @@ def _parse_medal_winners(wikitext: str, target_codes: set) -> list:
         # Ny rad - prosesser forrige
         if line.startswith("|-"):
             if row_cells:
-                _process_medal_row(row_cells, current_sport, target_codes, medal_types, winners)
+                _process_medal_row(row_cells, current_sport, medal_types, winners)
             row_cells = []
             continue
         
@@ -401,13 +448,13 @@ def _parse_medal_winners(wikitext: str, target_codes: set) -> list:
     
     # Prosesser siste rad
     if row_cells:
-        _process_medal_row(row_cells, current_sport, target_codes, medal_types, winners)
+        _process_medal_row(row_cells, current_sport, medal_types, winners)
     
     return winners
 
 
-def _process_medal_row(row_cells: list, sport: str, target_codes: set, medal_types: dict, winners: list):
-    """Prosesser en tabellrad og legg til medaljister for target-landet."""
+def _process_medal_row(row_cells: list, sport: str, medal_types: dict, winners: list):
+    """Prosesser en tabellrad og legg til medaljistene i hver medaljecelle."""
     # Finn event-navn
     event_name = ""
     for cell in row_cells:
@@ -430,7 +477,7 @@ def _process_medal_row(row_cells: list, sport: str, target_codes: set, medal_typ
         cell = row_cells[cell_idx]
         medal_type = medal_types.get(cell_idx, "unknown")
         
-        # Finn alle athletes for target-landet i denne cellen
+        # Finn alle athletes i denne cellen
         # Format: flagIOCmedalist|[[name]]|CODE|2026 Winter
         # Eller:  flagIOCmedalist|[[display|name]]|CODE|2026 Winter
         athletes = re.findall(
@@ -438,12 +485,10 @@ def _process_medal_row(row_cells: list, sport: str, target_codes: set, medal_typ
             cell
         )
         
-        country_athletes = [name for name, code in athletes if code in target_codes]
-        
-        if country_athletes:
+        if athletes:
             winners.append({
                 "sport": sport,
                 "event": event_name,
                 "medal": medal_type,
-                "athletes": country_athletes,
+                "athletes": [[name, code] for name, code in athletes],
             })
@@ -0,0 +1,281 @@
+"""
+PhraseCache — ferdig andifisert tale på disk.
+
+Korte fraser som gjentas ofte ("Ja?", adaptive hilsener, "Gææææsp!",
+sult- og påminnelsesannonseringer) går ellers gjennom TTS og hele DSP-kjeden
+hver gang. Cachen lagrer ferdig prosessert PCM (før volum, som legges på ved
+avspilling), nøklet på hash(tekst, stemme, hastighet, pitch, engine).
+
+- Treff starter avspilling på millisekunder og fungerer uten nett
+- LRU-eviction når total størrelse overstiger PHRASE_CACHE_MAX_BYTES
+- Bakgrunns-pre-rendering (neste hilsen, faste fraser) mens anda ikke snakker
+- Filer for gamle stemmeinnstillinger slettes når DuckSettings endres
+
+Bruk:
+    from src.duck_phrase_cache import get_phrase_cache
+
+    cache = get_phrase_cache()
+    rendered = cache.get(text, tts)               # (samples, framerate) eller None
+    cache.put(text, tts, samples, framerate)
+    cache.prerender(["Ja?"], speech_config)        # rendres i bakgrunnen
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from src.duck_config import (
+    PHRASE_CACHE_DIR, PHRASE_CACHE_MAX_BYTES, PHRASE_CACHE_PRERENDER,
+    TTS_ENGINE, OPENAI_TTS_VOICE, OPENAI_TTS_MODEL, DUCK_PITCH_OCTAVES, FADE_MS
+)
+from src.duck_settings import get_settings
+
+# Settings som påvirker den cachede lyden (volum legges på ved avspilling)
+_AUDIO_SETTINGS = ('voice', 'speed')
+
+
+class PhraseCache:
+    """
+    Innholdsadressert PCM-cache med LRU-eviction.
+    Singleton — bruk get_phrase_cache() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or PHRASE_CACHE_DIR
+        self.max_bytes = max_bytes or PHRASE_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._index: 'OrderedDict[str, int]' = OrderedDict()  # filnavn → bytes, eldst først
+        self._total_bytes = 0
+        self._loaded = False
+        self._hits = 0
+        self._misses = 0
+
+        # Bakgrunns-rendering
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        self._queued = set()
+        self._worker = None
+        self._speech_config = None
+        self._pinned = list(PHRASE_CACHE_PRERENDER)
+
+        get_settings().add_listener(self._on_settings_changed)
+
+    @classmethod
+    def get_instance(cls) -> 'PhraseCache':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # ── Nøkler ───────────────────────────────────────────────
+
+    @staticmethod
+    def settings_signature(tts: Dict[str, Any]) -> str:
+        """Hash av alt utenom teksten som påvirker den rendrede lyden."""
+        voice = f"{OPENAI_TTS_MODEL}/{OPENAI_TTS_VOICE}" if TTS_ENGINE == 'openai' else tts['voice']
+        raw = json.dumps([TTS_ENGINE, voice, tts['speed'], DUCK_PITCH_OCTAVES, FADE_MS])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+    def _filename(self, text: str, tts: Dict[str, Any]) -> str:
+        text_hash = hashlib.sha1(text.strip().encode('utf-8')).hexdigest()[:24]
+        return f"{self.settings_signature(tts)}_{text_hash}.npz"
+
+    # ── Indeks ───────────────────────────────────────────────
+
+    def _ensure_loaded(self):
+        """Bygg LRU-indeksen fra disk (mtime = sist brukt). Kalles med lock holdt."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.npz'):
+                    continue
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime, name, st.st_size))
+            for _, name, size in sorted(entries):
+                self._index[name] = size
+                self._total_bytes += size
+        except OSError as e:
+            print(f"⚠️ Kunne ikke lese frase-cache: {e}", flush=True)
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and self._index:
+            name, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    # ── Oppslag og lagring ───────────────────────────────────
+
+    def get(self, text: str, tts: Dict[str, Any]) -> Optional[Tuple[np.ndarray, int]]:
+        """Hent ferdig andifisert lyd, eller None ved cache-miss."""
+        name = self._filename(text, tts)
+        with self._lock:
+            self._ensure_loaded()
+            if name not in self._index:
+                self._misses += 1
+                return None
+            self._index.move_to_end(name)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with np.load(path) as data:
+                samples = data['pcm'].astype(np.float32) / 32767.0
+                framerate = int(data['rate'])
+            os.utime(path)  # LRU-rekkefølgen overlever restart
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ Ødelagt frase-cache fil {name}: {e}", flush=True)
+            self._remove(name)
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return samples, framerate
+
+    def contains(self, text: str, tts: Dict[str, Any]) -> bool:
+        """Sjekk om frasen er cachet (uten å telle som treff/bom)."""
+        name = self._filename(text, tts)
+        with self._lock:
+            self._ensure_loaded()
+            return name in self._index
+
+    def put(self, text: str, tts: Dict[str, Any], samples: np.ndarray, framerate: int):
+        """Lagre ferdig andifisert lyd (før volum)."""
+        name = self._filename(text, tts)
+        path = os.path.join(self.cache_dir, name)
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.savez(f, pcm=pcm, rate=np.int32(framerate))
+            os.replace(tmp, path)  # Atomisk
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"⚠️ Kunne ikke lagre frase-cache: {e}", flush=True)
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._total_bytes += size - self._index.pop(name, 0)
+            self._index[name] = size
+            self._evict_locked()
+
+    def get_or_render(self, text: str, speech_config, tts: Dict[str, Any] = None) -> Optional[Tuple[np.ndarray, int]]:
+        """Hent fra cache, ellers render via TTS og lagre."""
+        from src.duck_audio import render_speech
+        if tts is None:
+            tts = get_settings().get_tts_settings()
+        rendered = self.get(text, tts)
+        if rendered is None:
+            rendered = render_speech(text, speech_config, tts)
+            if rendered is not None:
+                self.put(text, tts, *rendered)
+        return rendered
+
+    def _remove(self, name: str):
+        with self._lock:
+            size = self._index.pop(name, None)
+            if size is not None:
+                self._total_bytes -= size
+        try:
+            os.unlink(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def invalidate(self, keep_signature: str = None):
+        """Slett alle filer som ikke tilhører `keep_signature` (alle hvis None)."""
+        with self._lock:
+            self._ensure_loaded()
+            stale = [n for n in self._index if keep_signature is None or not n.startswith(f"{keep_signature}_")]
+        for name in stale:
+            self._remove(name)
+        if stale:
+            print(f"🗑️ Frase-cache: fjernet {len(stale)} filer for gamle stemmeinnstillinger", flush=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._ensure_loaded()
+            total = self._hits + self._misses
+            return {
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / total, 3) if total else 0.0,
+            }
+
+    # ── Bakgrunns-pre-rendering ──────────────────────────────
+
+    def prerender(self, texts: Iterable[str], speech_config, pin: bool = False):
+        """
+        Legg fraser i kø for rendering i bakgrunnen (kun de som mangler).
+
+        Args:
+            pin: Husk frasene og render dem på nytt etter stemmebytte
+        """
+        if speech_config is not None:
+            self._speech_config = speech_config
+        with self._lock:
+            for text in texts:
+                if not text:
+                    continue
+                if pin and text not in self._pinned:
+                    self._pinned.append(text)
+                if text not in self._queued:
+                    self._queued.add(text)
+                    self._queue.put(text)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._prerender_loop, daemon=True, name="phrase-prerender")
+                self._worker.start()
+
+    def _prerender_loop(self):
+        from src.duck_audio import is_speaking
+        while True:
+            try:
+                text = self._queue.get(timeout=30)
+            except queue.Empty:
+                return  # Tråden startes igjen ved neste prerender()
+            try:
+                # Render kun når anda er ledig (ikke konkurrer med pågående tale)
+                while is_speaking():
+                    time.sleep(0.5)
+                tts = get_settings().get_tts_settings()
+                if not self.contains(text, tts) and self._speech_config is not None:
+                    from src.duck_audio import render_speech
+                    rendered = render_speech(text, self._speech_config, tts)
+                    if rendered is not None:
+                        self.put(text, tts, *rendered)
+            except Exception as e:
+                print(f"⚠️ Pre-rendering feilet for '{text[:30]}': {e}", flush=True)
+            finally:
+                with self._lock:
+                    self._queued.discard(text)
+
+    def _on_settings_changed(self, changed: Dict[str, Any]):
+        """Stemme/hastighet endret: slett gammel lyd og render faste fraser på nytt."""
+        if not any(key in changed for key in _AUDIO_SETTINGS):
+            return
+        tts = get_settings().get_tts_settings()
+        self.invalidate(keep_signature=self.settings_signature(tts))
+        if self._speech_config is not None:
+            self.prerender(list(self._pinned), None)
+
+
+def get_phrase_cache() -> PhraseCache:
+    """Hent singleton PhraseCache-instansen."""
+    return PhraseCache.get_instance()
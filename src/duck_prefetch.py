@@ -0,0 +1,296 @@
+"""
+PrefetchScheduler — forhåndsvarming av tool-cachen før vanlige spørretider.
+
+Bruken følger døgnet: vær og avganger om morgenen, nyheter til lunsj,
+strømpris om kvelden. Likevel startet hvert svar kaldt, med full rundtur
+til API-ene mens brukeren venter.
+
+- Tool-kall fra samtaler logges (tool_call_log: tool, argumenter, time),
+  men bare cachebare tools (TOOL_CACHE_TTLS) - send_sms, påminnelser og
+  HA-kommandoer har personlig innhold og kan ikke forhåndshentes uansett.
+  Skrivingen gjøres av en bakgrunnstråd, ikke i svar-løpet
+- Før hver klokketime finner scheduleren kallene som har skjedd i den timen
+  på minst PREFETCH_MIN_DAYS av de siste PREFETCH_HISTORY_DAYS dagene, og
+  varmer tool-cachen for dem PREFETCH_LEAD_S før timen
+- Argumentene gjenbrukes som de ble logget: get_weather uten sted slår opp
+  duck_current_location når det forhåndshentes
+- Tools med kort levetid (avganger, Netatmo) varmes rett før timen i stedet
+  for PREFETCH_LEAD_S før: halve ttl + stale-vinduet før, så resultatet
+  fortsatt er brukbart et stykke inn i timen
+- Maks PREFETCH_MAX_PER_HOUR kall per klokketime med PREFETCH_SPACING_S
+  mellom - høflig mot API-ene
+- Kalender er ikke med: "nå"-spørsmålet leses fra HA-speilet uten nettverk,
+  og avtalelister caches ikke (nye avtaler skal vises med en gang)
+- Ligger resultatet allerede i cachen, hentes ingenting
+
+Bruk:
+    from src.duck_prefetch import record_tool_call, start_prefetch_scheduler
+
+    record_tool_call("get_weather", {"location": "Sandnes"}, source="voice")
+    start_prefetch_scheduler()  # Fra chatgpt_voice.main
+"""
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from src.duck_config import (
+    PREFETCH_ENABLED, PREFETCH_LEAD_S, PREFETCH_HISTORY_DAYS, PREFETCH_MIN_DAYS,
+    PREFETCH_MAX_PER_HOUR, PREFETCH_SPACING_S, PREFETCH_CALL_BUDGET_S,
+    PREFETCH_CHECK_INTERVAL_S, TOOL_CACHE_TTLS
+)
+from src.duck_database import get_db
+from src.duck_deadline import deadline_at
+from src.duck_tool_cache import get_tool_cache
+
+_table_ready = False
+_table_lock = threading.Lock()
+_log_queue: 'queue.Queue' = queue.Queue(maxsize=1000)
+_log_thread: Optional[threading.Thread] = None
+
+
+def _ensure_table():
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        with get_db().cursor() as c:
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS tool_call_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tool TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    source TEXT,
+                    hour INTEGER NOT NULL,
+                    called_at TEXT NOT NULL
+                )
+            """)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_tool_call_log_hour ON tool_call_log(hour, called_at)")
+            # Eldre versjoner logget alle tools med full tekst (SMS, påminnelser) - fjern dem
+            placeholders = ','.join('?' * len(TOOL_CACHE_TTLS))
+            c.execute(f"DELETE FROM tool_call_log WHERE tool NOT IN ({placeholders})", tuple(TOOL_CACHE_TTLS))
+        _table_ready = True
+
+
+def record_tool_call(tool: str, args: Dict[str, Any], source: Optional[str] = None):
+    """
+    Logg et tool-kall fra en samtale (kalles fra duck_ai._handle_tool_calls).
+    Bare cachebare tools logges, og skrivingen skjer i bakgrunnen.
+    """
+    global _log_thread
+    if not PREFETCH_ENABLED or not get_tool_cache().cacheable(tool):
+        return
+    # Samme normalisering som tool-cachen, så like kall telles sammen
+    args_key = get_tool_cache().make_key(tool, args).split(":", 1)[1]
+    try:
+        _log_queue.put_nowait((tool, args_key, source, datetime.now()))
+    except queue.Full:
+        return  # Databasen henger etter - ett kall mindre i statistikken
+    with _table_lock:
+        if _log_thread is None or not _log_thread.is_alive():
+            _log_thread = threading.Thread(target=_log_writer, daemon=True, name="prefetch-log-writer")
+            _log_thread.start()
+
+
+def _log_writer():
+    """Skriver loggede tool-kall til SQLite (bakgrunnstråd)."""
+    while True:
+        tool, args_key, source, called_at = _log_queue.get()
+        try:
+            _ensure_table()
+            with get_db().cursor() as c:
+                c.execute("""
+                    INSERT INTO tool_call_log (tool, args, source, hour, called_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (tool, args_key, source, called_at.hour, called_at.isoformat()))
+        except Exception as e:
+            print(f"⚠️ Prefetch: kunne ikke logge tool-kall: {e}", flush=True)
+        finally:
+            _log_queue.task_done()
+
+
+def _execute(tool: str, args: Dict[str, Any]) -> str:
+    # Importeres her - duck_ai importerer denne modulen
+    from src.duck_ai import _execute_tool
+    return _execute_tool(tool, args, None)[0]
+
+
+class PrefetchScheduler:
+    """
+    Lærer tool-frekvenser per time og varmer tool-cachen før timen.
+    Singleton — bruk get_prefetch_scheduler() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, execute=_execute):
+        self._execute = execute
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._planned_for: Optional[datetime] = None  # Timen planen gjelder
+        self._plan: List[Dict[str, Any]] = []
+        self._budget_hour: Optional[datetime] = None
+        self._budget_used = 0
+        self._stats = {'prefetched': 0, 'already_cached': 0, 'failed': 0, 'budget_exhausted': 0}
+
+    @classmethod
+    def get_instance(cls) -> 'PrefetchScheduler':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # ── Læring ───────────────────────────────────────────────
+
+    def likely_calls(self, hour: int, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Tool-kall som pleier å komme i en gitt time, vanligste først.
+
+        Returns:
+            Liste med {'tool', 'args', 'days', 'calls', 'lead_s'} der lead_s er
+            hvor lenge før timen kallet bør varmes
+        """
+        _ensure_table()
+        now = now or datetime.now()
+        since = (now - timedelta(days=PREFETCH_HISTORY_DAYS)).isoformat()
+        with get_db().cursor() as c:
+            c.execute("""
+                SELECT tool, args, COUNT(DISTINCT substr(called_at, 1, 10)) AS days, COUNT(*) AS calls
+                FROM tool_call_log
+                WHERE hour = ? AND called_at >= ?
+                GROUP BY tool, args
+                HAVING days >= ?
+                ORDER BY days DESC, calls DESC
+            """, (hour, since, PREFETCH_MIN_DAYS))
+            rows = c.fetchall()
+        likely = []
+        for row in rows:
+            ttl = TOOL_CACHE_TTLS.get(row['tool'])
+            if ttl is None:
+                continue
+            # Resultatet må fortsatt kunne brukes et stykke inn i timen
+            lead_s = min(PREFETCH_LEAD_S, sum(ttl) / 2)
+            likely.append({'tool': row['tool'], 'args': json.loads(row['args']),
+                           'days': row['days'], 'calls': row['calls'], 'lead_s': lead_s})
+        return likely[:PREFETCH_MAX_PER_HOUR]
+
+    def prune(self):
+        """Slett logg eldre enn historikkvinduet."""
+        cutoff = (datetime.now() - timedelta(days=PREFETCH_HISTORY_DAYS)).isoformat()
+        try:
+            _ensure_table()
+            with get_db().cursor() as c:
+                c.execute("DELETE FROM tool_call_log WHERE called_at < ?", (cutoff,))
+        except Exception as e:
+            print(f"⚠️ Prefetch: kunne ikke rydde tool-logg: {e}", flush=True)
+
+    # ── Oppvarming ───────────────────────────────────────────
+
+    def _take_budget(self, now: datetime) -> bool:
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        with self._lock:
+            if self._budget_hour != hour:
+                self._budget_hour, self._budget_used = hour, 0
+            if self._budget_used >= PREFETCH_MAX_PER_HOUR:
+                return False
+            self._budget_used += 1
+            return True
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        """
+        Varm opp cachen for timen som starter innen PREFETCH_LEAD_S.
+
+        Returns:
+            Antall resultater som ble hentet
+        """
+        now = now or datetime.now()
+        target = (now + timedelta(seconds=PREFETCH_LEAD_S)).replace(minute=0, second=0, microsecond=0)
+        if target <= now:
+            return 0  # Timen har allerede startet - neste vindu kommer før neste time
+        if self._planned_for != target:
+            self._planned_for = target
+            self._plan = self.likely_calls(target.hour, now)
+            for call in self._plan:
+                call['warm_at'] = target - timedelta(seconds=call['lead_s'])
+            self._plan.sort(key=lambda call: call['warm_at'])
+            self.prune()
+            if self._plan:
+                names = ", ".join(call['tool'] for call in self._plan)
+                print(f"🔮 Prefetch: varmer opp for kl. {target.hour:02d} ({names})", flush=True)
+
+        cache = get_tool_cache()
+        fetched = 0
+        while self._plan and not self._stop.is_set():
+            if self._plan[0]['warm_at'] > now:
+                break  # Kort levetid - varmes rett før timen
+            call = self._plan.pop(0)
+            if cache.peek(call['tool'], call['args']):
+                self._stats['already_cached'] += 1
+                continue
+            if not self._take_budget(now):
+                self._stats['budget_exhausted'] += 1
+                self._plan.clear()
+                break
+            try:
+                with deadline_at(time.monotonic() + PREFETCH_CALL_BUDGET_S):
+                    ok = cache.warm(call['tool'], call['args'], lambda: self._execute(call['tool'], call['args']))
+            except Exception as e:
+                print(f"⚠️ Prefetch: {call['tool']} feilet: {e}", flush=True)
+                ok = False
+            if ok:
+                fetched += 1
+                self._stats['prefetched'] += 1
+            else:
+                self._stats['failed'] += 1
+            if self._plan:
+                self._stop.wait(PREFETCH_SPACING_S)
+        return fetched
+
+    def _next_wait_s(self) -> float:
+        """Sekunder til neste sjekk: neste planlagte oppvarming, maks PREFETCH_CHECK_INTERVAL_S."""
+        if not self._plan:
+            return PREFETCH_CHECK_INTERVAL_S
+        until = (self._plan[0]['warm_at'] - datetime.now()).total_seconds()
+        return min(PREFETCH_CHECK_INTERVAL_S, max(1.0, until))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Prefetch-feil: {e}", flush=True)
+            self._stop.wait(self._next_wait_s())
+
+    def start(self) -> bool:
+        if not PREFETCH_ENABLED:
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="tool-prefetch")
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, planned_for=self._planned_for.isoformat() if self._planned_for else None,
+                    pending=len(self._plan), budget_used=self._budget_used)
+
+
+def get_prefetch_scheduler() -> PrefetchScheduler:
+    """Hent singleton PrefetchScheduler-instansen."""
+    return PrefetchScheduler.get_instance()
+
+
+def start_prefetch_scheduler() -> bool:
+    """Start forhåndsvarmingen (kalles fra chatgpt_voice.main). False hvis deaktivert."""
+    return get_prefetch_scheduler().start()
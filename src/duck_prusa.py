@@ -10,6 +10,11 @@ import logging
 from typing import Dict, Optional, Any, Callable
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from src.duck_config import (
+    PRUSA_POLL_IDLE_S, PRUSA_POLL_PRINTING_S, PRUSA_NEAR_END_S, PRUSA_POLL_NEAR_END_S,
+    PRUSA_BACKOFF_BASE_S, PRUSA_BACKOFF_MAX_S, PRUSA_BOOT_POLL_S, PRUSA_BOOT_TIMEOUT_S
+)
+from src.duck_http import get_http_client
 
 # Load environment variables
 load_dotenv()
@@ -18,33 +23,90 @@ logger = logging.getLogger(__name__)
 
 
 class PrusaLinkManager:
-    """Manages connection to PrusaLink local API"""
+    """
+    Manages connection to PrusaLink local API
+
+    Overvåkingen poller adaptivt: sjelden når printeren står i ro, oftere
+    under en print og tett mot slutten (time_remaining), med backoff når
+    printeren ikke svarer. Siste kjente status caches, så spørsmål om
+    printeren besvares uten nettverk mens overvåkingen går.
+    """
     
     def __init__(self):
         self.api_key = os.getenv('PRUSALINK_API_KEY')
         self.host = os.getenv('PRUSALINK_HOST')  # e.g. "192.168.10.100" or "prusa-xl.local"
         
-        # Status tracking
+        # Status tracking (siste kjente status, beskyttet av _status_lock)
+        self._status_lock = threading.Lock()
         self.last_status = None
         self.last_check = None
         self.last_state = None
+        self._reachable = False
+        self._failures = 0
+        self._job_key = None  # Jobben filnavnet under gjelder (id fra /status)
+        self._job_name = None
         self.print_finished_callback = None
         self.print_failed_callback = None
         
         # Polling thread
         self.polling_thread = None
-        self.stop_polling = False
+        self._stop_event = threading.Event()
         self._monitoring_active = False
+        
+        # Oppstartsjobb (skru på stikkontakten og vent på PrusaLink)
+        self._power_on_thread = None
+        self._power_on_cancel = threading.Event()
     
     @property
     def is_monitoring(self) -> bool:
         """Check if monitoring is currently active"""
         return self._monitoring_active
     
+    @property
+    def is_powering_on(self) -> bool:
+        """Oppstartsjobben venter fortsatt på at printeren skal svare"""
+        return bool(self._power_on_thread and self._power_on_thread.is_alive())
+    
     def is_configured(self) -> bool:
         """Check if PrusaLink is properly configured"""
         return bool(self.api_key and self.host)
     
+    @staticmethod
+    def _clean_job_name(raw_name: str) -> str:
+        # Clean up job name: remove extension, replace + and _ with spaces
+        job_name = raw_name.replace('.bgcode', '').replace('.gcode', '').replace('+', ' ').replace('_', ' ')
+        # Truncate at next space after 25 chars to avoid cutting words
+        if len(job_name) > 25:
+            # Find next space after position 25
+            next_space = job_name.find(' ', 25)
+            if next_space != -1:
+                job_name = job_name[:next_space] + '...'
+            else:
+                job_name = job_name[:22] + '...'
+        return job_name
+    
+    def _get_job_name(self, job: Dict[str, Any], headers: Dict[str, str]) -> str:
+        """Filnavnet til jobben. /api/v1/job hentes bare når jobben er ny."""
+        job_key = job.get('id')
+        if job_key is not None and job_key == self._job_key and self._job_name:
+            return self._job_name
+        job_name = 'ukjent fil'
+        try:
+            job_response = get_http_client().get(f"http://{self.host}/api/v1/job", headers=headers, timeout=5)
+            if job_response.status_code == 200:
+                file_info = job_response.json().get('file', {})
+                raw_name = file_info.get('display_name') or file_info.get('name') or 'ukjent fil'
+                job_name = self._clean_job_name(raw_name)
+                self._job_key, self._job_name = job_key, job_name
+        except Exception:
+            pass
+        return job_name
+    
+    def _record_failure(self):
+        with self._status_lock:
+            self._reachable = False
+            self._failures += 1
+    
     def get_printer_status(self) -> Optional[Dict[str, Any]]:
         """
         Get current printer status from PrusaLink local API
@@ -70,9 +132,8 @@ class PrusaLinkManager:
             
             # PrusaLink API endpoints
             status_url = f"http://{self.host}/api/v1/status"
-            job_url = f"http://{self.host}/api/v1/job"
             
-            status_response = requests.get(status_url, headers=headers, timeout=5)
+            status_response = get_http_client().get(status_url, headers=headers, timeout=5)
             
             if status_response.status_code == 200:
                 status_data = status_response.json()
@@ -97,28 +158,8 @@ class PrusaLinkManager:
                 raw_state = printer.get('state', 'UNKNOWN')
                 mapped_state = state_map.get(raw_state, 'UNKNOWN')
                 
-                # Try to get full job info for file name
-                file_info = {}
-                job_name = 'ukjent fil'
-                if job:
-                    try:
-                        job_response = requests.get(job_url, headers=headers, timeout=5)
-                        if job_response.status_code == 200:
-                            job_full = job_response.json()
-                            file_info = job_full.get('file', {})
-                            raw_name = file_info.get('display_name') or file_info.get('name') or 'ukjent fil'
-                            # Clean up job name: remove extension, replace + and _ with spaces
-                            job_name = raw_name.replace('.bgcode', '').replace('.gcode', '').replace('+', ' ').replace('_', ' ')
-                            # Truncate at next space after 25 chars to avoid cutting words
-                            if len(job_name) > 25:
-                                # Find next space after position 25
-                                next_space = job_name.find(' ', 25)
-                                if next_space != -1:
-                                    job_name = job_name[:next_space] + '...'
-                                else:
-                                    job_name = job_name[:22] + '...'
-                    except:
-                        pass
+                # /status har ikke filnavnet - det hentes fra /job én gang per jobb
+                job_name = self._get_job_name(job, headers) if job else 'ukjent fil'
                 
                 status = {
                     'state': mapped_state,
@@ -130,24 +171,43 @@ class PrusaLinkManager:
                     'temp_bed': printer.get('temp_bed')
                 }
                 
-                self.last_status = status
-                self.last_check = datetime.now()
+                with self._status_lock:
+                    self.last_status = status
+                    self.last_check = datetime.now()
+                    self._reachable = True
+                    self._failures = 0
                 return status
             else:
                 logger.warning(f"⚠️ PrusaLink API error: {status_response.status_code}")
+                self._record_failure()
                 return None
                 
         except requests.exceptions.ConnectionError:
             logger.error(f"❌ Cannot connect to PrusaLink at {self.host}")
+            self._record_failure()
             return None
         except Exception as e:
             logger.error(f"❌ Error getting PrusaLink status: {e}")
+            self._record_failure()
             return None
     
+    def current_status(self) -> Optional[Dict[str, Any]]:
+        """
+        Status for spørsmål fra brukeren. Mens overvåkingen går brukes siste
+        kjente status (ingen nettverk), ellers hentes den fra printeren.
+        
+        Returns:
+            Status som fra get_printer_status, eller None hvis printeren ikke svarer
+        """
+        with self._status_lock:
+            if self._monitoring_active and self.last_check is not None:
+                return self.last_status if self._reachable else None
+        return self.get_printer_status()
+    
     def get_human_readable_status(self, status: Optional[Dict] = None) -> str:
         """Get status in human-readable Norwegian format"""
         if status is None:
-            status = self.get_printer_status()
+            status = self.current_status()
         
         if not status:
             return "Jeg kan ikke nå printeren akkurat nå. Sjekk at den er på og koblet til nettverket."
@@ -197,15 +257,13 @@ class PrusaLinkManager:
     
     def start_monitoring(self, 
                         on_print_finished: Optional[Callable[[str], None]] = None,
-                        on_print_failed: Optional[Callable[[str], None]] = None,
-                        poll_interval: int = 60):
+                        on_print_failed: Optional[Callable[[str], None]] = None):
         """
         Start background monitoring thread
         
         Args:
             on_print_finished: Callback when print finishes successfully
             on_print_failed: Callback when print fails or is cancelled
-            poll_interval: Seconds between status checks (default: 60)
         """
         if not self.is_configured():
             logger.warning("PrusaLink not configured, cannot start monitoring")
@@ -213,54 +271,140 @@ class PrusaLinkManager:
         
         self.print_finished_callback = on_print_finished
         self.print_failed_callback = on_print_failed
-        self.stop_polling = False
+        if self.polling_thread and self.polling_thread.is_alive():
+            return True
         
-        self.polling_thread = threading.Thread(target=self._monitoring_loop, args=(poll_interval,), daemon=True)
-        self.polling_thread.start()
+        self._stop_event = threading.Event()
         self._monitoring_active = True
+        self.polling_thread = threading.Thread(target=self._monitoring_loop, args=(self._stop_event,),
+                                               daemon=True, name="prusa-monitor")
+        self.polling_thread.start()
         
         logger.info("🖨️ PrusaLink monitoring started")
         return True
     
-    def _monitoring_loop(self, poll_interval: int):
-        """Background polling loop"""
-        while not self.stop_polling:
+    def next_poll_interval(self, status: Optional[Dict[str, Any]]) -> float:
+        """
+        Sekunder til neste poll: backoff når printeren ikke svarer, tett mot
+        slutten av en print, sjelden når den står i ro.
+        """
+        if status is None:
+            failures = max(1, self._failures)
+            return min(PRUSA_BACKOFF_BASE_S * 2 ** (failures - 1), PRUSA_BACKOFF_MAX_S)
+        if status['state'] not in ('PRINTING', 'PAUSED'):
+            return PRUSA_POLL_IDLE_S
+        time_remaining = status.get('time_remaining')
+        if time_remaining is None:
+            return PRUSA_POLL_PRINTING_S
+        if time_remaining <= PRUSA_NEAR_END_S:
+            return PRUSA_POLL_NEAR_END_S
+        # Våkn når sluttfasen begynner, ikke et helt intervall for sent
+        return max(PRUSA_POLL_NEAR_END_S, min(PRUSA_POLL_PRINTING_S, time_remaining - PRUSA_NEAR_END_S))
+    
+    def _check_transition(self, status: Dict[str, Any]):
+        current_state = status['state']
+        job_name = status.get('job_name', 'ukjent fil')
+        
+        # Detect state changes
+        if self.last_state != current_state:
+            logger.info(f"🖨️ Printer state changed: {self.last_state} → {current_state}")
+            
+            # Print finished successfully
+            if self.last_state == 'PRINTING' and current_state == 'FINISHED':
+                if self.print_finished_callback:
+                    self.print_finished_callback(job_name)
+            
+            # Print stopped/failed
+            elif self.last_state == 'PRINTING' and current_state in ['STOPPED', 'ERROR']:
+                if self.print_failed_callback:
+                    self.print_failed_callback(job_name)
+            
+            self.last_state = current_state
+    
+    def _monitoring_loop(self, stop_event: threading.Event):
+        """Background polling loop med adaptivt intervall"""
+        while not stop_event.is_set():
+            status = None
             try:
                 status = self.get_printer_status()
-                
                 if status:
-                    current_state = status['state']
-                    job_name = status.get('job_name', 'ukjent fil')
-                    
-                    # Detect state changes
-                    if self.last_state != current_state:
-                        logger.info(f"🖨️ Printer state changed: {self.last_state} → {current_state}")
-                        
-                        # Print finished successfully
-                        if self.last_state == 'PRINTING' and current_state == 'FINISHED':
-                            if self.print_finished_callback:
-                                self.print_finished_callback(job_name)
-                        
-                        # Print stopped/failed
-                        elif self.last_state == 'PRINTING' and current_state in ['STOPPED', 'ERROR']:
-                            if self.print_failed_callback:
-                                self.print_failed_callback(job_name)
-                        
-                        self.last_state = current_state
-                
+                    self._check_transition(status)
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {e}")
             
-            time.sleep(poll_interval)
+            stop_event.wait(self.next_poll_interval(status))
     
     def stop_monitoring(self):
         """Stop the monitoring thread"""
-        self.stop_polling = True
+        self._stop_event.set()
         if self.polling_thread:
             self.polling_thread.join(timeout=5)
         self._monitoring_active = False
         self.last_state = None
         logger.info("🖨️ PrusaLink monitoring stopped")
+    
+    def power_on(self,
+                 on_print_finished: Optional[Callable[[str], None]] = None,
+                 on_print_failed: Optional[Callable[[str], None]] = None) -> bool:
+        """
+        Skru på printeren i bakgrunnen. Returnerer med én gang; når PrusaLink
+        svarer startes overvåkingen og det meldes via event-bussen
+        (Event.PRUSA_ANNOUNCEMENT).
+        
+        Returns:
+            False hvis en oppstart allerede pågår
+        """
+        if self.is_powering_on:
+            return False
+        self._power_on_cancel = threading.Event()
+        self._power_on_thread = threading.Thread(
+            target=self._power_on_job, args=(self._power_on_cancel, on_print_finished, on_print_failed),
+            daemon=True, name="prusa-power-on")
+        self._power_on_thread.start()
+        return True
+    
+    def cancel_power_on(self):
+        """Avbryt en pågående oppstart (printeren skrus av igjen)."""
+        self._power_on_cancel.set()
+        if self._power_on_thread:
+            self._power_on_thread.join(timeout=10)
+    
+    def _power_on_job(self, cancel: threading.Event, on_print_finished, on_print_failed):
+        from src.duck_tools import control_hue_lights
+        
+        # Turn on smart plug via Hue
+        plug_result = control_hue_lights("on", "3D printer")
+        logger.info(f"🖨️ Smart plug result: {plug_result}")
+        
+        # Vent til PrusaLink svarer i stedet for en fast pause
+        started = time.monotonic()
+        status = None
+        while not cancel.wait(PRUSA_BOOT_POLL_S):
+            status = self.get_printer_status()
+            if status or time.monotonic() - started >= PRUSA_BOOT_TIMEOUT_S:
+                break
+        if cancel.is_set():
+            return
+        
+        # Start monitoring (svarer den ikke ennå, tar backoff-pollingen over)
+        self.start_monitoring(
+            on_print_finished=on_print_finished,
+            on_print_failed=on_print_failed
+        )
+        if status:
+            logger.info(f"🖨️ Printer ready after {time.monotonic() - started:.0f}s")
+            if status['state'] == 'IDLE':
+                message = "🖨️ 3D-printeren er skrudd på og klar til bruk."
+            else:
+                message = f"🖨️ 3D-printeren er skrudd på. {self.get_human_readable_status(status)}"
+        else:
+            message = ("🖨️ 3D-printeren er skrudd på, men svarer ikke ennå. "
+                       "Jeg fortsetter å følge med og sier fra når printen er ferdig.")
+        try:
+            from src.duck_event_bus import get_event_bus, Event
+            get_event_bus().post(Event.PRUSA_ANNOUNCEMENT, message)
+        except Exception as e:
+            logger.error(f"Could not announce printer power-on: {e}")
 
 
 def toggle_3d_printer(action: str, 
@@ -269,6 +413,9 @@ def toggle_3d_printer(action: str,
     """
     Turn 3D printer on/off via Hue smart plug and manage monitoring.
     
+    "on" venter ikke på oppstarten: den kjøres som en bakgrunnsjobb som
+    melder fra via event-bussen når printeren svarer.
+    
     Args:
         action: "on" or "off"
         on_print_finished: Callback when print finishes (only for "on")
@@ -288,24 +435,15 @@ def toggle_3d_printer(action: str,
         if prusa.is_monitoring:
             return "3D-printeren er allerede på og overvåkes."
         
-        # Turn on smart plug via Hue
-        plug_result = control_hue_lights("on", "3D printer")
-        logger.info(f"🖨️ Smart plug result: {plug_result}")
-        
-        # Wait for printer to boot up
-        logger.info("🖨️ Waiting 20 seconds for printer to boot...")
-        time.sleep(20)
-        
-        # Start monitoring
-        prusa.start_monitoring(
-            on_print_finished=on_print_finished,
-            on_print_failed=on_print_failed
-        )
+        if not prusa.power_on(on_print_finished=on_print_finished, on_print_failed=on_print_failed):
+            return "3D-printeren holder allerede på å starte. Jeg sier fra når den er klar."
         
-        return "Jeg har skrudd på 3D-printeren og startet overvåking. Det tar litt tid før den er helt klar."
+        return "Jeg skrur på 3D-printeren nå. Den trenger litt tid på å starte, så jeg sier fra når den er klar."
     
     elif action == "off":
-        # Stop monitoring first
+        # Stop boot job and monitoring first
+        if prusa.is_powering_on:
+            prusa.cancel_power_on()
         if prusa.is_monitoring:
             prusa.stop_monitoring()
         
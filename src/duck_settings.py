@@ -24,7 +24,7 @@ import os
 import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List
 
 from src.duck_config import DEFAULT_MODEL, DEFAULT_VOICE
 
@@ -59,6 +59,7 @@ class DuckSettings:
     def __init__(self):
         self._lock = threading.Lock()
         self._data: Dict[str, Any] = dict(DEFAULTS)
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
 
     @classmethod
     def get_instance(cls) -> 'DuckSettings':
@@ -77,9 +78,7 @@ class DuckSettings:
 
     @voice.setter
     def voice(self, value: str):
-        with self._lock:
-            self._data['voice'] = value
-            self._save_locked()
+        self.update({'voice': value})
 
     @property
     def beak(self) -> str:
@@ -89,9 +88,7 @@ class DuckSettings:
 
     @beak.setter
     def beak(self, value: str):
-        with self._lock:
-            self._data['beak'] = value
-            self._save_locked()
+        self.update({'beak': value})
 
     @property
     def beak_enabled(self) -> bool:
@@ -106,9 +103,7 @@ class DuckSettings:
 
     @speed.setter
     def speed(self, value: int):
-        with self._lock:
-            self._data['speed'] = max(0, min(100, int(value)))
-            self._save_locked()
+        self.update({'speed': value})
 
     @property
     def volume(self) -> int:
@@ -117,9 +112,7 @@ class DuckSettings:
 
     @volume.setter
     def volume(self, value: int):
-        with self._lock:
-            self._data['volume'] = max(0, min(100, int(value)))
-            self._save_locked()
+        self.update({'volume': value})
 
     @property
     def model(self) -> str:
@@ -128,9 +121,7 @@ class DuckSettings:
 
     @model.setter
     def model(self, value: str):
-        with self._lock:
-            self._data['model'] = value
-            self._save_locked()
+        self.update({'model': value})
 
     @property
     def personality(self) -> str:
@@ -139,9 +130,7 @@ class DuckSettings:
 
     @personality.setter
     def personality(self, value: str):
-        with self._lock:
-            self._data['personality'] = value
-            self._save_locked()
+        self.update({'personality': value})
 
     # ── Persistens ───────────────────────────────────────────
 
@@ -245,15 +234,33 @@ class DuckSettings:
     def update(self, updates: Dict[str, Any]):
         """Atomisk oppdatering av flere settings samtidig."""
         with self._lock:
-            changed = False
+            changed = {}
             for key, value in updates.items():
                 if key in self._data:
                     if key in ('speed', 'volume'):
                         value = max(0, min(100, int(value)))
+                    if self._data[key] != value:
+                        changed[key] = value
                     self._data[key] = value
-                    changed = True
             if changed:
                 self._save_locked()
+            listeners = list(self._listeners)
+        # Varsle utenfor låsen (lyttere kan lese settings selv)
+        if changed:
+            for listener in listeners:
+                try:
+                    listener(changed)
+                except Exception as e:
+                    print(f"⚠️ Settings-lytter feilet: {e}", flush=True)
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """
+        Registrer callback som kalles med {key: ny_verdi} når settings endres.
+        Brukes f.eks. av frase-cachen for å invalidere lyd ved stemmebytte.
+        """
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
 
     def load_from_tmp_files(self):
         """DEPRECATED: Bruk load() i stedet. Beholdt for bakoverkompatibilitet."""
@@ -310,10 +317,20 @@ class _SettingsHandler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
 
     def do_GET(self):
-        """GET /settings — hent alle settings (for duck-control status)."""
+        """GET /settings — hent alle settings (for duck-control status). GET /*-stats — statistikk."""
         try:
-            settings = get_settings()
-            data = settings.get_all()
+            if self.path == '/http-stats':
+                from src.duck_http import get_http_client
+                data = get_http_client().stats()
+            elif self.path == '/tool-cache-stats':
+                from src.duck_tool_cache import get_tool_cache
+                data = get_tool_cache().stats()
+            elif self.path == '/sms-queue-stats':
+                from src.duck_sms_pool import get_sms_pool
+                data = get_sms_pool().stats()
+            else:
+                settings = get_settings()
+                data = settings.get_all()
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
@@ -6,10 +6,12 @@ Handles SMS sending/receiving via Twilio and boredom management.
 import os
 import sqlite3
 import json
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from twilio.rest import Client
+from src.duck_http import get_http_client
 from src.duck_database import get_db
 from src.duck_config import DB_PATH
 
@@ -116,6 +118,14 @@ class SMSManager:
             )
         """)
         
+        # Meldinger fra relayen som er behandlet (relayen leverer minst én gang)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS relay_messages_seen (
+                id TEXT PRIMARY KEY,
+                seen_at TEXT NOT NULL
+            )
+        """)
+        
         # Initialize boredom state if not exists
         c.execute("INSERT OR IGNORE INTO boredom_state (id) VALUES (1)")
         
@@ -900,19 +910,21 @@ Hold det kort (under 160 tegn er best)."""
             Dict with status
         """
         try:
-            import requests
             
             payload = {
                 'from_duck': self.duck_name.lower(),
                 'to_duck': to_duck.lower(),
                 'message': message,
-                'media_url': media_url
+                'media_url': media_url,
+                'id': f"duck_{uuid.uuid4().hex}"  # Idempotensnøkkel - trygt å prøve på nytt
             }
             
-            response = requests.post(
+            response = get_http_client().post(
                 f"{self.sms_relay_url}/duck/send",
                 json=payload,
-                timeout=10
+                timeout=10,
+                retries=2,
+                retry_timeouts=True
             )
             
             if response.status_code == 200:
@@ -934,9 +946,7 @@ Hold det kort (under 160 tegn er best)."""
             List of messages: [{from_duck, message, media_url, timestamp}, ...]
         """
         try:
-            import requests
-            
-            response = requests.get(
+            response = get_http_client().get(
                 f"{self.sms_relay_url}/duck/poll/{self.duck_name.lower()}",
                 timeout=10
             )
@@ -953,6 +963,35 @@ Hold det kort (under 160 tegn er best)."""
             print(f"⚠️ Duck poll error: {e}", flush=True)
             return []
     
+    # ==================== RELAY-LEVERING (idempotens) ====================
+    
+    def filter_new_relay_messages(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Fjern meldinger som allerede er behandlet. Relayen leverer på nytt
+        hvis ack ikke kom frem (krasj eller nettverksfeil etter behandling).
+        """
+        ids = [m['id'] for m in messages if m.get('id')]
+        if not ids:
+            return messages
+        placeholders = ",".join("?" * len(ids))
+        with self.db.cursor() as c:
+            c.execute(f"SELECT id FROM relay_messages_seen WHERE id IN ({placeholders})", ids)
+            seen = {row[0] for row in c.fetchall()}
+        if seen:
+            print(f"♻️ Hopper over {len(seen)} melding(er) som allerede er behandlet", flush=True)
+        return [m for m in messages if m.get('id') not in seen]
+    
+    def mark_relay_messages_seen(self, ids: List[str]):
+        """Husk behandlede relay-meldinger (ryddes etter 7 dager)."""
+        if not ids:
+            return
+        now = datetime.now()
+        with self.db.cursor() as c:
+            c.executemany("INSERT OR IGNORE INTO relay_messages_seen (id, seen_at) VALUES (?, ?)",
+                          [(i, now.isoformat()) for i in ids])
+            c.execute("DELETE FROM relay_messages_seen WHERE seen_at < ?",
+                      ((now - timedelta(days=7)).isoformat(),))
+    
     def get_duck_contacts(self) -> List[str]:
         """
         Get list of other ducks from central config.
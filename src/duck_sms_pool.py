@@ -0,0 +1,189 @@
+"""
+SMSWorkerPool — behandling av innkommende SMS/MMS utenfor polling-løkka.
+
+Før behandlet sms_polling_loop i chatgpt_voice.py hver melding selv. Én MMS
+med bildeanalyse og AI-svar holdt alle andre meldinger (og pollingen mot
+relayen) igjen i mange sekunder.
+
+- Et fast antall worker-tråder (SMS_WORKERS) deler på jobbene
+- Én kø per avsender: meldinger fra samme nummer behandles i rekkefølge,
+  meldinger fra ulike avsendere parallelt (gruppemeldinger, flere i
+  familien som skriver samtidig)
+- Backpressure: polling-løkka kaller wait_for_capacity() før neste henting,
+  og venter når SMS_QUEUE_MAX meldinger er i kø eller under behandling.
+  Meldingene blir liggende i relayen (de er ikke ack-et) til det er plass
+- Id-ene til meldinger som er i kø holdes utenfor, så en melding relayen
+  leverer på nytt mens den fortsatt behandles, ikke legges inn to ganger
+- Kødybde, ventetid og backpressure vises i kontrollpanelet (/api/sms/queue)
+
+Bruk:
+    from src.duck_sms_pool import get_sms_pool
+
+    pool = get_sms_pool()
+    pool.submit(msg['from'], handle, msg, item_id=msg['id'])
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from src.duck_config import SMS_WORKERS, SMS_QUEUE_MAX
+
+
+class SMSWorkerPool:
+    """Begrenset worker-pool med rekkefølge per avsender (nøkkel)."""
+
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, workers: int = SMS_WORKERS, max_queued: int = SMS_QUEUE_MAX):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {}  # Nøkkel → ventende jobber (finnes så lenge nøkkelen har arbeid)
+        self._ready: deque = deque()  # Nøkler med ventende jobber som ingen worker holder på med
+        self._running = set()  # Nøkler som behandles nå
+        self._item_ids = set()  # Meldings-id-er i kø eller under behandling
+        self._pending = 0  # Jobber i kø + under behandling
+        self._threads = []
+        self._stats = {
+            'submitted': 0, 'processed': 0, 'failed': 0, 'duplicates': 0,
+            'max_depth': 0, 'backpressure_waits': 0, 'backpressure_s': 0.0,
+            'wait_s_total': 0.0, 'wait_s_max': 0.0, 'process_s_total': 0.0, 'process_s_max': 0.0,
+        }
+
+    @classmethod
+    def get_instance(cls) -> 'SMSWorkerPool':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _start_workers(self):
+        """Start worker-trådene ved første jobb (kalles med _cond holdt)."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, daemon=True, name=f"sms-worker-{i}")
+            thread.start()
+            self._threads.append(thread)
+
+    # ── Jobber ───────────────────────────────────────────────
+
+    def submit(self, key: str, fn: Callable, *args, item_id: Optional[str] = None) -> bool:
+        """
+        Legg en jobb i køen til en avsender.
+
+        Args:
+            key: Avsender (telefonnummer, 'duck:<navn>'); samme nøkkel = samme rekkefølge
+            fn, args: Jobben, kjøres som fn(*args) i en worker-tråd
+            item_id: Meldings-id (valgfri). Er den allerede i kø, hoppes jobben over
+
+        Returns:
+            True hvis jobben ble lagt i kø, False hvis item_id allerede var i kø
+        """
+        with self._cond:
+            if item_id is not None:
+                if item_id in self._item_ids:
+                    self._stats['duplicates'] += 1
+                    return False
+                self._item_ids.add(item_id)
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                self._ready.append(key)  # En nøkkel uten deque kjøres ikke nå
+            queue.append((fn, args, item_id, time.monotonic()))
+            self._pending += 1
+            self._stats['submitted'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._pending)
+            self._start_workers()
+            self._cond.notify_all()
+            return True
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                key = self._ready.popleft()
+                fn, args, item_id, enqueued_at = self._queues[key].popleft()
+                self._running.add(key)
+            started = time.monotonic()
+            failed = False
+            try:
+                fn(*args)
+            except Exception as e:
+                failed = True
+                print(f"⚠️ SMS-jobb feilet ({key}): {e}", flush=True)
+            finished = time.monotonic()
+            with self._cond:
+                self._running.discard(key)
+                self._item_ids.discard(item_id)
+                self._pending -= 1
+                # Neste melding fra samme avsender først når denne er ferdig
+                if self._queues[key]:
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                waited, took = started - enqueued_at, finished - started
+                self._stats['processed'] += 1
+                self._stats['failed'] += failed
+                self._stats['wait_s_total'] += waited
+                self._stats['wait_s_max'] = max(self._stats['wait_s_max'], waited)
+                self._stats['process_s_total'] += took
+                self._stats['process_s_max'] = max(self._stats['process_s_max'], took)
+                self._cond.notify_all()
+
+    # ── Backpressure ─────────────────────────────────────────
+
+    def wait_for_capacity(self, timeout: float) -> bool:
+        """
+        Vent til det er plass til flere meldinger (kalles av polling-løkka før henting).
+
+        Returns:
+            True når det er plass, False hvis køen fortsatt er full etter timeout
+        """
+        with self._cond:
+            if self._pending < self.max_queued:
+                return True
+            started = time.monotonic()
+            self._stats['backpressure_waits'] += 1
+            has_room = self._cond.wait_for(lambda: self._pending < self.max_queued, timeout)
+            self._stats['backpressure_s'] += time.monotonic() - started
+            return has_room
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Vent til alle jobber er ferdige (for tester og nedstenging)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    # ── Statistikk ───────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        """Kødybde, backpressure og vente-/behandlingstid for kontrollpanelet."""
+        with self._cond:
+            s = dict(self._stats)
+            processed = s.pop('processed')
+            wait_total, process_total = s.pop('wait_s_total'), s.pop('process_s_total')
+            return dict(
+                s,
+                workers=self.workers,
+                busy=len(self._running),
+                queued=self._pending - len(self._running),
+                max_queued=self.max_queued,
+                senders=len(self._queues),
+                processed=processed,
+                full=self._pending >= self.max_queued,
+                backpressure_s=round(s['backpressure_s'], 1),
+                wait_s_avg=round(wait_total / processed, 2) if processed else 0.0,
+                wait_s_max=round(s['wait_s_max'], 2),
+                process_s_avg=round(process_total / processed, 2) if processed else 0.0,
+                process_s_max=round(s['process_s_max'], 2),
+            )
+
+
+def get_sms_pool() -> SMSWorkerPool:
+    """Hent singleton SMSWorkerPool-instansen."""
+    return SMSWorkerPool.get_instance()
@@ -0,0 +1,200 @@
+"""
+SportsDataCache — ferdig parsede sportsdata med revisjonssjekk.
+
+OL-verktøyene lastet ned hele wikitexten (flere hundre KB) og regex-parset
+den ved hvert spørsmål, og fotball hentet tabellen på nytt for hvert lag.
+Et oppfølgingsspørsmål om et annet land eller lag kostet dermed like mye
+som det første.
+
+- Parsede tabeller lagres sammen med kildens revisjon (Wikipedia: sidens
+  lastrevid), i minnet og i SQLite (sports_cache)
+- Innenfor check_interval_s brukes dataene uten nettverk
+- Deretter gjøres en billig revisjonssjekk; bare ny revisjon gir ny
+  nedlasting og parsing
+- Kilder uten revisjon (fotball) lastes på nytt etter check_interval_s
+- Feiler sjekken eller nedlastingen, brukes forrige parsede data hvis den
+  ble bekreftet for mindre enn SPORTS_CACHE_MAX_STALE_S siden; eldre
+  resultater og terminlister presenteres ikke som gjeldende - da kastes feilen
+
+Bruk:
+    from src.duck_sports_cache import get_sports_cache
+
+    data = get_sports_cache().get(
+        "olympics:medals",
+        check_revision=lambda: current_revision(),   # str eller None
+        load=lambda revision: parse(download()),     # JSON-serialiserbart
+        check_interval_s=300,
+    )
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from src.duck_config import SPORTS_CACHE_MAX_STALE_S
+from src.duck_database import get_db
+
+
+class _Entry:
+    __slots__ = ('revision', 'data', 'checked_at')
+
+    def __init__(self, revision: Optional[str], data: Any, checked_at: float):
+        self.revision = revision
+        self.data = data
+        self.checked_at = checked_at
+
+
+class SportsDataCache:
+    """
+    Cache for parsede sportsdata, nøklet på navn og revisjon.
+    Singleton — bruk get_sports_cache() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._stats = {'hits': 0, 'revalidated': 0, 'reloads': 0, 'stale': 0}
+        self._init_database()
+
+    @classmethod
+    def get_instance(cls) -> 'SportsDataCache':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _init_database(self):
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    CREATE TABLE IF NOT EXISTS sports_cache (
+                        key TEXT PRIMARY KEY,
+                        revision TEXT,
+                        data TEXT NOT NULL,
+                        checked_at REAL NOT NULL
+                    )
+                """)
+                c.execute("SELECT key, revision, data, checked_at FROM sports_cache")
+                rows = c.fetchall()
+        except Exception as e:
+            print(f"⚠️ Sportsdata-cache: kunne ikke lese SQLite: {e}", flush=True)
+            return
+        for row in rows:
+            try:
+                self._entries[row['key']] = _Entry(row['revision'], json.loads(row['data']), row['checked_at'])
+            except ValueError:
+                continue
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _store(self, key: str, entry: _Entry, data_changed: bool = True):
+        with self._lock:
+            self._entries[key] = entry
+        try:
+            with get_db().cursor() as c:
+                if data_changed:
+                    c.execute("""
+                        INSERT OR REPLACE INTO sports_cache (key, revision, data, checked_at)
+                        VALUES (?, ?, ?, ?)
+                    """, (key, entry.revision, json.dumps(entry.data, ensure_ascii=False), entry.checked_at))
+                else:
+                    c.execute("UPDATE sports_cache SET checked_at = ? WHERE key = ?", (entry.checked_at, key))
+        except Exception as e:
+            print(f"⚠️ Sportsdata-cache: kunne ikke lagre {key}: {e}", flush=True)
+
+    def get(self, key: str, check_revision: Optional[Callable[[], Optional[str]]],
+            load: Callable[[Optional[str]], Any], check_interval_s: float,
+            max_stale_s: float = SPORTS_CACHE_MAX_STALE_S) -> Any:
+        """
+        Hent parsede data for key.
+
+        Args:
+            key: Navn på datasettet (f.eks. "olympics:medals")
+            check_revision: Billig oppslag av kildens revisjon, eller None hvis
+                kilden ikke har revisjoner (da lastes det på nytt etter intervallet)
+            load: Laster ned og parser for en gitt revisjon. None = ingen data
+            check_interval_s: Hvor lenge dataene brukes uten å sjekke kilden
+            max_stale_s: Hvor gamle (siden siste vellykkede sjekk) dataene kan
+                være når oppdateringen feiler
+
+        Returns:
+            Parsede data, eller None hvis kilden ikke har noe
+
+        Raises:
+            Feilen fra check_revision/load når det ikke finnes data som er
+            nye nok å falle tilbake på
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.checked_at < check_interval_s:
+                self._stats['hits'] += 1
+                return entry.data
+
+        with self._key_lock(key):
+            # En annen tråd kan ha oppdatert mens vi ventet
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.time() - entry.checked_at < check_interval_s:
+                    self._stats['hits'] += 1
+                    return entry.data
+            try:
+                revision = check_revision() if check_revision else None
+                if entry is not None and revision is not None and revision == entry.revision:
+                    self._store(key, _Entry(revision, entry.data, time.time()), data_changed=False)
+                    with self._lock:
+                        self._stats['revalidated'] += 1
+                    return entry.data
+                data = load(revision)
+            except Exception as e:
+                if entry is None:
+                    raise
+                age = time.time() - entry.checked_at
+                if age > max_stale_s:
+                    print(f"⚠️ Sportsdata-cache: {key} kunne ikke oppdateres ({e}), "
+                          f"forrige data er {age / 3600:.0f} t gamle - brukes ikke", flush=True)
+                    raise
+                print(f"⚠️ Sportsdata-cache: {key} kunne ikke oppdateres ({e}), bruker forrige data", flush=True)
+                with self._lock:
+                    self._stats['stale'] += 1
+                return entry.data
+            if data is None:
+                if entry is not None and time.time() - entry.checked_at <= max_stale_s:
+                    return entry.data
+                return None
+            self._store(key, _Entry(revision, data, time.time()))
+            with self._lock:
+                self._stats['reloads'] += 1
+            print(f"🏅 Sportsdata-cache: {key} lastet (revisjon {revision or '-'})", flush=True)
+            return data
+
+    def invalidate(self, key: str = None):
+        """Glem data (alt, eller én nøkkel)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        try:
+            with get_db().cursor() as c:
+                if key is None:
+                    c.execute("DELETE FROM sports_cache")
+                else:
+                    c.execute("DELETE FROM sports_cache WHERE key = ?", (key,))
+        except Exception as e:
+            print(f"⚠️ Sportsdata-cache: kunne ikke tømme: {e}", flush=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def get_sports_cache() -> SportsDataCache:
+    """Hent singleton SportsDataCache-instansen."""
+    return SportsDataCache.get_instance()
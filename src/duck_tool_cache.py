@@ -0,0 +1,326 @@
+"""
+ToolResultCache — gjenbruk av resultater fra identiske tool-kall.
+
+Samme værmelding, tabell, nyhetsliste eller Wikipedia-oppslag hentes ofte
+flere ganger kort tid etter hverandre. Cachen ligger rundt tool-dispatchen
+i duck_ai (_execute_tool) og er nøklet på (tool, normaliserte argumenter).
+
+- TTL per tool (TOOL_CACHE_TTLS). Tools kan overstyre TTL for ett kall med
+  hint_ttl() - get_weather bruker MET sin Expires-header
+- Stale-while-revalidate: etter TTL svares det umiddelbart med gammelt
+  resultat i stale-vinduet, mens et nytt hentes i bakgrunnen
+- Feilmeldinger og "fant ikke"-svar (TOOL_CACHE_ERROR_PREFIXES) caches
+  ikke. Feiler et tool (f.eks. fordi circuit breakeren for hosten er åpen)
+  svares det med siste kjente resultat, merket som eldre data, så lenge toolet tillater det
+  (TOOL_CACHE_FALLBACK_MAX_AGE_S per tool, 0 for tidsrelative svar)
+- I minnet (LRU, TOOL_CACHE_MAX_ENTRIES) og valgfritt i SQLite (tool_cache)
+  så cachen overlever restart
+- Treffrate per tool vises i kontrollpanelet (/api/tools/cache)
+- duck_prefetch varmer opp cachen (warm) før timene kallene pleier å komme
+
+Bruk:
+    from src.duck_tool_cache import get_tool_cache
+
+    cache = get_tool_cache()
+    if cache.cacheable(name):
+        result, status = cache.call(name, args, lambda: compute(name, args))
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.duck_config import (
+    TOOL_CACHE_ENABLED, TOOL_CACHE_PERSIST, TOOL_CACHE_MAX_ENTRIES,
+    TOOL_CACHE_TTLS, TOOL_CACHE_ERROR_PREFIXES, TOOL_CACHE_FALLBACK_MAX_AGE_S
+)
+from src.duck_database import get_db
+
+FALLBACK_NOTE = "⚠️ Tjenesten svarer ikke akkurat nå - dette er sist hentede data:\n"
+
+# TTL-hint fra toolet som kjører i denne tråden (se hint_ttl)
+_hint = threading.local()
+
+
+def hint_ttl(seconds: float):
+    """
+    Overstyr TTL for resultatet av tool-kallet som kjører nå.
+    Kalles fra tool-koden, f.eks. basert på en Expires-header.
+    """
+    _hint.ttl = max(0.0, float(seconds))
+
+
+def _seconds_until_next_hour() -> float:
+    now = datetime.now()
+    return (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1) - now).total_seconds()
+
+
+def _seconds_until_midnight() -> float:
+    now = datetime.now()
+    return (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1) - now).total_seconds()
+
+
+def _dynamic_ttl(tool: str, args: Dict[str, Any]) -> Optional[float]:
+    """TTL som avhenger av klokka (strømpriser gjelder per time/døgn)."""
+    if tool == "get_electricity_price":
+        if args.get("timeframe", "now") == "now":
+            return _seconds_until_next_hour()
+        return _seconds_until_midnight()
+    return None
+
+
+def _normalize(value):
+    """Case/whitespace-normalisering så "Oslo" og " oslo" gir samme nøkkel."""
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v not in (None, "")}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class _Entry:
+    __slots__ = ('tool', 'value', 'expires_at', 'stale_until')
+
+    def __init__(self, tool: str, value: str, expires_at: float, stale_until: float):
+        self.tool = tool
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class ToolResultCache:
+    """
+    Cache for tool-resultater med TTL per tool og stale-while-revalidate.
+    Singleton — bruk get_tool_cache() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, persist: bool = TOOL_CACHE_PERSIST):
+        self.persist = persist
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        if self.persist:
+            self._load()
+
+    @classmethod
+    def get_instance(cls) -> 'ToolResultCache':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # ── Nøkler og policy ─────────────────────────────────────
+
+    @staticmethod
+    def cacheable(tool: str) -> bool:
+        return TOOL_CACHE_ENABLED and tool in TOOL_CACHE_TTLS
+
+    @staticmethod
+    def make_key(tool: str, args: Dict[str, Any]) -> str:
+        return f"{tool}:{json.dumps(_normalize(args or {}), sort_keys=True, ensure_ascii=False)}"
+
+    def _count(self, tool: str, field: str):
+        """Oppdater statistikk. Kalles med lock holdt."""
+        stats = self._stats.setdefault(tool, {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+                                              'fallbacks': 0, 'prefetches': 0})
+        stats[field] += 1
+
+    # ── Oppslag ──────────────────────────────────────────────
+
+    def peek(self, tool: str, args: Dict[str, Any]) -> bool:
+        """Finnes et brukbart (ferskt eller stale) resultat? Teller ikke i statistikken."""
+        if not self.cacheable(tool):
+            return False
+        with self._lock:
+            entry = self._entries.get(self.make_key(tool, args))
+            return entry is not None and time.time() < entry.stale_until
+
+    def call(self, tool: str, args: Dict[str, Any], compute: Callable[[], str]) -> Tuple[str, str]:
+        """
+        Hent resultat fra cache, eller beregn og lagre det.
+
+        Args:
+            tool: Tool-navn
+            args: Argumentene fra tool-kallet
+            compute: Funksjon som kjører toolet og returnerer resultatet
+
+        Returns:
+            (resultat, status) der status er 'hit', 'stale', 'miss' eller
+            'fallback' (toolet feilet, eldre resultat brukt)
+        """
+        key = self.make_key(tool, args)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self._count(tool, 'hits')
+                return entry.value, 'hit'
+            if entry is not None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                self._count(tool, 'stale_hits')
+                refresh = key not in self._refreshing
+                if refresh:
+                    self._refreshing.add(key)
+            else:
+                expired, entry = entry, None
+                self._count(tool, 'misses')
+
+        if entry is not None:
+            if refresh:
+                threading.Thread(target=self._refresh, args=(key, tool, args, compute),
+                                 daemon=True, name=f"tool-cache-refresh-{tool}").start()
+            return entry.value, 'stale'
+
+        result = self._compute_and_store(key, tool, args, compute)
+        fallback_max_age = TOOL_CACHE_FALLBACK_MAX_AGE_S.get(tool, 0)
+        if (expired is not None and fallback_max_age > 0 and self._is_error(result)
+                and time.time() < expired.stale_until + fallback_max_age):
+            with self._lock:
+                self._count(tool, 'fallbacks')
+            print(f"♻️ Tool-cache: {tool} feilet, svarer med sist hentede resultat", flush=True)
+            return FALLBACK_NOTE + expired.value, 'fallback'
+        return result, 'miss'
+
+    def warm(self, tool: str, args: Dict[str, Any], compute: Callable[[], str]) -> bool:
+        """
+        Forhåndshent et resultat (duck_prefetch). Teller ikke som treff/bom.
+
+        Returns:
+            True hvis et resultat ble lagret
+        """
+        if not self.cacheable(tool):
+            return False
+        key = self.make_key(tool, args)
+        result = self._compute_and_store(key, tool, args, compute)
+        with self._lock:
+            self._count(tool, 'prefetches')
+        return not self._is_error(result)
+
+    @staticmethod
+    def _is_error(result) -> bool:
+        return not isinstance(result, str) or not result or result.startswith(TOOL_CACHE_ERROR_PREFIXES)
+
+    def _compute_and_store(self, key: str, tool: str, args: Dict[str, Any], compute: Callable[[], str]) -> str:
+        _hint.ttl = None
+        result = compute()
+        ttl_hint = getattr(_hint, 'ttl', None)
+        _hint.ttl = None
+        if not self._is_error(result):
+            self._store(key, tool, args, result, ttl_hint)
+        return result
+
+    def _refresh(self, key: str, tool: str, args: Dict[str, Any], compute: Callable[[], str]):
+        """Bakgrunnsoppdatering av et stale resultat."""
+        try:
+            self._compute_and_store(key, tool, args, compute)
+            with self._lock:
+                self._count(tool, 'refreshes')
+        except Exception as e:
+            print(f"⚠️ Tool-cache: oppdatering av {tool} feilet: {e}", flush=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    # ── Lagring ──────────────────────────────────────────────
+
+    def _store(self, key: str, tool: str, args: Dict[str, Any], value: str, ttl_hint: Optional[float]):
+        ttl, stale = TOOL_CACHE_TTLS[tool]
+        dynamic = _dynamic_ttl(tool, args)
+        if ttl_hint is not None:
+            ttl = ttl_hint
+        elif dynamic is not None:
+            ttl = dynamic
+        now = time.time()
+        entry = _Entry(tool, value, now + ttl, now + ttl + stale)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > TOOL_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        if self.persist:
+            try:
+                with get_db().cursor() as c:
+                    c.execute("""
+                        INSERT OR REPLACE INTO tool_cache (key, tool, value, expires_at, stale_until)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (key, tool, value, entry.expires_at, entry.stale_until))
+            except Exception as e:
+                print(f"⚠️ Tool-cache: kunne ikke lagre {tool}: {e}", flush=True)
+
+    def _load(self):
+        """Opprett tabellen og last inn resultater som fortsatt er brukbare."""
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    CREATE TABLE IF NOT EXISTS tool_cache (
+                        key TEXT PRIMARY KEY,
+                        tool TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        stale_until REAL NOT NULL
+                    )
+                """)
+                # Utløpte resultater beholdes en stund som reserve når toolet feiler
+                c.execute("DELETE FROM tool_cache WHERE stale_until < ?",
+                          (time.time() - max(TOOL_CACHE_FALLBACK_MAX_AGE_S.values(), default=0),))
+                c.execute("""
+                    SELECT key, tool, value, expires_at, stale_until FROM tool_cache
+                    ORDER BY expires_at DESC LIMIT ?
+                """, (TOOL_CACHE_MAX_ENTRIES,))
+                rows = c.fetchall()
+        except Exception as e:
+            print(f"⚠️ Tool-cache: kunne ikke lese SQLite-cache: {e}", flush=True)
+            return
+        for row in reversed(rows):
+            if row['tool'] in TOOL_CACHE_TTLS:
+                self._entries[row['key']] = _Entry(row['tool'], row['value'], row['expires_at'], row['stale_until'])
+        if rows:
+            print(f"✅ Tool-cache: lastet {len(self._entries)} resultater fra SQLite", flush=True)
+
+    def invalidate(self, tool: str = None):
+        """Fjern alle resultater (eller kun for ett tool)."""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if tool is None or e.tool == tool]:
+                del self._entries[key]
+        if self.persist:
+            try:
+                with get_db().cursor() as c:
+                    if tool is None:
+                        c.execute("DELETE FROM tool_cache")
+                    else:
+                        c.execute("DELETE FROM tool_cache WHERE tool = ?", (tool,))
+            except Exception as e:
+                print(f"⚠️ Tool-cache: kunne ikke tømme SQLite-cache: {e}", flush=True)
+
+    # ── Statistikk ───────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        """Treffrate per tool (stale-treff regnes som treff) og antall lagrede resultater."""
+        with self._lock:
+            tools = {}
+            for tool, s in sorted(self._stats.items()):
+                served = s['hits'] + s['stale_hits']
+                total = served + s['misses']
+                tools[tool] = dict(s, hit_rate=round(served / total, 3) if total else 0.0)
+            return {
+                'enabled': TOOL_CACHE_ENABLED,
+                'persist': self.persist,
+                'entries': len(self._entries),
+                'max_entries': TOOL_CACHE_MAX_ENTRIES,
+                'tools': tools,
+            }
+
+
+def get_tool_cache() -> ToolResultCache:
+    """Hent singleton ToolResultCache-instansen."""
+    return ToolResultCache.get_instance()
@@ -3,65 +3,27 @@ Duck Tools Module
 AI function calling tools: weather, lights, IP address, geocoding, and Netatmo sensors.
 """
 
-import os
-import json
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 
-from src.duck_config import LOCATIONS_FILE
+from src.duck_http import get_http_client
+from src.duck_geocoder import get_geocoder
+from src.duck_hue import get_hue_client
+from src.duck_netatmo import get_netatmo_client
+from src.duck_tool_cache import hint_ttl
 
 
 def get_coordinates(location_name):
     """
-    Hent koordinater for et stedsnavn - sjekker først lokal database, deretter Nominatim.
+    Hent koordinater for et stedsnavn - lokal indeks (locations.json), deretter
+    cachet Nominatim-oppslag. Se src/duck_geocoder.py.
     
     Returns:
         tuple: (lat, lon, display_name) eller None
     """
-    try:
-        # Først: Sjekk om stedet finnes i vår lokale database
-        if os.path.exists(LOCATIONS_FILE):
-            try:
-                with open(LOCATIONS_FILE, 'r', encoding='utf-8') as f:
-                    locations_data = json.load(f)
-                    locations = locations_data.get('locations', {})
-                    
-                    # Søk case-insensitive
-                    location_key = location_name.lower().strip()
-                    if location_key in locations:
-                        loc = locations[location_key]
-                        print(f"📍 Bruker lokal koordinat for {loc['name']}", flush=True)
-                        return loc['lat'], loc['lon'], loc['description']
-            except Exception as e:
-                print(f"Kunne ikke lese locations-fil: {e}", flush=True)
-        
-        # Fallback: Søk via Nominatim (OpenStreetMap)
-        search_query = f"{location_name}, Norge"
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': search_query,
-            'format': 'json',
-            'limit': 1
-        }
-        headers = {
-            'User-Agent': 'ChatGPTDuck/2.1.2 (contact: github.com/osmund/chatgpt-and)'
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data and len(data) > 0:
-            lat = float(data[0]['lat'])
-            lon = float(data[0]['lon'])
-            display_name = data[0].get('display_name', location_name)
-            print(f"📍 Bruker Nominatim for {location_name}", flush=True)
-            return lat, lon, display_name
-        return None
-    except Exception as e:
-        print(f"Geocoding feil for '{location_name}': {e}", flush=True)
-        return None
+    return get_geocoder().geocode(location_name)
 
 
 def get_weather(location_name, timeframe="now"):
@@ -91,10 +53,18 @@ def get_weather(location_name, timeframe="now"):
             'User-Agent': 'ChatGPTDuck/2.1.2 (contact: github.com/osmund/chatgpt-and)'
         }
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = get_http_client().get(url, params=params, headers=headers, timeout=10)
         response.raise_for_status()
         data = response.json()
         
+        # MET oppgir når varselet utløper - bruk det som TTL i tool-cachen
+        expires = response.headers.get('Expires')
+        if expires:
+            try:
+                hint_ttl(max(60, (parsedate_to_datetime(expires) - datetime.now(timezone.utc)).total_seconds()))
+            except (TypeError, ValueError):
+                pass
+        
         # Parse værdata
         timeseries = data['properties']['timeseries']
         
@@ -344,37 +314,18 @@ def control_hue_lights(action, room=None, brightness=None, color=None):
         str: Beskrivelse av hva som ble gjort
     """
     try:
-        bridge_ip = os.getenv("HUE_BRIDGE_IP")
-        api_key = os.getenv("HUE_API_KEY")
+        hue = get_hue_client()
         
-        if not bridge_ip or not api_key:
+        if not hue.is_configured():
             return "Philips Hue er ikke konfigurert. Legg til HUE_BRIDGE_IP og HUE_API_KEY i .env"
         
-        base_url = f"http://{bridge_ip}/api/{api_key}"
-        
-        # Hent alle lys
-        response = requests.get(f"{base_url}/lights", timeout=5)
-        response.raise_for_status()
-        lights = response.json()
-        
-        if not lights:
-            return "Fant ingen Philips Hue-lys på nettverket."
+        # Finn hvilke lys som skal styres (rom → én gruppe-kommando, ellers enkeltlys)
+        target = hue.resolve(room)
         
-        # Finn hvilke lys som skal styres
-        target_lights = []
-        if room:
-            # Søk etter lys som matcher romnavnet
-            room_lower = room.lower()
-            for light_id, light_data in lights.items():
-                light_name = light_data.get('name', '').lower()
-                if room_lower in light_name:
-                    target_lights.append((light_id, light_data['name']))
-            
-            if not target_lights:
-                return f"Fant ingen lys som matcher '{room}'. Tilgjengelige lys: {', '.join([lights[lid]['name'] for lid in lights])}"
-        else:
-            # Alle lys
-            target_lights = [(lid, lights[lid]['name']) for lid in lights]
+        if target is None or not target.names:
+            if not room:
+                return "Fant ingen Philips Hue-lys på nettverket."
+            return f"Fant ingen lys som matcher '{room}'. Tilgjengelige rom: {', '.join(hue.room_names())}. Tilgjengelige lys: {', '.join(hue.light_names())}"
         
         # Fargekart (Hue format: 0-65535)
         color_map = {
@@ -417,16 +368,8 @@ def control_hue_lights(action, room=None, brightness=None, color=None):
             else:
                 state['bri'] = 254  # Full lysstyrke
         
-        # Utfør kommandoen på alle target lys
-        results = []
-        for light_id, light_name in target_lights:
-            try:
-                url = f"{base_url}/lights/{light_id}/state"
-                resp = requests.put(url, json=state, timeout=5)
-                resp.raise_for_status()
-                results.append(light_name)
-            except Exception as e:
-                print(f"Feil ved kontroll av {light_name}: {e}", flush=True)
+        # Utfør kommandoen (gruppe: ett kall, enkeltlys: samtidige kall)
+        results = hue.apply(target, state)
         
         # Bygg svar
         action_desc = {
@@ -490,98 +433,36 @@ def get_netatmo_temperature(room_name=None):
         str: Temperatur-rapport med fuktighet og CO2 hvis tilgjengelig
     """
     try:
-        # Hent credentials fra environment
-        client_id = os.getenv("NETATMO_CLIENT_ID")
-        client_secret = os.getenv("NETATMO_CLIENT_SECRET")
-        refresh_token = os.getenv("NETATMO_REFRESH_TOKEN")
-        
-        if not all([client_id, client_secret, refresh_token]):
+        netatmo = get_netatmo_client()
+        if not netatmo.is_configured():
             return "Netatmo er ikke konfigurert. Mangler API-nøkler i .env filen."
         
-        # Få access token via refresh token
-        token_url = "https://api.netatmo.com/oauth2/token"
-        token_data = {
-            "grant_type": "refresh_token",
-            "refresh_token": refresh_token,
-            "client_id": client_id,
-            "client_secret": client_secret
-        }
-        
-        token_response = requests.post(token_url, data=token_data)
-        token_response.raise_for_status()
-        access_token = token_response.json()["access_token"]
-        
-        # Hent homestatus data
-        api_url = "https://api.netatmo.com/api/homestatus"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        
-        # Først hent homes for å få home_id
-        homes_url = "https://api.netatmo.com/api/homesdata"
-        homes_response = requests.post(homes_url, headers=headers)
-        homes_response.raise_for_status()
-        homes_data = homes_response.json()
-        
-        if "body" not in homes_data or "homes" not in homes_data["body"]:
-            return "Fant ingen Netatmo-hjem i kontoen din."
-        
+        # Token og hjem/rom-oversikt er cachet, status for alle hjem hentes samtidig
         all_data = []
-        
-        # Loop gjennom alle hjem
-        for home in homes_data["body"]["homes"]:
-            home_id = home["id"]
-            home_name = home.get("name", "Hjem")
-            
-            # Hent status for dette hjemmet
-            status_response = requests.post(
-                api_url,
-                headers=headers,
-                json={"home_id": home_id}
-            )
-            status_response.raise_for_status()
-            status_data = status_response.json()
+        for reading in netatmo.read_rooms():
+            room_name_str = reading["room"]
+            temp = reading["temperature"]
+            humidity = reading["humidity"]
+            co2 = reading["co2"]
             
-            # Parse rooms og modules
-            if "body" not in status_data or "home" not in status_data["body"]:
-                continue
-                
-            home_status = status_data["body"]["home"]
-            rooms = {r["id"]: r for r in home_status.get("rooms", [])}
-            modules = {m["id"]: m for m in home_status.get("modules", [])}
+            parts = []
+            if temp is not None:
+                # Bruk komma for desimaltall (norsk standard) i stedet for punktum
+                temp_str = f"{temp:.1f}".replace('.', ',')
+                parts.append(f"{temp_str} grader")
+            if humidity is not None:
+                parts.append(f"{humidity}% fuktighet")
+            if co2 is not None:
+                # Forenkle CO2 for tale - dropp "ppm" som er vanskelig å si
+                parts.append(f"CO2 på {co2}")
             
-            # Map modules to rooms from homesdata
-            for room_info in home.get("rooms", []):
-                room_id = room_info["id"]
-                room_name_str = room_info.get("name", "Ukjent rom")
-                
-                # Finn moduler i rommet
-                for module_id in room_info.get("module_ids", []):
-                    if module_id in modules:
-                        module = modules[module_id]
-                        
-                        # Sjekk om modulen har målinger
-                        if "temperature" in module or "humidity" in module or "co2" in module:
-                            temp = module.get("temperature")
-                            humidity = module.get("humidity")
-                            co2 = module.get("co2")
-                            
-                            parts = []
-                            if temp is not None:
-                                # Bruk komma for desimaltall (norsk standard) i stedet for punktum
-                                temp_str = f"{temp:.1f}".replace('.', ',')
-                                parts.append(f"{temp_str} grader")
-                            if humidity is not None:
-                                parts.append(f"{humidity}% fuktighet")
-                            if co2 is not None:
-                                # Forenkle CO2 for tale - dropp "ppm" som er vanskelig å si
-                                parts.append(f"CO2 på {co2}")
-                            
-                            if parts:
-                                data_str = f"{room_name_str}: " + ", ".join(parts)
-                                all_data.append({
-                                    "name": room_name_str.lower(),
-                                    "display_name": room_name_str,
-                                    "data": data_str
-                                })
+            if parts:
+                data_str = f"{room_name_str}: " + ", ".join(parts)
+                all_data.append({
+                    "name": room_name_str.lower(),
+                    "display_name": room_name_str,
+                    "data": data_str
+                })
         
         # Hvis spesifikt rom ble forespurt
         if room_name:
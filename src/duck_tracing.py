@@ -0,0 +1,289 @@
+"""
+DuckTracer — lett per-tur latency-tracing.
+
+Hver stemme-tur (wake word → STT → prompt → LLM-runder → tools → TTS → avspilling)
+blir én trace med spans målt med time.monotonic(). Ferdige traces skrives som én
+JSON-linje per tur til en roterende fil, som duck-control.py leser for å vise
+p50/p95 per steg og en waterfall for de siste turene.
+
+Bruk:
+    from src.duck_tracing import get_tracer
+
+    tracer = get_tracer()
+    tracer.begin_turn("voice")
+    with tracer.span("stt"):
+        prompt = recognize_speech_from_mic()
+    with tracer.span("tool", tool="get_weather"):
+        ...
+    tracer.mark("first_audio")
+    tracer.end_turn()
+
+Spans utenfor en aktiv tur (f.eks. chatgpt_query fra SMS-tråden) er no-ops,
+så instrumentering kan ligge i delt kode uten å påvirke andre tråder.
+"""
+
+import json
+import logging
+import logging.handlers
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from src.duck_config import TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_FILE_BACKUPS
+
+
+class _Trace:
+    """Én tur under oppbygging (kun brukt av tråden som startet den)."""
+
+    def __init__(self, kind: str, attrs: Dict[str, Any]):
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.attrs = attrs
+        self.wall_start = time.time()
+        self.t0 = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+        self.marks: List[Dict[str, Any]] = []
+        self.depth = 0
+
+    def offset_ms(self, t: float) -> float:
+        return round((t - self.t0) * 1000, 1)
+
+    def to_dict(self, end: float) -> Dict[str, Any]:
+        return {
+            'turn_id': self.turn_id,
+            'kind': self.kind,
+            'start': self.wall_start,
+            'duration_ms': self.offset_ms(end),
+            'attrs': self.attrs,
+            'spans': self.spans,
+            'marks': self.marks,
+        }
+
+
+class DuckTracer:
+    """
+    Thread-local tracer med roterende JSONL-output.
+    Singleton — bruk get_tracer() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, trace_file: str = None):
+        self.trace_file = trace_file or TRACE_FILE
+        self._local = threading.local()
+        self._logger = None
+        self._logger_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'DuckTracer':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # ── Tur-livssyklus ───────────────────────────────────────
+
+    def begin_turn(self, kind: str = 'voice', **attrs) -> str:
+        """
+        Start en ny tur i denne tråden. En uavsluttet tur avsluttes først.
+
+        Returns:
+            turn_id for den nye turen
+        """
+        if getattr(self._local, 'trace', None) is not None:
+            self.end_turn()
+        trace = _Trace(kind, attrs)
+        self._local.trace = trace
+        return trace.turn_id
+
+    def end_turn(self, **attrs) -> Optional[Dict[str, Any]]:
+        """Avslutt aktiv tur og skriv den til trace-filen."""
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return None
+        self._local.trace = None
+        trace.attrs.update(attrs)
+        record = trace.to_dict(time.monotonic())
+        self._write(record)
+        return record
+
+    def discard_turn(self):
+        """Forkast aktiv tur uten å skrive den (f.eks. ingen tale gjenkjent)."""
+        self._local.trace = None
+
+    @property
+    def active(self) -> bool:
+        return getattr(self._local, 'trace', None) is not None
+
+    # ── Spans og marks ───────────────────────────────────────
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Mål en blokk som et steg i aktiv tur. No-op uten aktiv tur."""
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            yield
+            return
+        start = time.monotonic()
+        trace.depth += 1
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            end = time.monotonic()
+            trace.depth -= 1
+            span = {
+                'name': name,
+                'start_ms': trace.offset_ms(start),
+                'duration_ms': round((end - start) * 1000, 1),
+                'depth': trace.depth,
+            }
+            if attrs:
+                span['attrs'] = attrs
+            if error:
+                span['error'] = error
+            trace.spans.append(span)
+
+    def record_span(self, name: str, start: float, end: float = None, **attrs):
+        """
+        Registrer et steg med eksplisitte monotonic-tidspunkt.
+        For kode der en with-blokk ikke passer (f.eks. steg som krysser try/finally).
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return
+        end = time.monotonic() if end is None else end
+        span = {
+            'name': name,
+            'start_ms': trace.offset_ms(start),
+            'duration_ms': round((end - start) * 1000, 1),
+            'depth': trace.depth,
+        }
+        if attrs:
+            span['attrs'] = attrs
+        trace.spans.append(span)
+
+    def mark(self, name: str, **attrs):
+        """Registrer et tidspunkt (f.eks. first_audio) i aktiv tur."""
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return
+        mark = {'name': name, 'at_ms': trace.offset_ms(time.monotonic())}
+        if attrs:
+            mark['attrs'] = attrs
+        trace.marks.append(mark)
+
+    # ── Persistens ───────────────────────────────────────────
+
+    def _get_logger(self) -> logging.Logger:
+        """Lazy-init av dedikert logger med RotatingFileHandler."""
+        if self._logger is None:
+            with self._logger_lock:
+                if self._logger is None:
+                    os.makedirs(os.path.dirname(self.trace_file), exist_ok=True)
+                    handler = logging.handlers.RotatingFileHandler(
+                        self.trace_file,
+                        maxBytes=TRACE_FILE_MAX_BYTES,
+                        backupCount=TRACE_FILE_BACKUPS,
+                        encoding='utf-8'
+                    )
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    trace_logger = logging.getLogger('duck.traces')
+                    trace_logger.setLevel(logging.INFO)
+                    trace_logger.propagate = False
+                    trace_logger.addHandler(handler)
+                    self._logger = trace_logger
+        return self._logger
+
+    def _write(self, record: Dict[str, Any]):
+        try:
+            self._get_logger().info(json.dumps(record, ensure_ascii=False))
+        except Exception as e:
+            print(f"⚠️ Kunne ikke skrive trace: {e}", flush=True)
+
+
+# ═══════════════════════════════════════════════════════════════
+# Lesing og aggregering (brukes av duck-control.py)
+# ═══════════════════════════════════════════════════════════════
+
+def load_recent_traces(limit: int = 50, trace_file: str = None) -> List[Dict[str, Any]]:
+    """
+    Les de siste `limit` turene fra trace-filen (inkludert rotert backup).
+
+    Returns:
+        Liste med trace-dicts, eldst først
+    """
+    trace_file = trace_file or TRACE_FILE
+    lines: List[str] = []
+    for path in (f"{trace_file}.1", trace_file):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines.extend(f.readlines())
+        except FileNotFoundError:
+            continue
+    traces = []
+    for line in lines[-limit:]:
+        try:
+            traces.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return traces
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentil på en sortert liste."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+def _stage_name(span: Dict[str, Any]) -> str:
+    """Tool-spans grupperes per tool (tool:get_weather), resten per navn."""
+    tool = span.get('attrs', {}).get('tool')
+    return f"{span['name']}:{tool}" if tool else span['name']
+
+
+def compute_stage_stats(traces: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Beregn p50/p95 per steg over gitte traces.
+
+    Et steg som forekommer flere ganger i samme tur (f.eks. llm_round)
+    telles per forekomst. Marks rapporteres som tid fra turstart (første forekomst).
+    """
+    durations: Dict[str, List[float]] = {}
+    for trace in traces:
+        durations.setdefault(f"turn:{trace.get('kind', 'voice')}", []).append(trace.get('duration_ms', 0.0))
+        for span in trace.get('spans', []):
+            durations.setdefault(_stage_name(span), []).append(span.get('duration_ms', 0.0))
+        seen_marks = set()
+        for mark in trace.get('marks', []):
+            # Kun første forekomst per tur (f.eks. første lyd, ikke hver speak())
+            if mark['name'] in seen_marks:
+                continue
+            seen_marks.add(mark['name'])
+            durations.setdefault(f"@{mark['name']}", []).append(mark.get('at_ms', 0.0))
+
+    stats = {}
+    for stage, values in durations.items():
+        values.sort()
+        stats[stage] = {
+            'count': len(values),
+            'p50_ms': _percentile(values, 50),
+            'p95_ms': _percentile(values, 95),
+            'max_ms': values[-1],
+        }
+    return stats
+
+
+def get_tracer() -> DuckTracer:
+    """Hent singleton DuckTracer-instansen."""
+    return DuckTracer.get_instance()
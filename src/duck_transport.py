@@ -2,11 +2,27 @@
 Duck Transport Module
 Henter avganger og reiseforslag fra Entur API.
 Gratis, ingen API-nøkkel nødvendig (bare ET-Client-Name header).
+
+- Holdeplassnavn → Entur-ID huskes i SQLite (entur_stops), så geocoderen
+  bare spørres første gang et navn brukes
+- Favorittholdeplasser (ENTUR_FAVORITE_STOPS) holdes varme: avgangene
+  hentes i bakgrunnen i aktive timer med én GraphQL-spørring for alle, og
+  "når går bussen" svares fra minnet
 """
 
+import json
+import re
+import threading
+import time
 import requests
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
+from src.duck_config import (
+    ENTUR_STOP_TTL_S, ENTUR_STOP_NEGATIVE_TTL_S, ENTUR_FAVORITE_STOPS, ENTUR_BOARD_ACTIVE_HOURS,
+    ENTUR_BOARD_REFRESH_S, ENTUR_BOARD_MAX_AGE_S, ENTUR_BOARD_DEPARTURES
+)
+from src.duck_database import get_db
+from src.duck_http import get_http_client
 
 
 ENTUR_GEOCODER_URL = 'https://api.entur.io/geocoder/v1/autocomplete'
@@ -29,27 +45,117 @@ TRANSPORT_MODE_NO = {
     'funicular': '🚡 Kabelbane',
 }
 
+# Talte/skrevne transporttyper → Entur transportMode
+MODE_MAP = {
+    'buss': 'bus', 'bus': 'bus',
+    'trikk': 'tram', 'tram': 'tram',
+    'tbane': 'metro', 't-bane': 'metro', 'metro': 'metro',
+    'tog': 'rail', 'rail': 'rail', 'jernbane': 'rail',
+    'båt': 'water', 'ferge': 'water', 'water': 'water',
+}
 
-def _find_stop(query: str) -> Optional[dict]:
-    """
-    Søk etter holdeplass/stasjon via Entur geocoder.
+_CALL_FIELDS = """
+                expectedDepartureTime
+                aimedDepartureTime
+                realtime
+                destinationDisplay {
+                    frontText
+                }
+                serviceJourney {
+                    line {
+                        publicCode
+                        transportMode
+                    }
+                }"""
 
-    Returns:
-        dict med 'id', 'name', 'locality' eller None
+
+def _stop_key(name: str) -> str:
+    """Nøkkel for et holdeplassnavn: små bokstaver, bare ord ("Oslo S" og " oslo  s" er like)."""
+    return ' '.join(re.findall(r'\w+', (name or '').lower()))
+
+
+class StopResolver:
     """
-    try:
+    Holdeplassnavn → Entur-holdeplass, husket i minnet og i SQLite.
+    Singleton — bruk get_stop_resolver() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memo: Dict[str, Optional[dict]] = {}
+        self._init_database()
+
+    @classmethod
+    def get_instance(cls) -> 'StopResolver':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _init_database(self):
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    CREATE TABLE IF NOT EXISTS entur_stops (
+                        query TEXT PRIMARY KEY,
+                        found INTEGER NOT NULL,
+                        stop TEXT,
+                        fetched_at REAL NOT NULL
+                    )
+                """)
+        except Exception as e:
+            print(f"⚠️ Entur: kunne ikke opprette entur_stops: {e}", flush=True)
+
+    def _lookup_cached(self, key: str):
+        """(funnet_i_cache, holdeplass). Utløpte rader regnes som ikke funnet."""
+        with self._lock:
+            if key in self._memo:
+                return True, self._memo[key]
+        try:
+            with get_db().cursor() as c:
+                c.execute("SELECT found, stop, fetched_at FROM entur_stops WHERE query = ?", (key,))
+                row = c.fetchone()
+        except Exception as e:
+            print(f"⚠️ Entur: kunne ikke lese holdeplass-cache: {e}", flush=True)
+            return False, None
+        if row is None:
+            return False, None
+        ttl = ENTUR_STOP_TTL_S if row['found'] else ENTUR_STOP_NEGATIVE_TTL_S
+        if time.time() - row['fetched_at'] > ttl:
+            return False, None
+        stop = json.loads(row['stop']) if row['found'] else None
+        with self._lock:
+            self._memo[key] = stop
+        return True, stop
+
+    def _store(self, key: str, stop: Optional[dict]):
+        with self._lock:
+            self._memo[key] = stop
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    INSERT OR REPLACE INTO entur_stops (query, found, stop, fetched_at)
+                    VALUES (?, ?, ?, ?)
+                """, (key, 1 if stop else 0, json.dumps(stop, ensure_ascii=False) if stop else None, time.time()))
+        except Exception as e:
+            print(f"⚠️ Entur: kunne ikke lagre holdeplass-cache: {e}", flush=True)
+
+    @staticmethod
+    def _query_geocoder(query: str) -> Optional[dict]:
+        """Søk via Entur geocoder. Kaster ved nettverksfeil."""
         params = {
             'text': query,
             'lang': 'no',
             'layers': 'venue',
             'size': 1,
         }
-        response = requests.get(ENTUR_GEOCODER_URL, params=params, headers=HEADERS, timeout=10)
+        response = get_http_client().get(ENTUR_GEOCODER_URL, params=params, headers=HEADERS, timeout=5)
         response.raise_for_status()
 
-        data = response.json()
-        features = data.get('features', [])
-
+        features = response.json().get('features', [])
         if not features:
             return None
 
@@ -60,9 +166,186 @@ def _find_stop(query: str) -> Optional[dict]:
             'locality': props.get('locality', ''),
             'label': props.get('label', ''),
         }
-    except Exception as e:
-        print(f"⚠️ Entur geocoder feil: {e}", flush=True)
-        return None
+
+    def resolve(self, query: str) -> Optional[dict]:
+        """
+        Finn holdeplass/stasjon: minne → SQLite → Entur geocoder.
+
+        Returns:
+            dict med 'id', 'name', 'locality', 'label' eller None
+        """
+        key = _stop_key(query)
+        if not key:
+            return None
+        cached, stop = self._lookup_cached(key)
+        if cached:
+            return stop
+        try:
+            stop = self._query_geocoder(query)
+        except Exception as e:
+            # Nettverksfeil huskes ikke - prøv igjen neste gang
+            print(f"⚠️ Entur geocoder feil: {e}", flush=True)
+            return None
+        self._store(key, stop)
+        return stop
+
+
+def get_stop_resolver() -> StopResolver:
+    """Hent singleton StopResolver-instansen."""
+    return StopResolver.get_instance()
+
+
+def _find_stop(query: str) -> Optional[dict]:
+    """
+    Søk etter holdeplass/stasjon (cachet, se StopResolver).
+
+    Returns:
+        dict med 'id', 'name', 'locality' eller None
+    """
+    return get_stop_resolver().resolve(query)
+
+
+def _fetch_calls(stop_ids: List[str], count: int, mode: Optional[str] = None, timeout=10) -> Dict[str, Optional[dict]]:
+    """
+    Hent avganger for én eller flere holdeplasser i én GraphQL-spørring.
+
+    Returns:
+        {stop_id: {'name', 'calls'} eller None hvis Entur ikke kjenner holdeplassen}
+    """
+    whitelist = f', whiteListedModes: [{mode}]' if mode else ""
+    parts = []
+    for i, stop_id in enumerate(stop_ids):
+        parts.append(f"""
+        s{i}: stopPlace(id: "{stop_id}") {{
+            name
+            estimatedCalls(timeRange: 7200, numberOfDepartures: {count}{whitelist}) {{{_CALL_FIELDS}
+            }}
+        }}""")
+    query = "{" + "".join(parts) + "\n    }"
+
+    response = get_http_client().post(
+        ENTUR_GRAPHQL_URL,
+        json={'query': query},
+        headers=HEADERS,
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+    data = response.json().get('data') or {}
+    result = {}
+    for i, stop_id in enumerate(stop_ids):
+        stop_data = data.get(f's{i}')
+        result[stop_id] = {'name': stop_data.get('name'), 'calls': stop_data.get('estimatedCalls', [])} \
+            if stop_data else None
+    return result
+
+
+class DepartureBoard:
+    """
+    Avgangstavle for favorittholdeplassene, oppdatert i bakgrunnen.
+    Singleton — bruk get_departure_board() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self, favorites: List[str] = None):
+        self.favorites = list(ENTUR_FAVORITE_STOPS if favorites is None else favorites)
+        self._lock = threading.Lock()
+        self._boards: Dict[str, Dict[str, Any]] = {}  # stop_id → {'calls', 'fetched_at'}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls) -> 'DepartureBoard':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def refresh(self) -> int:
+        """
+        Hent avganger for alle favorittene med én spørring.
+
+        Returns:
+            Antall holdeplasser som ble oppdatert
+        """
+        stop_ids = []
+        for name in self.favorites:
+            stop = _find_stop(name)
+            if stop and stop['id'] not in stop_ids:
+                stop_ids.append(stop['id'])
+        if not stop_ids:
+            return 0
+        boards = _fetch_calls(stop_ids, ENTUR_BOARD_DEPARTURES)
+        now = time.monotonic()
+        with self._lock:
+            for stop_id, board in boards.items():
+                if board is not None:
+                    self._boards[stop_id] = {'calls': board['calls'], 'fetched_at': now}
+        return sum(board is not None for board in boards.values())
+
+    def get(self, stop_id: str, count: int, mode: Optional[str] = None) -> Optional[List[dict]]:
+        """
+        Avganger fra tavla, eller None hvis holdeplassen ikke er varm (eller
+        tavla er for gammel / har for få avganger igjen etter filtrering).
+        """
+        with self._lock:
+            board = self._boards.get(stop_id)
+        if not board or time.monotonic() - board['fetched_at'] > ENTUR_BOARD_MAX_AGE_S:
+            return None
+        now = datetime.now().astimezone()
+        calls = []
+        for call in board['calls']:
+            try:
+                if datetime.fromisoformat(call.get('expectedDepartureTime', '')) < now:
+                    continue  # Allerede gått siden tavla ble hentet
+            except ValueError:
+                pass
+            if mode and call.get('serviceJourney', {}).get('line', {}).get('transportMode') != mode:
+                continue
+            calls.append(call)
+        if len(calls) < count and len(board['calls']) >= ENTUR_BOARD_DEPARTURES:
+            return None  # Tavla er kuttet - kan mangle avganger innen 2 timer
+        return calls[:count]
+
+    @staticmethod
+    def _active(hour: int) -> bool:
+        start, end = ENTUR_BOARD_ACTIVE_HOURS
+        return start <= hour < end
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self._active(datetime.now().hour):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️ Entur: oppdatering av favorittavganger feilet: {e}", flush=True)
+            self._stop.wait(ENTUR_BOARD_REFRESH_S)
+
+    def start(self) -> bool:
+        """Start bakgrunnsoppdatering. False hvis ingen favoritter er satt."""
+        if not self.favorites:
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="entur-board")
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+
+def get_departure_board() -> DepartureBoard:
+    """Hent singleton DepartureBoard-instansen."""
+    return DepartureBoard.get_instance()
+
+
+def start_departure_board() -> bool:
+    """Start favoritt-tavla (kalles fra chatgpt_voice.main). False hvis ingen favoritter."""
+    return get_departure_board().start()
 
 
 def _format_time(iso_time: str) -> str:
@@ -91,6 +374,39 @@ def _minutes_until(iso_time: str) -> str:
         return ""
 
 
+def _format_departures(stop_label: str, calls: List[dict]) -> str:
+    """Formater avganger for tale/tekst."""
+    results = [f"🚏 Avganger fra {stop_label}:\n"]
+
+    for call in calls:
+        departure = call.get('expectedDepartureTime', '')
+        aimed = call.get('aimedDepartureTime', '')
+        realtime = call.get('realtime', False)
+        destination = call.get('destinationDisplay', {}).get('frontText', '?')
+        line = call.get('serviceJourney', {}).get('line', {})
+        line_code = line.get('publicCode', '?')
+        mode = line.get('transportMode', 'bus')
+
+        time_str = _format_time(departure)
+        minutes = _minutes_until(departure)
+        mode_str = TRANSPORT_MODE_NO.get(mode, mode)
+
+        # Sjekk forsinkelse
+        delay_str = ""
+        if aimed and departure and aimed != departure:
+            aimed_time = _format_time(aimed)
+            delay_str = f" (planlagt {aimed_time})"
+
+        rt_str = "⏱️" if realtime else "📅"
+
+        results.append(
+            f"  {rt_str} {time_str} ({minutes}) — {mode_str} {line_code} → {destination}{delay_str}"
+        )
+
+    results.append(f"\n⏱️ = sanntid, 📅 = ruteplan")
+    return "\n".join(results)
+
+
 def get_departures(stop_name: str, count: int = 8, transport_mode: Optional[str] = None) -> str:
     """
     Hent neste avganger fra en holdeplass/stasjon.
@@ -111,93 +427,29 @@ def get_departures(stop_name: str, count: int = 8, transport_mode: Optional[str]
     stop_id = stop['id']
     stop_label = stop['label']
 
-    # Bygg GraphQL-query
     count = min(count, 20)
+    mode = MODE_MAP.get(transport_mode.lower(), transport_mode.lower()) if transport_mode else None
 
-    # Filtrer på transporttype hvis angitt
-    whitelist = ""
-    if transport_mode:
-        mode_map = {
-            'buss': 'bus', 'bus': 'bus',
-            'trikk': 'tram', 'tram': 'tram',
-            'tbane': 'metro', 't-bane': 'metro', 'metro': 'metro',
-            'tog': 'rail', 'rail': 'rail', 'jernbane': 'rail',
-            'båt': 'water', 'ferge': 'water', 'water': 'water',
-        }
-        resolved = mode_map.get(transport_mode.lower(), transport_mode.lower())
-        whitelist = f', whiteListedModes: [{resolved}]'
-
-    query = f"""{{
-        stopPlace(id: "{stop_id}") {{
-            name
-            estimatedCalls(timeRange: 7200, numberOfDepartures: {count}{whitelist}) {{
-                expectedDepartureTime
-                aimedDepartureTime
-                realtime
-                destinationDisplay {{
-                    frontText
-                }}
-                serviceJourney {{
-                    line {{
-                        publicCode
-                        transportMode
-                    }}
-                }}
-            }}
-        }}
-    }}"""
+    # Favorittholdeplass: svar fra tavla som holdes varm i bakgrunnen
+    calls = get_departure_board().get(stop_id, count, mode)
+    if calls is not None:
+        print(f"🚏 Avganger fra {stop_label} hentet fra favoritt-tavla", flush=True)
+        if not calls:
+            return f"Ingen avganger fra {stop_label} de neste 2 timene."
+        return _format_departures(stop_label, calls)
 
     try:
         print(f"🚌 Henter avganger fra {stop_label} ({stop_id})", flush=True)
-        response = requests.post(
-            ENTUR_GRAPHQL_URL,
-            json={'query': query},
-            headers=HEADERS,
-            timeout=10
-        )
-        response.raise_for_status()
-
-        data = response.json()
-        stop_data = data.get('data', {}).get('stopPlace')
+        stop_data = _fetch_calls([stop_id], count, mode)[stop_id]
 
         if not stop_data:
             return f"❌ Ingen data for holdeplass {stop_label}"
 
-        calls = stop_data.get('estimatedCalls', [])
+        calls = stop_data['calls']
         if not calls:
             return f"Ingen avganger fra {stop_label} de neste 2 timene."
 
-        # Formater resultat
-        results = [f"🚏 Avganger fra {stop_label}:\n"]
-
-        for call in calls:
-            departure = call.get('expectedDepartureTime', '')
-            aimed = call.get('aimedDepartureTime', '')
-            realtime = call.get('realtime', False)
-            destination = call.get('destinationDisplay', {}).get('frontText', '?')
-            line = call.get('serviceJourney', {}).get('line', {})
-            line_code = line.get('publicCode', '?')
-            mode = line.get('transportMode', 'bus')
-
-            time_str = _format_time(departure)
-            minutes = _minutes_until(departure)
-            mode_str = TRANSPORT_MODE_NO.get(mode, mode)
-
-            # Sjekk forsinkelse
-            delay_str = ""
-            if aimed and departure and aimed != departure:
-                aimed_time = _format_time(aimed)
-                delay_str = f" (planlagt {aimed_time})"
-
-            rt_str = "⏱️" if realtime else "📅"
-
-            results.append(
-                f"  {rt_str} {time_str} ({minutes}) — {mode_str} {line_code} → {destination}{delay_str}"
-            )
-
-        results.append(f"\n⏱️ = sanntid, 📅 = ruteplan")
-
-        formatted = "\n".join(results)
+        formatted = _format_departures(stop_label, calls)
         print(f"✅ Hentet {len(calls)} avganger fra {stop_label}", flush=True)
         return formatted
 
@@ -264,7 +516,7 @@ def plan_journey(from_place: str, to_place: str, count: int = 3) -> str:
 
     try:
         print(f"🗺️ Planlegger reise: {from_stop['label']} → {to_stop['label']}", flush=True)
-        response = requests.post(
+        response = get_http_client().post(
             ENTUR_GRAPHQL_URL,
             json={'query': query},
             headers=HEADERS,
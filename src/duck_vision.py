@@ -3,13 +3,13 @@ Duck Vision Module
 Handles MMS image analysis using GPT-4 Vision.
 """
 import os
-import requests
 import base64
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from openai import OpenAI
 from PIL import Image
 import io
+from src.duck_http import get_http_client
 
 
 class VisionConfig:
@@ -176,7 +176,7 @@ class VisionAnalyzer:
         
         try:
             # Download image
-            response = requests.get(image_url, timeout=30)
+            response = get_http_client().get(image_url, timeout=30)
             response.raise_for_status()
             
             # Check size
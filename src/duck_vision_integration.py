@@ -8,6 +8,7 @@ import json
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Callable
 
 logger = logging.getLogger(__name__)
@@ -27,6 +28,9 @@ class DuckVisionHandler:
     - Last Will and Testament (LWT) for pålitelig status-deteksjon
     - threading.Event for effektiv synkron venting (ingen busy-wait)
     - QoS 1 for kommandoer som må leveres
+    - Presence-modell: siste gjenkjente ansikt/stemme med confidence og alder,
+      slik at check_person() kan svare umiddelbart når tilstanden er fersk
+    - MQTT-callbacks kjøres i en worker-pool, ikke på paho sin nettverkstråd
     """
     
     # LWT topic - brokeren publiserer dette automatisk når klienten forsvinner
@@ -37,6 +41,15 @@ class DuckVisionHandler:
     RECONNECT_MIN_DELAY = 1    # sekunder
     RECONNECT_MAX_DELAY = 30   # sekunder
     
+    # Presence-modell: hvor gammel en observasjon kan være før den regnes som stale
+    FACE_PRESENCE_MAX_AGE = 5.0      # sekunder (ansikt-events kommer fortløpende)
+    SPEAKER_PRESENCE_MAX_AGE = 30.0  # sekunder (stemme gjenkjennes sjeldnere)
+    
+    # Worker-pool for MQTT-meldinger (trege handlers skal ikke blokkere intake).
+    # Hver topic får fast worker slik at rekkefølgen per topic bevares
+    # (f.eks. learning_progress-instruksjoner som leses opp etter tur).
+    MESSAGE_WORKERS = 4
+    
     def __init__(self, 
                  broker_host: str = "localhost",
                  broker_port: int = 1883,
@@ -106,11 +119,35 @@ class DuckVisionHandler:
         self.last_all_objects = []
         self.last_openai_analysis = None
         self.last_face_result = None
+        
+        # Presence-modell (oppdateres av alle face/speaker events, ikke bare svar på kommandoer)
+        # Hver observasjon: {"found": bool, "name": str|None, "confidence": float, "timestamp": float}
+        self._presence_lock = threading.Lock()
+        self._last_face_presence = None
+        self._last_speaker_presence = None
+        
+        # Worker-pool for meldingshåndtering (paho sin nettverkstråd gjør kun decode + submit)
+        self._workers = None
+    
+    def _start_workers(self):
+        """Opprett worker-pool (én single-thread executor per lane)"""
+        if self._workers is None:
+            self._workers = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"duck-vision-mqtt-{i}")
+                for i in range(self.MESSAGE_WORKERS)
+            ]
+    
+    def _stop_workers(self):
+        """Stopp worker-pool uten å vente på ventende meldinger"""
+        workers, self._workers = self._workers, None
+        for worker in workers or []:
+            worker.shutdown(wait=False, cancel_futures=True)
     
     def connect(self):
         """Koble til MQTT broker"""
         try:
             self._intentional_disconnect = False
+            self._start_workers()
             self.client.connect(self.broker_host, self.broker_port, keepalive=60)
             self.client.loop_start()
             logger.info(f"Koblet til MQTT broker på {self.broker_host}:{self.broker_port}")
@@ -135,6 +172,7 @@ class DuckVisionHandler:
         self.client.loop_stop()
         self.client.disconnect()
         self.connected = False
+        self._stop_workers()
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback når koblet til broker"""
@@ -164,34 +202,118 @@ class DuckVisionHandler:
             logger.info("MQTT frakoblet")
     
     def _on_message(self, client, userdata, msg):
-        """Callback når melding mottas"""
+        """Callback når melding mottas (paho nettverkstråd - kun decode og dispatch)"""
+        received_at = time.monotonic()
         try:
             topic = msg.topic
             payload = json.loads(msg.payload.decode())
-            
+        except json.JSONDecodeError as e:
+            logger.error(f"Ugyldig JSON fra {msg.topic}: {e}")
+            return
+        
+        workers = self._workers
+        if not workers:
+            logger.debug(f"Dropper MQTT-melding på {topic} - handler stoppet")
+            return
+        try:
+            lane = workers[hash(topic) % len(workers)]
+            lane.submit(self._dispatch_message, topic, payload, received_at)
+        except RuntimeError:
+            # Executor er stengt (disconnect pågår)
+            logger.debug(f"Dropper MQTT-melding på {topic} - handler stoppet")
+    
+    def _dispatch_message(self, topic: str, payload: dict, received_at: float):
+        """Håndter en MQTT-melding i worker-poolen"""
+        try:
             if topic == "duck/vision/status":
                 self._handle_publisher_status(payload)
             elif topic == "duck/vision/face":
-                self._handle_face_event(payload)
+                self._handle_face_event(payload, received_at)
             elif topic == "duck/vision/object":
                 self._handle_object_event(payload)
             elif topic in ("duck/vision/event", "duck/vision/events"):
-                self._handle_generic_event(payload)
+                self._handle_generic_event(payload, received_at)
             elif topic == "duck/audio/speaker":
-                self._handle_speaker_recognized(payload)
+                self._handle_speaker_recognized(payload, received_at)
             elif topic == "duck/audio/voice_learned":
                 self._handle_voice_learned(payload)
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"Ugyldig JSON fra {msg.topic}: {e}")
         except Exception as e:
-            logger.error(f"Feil ved håndtering av MQTT-melding på {msg.topic}: {e}")
+            logger.error(f"Feil ved håndtering av MQTT-melding på {topic}: {e}")
+    
+    # ── Presence-modell ─────────────────────────────────────────
     
-    def _handle_speaker_recognized(self, data: dict):
+    def _update_face_presence(self, found: bool, name: Optional[str], confidence: float, observed_at: float):
+        """Oppdater siste ansikts-observasjon (ignorer eldre events som kommer i feil rekkefølge)"""
+        with self._presence_lock:
+            current = self._last_face_presence
+            if current and current["timestamp"] > observed_at:
+                return
+            self._last_face_presence = {
+                "found": found,
+                "name": name,
+                "confidence": confidence,
+                "timestamp": observed_at,
+            }
+    
+    def _update_speaker_presence(self, name: Optional[str], confidence: float, observed_at: float):
+        """Oppdater siste stemmegjenkjenning"""
+        if not name:
+            return
+        with self._presence_lock:
+            current = self._last_speaker_presence
+            if current and current["timestamp"] > observed_at:
+                return
+            self._last_speaker_presence = {
+                "found": True,
+                "name": name,
+                "confidence": confidence,
+                "timestamp": observed_at,
+            }
+    
+    def get_presence(self) -> dict:
+        """
+        Snapshot av presence-modellen.
+        
+        Returns:
+            dict: {"face": {...}|None, "speaker": {...}|None} der hver observasjon
+                  har found, name, confidence og age (sekunder siden observasjon)
+        """
+        now = time.monotonic()
+        with self._presence_lock:
+            snapshot = {}
+            for key, observation in (("face", self._last_face_presence),
+                                     ("speaker", self._last_speaker_presence)):
+                if observation is None:
+                    snapshot[key] = None
+                else:
+                    snapshot[key] = {
+                        "found": observation["found"],
+                        "name": observation["name"],
+                        "confidence": observation["confidence"],
+                        "age": now - observation["timestamp"],
+                    }
+            return snapshot
+    
+    def get_recent_speaker(self, max_age: Optional[float] = None):
+        """
+        Siste gjenkjente stemme hvis den er fersk nok.
+        
+        Returns:
+            tuple: (name, confidence) eller (None, 0.0) hvis stale/ukjent
+        """
+        if max_age is None:
+            max_age = self.SPEAKER_PRESENCE_MAX_AGE
+        speaker = self.get_presence()["speaker"]
+        if speaker and speaker["age"] <= max_age:
+            return (speaker["name"], speaker["confidence"])
+        return (None, 0.0)
+    
+    def _handle_speaker_recognized(self, data: dict, received_at: Optional[float] = None):
         """Håndter stemmegjenkjenning fra Duck-Vision"""
         name = data.get("name")
         confidence = data.get("confidence", 0.0)
         duration = data.get("speech_duration", 0.0)
+        self._update_speaker_presence(name, confidence, received_at or time.monotonic())
         logger.info(f"🔊 Stemme gjenkjent: {name} ({confidence:.2%}, {duration:.1f}s tale)")
         if self.on_speaker_recognized:
             self.on_speaker_recognized(name, confidence)
@@ -218,12 +340,19 @@ class DuckVisionHandler:
         elif not self.publisher_online and was_online:
             logger.info("Duck-Vision publisher er offline (Pi 5 kamera ikke tilgjengelig)")
     
-    def _handle_face_event(self, data: dict):
-        """Håndter ansiktsdeteksjon (legacy - ikke brukt med on-demand)"""
+    def _handle_face_event(self, data: dict, received_at: Optional[float] = None):
+        """Håndter ansiktsdeteksjon fra kontinuerlig strøm (mater presence-modellen)"""
         person_name = data.get("person_name")
         is_known = data.get("is_known", False)
         confidence = data.get("confidence", 0.0)
         
+        self._update_face_presence(
+            bool(is_known and person_name),
+            person_name if is_known else None,
+            confidence if is_known else 0.0,
+            received_at or time.monotonic()
+        )
+        
         if is_known and self.on_face_detected:
             self.on_face_detected(person_name, confidence)
         elif not is_known and self.on_unknown_face:
@@ -241,9 +370,10 @@ class DuckVisionHandler:
         if self.on_object_detected:
             self.on_object_detected(self.last_object_seen, self.last_object_confidence)
     
-    def _handle_generic_event(self, data: dict):
+    def _handle_generic_event(self, data: dict, received_at: Optional[float] = None):
         """Håndter generiske events"""
         event_type = data.get("type") or data.get("event")
+        observed_at = received_at or time.monotonic()
         
         if event_type == "person_learned":
             event_data = data.get("data", {})
@@ -267,6 +397,7 @@ class DuckVisionHandler:
         
         elif event_type == "unknown_person":
             self.last_face_result = (False, None, 0.0)
+            self._update_face_presence(False, None, 0.0, observed_at)
             self._face_event.set()
             if self.on_unknown_face:
                 self.on_unknown_face()
@@ -277,6 +408,7 @@ class DuckVisionHandler:
             name = event_data.get("name")
             confidence = event_data.get("confidence", 0.0)
             self.last_face_result = (True, name, confidence)
+            self._update_face_presence(True, name, confidence, observed_at)
             self._face_event.set()
             if self.on_face_detected:
                 self.on_face_detected(name, confidence)
@@ -299,11 +431,13 @@ class DuckVisionHandler:
                 name = event_data.get("name")
                 confidence = event_data.get("confidence", 0.0)
                 self.last_face_result = (True, name, confidence)
+                self._update_face_presence(True, name, confidence, observed_at)
                 logger.info(f"check_person: Gjenkjente {name} ({confidence:.2%})")
             else:
                 reason = event_data.get("reason", "unknown")
                 logger.debug(f"Ingen person funnet: {reason}")
                 self.last_face_result = (False, None, 0.0)
+                self._update_face_presence(False, None, 0.0, observed_at)
                 if reason == "no_person_detected" and self.on_unknown_face:
                     self.on_unknown_face()
             self._face_event.set()
@@ -414,13 +548,25 @@ class DuckVisionHandler:
         self.last_openai_analysis = None
         return result or "Tomt svar fra OpenAI Vision"
     
-    def check_person(self, timeout: float = 5.0):
+    def check_person(self, timeout: float = 5.0, max_age: Optional[float] = None):
         """
-        Be Duck-Vision om å sjekke hvem som er foran kameraet (synkron).
+        Hvem er foran kameraet? Svarer umiddelbart fra presence-modellen når
+        siste ansikts-observasjon er fersk, ellers sendes en aktiv forespørsel (synkron).
+        
+        Args:
+            timeout: Maks ventetid for aktiv forespørsel (sekunder)
+            max_age: Maks alder på cachet observasjon (default FACE_PRESENCE_MAX_AGE, 0 = alltid spør)
         
         Returns:
             tuple: (found: bool, name: Optional[str], confidence: float)
         """
+        if max_age is None:
+            max_age = self.FACE_PRESENCE_MAX_AGE
+        face = self.get_presence()["face"]
+        if face and face["age"] <= max_age:
+            logger.debug(f"check_person fra presence-cache ({face['age']:.1f}s gammel): {face['name']}")
+            return (face["found"], face["name"], face["confidence"])
+        
         self.last_face_result = None
         self._face_event.clear()
         
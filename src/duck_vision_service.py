@@ -201,18 +201,32 @@ class DuckVisionService:
         self.vision_handler.learn_person(name, num_samples)
         logger.info(f"Requested Duck-Vision to learn: {name} ({num_samples} samples)")
     
-    def check_person(self, timeout: float = 3.0):
+    def check_person(self, timeout: float = 3.0, max_age: Optional[float] = None):
         """
-        Check who is in front of the camera (synkron).
+        Check who is in front of the camera.
+        Answers instantly from the cached presence state when it is fresh,
+        falls back to an active (synkron) request when it is stale.
         Returns tuple: (found, name, confidence)
         """
         if not self.is_connected():
             logger.warning("Duck-Vision not connected, cannot check person")
             return (False, None, 0.0)
-        result = self.vision_handler.check_person(timeout=timeout)
+        result = self.vision_handler.check_person(timeout=timeout, max_age=max_age)
         logger.info(f"check_person result: {result}")
         return result
     
+    def get_presence(self) -> dict:
+        """Snapshot of the presence model (last face and speaker with confidence and age)"""
+        if not self.vision_handler:
+            return {"face": None, "speaker": None}
+        return self.vision_handler.get_presence()
+    
+    def get_recent_speaker(self, max_age: Optional[float] = None):
+        """Last recognized speaker if fresh. Returns tuple: (name, confidence)"""
+        if not self.vision_handler:
+            return (None, 0.0)
+        return self.vision_handler.get_recent_speaker(max_age=max_age)
+    
     def forget_person(self, name: str):
         """Tell Duck-Vision to forget a person"""
         if not self.is_connected():
@@ -6,38 +6,135 @@ Handles web search via Brave Search API and fetches article content
 import os
 import requests
 import re
+import threading
+import time
 import trafilatura
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List
+from urllib.parse import urlparse
+from urllib3.exceptions import ReadTimeoutError
 from dotenv import load_dotenv
+from src.duck_http import get_http_client
 
 load_dotenv()
 
 BRAVE_API_KEY = os.getenv('BRAVE_SEARCH_API_KEY')
 BRAVE_SEARCH_URL = 'https://api.search.brave.com/res/v1/web/search'
 
-# Domener som er trege, blokkerer bots, eller krever JavaScript for innhold
-SLOW_DOMAINS = {
-    'olympics.com',
-    'theathletic.com',
-    'nytimes.com',
-    'wsj.com',
-    'bloomberg.com',
-    'paywallsite.com',
+# Innholdshenting for de øverste treffene
+ARTICLE_FETCH_COUNT = 2  # Antall treff vi prøver å hente fulltekst for
+ARTICLE_FETCH_DEADLINE_S = 3.0  # Felles frist for alle hentinger - resten faller tilbake til beskrivelsen
+ARTICLE_READ_TIMEOUT_S = 8.0  # Hentinger som bommer på fristen fullføres i bakgrunnen (fyller cachen)
+ARTICLE_CACHE_TTL_S = 6 * 3600
+ARTICLE_CACHE_FAILED_TTL_S = 10 * 60  # Sider uten uttrekkbart innhold prøves ikke igjen med en gang
+ARTICLE_CACHE_MAX_ENTRIES = 64
+ARTICLE_MAX_BYTES = 2 * 1024 * 1024  # Større sider lastes ikke ned (som MAX_FILE_SIZE i trafilatura.fetch_url)
+
+# Trege domener læres fra målt hentetid (EWMA) i stedet for en fast liste
+SLOW_DOMAIN_MS = ARTICLE_FETCH_DEADLINE_S * 1000 * 0.8
+SLOW_DOMAIN_MIN_SAMPLES = 2
+SLOW_DOMAIN_RETRY_S = 24 * 3600  # Et tregt domene prøves igjen etter et døgn
+
+_FETCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux aarch64) ChatGPTDuck/2.1.2',
+    'Accept': 'text/html,application/xhtml+xml',
 }
 
+_fetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="article-fetch")
+_article_cache: 'OrderedDict[str, tuple]' = OrderedDict()  # url → (tekst eller None, utløper)
+_domain_latency: Dict[str, Dict[str, float]] = {}  # domene → {'ewma_ms', 'samples', 'updated'}
+_state_lock = threading.Lock()
+
+
+def _domain(url: str) -> str:
+    domain = urlparse(url).netloc.lower()
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+def _record_fetch_latency(url: str, duration_ms: float):
+    """Oppdater glidende snitt av hentetid for domenet."""
+    domain = _domain(url)
+    with _state_lock:
+        stats = _domain_latency.get(domain)
+        if stats is None:
+            stats = _domain_latency[domain] = {'ewma_ms': duration_ms, 'samples': 0, 'updated': 0.0}
+        else:
+            stats['ewma_ms'] = 0.7 * stats['ewma_ms'] + 0.3 * duration_ms
+        stats['samples'] += 1
+        stats['updated'] = time.time()
+        slow = stats['samples'] >= SLOW_DOMAIN_MIN_SAMPLES and stats['ewma_ms'] > SLOW_DOMAIN_MS
+    if slow:
+        print(f"🐢 {domain} er tregt ({stats['ewma_ms']:.0f}ms snitt) - bruker beskrivelsen fremover", flush=True)
+
 
 def _is_slow_domain(url: str) -> bool:
-    """Sjekk om en URL er fra et kjent tregt/blokkert domene"""
+    """Sjekk om domenet har vist seg tregt/blokkert (målt, utløper etter SLOW_DOMAIN_RETRY_S)"""
     try:
-        from urllib.parse import urlparse
-        domain = urlparse(url).netloc.lower()
-        return any(blocked in domain for blocked in SLOW_DOMAINS)
+        domain = _domain(url)
     except Exception:
         return False
+    with _state_lock:
+        stats = _domain_latency.get(domain)
+        if stats is None or stats['samples'] < SLOW_DOMAIN_MIN_SAMPLES:
+            return False
+        if time.time() - stats['updated'] > SLOW_DOMAIN_RETRY_S:
+            return False  # Gi domenet en ny sjanse
+        return stats['ewma_ms'] > SLOW_DOMAIN_MS
+
+
+def _cached_article(url: str):
+    """(funnet, tekst) fra URL-cachen."""
+    with _state_lock:
+        entry = _article_cache.get(url)
+        if entry is None:
+            return False, None
+        text, expires = entry
+        if time.time() > expires:
+            del _article_cache[url]
+            return False, None
+        _article_cache.move_to_end(url)
+        return True, text
+
+
+def _cache_article(url: str, text):
+    ttl = ARTICLE_CACHE_TTL_S if text else ARTICLE_CACHE_FAILED_TTL_S
+    with _state_lock:
+        _article_cache[url] = (text, time.time() + ttl)
+        _article_cache.move_to_end(url)
+        while len(_article_cache) > ARTICLE_CACHE_MAX_ENTRIES:
+            _article_cache.popitem(last=False)
+
+
+def _download(url: str) -> bytes:
+    """Last ned en side (maks ARTICLE_MAX_BYTES). Kaster ved HTTP-feil og for store sider."""
+    response = get_http_client().get(url, headers=_FETCH_HEADERS, retries=0, stream=True,
+                                     timeout=(3.05, ARTICLE_READ_TIMEOUT_S))
+    try:
+        response.raise_for_status()
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > ARTICLE_MAX_BYTES:
+            raise ValueError(f"siden er for stor ({int(length) // 1024} KB)")
+        chunks, size = [], 0
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > ARTICLE_MAX_BYTES:
+                    raise ValueError(f"siden er større enn {ARTICLE_MAX_BYTES // 1024} KB")
+                chunks.append(chunk)
+        except requests.ConnectionError as e:
+            # requests melder read timeout under lesing av body som ConnectionError
+            if e.args and isinstance(e.args[0], ReadTimeoutError):
+                raise requests.ReadTimeout(e) from e
+            raise
+        return b''.join(chunks)
+    finally:
+        response.close()
 
 
 def _fetch_article_content(url: str, max_length: int = 3000) -> str:
     """
-    Henter hovedinnholdet fra en nettside via trafilatura.
+    Henter hovedinnholdet fra en nettside via trafilatura (cachet per URL).
     
     Args:
         url: URL til siden
@@ -46,14 +143,20 @@ def _fetch_article_content(url: str, max_length: int = 3000) -> str:
     Returns:
         Hovedteksten fra siden, eller None hvis feil
     """
+    found, text = _cached_article(url)
+    if found:
+        return text[:max_length] if text else None
+    
+    start = time.monotonic()
+    text = None
     try:
-        downloaded = trafilatura.fetch_url(url)
-        if not downloaded:
-            return None
+        html = _download(url)
         
-        # Ekstraher innhold med tabeller inkludert
+        # Ekstraher innhold med tabeller inkludert. Bytes, ikke response.text:
+        # uten charset i Content-Type dekoder requests som ISO-8859-1 ("rÃ¸dÃ¸l"),
+        # mens trafilatura finner kodingen fra <meta charset> på siden
         text = trafilatura.extract(
-            downloaded,
+            html,
             include_tables=True,
             include_links=False,
             include_images=False,
@@ -61,16 +164,44 @@ def _fetch_article_content(url: str, max_length: int = 3000) -> str:
             favor_recall=True,  # Hent mer innhold fremfor presisjon
         )
         
-        if not text:
-            return None
-        
-        # Rens og begrens
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text[:max_length] if text else None
+        # Rens
+        if text:
+            text = re.sub(r'\s+', ' ', text).strip() or None
         
     except Exception as e:
         print(f"⚠️ Kunne ikke hente innhold fra {url}: {e}", flush=True)
+        if isinstance(e, requests.Timeout):
+            # Bare timeout teller som tregt - en rask 403/404 sier ingenting om hentetiden
+            _record_fetch_latency(url, max((time.monotonic() - start) * 1000, ARTICLE_READ_TIMEOUT_S * 1000))
+        _cache_article(url, None)
         return None
+    
+    _record_fetch_latency(url, (time.monotonic() - start) * 1000)
+    _cache_article(url, text)
+    return text[:max_length] if text else None
+
+
+def _fetch_articles(urls: List[str]) -> Dict[str, str]:
+    """
+    Hent innhold for flere URL-er parallelt med felles frist.
+    
+    Returns:
+        url → tekst for hentinger som ble ferdige i tide (og ga innhold).
+        Resten fullføres i bakgrunnen og havner i cachen til neste gang.
+    """
+    futures = {_fetch_pool.submit(_fetch_article_content, url): url for url in urls}
+    if not futures:
+        return {}
+    done, not_done = wait(futures, timeout=ARTICLE_FETCH_DEADLINE_S)
+    if not_done:
+        late = ', '.join(_domain(futures[f]) for f in not_done)
+        print(f"⏱️ Innholdshenting bommet på fristen ({ARTICLE_FETCH_DEADLINE_S}s): {late}", flush=True)
+    contents = {}
+    for future in done:
+        text = future.result()
+        if text:
+            contents[futures[future]] = text
+    return contents
 
 
 def web_search(query: str, count: int = 5) -> str:
@@ -101,7 +232,7 @@ def web_search(query: str, count: int = 5) -> str:
         }
         
         print(f"🔍 Søker på nettet: '{query}'", flush=True)
-        response = requests.get(BRAVE_SEARCH_URL, headers=headers, params=params, timeout=10)
+        response = get_http_client().get(BRAVE_SEARCH_URL, headers=headers, params=params, timeout=10)
         response.raise_for_status()
         
         data = response.json()
@@ -114,6 +245,9 @@ def web_search(query: str, count: int = 5) -> str:
             web_results = data['web']['results'][:count]
             if web_results:
                 results.append("🌐 Søkeresultater:")
+                # Hent innhold for de øverste treffene parallelt (hopp over trege domener)
+                fetch_urls = [r.get('url', '') for r in web_results[:ARTICLE_FETCH_COUNT]]
+                contents = _fetch_articles([u for u in fetch_urls if u and not _is_slow_domain(u)])
                 for i, result in enumerate(web_results, 1):
                     title = result.get('title', 'Ingen tittel')
                     description = result.get('description', 'Ingen beskrivelse')
@@ -122,19 +256,13 @@ def web_search(query: str, count: int = 5) -> str:
                     
                     results.append(f"\n{i}. {title}")
                     
-                    # Prøv å hente faktisk innhold fra siden (kun første 2 resultater, hopp over trege domener)
-                    if i <= 2 and not _is_slow_domain(url):
-                        content = _fetch_article_content(url)
-                        if content:
-                            results.append(f"   Innhold: {content}")
-                        else:
-                            results.append(f"   Beskrivelse: {description}")
+                    # Faktisk innhold fra siden hvis det ble hentet i tide, ellers beskrivelsen
+                    if url in contents:
+                        results.append(f"   Innhold: {contents[url]}")
                     else:
-                        if _is_slow_domain(url) and i <= 2:
-                            results.append(f"   Beskrivelse: {description}")
+                        results.append(f"   Beskrivelse: {description}")
+                        if i <= ARTICLE_FETCH_COUNT and _is_slow_domain(url):
                             results.append(f"   (Hopper over innholdshenting - tregt nettsted)")
-                        else:
-                            results.append(f"   Beskrivelse: {description}")
                     
                     if age:
                         results.append(f"   Publisert: {age}")
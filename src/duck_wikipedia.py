@@ -2,10 +2,27 @@
 Duck Wikipedia Module
 Slår opp artikler fra Wikipedia (norsk og engelsk).
 Gratis, ingen API-nøkkel nødvendig.
+
+- Ett oppslag per språk er én rundtur: REST-sammendraget for tittelen og et
+  samlet søk+utdrag (generator=search) kjøres samtidig
+- Norsk og engelsk slås opp samtidig; engelsk brukes hvis det valgte
+  språket ikke har noen artikkel
+- Treff (og "fant ingen") huskes per språk og normalisert søk i minnet (LRU)
+  og i SQLite (wiki_cache), så "hvem er X" og "fortell mer om X" ikke går
+  til Wikipedia igjen
 """
 
-import requests
-from typing import Optional
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from src.duck_config import WIKI_CACHE_TTL_S, WIKI_CACHE_NEGATIVE_TTL_S, WIKI_CACHE_MAX_ENTRIES
+from src.duck_database import get_db
+from src.duck_deadline import deadline_at, remaining
+from src.duck_http import get_http_client
 
 
 HEADERS = {
@@ -19,6 +36,16 @@ WIKI_LANGUAGES = {
     'en': {'name': 'English', 'emoji': '🇬🇧'},
 }
 
+# Spørreord som ikke endrer hvilken artikkel det er snakk om
+_QUERY_PREFIXES = (
+    'hvem er', 'hvem var', 'hva er', 'hva var', 'fortell mer om', 'fortell meg om', 'fortell om', 'mer om',
+    'who is', 'who was', 'what is', 'what was', 'tell me more about', 'tell me about', 'more about',
+)
+
+# Egne pooler for språk og søk, så et språkoppslag aldri venter på en plass i sin egen pool
+_language_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="wiki-lang")
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="wiki-search")
+
 
 def _wiki_api_url(language: str = 'no') -> str:
     """Returnerer MediaWiki API URL for valgt språk"""
@@ -30,6 +57,104 @@ def _wiki_rest_url(language: str = 'no') -> str:
     return f'https://{language}.wikipedia.org/api/rest_v1'
 
 
+def normalize_query(query: str) -> str:
+    """Nøkkel for et søk: små bokstaver, uten tegnsetting og spørreord ("Hvem er Roald Amundsen?")."""
+    text = ' '.join(re.findall(r'\w+', (query or '').lower()))
+    for prefix in _QUERY_PREFIXES:
+        if text.startswith(prefix + ' '):
+            return text[len(prefix) + 1:]
+    return text
+
+
+class WikiCache:
+    """
+    Artikkelsammendrag per (språk, normalisert søk), i minnet og i SQLite.
+    Singleton — bruk get_wiki_cache() for å hente instansen.
+    """
+    _instance = None
+    _create_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memo: 'OrderedDict[str, Tuple[Optional[dict], float]]' = OrderedDict()  # nøkkel → (sammendrag, utløper)
+        self._init_database()
+
+    @classmethod
+    def get_instance(cls) -> 'WikiCache':
+        if cls._instance is None:
+            with cls._create_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _init_database(self):
+        try:
+            with get_db().cursor() as c:
+                c.execute("""
+                    CREATE TABLE IF NOT EXISTS wiki_cache (
+                        key TEXT PRIMARY KEY,
+                        found INTEGER NOT NULL,
+                        summary TEXT,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                c.execute("DELETE FROM wiki_cache WHERE expires_at < ?", (time.time(),))
+        except Exception as e:
+            print(f"⚠️ Wikipedia-cache: kunne ikke opprette wiki_cache: {e}", flush=True)
+
+    def _remember(self, key: str, summary: Optional[dict], expires_at: float):
+        with self._lock:
+            self._memo[key] = (summary, expires_at)
+            self._memo.move_to_end(key)
+            while len(self._memo) > WIKI_CACHE_MAX_ENTRIES:
+                self._memo.popitem(last=False)
+
+    def get(self, language: str, query: str) -> Tuple[bool, Optional[dict]]:
+        """(funnet_i_cache, sammendrag). Sammendraget er None for husket "fant ingen"."""
+        key = f"{language}:{normalize_query(query)}"
+        with self._lock:
+            hit = self._memo.get(key)
+            if hit is not None and time.time() < hit[1]:
+                self._memo.move_to_end(key)
+                return True, hit[0]
+        try:
+            with get_db().cursor() as c:
+                c.execute("SELECT found, summary, expires_at FROM wiki_cache WHERE key = ?", (key,))
+                row = c.fetchone()
+        except Exception as e:
+            print(f"⚠️ Wikipedia-cache: kunne ikke lese: {e}", flush=True)
+            return False, None
+        if row is None or time.time() >= row['expires_at']:
+            return False, None
+        summary = json.loads(row['summary']) if row['found'] else None
+        self._remember(key, summary, row['expires_at'])
+        return True, summary
+
+    def put(self, language: str, query: str, summary: Optional[dict]):
+        """Husk et treff (også under artikkeltittelen) eller "fant ingen"."""
+        expires_at = time.time() + (WIKI_CACHE_TTL_S if summary else WIKI_CACHE_NEGATIVE_TTL_S)
+        keys = {f"{language}:{normalize_query(query)}"}
+        if summary:
+            keys.add(f"{language}:{normalize_query(summary['title'])}")
+        for key in keys:
+            self._remember(key, summary, expires_at)
+        try:
+            with get_db().cursor() as c:
+                for key in keys:
+                    c.execute("""
+                        INSERT OR REPLACE INTO wiki_cache (key, found, summary, expires_at)
+                        VALUES (?, ?, ?, ?)
+                    """, (key, 1 if summary else 0,
+                          json.dumps(summary, ensure_ascii=False) if summary else None, expires_at))
+        except Exception as e:
+            print(f"⚠️ Wikipedia-cache: kunne ikke lagre: {e}", flush=True)
+
+
+def get_wiki_cache() -> WikiCache:
+    """Hent singleton WikiCache-instansen."""
+    return WikiCache.get_instance()
+
+
 def wikipedia_lookup(query: str, sentences: int = 5, language: str = 'no') -> str:
     """
     Slå opp et tema på Wikipedia.
@@ -51,18 +176,13 @@ def wikipedia_lookup(query: str, sentences: int = 5, language: str = 'no') -> st
     try:
         print(f"📚 Wikipedia-oppslag ({lang_info['name']}): '{query}'", flush=True)
 
-        # Først: prøv direkte oppslag via REST API (raskest)
-        summary = _get_page_summary(query, language)
-
-        if not summary:
-            # Fallback: søk etter artikkel
-            title = _search_article(query, language)
-            if title:
-                summary = _get_page_summary(title, language)
+        summary, found_language = _lookup_with_fallback(query, language)
 
         if not summary:
             return f"Fant ingen Wikipedia-artikkel om '{query}' ({lang_info['name']}). Prøv et annet søkeord eller språk."
 
+        lang_info = WIKI_LANGUAGES[found_language]
+
         # Bygg resultat
         title = summary.get('title', query)
         extract = summary.get('extract', '')
@@ -82,7 +202,7 @@ def wikipedia_lookup(query: str, sentences: int = 5, language: str = 'no') -> st
         results.append(extract)
 
         # Legg til URL
-        page_url = summary.get('content_urls', {}).get('desktop', {}).get('page', '')
+        page_url = summary.get('url', '')
         if page_url:
             results.append(f"\n🔗 {page_url}")
 
@@ -95,58 +215,138 @@ def wikipedia_lookup(query: str, sentences: int = 5, language: str = 'no') -> st
         return f"❌ Kunne ikke slå opp på Wikipedia: {str(e)}"
 
 
-def _get_page_summary(title: str, language: str = 'no') -> Optional[dict]:
-    """Hent artikkelsammendrag via REST API"""
+def _lookup_with_fallback(query: str, language: str) -> Tuple[Optional[dict], str]:
+    """
+    Slå opp i valgt språk, med det andre språket som reserve. Språk som ikke
+    ligger i cachen slås opp samtidig.
+
+    Returns:
+        (sammendrag eller None, språket det ble funnet på)
+    """
+    cache = get_wiki_cache()
+    languages = [language] + [lang for lang in WIKI_LANGUAGES if lang != language]
+    results: Dict[str, Optional[dict]] = {}
+    missing = []
+    for lang in languages:
+        cached, summary = cache.get(lang, query)
+        if cached:
+            results[lang] = summary
+        else:
+            missing.append(lang)
+
+    # Trengs ikke reserven, hent bare valgt språk
+    if language in results and results[language]:
+        missing = []
+    elif language not in missing:
+        missing = missing[:1]
+
+    if missing:
+        left = remaining()
+        deadline = time.monotonic() + left if left is not None else None
+        futures = {lang: _language_pool.submit(_call_with_deadline, deadline, _lookup_language, query, lang, deadline)
+                   for lang in missing}
+        errors = []
+        for lang, future in futures.items():
+            try:
+                results[lang] = future.result()
+                cache.put(lang, query, results[lang])
+            except Exception as e:
+                # Nettverksfeil huskes ikke - prøv igjen neste gang
+                print(f"⚠️ Wikipedia ({lang}) feilet: {e}", flush=True)
+                errors.append(e)
+        if errors and not any(results.get(lang) for lang in languages):
+            raise errors[0]
+
+    for lang in languages:
+        if results.get(lang):
+            return results[lang], lang
+    return None, language
+
+
+def _call_with_deadline(deadline: Optional[float], fn, *args):
+    if deadline is None:
+        return fn(*args)
+    with deadline_at(deadline):  # Turens frist gjelder også i pool-trådene
+        return fn(*args)
+
+
+def _lookup_language(query: str, language: str, deadline: Optional[float]) -> Optional[dict]:
+    """Ett språk: REST-sammendrag og søk+utdrag samtidig, sammendraget foretrekkes."""
+    search = _search_pool.submit(_call_with_deadline, deadline, _search_with_extract, query, language)
     try:
-        # URL-encode title med underscore i stedet for mellomrom
-        encoded_title = title.strip().replace(' ', '_')
-        url = f"{_wiki_rest_url(language)}/page/summary/{encoded_title}"
+        summary = _fetch_summary(query, language)
+    except Exception:
+        summary = None
+        if search.exception() is not None:
+            raise
+    return summary or search.result()
 
-        response = requests.get(url, headers=HEADERS, timeout=10)
 
-        if response.status_code == 404:
-            return None
+def _fetch_summary(title: str, language: str = 'no') -> Optional[dict]:
+    """Artikkelsammendrag via REST API for en eksakt tittel. Kaster ved nettverksfeil."""
+    # URL-encode title med underscore i stedet for mellomrom
+    encoded_title = title.strip().replace(' ', '_')
+    url = f"{_wiki_rest_url(language)}/page/summary/{encoded_title}"
 
-        response.raise_for_status()
-        data = response.json()
+    response = get_http_client().get(url, headers=HEADERS, timeout=10)
 
-        # Sjekk at vi fikk en ekte artikkel (ikke disambiguation etc.)
-        if data.get('type') == 'disambiguation':
-            # Prøv å hente første alternativ
-            return None
+    if response.status_code == 404:
+        return None
 
-        if data.get('extract'):
-            return data
+    response.raise_for_status()
+    data = response.json()
 
+    # Sjekk at vi fikk en ekte artikkel (ikke disambiguation etc.)
+    if data.get('type') == 'disambiguation' or not data.get('extract'):
         return None
 
-    except Exception:
+    return {
+        'title': data.get('title', title),
+        'extract': data.get('extract', ''),
+        'description': data.get('description', ''),
+        'url': data.get('content_urls', {}).get('desktop', {}).get('page', ''),
+    }
+
+
+def _search_with_extract(query: str, language: str = 'no') -> Optional[dict]:
+    """Søk og hent utdrag for beste treff i samme kall (generator=search). Kaster ved nettverksfeil."""
+    params = {
+        'action': 'query',
+        'generator': 'search',
+        'gsrsearch': query,
+        'gsrlimit': 1,
+        'prop': 'extracts|description|info|pageprops',
+        'exintro': 1,
+        'explaintext': 1,
+        'inprop': 'url',
+        'ppprop': 'disambiguation',
+        'redirects': 1,
+        'format': 'json',
+        'formatversion': 2,
+    }
+
+    response = get_http_client().get(_wiki_api_url(language), params=params, headers=HEADERS, timeout=10)
+    response.raise_for_status()
+
+    pages = response.json().get('query', {}).get('pages', [])
+    if not pages:
+        return None
+    page = pages[0]
+    if 'disambiguation' in page.get('pageprops', {}) or not page.get('extract'):
         return None
 
+    return {
+        'title': page.get('title', query),
+        'extract': page.get('extract', ''),
+        'description': page.get('description', ''),
+        'url': page.get('fullurl', ''),
+    }
 
-def _search_article(query: str, language: str = 'no') -> Optional[str]:
-    """Søk etter artikkel og returner beste treff"""
-    try:
-        params = {
-            'action': 'query',
-            'list': 'search',
-            'srsearch': query,
-            'srlimit': 3,
-            'srprop': 'snippet',
-            'format': 'json',
-        }
-
-        response = requests.get(_wiki_api_url(language), params=params, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()
-        results = data.get('query', {}).get('search', [])
-
-        if results:
-            return results[0].get('title')
-
-        return None
 
+def _get_page_summary(title: str, language: str = 'no') -> Optional[dict]:
+    """Hent artikkelsammendrag via REST API (None ved feil eller ingen artikkel)"""
+    try:
+        return _fetch_summary(title, language)
     except Exception:
         return None
 
@@ -171,7 +371,7 @@ def wikipedia_random() -> str:
             'format': 'json',
         }
 
-        response = requests.get(_wiki_api_url('no'), params=params, headers=HEADERS, timeout=10)
+        response = get_http_client().get(_wiki_api_url('no'), params=params, headers=HEADERS, timeout=10)
         response.raise_for_status()
 
         data = response.json()
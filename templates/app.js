@@ -1510,6 +1510,20 @@ async function pollDashboard() {
                 memoryEl.innerHTML = `<span style="color: ${color};">${availableGB}GB / ${totalGB}GB</span>`;
             }
         }
+        
+        // SMS-kø (worker-pool for innkommende SMS/MMS)
+        const smsQueueEl = document.getElementById('sms-queue-status');
+        if (smsQueueEl && data.sms_queue && data.sms_queue.status === 'success') {
+            const q = data.sms_queue;
+            let color = '#4caf50';
+            if (q.queued > 0) color = '#ff9800';
+            if (q.full) color = '#f44336';
+            smsQueueEl.innerHTML = `<span style="color: ${color};">⚙️ Behandler ${q.busy}/${q.workers}, ` +
+                `${q.queued} i kø (maks ${q.max_queued}, topp ${q.max_depth})</span>` +
+                ` · ${q.processed} behandlet` + (q.failed ? `, ${q.failed} feilet` : '') +
+                ` · ventetid snitt ${q.wait_s_avg}s / maks ${q.wait_s_max}s` +
+                (q.backpressure_waits ? ` · backpressure ${q.backpressure_waits}× (${q.backpressure_s}s)` : '');
+        }
     } catch (error) {
         console.error('Poll feil:', error);
     }
@@ -1684,6 +1698,16 @@ async function loadPrinterStatus() {
             return;
         }
         
+        if (data.status === 'starting') {
+            // Oppstarten kjører i bakgrunnen - fortsett å polle til den svarer
+            errorEl.style.display = 'block';
+            statusEl.style.display = 'none';
+            offMsgEl.style.display = 'none';
+            document.getElementById('printer-error-text').textContent = data.message || 'Printeren starter opp...';
+            startPrinterPolling();
+            return;
+        }
+
         if (data.status === 'off') {
             statusEl.style.display = 'none';
             errorEl.style.display = 'none';
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Ytelsestest av relayens varige kø (sms-relay/message_store.py).
+
+Måler direkte mot MessageStore (uten HTTP):
+- enqueue fra mange samtidige tråder, med gruppe-commit (én transaksjon per
+  batch) mot én transaksjon per melding
+- duplikater (Twilio-retries med samme MessageSid) som ignoreres
+- lease + ack gjennom et stort etterslep fordelt på mange postkasser, og at
+  lease-tiden holder seg flat når tabellen vokser (indeksert dequeue)
+
+Sjekker også semantikken: levering på nytt etter visibility timeout, at
+ack-ede meldinger ikke kommer tilbake, og at køen overlever en omstart.
+
+Kjør: python3 tests/bench_relay_queue.py [--messages 20000] [--producers 16]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "sms-relay"))
+
+from message_store import MessageStore  # noqa: E402
+
+MAILBOXES = 500
+
+
+def _store(batch_size, **kwargs):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    return MessageStore(path, batch_size=batch_size, max_pending=10 ** 9, **kwargs), path
+
+
+def bench_enqueue(messages, producers, batch_size):
+    store, _path = _store(batch_size)
+    per_producer = messages // producers
+
+    def produce(worker):
+        for i in range(per_producer):
+            store.enqueue(f"sms:+47{(worker * per_producer + i) % MAILBOXES:08d}", f"SM{worker}-{i}",
+                          {'from': '+4712345678', 'message': f"melding {i}"})
+
+    threads = [threading.Thread(target=produce, args=(w,)) for w in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = per_producer * producers
+    batches = store.stats['batches']
+    print(f"  batch_size={batch_size:<4d} {total / elapsed:9.0f} meldinger/s  "
+          f"({batches} transaksjoner, snitt {total / max(batches, 1):.1f} per commit)", flush=True)
+    return store, total / elapsed
+
+
+def bench_duplicates(store, count, producers, per_producer):
+    """Send meldinger fra enqueue-testen på nytt (samme postkasse og MessageSid)."""
+    items = []
+    for n in range(count):
+        worker, i = n % producers, n // producers
+        items.append((f"sms:+47{(worker * per_producer + i) % MAILBOXES:08d}", f"SM{worker}-{i}", {'message': 'retry'}))
+    start = time.perf_counter()
+    inserted = store.enqueue_many(items)
+    elapsed = time.perf_counter() - start
+    print(f"  {count} Twilio-retries: {sum(inserted)} lagret på nytt, {count / elapsed:.0f} avvist/s", flush=True)
+    return sum(inserted)
+
+
+def bench_drain(store):
+    """Lease + ack alt, postkasse for postkasse, og mål lease-tiden."""
+    latencies = []
+    delivered = 0
+    start = time.perf_counter()
+    for m in range(MAILBOXES):
+        mailbox = f"sms:+47{m:08d}"
+        while True:
+            t0 = time.perf_counter()
+            found = store.lease([mailbox], limit=100)
+            latencies.append(time.perf_counter() - t0)
+            messages = found.get(mailbox, [])
+            if not messages:
+                break
+            store.ack(mailbox, [msg['id'] for msg in messages])
+            delivered += len(messages)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"  lease+ack: {delivered / elapsed:.0f} meldinger/s  lease p50 {statistics.median(latencies) * 1000:.2f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms", flush=True)
+    return delivered
+
+
+def lease_latency(rows):
+    """Lease-tid for én melding når tabellen har `rows` ventende meldinger."""
+    store, _path = _store(500)
+    store.enqueue_many([(f"sms:+47{i % MAILBOXES:08d}", f"SM{i}", {'message': 'x'}) for i in range(rows)])
+    samples = []
+    for m in range(MAILBOXES):
+        t0 = time.perf_counter()
+        found = store.lease([f"sms:+47{m:08d}", f"duck:and-{m}"], limit=1)
+        samples.append(time.perf_counter() - t0)
+        assert found, "postkassen skal ha meldinger"
+    return statistics.median(samples)
+
+
+def check_semantics():
+    ok = True
+    store, path = _store(500, visibility_timeout=0.3)
+    store.enqueue('sms:+4711111111', 'SM-A', {'message': 'a'})
+    store.enqueue('sms:+4711111111', 'SM-B', {'message': 'b'})
+
+    first = store.lease(['sms:+4711111111'])['sms:+4711111111']
+    hidden = store.lease(['sms:+4711111111'])
+    store.ack('sms:+4711111111', ['SM-A'])
+    time.sleep(0.35)
+    again = store.lease(['sms:+4711111111']).get('sms:+4711111111', [])
+    if [m['id'] for m in first] != ['SM-A', 'SM-B'] or hidden:
+        print("❌ Lease skal gi eldste først og skjule leasede meldinger")
+        ok = False
+    if [m['id'] for m in again] != ['SM-B']:
+        print(f"❌ Bare ikke-ack-et melding skal leveres på nytt, fikk {[m['id'] for m in again]}")
+        ok = False
+    if store.enqueue('sms:+4711111111', 'SM-A', {'message': 'a'}):
+        print("❌ Ack-et MessageSid skal fortsatt avvises som duplikat")
+        ok = False
+
+    # Omstart: ny instans på samme fil ser meldingen som ikke er ack-et
+    time.sleep(0.35)
+    restarted = MessageStore(path, visibility_timeout=0.3)
+    survived = restarted.lease(['sms:+4711111111']).get('sms:+4711111111', [])
+    if [m['id'] for m in survived] != ['SM-B']:
+        print(f"❌ Ikke-ack-et melding skal overleve omstart, fikk {[m['id'] for m in survived]}")
+        ok = False
+    print("  Semantikk: " + ("✅ redelivery, ack, duplikater og omstart OK" if ok else "❌ feil"), flush=True)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--producers', type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"📦 Enqueue: {args.messages} meldinger fra {args.producers} tråder til {MAILBOXES} postkasser", flush=True)
+    _single, single_rate = bench_enqueue(args.messages // 4, args.producers, batch_size=1)
+    store, batched_rate = bench_enqueue(args.messages, args.producers, batch_size=500)
+    print(f"  Gruppe-commit: {batched_rate / single_rate:.1f}x raskere enn én commit per melding", flush=True)
+
+    print("♻️ Duplikater:", flush=True)
+    reinserted = bench_duplicates(store, min(args.messages, 5000), args.producers, args.messages // args.producers)
+
+    print("📬 Dequeue:", flush=True)
+    delivered = bench_drain(store)
+
+    print("📈 Lease-tid mot tabellstørrelse (indeksert dequeue):", flush=True)
+    small, large = lease_latency(1000), lease_latency(100000)
+    print(f"  1 000 ventende: {small * 1000:.3f} ms   100 000 ventende: {large * 1000:.3f} ms", flush=True)
+
+    print("🔍 Semantikk:", flush=True)
+    ok = check_semantics()
+
+    expected = (args.messages // args.producers) * args.producers
+    if delivered != expected:
+        print(f"❌ Levert {delivered} av {expected}")
+        ok = False
+    if reinserted:
+        print(f"❌ {reinserted} duplikater ble lagret")
+        ok = False
+    if large > small * 5 + 0.001:
+        print("❌ Lease-tiden vokser med tabellen - indeksen brukes ikke")
+        ok = False
+    print("✅ Ferdig" if ok else "❌ Ytelsestesten feilet")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Ytelsestest (baseline) for SMS-relayen: hvor mange ender og meldinger per
+sekund klarer sms-relay/app.py, og hvor lang er leveringstiden?
+
+Starter relayen lokalt i en egen prosess (gunicorn som i produksjon, eller
+Flask-serveren i app.py) med tom kø, og simulerer:
+- N ender som registrerer seg og henter meldinger slik chatgpt_voice.py gjør
+  (long-poll /inbox + /ack, eller /poll hvert 10. sekund, eller /stream)
+- en falsk Twilio som sender webhooks med Poisson-fordelte ankomster,
+  en andel MMS og retries med samme MessageSid (som ekte Twilio ved timeout)
+- duck-til-duck-meldinger mellom tilfeldige ender
+
+For hver meldingsrate rapporteres gjennomstrømning, leveringstid ende til
+ende (p50/p95/p99/maks, målt fra planlagt sendetid), feilrate per endepunkt,
+tapte og dupliserte meldinger, og minnebruk (RSS for relayprosessene og
+størrelsen på køfila). Høyeste rate som holder p99 under --slo uten feil
+eller tap er kapasiteten.
+
+Resultatet kan lagres som JSON (--json) og sammenlignes med en tidligere
+kjøring (--baseline), så endringer i relayen kan måles mot samme tall.
+
+Kjør: python3 tests/bench_sms_relay.py [--ducks 100] [--rates 10,50,100]
+        [--duration 20] [--mode inbox|poll|stream] [--server gunicorn|flask]
+        [--json resultat.json] [--baseline forrige.json]
+      (krever flask og requests; gunicorn for --server gunicorn)
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+RELAY_DIR = Path(__file__).parent.parent / "sms-relay"
+POLL_INTERVAL = 10.0  # SMS_RELAY_LEGACY_POLL_S
+LONG_POLL_WAIT = 55.0  # SMS_RELAY_LONG_POLL_S
+LATE_SEND_S = 0.5  # Sendinger som starter så mye etter planen, telles som forsinket
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class RelayProcess:
+    """Relayen i en egen prosess med egen databasefil, så minnet kan måles."""
+
+    def __init__(self, server, workers, threads):
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, 'relay_queue.db')
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        if server == 'gunicorn':
+            cmd = [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}",
+                   '--worker-class', 'gthread', '--workers', str(workers), '--threads', str(threads),
+                   '--timeout', '120', '--log-level', 'warning', 'app:app']
+        else:
+            cmd = [sys.executable, 'app.py']  # Flask-serveren (trådet), lytter på PORT
+        env = dict(os.environ, RELAY_DB_PATH=self.db_path, PORT=str(port))
+        self.log_path = os.path.join(self.workdir, 'relay.log')
+        with open(self.log_path, 'w') as log:
+            self.process = subprocess.Popen(cmd, cwd=RELAY_DIR, env=env,
+                                            stdout=subprocess.DEVNULL, stderr=log)
+
+        deadline = time.time() + 30
+        while True:
+            try:
+                requests.get(f"{self.url}/health", timeout=2).raise_for_status()
+                return
+            except requests.RequestException:
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"Relayen startet ikke:\n{Path(self.log_path).read_text()[-2000:]}")
+                time.sleep(0.1)
+
+    def _pids(self):
+        """Relayprosessen og alle etterkommere (gunicorn-workere)."""
+        pids, todo = [], [self.process.pid]
+        while todo:
+            pid = todo.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as f:
+                        todo.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def rss_mb(self):
+        """Samlet RSS i MB (Linux /proc), eller None."""
+        total_kb = 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total_kb += int(line.split()[1])
+            except OSError:
+                continue
+        return total_kb / 1024 if total_kb else None
+
+    def db_mb(self):
+        """Køfila med WAL i MB."""
+        return sum(os.path.getsize(self.db_path + suffix) for suffix in ('', '-wal', '-shm')
+                   if os.path.exists(self.db_path + suffix)) / (1024 * 1024)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Metrics:
+    """Forespørsler, feil og leveringstid per melding (trådsikkert)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.closed = False  # Etter målingen: feil fra avbrutte long-polls telles ikke
+        self.sent = {}  # id -> planlagt sendetid
+        self.latencies = {}  # id -> sekunder fra planlagt sending til anda hadde meldingen
+        self.duplicates = 0
+        self.late_sends = 0
+        self.last_delivery = None
+        self.requests = Counter()
+        self.errors = Counter()
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """Kjør en HTTP-forespørsel og tell den. Returnerer responsen, eller None ved feil."""
+        try:
+            response = func(*args, **kwargs)
+        except requests.RequestException:
+            response = None
+        failed = response is None or response.status_code >= 400
+        self.count(endpoint, failed)
+        return None if failed else response
+
+    def count(self, endpoint, failed=False):
+        with self.lock:
+            if not self.closed:
+                self.requests[endpoint] += 1
+                if failed:
+                    self.errors[endpoint] += 1
+
+    def mark_sent(self, message_id, scheduled_at):
+        with self.lock:
+            self.sent.setdefault(message_id, scheduled_at)  # Twilio-retry beholder første tidspunkt
+            if time.time() - scheduled_at > LATE_SEND_S:
+                self.late_sends += 1
+
+    def mark_received(self, message_id):
+        now = time.time()
+        with self.lock:
+            if message_id in self.latencies:
+                self.duplicates += 1
+            elif message_id in self.sent:
+                self.latencies[message_id] = now - self.sent[message_id]
+                self.last_delivery = now
+
+
+class SimulatedDuck(threading.Thread):
+    """En and som henter meldinger slik chatgpt_voice.py gjør."""
+
+    def __init__(self, relay_url, index, mode, metrics, stop_event):
+        super().__init__(daemon=True)
+        self.url = relay_url
+        self.number = f"+4795{index:06d}"
+        self.quoted = requests.utils.quote(self.number, safe='')
+        self.duck_name = f"bench-duck-{index}"
+        self.mode = mode
+        self.metrics = metrics
+        self.stop_event = stop_event
+        self.session = requests.Session()
+
+    def register(self):
+        return self.metrics.call('register', self.session.post, f"{self.url}/register", json={
+            'twilio_number': self.number, 'name': self.duck_name, 'ip': '127.0.0.1'
+        }, timeout=10) is not None
+
+    def _ack(self, sms_ids, duck_ids):
+        if sms_ids or duck_ids:
+            self.metrics.call('ack', self.session.post, f"{self.url}/ack/{self.quoted}", json={
+                'messages': sms_ids, 'duck': self.duck_name, 'duck_messages': duck_ids
+            }, timeout=10)
+
+    def run(self):
+        fetch = {'inbox': self._inbox, 'poll': self._poll, 'stream': self._stream}[self.mode]
+        while not self.stop_event.is_set():
+            fetch()
+
+    def _inbox(self):
+        response = self.metrics.call('inbox', self.session.get, f"{self.url}/inbox/{self.quoted}",
+                                     params={'duck': self.duck_name, 'wait': LONG_POLL_WAIT},
+                                     timeout=LONG_POLL_WAIT + 10)
+        if response is None:
+            self.stop_event.wait(1)
+            return
+        data = response.json()
+        for message in data['messages'] + data['duck_messages']:
+            self.metrics.mark_received(message['id'])
+        self._ack([m['id'] for m in data['messages']], [m['id'] for m in data['duck_messages']])
+
+    def _poll(self):
+        for endpoint, url in (('poll', f"{self.url}/poll/{self.quoted}"),
+                              ('duck/poll', f"{self.url}/duck/poll/{self.duck_name}")):
+            response = self.metrics.call(endpoint, self.session.get, url, timeout=10)
+            if response is not None:
+                for message in response.json()['messages']:
+                    self.metrics.mark_received(message['id'])
+        self.stop_event.wait(POLL_INTERVAL)
+
+    def _stream(self):
+        response = self.metrics.call('stream', self.session.get, f"{self.url}/stream/{self.quoted}",
+                                     params={'duck': self.duck_name}, stream=True, timeout=LONG_POLL_WAIT + 10)
+        if response is None:
+            self.stop_event.wait(1)
+            return
+        with response:
+            event = None
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if self.stop_event.is_set():
+                        return
+                    if line.startswith('event: '):
+                        event = line[len('event: '):]
+                    elif line.startswith('data: '):
+                        message_id = json.loads(line[len('data: '):])['id']
+                        self.metrics.mark_received(message_id)
+                        self._ack([message_id] if event == 'sms' else [],
+                                  [message_id] if event == 'duck' else [])
+            except requests.RequestException:
+                self.metrics.count('stream', failed=True)  # Brutt strøm
+
+
+class FakeTwilio:
+    """Falsk Twilio: webhooks med samme felter som ekte Twilio, og retries på samme MessageSid."""
+
+    ACCOUNT_SID = 'AC' + '0' * 32
+
+    def __init__(self, relay_url, metrics):
+        self.url = relay_url
+        self.metrics = metrics
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def deliver(self, duck, scheduled_at, mms=False, retry=False):
+        sid = ('MM' if mms else 'SM') + uuid.uuid4().hex
+        form = {
+            'AccountSid': self.ACCOUNT_SID,
+            'MessageSid': sid,
+            'SmsSid': sid,
+            'From': f"+479{random.randrange(10 ** 7):07d}",
+            'To': duck.number,
+            'Body': 'Hei anda! Dette er en melding fra ytelsestesten.',
+            'NumMedia': '1' if mms else '0',
+            'NumSegments': '1',
+            'ApiVersion': '2010-04-01',
+        }
+        if mms:
+            form['MediaUrl0'] = (f"https://api.twilio.com/2010-04-01/Accounts/{self.ACCOUNT_SID}"
+                                 f"/Messages/{sid}/Media/ME{uuid.uuid4().hex}")
+            form['MediaContentType0'] = 'image/jpeg'
+        self.metrics.mark_sent(sid, scheduled_at)
+        url = f"{self.url}/webhook/sms/{duck.quoted}"
+        self.metrics.call('webhook', self._session().post, url, data=form, timeout=15)
+        if retry:
+            # Twilio sender webhooken på nytt når svaret uteblir - relayen skal ignorere den
+            self.metrics.call('webhook', self._session().post, url, data=form, timeout=15)
+
+
+def send_duck_message(metrics, relay_url, from_duck, to_duck, scheduled_at):
+    message_id = f"duck_{uuid.uuid4().hex}"
+    metrics.mark_sent(message_id, scheduled_at)
+    metrics.call('duck/send', requests.post, f"{relay_url}/duck/send", json={
+        'from_duck': from_duck.duck_name, 'to_duck': to_duck.duck_name,
+        'message': 'Kvakk fra ytelsestesten', 'id': message_id
+    }, timeout=15)
+
+
+def generate_load(args, relay, ducks, twilio, metrics, rate, rng):
+    """Poisson-fordelte meldinger i args.duration sekunder."""
+    with ThreadPoolExecutor(args.senders, thread_name_prefix="bench-sender") as executor:
+        scheduled_at = time.time()
+        end = scheduled_at + args.duration
+        while True:
+            scheduled_at += rng.expovariate(rate)
+            if scheduled_at >= end:
+                break
+            delay = scheduled_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            target = rng.choice(ducks)
+            if rng.random() < args.duck_share:
+                executor.submit(send_duck_message, metrics, relay.url, rng.choice(ducks), target, scheduled_at)
+            else:
+                executor.submit(twilio.deliver, target, scheduled_at,
+                                mms=rng.random() < args.mms_share, retry=rng.random() < args.retry_share)
+
+
+def run_step(args, rate):
+    """Én måling med fersk relay: registrering, last med gitt rate, uttømming."""
+    rng = random.Random(args.seed + int(rate * 1000))
+    relay = RelayProcess(args.server, args.workers, args.threads or args.ducks + 32)
+    metrics = Metrics()
+    stop_event = threading.Event()
+    rss_samples = []
+    try:
+        ducks = [SimulatedDuck(relay.url, i, args.mode, metrics, stop_event) for i in range(args.ducks)]
+        registered = sum(duck.register() for duck in ducks)
+        rss_start = relay.rss_mb()
+        for duck in ducks:
+            duck.start()
+        time.sleep(1)  # Alle ender venter før lasten starter
+
+        def sample_memory():
+            while not stop_event.wait(1):
+                rss_samples.append(relay.rss_mb())
+
+        threading.Thread(target=sample_memory, daemon=True).start()
+        started = time.time()
+        generate_load(args, relay, ducks, FakeTwilio(relay.url, metrics), metrics, rate, rng)
+
+        # Uttømming: vanlig polling trenger et helt poll-intervall
+        drain_until = time.time() + (POLL_INTERVAL if args.mode == 'poll' else 0) + args.drain
+        while time.time() < drain_until and len(metrics.latencies) < len(metrics.sent):
+            time.sleep(0.05)
+        elapsed = time.time() - started
+        rss_end = relay.rss_mb()
+        db_mb = relay.db_mb()
+    finally:
+        with metrics.lock:
+            metrics.closed = True
+        stop_event.set()
+        relay.stop()
+
+    with metrics.lock:
+        latencies = sorted(metrics.latencies.values())
+        sent, delivered = len(metrics.sent), len(latencies)
+        requests_total = sum(metrics.requests.values())
+        errors_total = sum(metrics.errors.values())
+        delivery_span = (metrics.last_delivery - started) if metrics.last_delivery else elapsed
+        result = {
+            'rate': rate,
+            'ducks': args.ducks,
+            'registered': registered,
+            'sent': sent,
+            'delivered': delivered,
+            'lost': sent - delivered,
+            'duplicates': metrics.duplicates,
+            'late_sends': metrics.late_sends,
+            'delivered_per_s': delivered / max(delivery_span, 1e-9),
+            'requests_per_s': requests_total / elapsed,
+            'latency_ms': {name: percentile(latencies, p) * 1000
+                           for name, p in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+            'requests': dict(metrics.requests),
+            'errors': dict(metrics.errors),
+            'error_rate': errors_total / max(requests_total, 1),
+        }
+    samples = [mb for mb in [rss_start, *rss_samples, rss_end] if mb is not None]
+    result['rss_mb'] = {
+        'start': rss_start,
+        'peak': max(samples) if samples else None,
+        'end': rss_end,
+        'growth': (rss_end - rss_start) if rss_start is not None and rss_end is not None else None,
+    }
+    result['db_mb'] = db_mb
+    return result
+
+
+def meets_slo(result, slo_s):
+    return (result['lost'] == 0 and result['duplicates'] == 0 and result['error_rate'] < 0.01
+            and result['latency_ms']['p99'] < slo_s * 1000 and result['late_sends'] <= 0.01 * result['sent'])
+
+
+def print_step(result, slo_s):
+    latency, rss = result['latency_ms'], result['rss_mb']
+    memory = (f"RSS {rss['start']:.0f}→{rss['end']:.0f} MB (topp {rss['peak']:.0f}, {rss['growth']:+.1f})"
+              if rss['growth'] is not None else "RSS n/a")
+    errors = ", ".join(f"{endpoint} {n}" for endpoint, n in sorted(result['errors'].items())) or "ingen"
+    print(f"  {result['rate']:6g}/s  levert {result['delivered']}/{result['sent']} "
+          f"({result['delivered_per_s']:.0f}/s, {result['requests_per_s']:.0f} req/s)  "
+          f"p50 {latency['p50']:.0f} ms  p95 {latency['p95']:.0f} ms  p99 {latency['p99']:.0f} ms  "
+          f"maks {latency['max']:.0f} ms", flush=True)
+    print(f"          feil {result['error_rate']:.2%} ({errors})  tapt {result['lost']}  "
+          f"duplikater {result['duplicates']}  {memory}  kø {result['db_mb']:.1f} MB  "
+          f"{'✅' if meets_slo(result, slo_s) else '❌'}", flush=True)
+    if result['late_sends'] > 0.01 * result['sent']:
+        print(f"          ⚠️ {result['late_sends']} sendinger startet for sent - alle sendere ventet på "
+              f"relayen (øk --senders) eller klienten mangler CPU", flush=True)
+
+
+def compare_with_baseline(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {step['rate']: step for step in json.load(f)['steps']}
+    print(f"\n📊 Mot baseline ({baseline_path}):", flush=True)
+    for result in results:
+        before = baseline.get(result['rate'])
+        if before is None:
+            continue
+
+        def delta(new, old):
+            return f"{(new - old) / old:+.0%}" if old else "n/a"
+
+        print(f"  {result['rate']:6g}/s  p99 {before['latency_ms']['p99']:.0f} → {result['latency_ms']['p99']:.0f} ms "
+              f"({delta(result['latency_ms']['p99'], before['latency_ms']['p99'])})  "
+              f"levert/s {before['delivered_per_s']:.0f} → {result['delivered_per_s']:.0f} "
+              f"({delta(result['delivered_per_s'], before['delivered_per_s'])})  "
+              f"feil {before['error_rate']:.2%} → {result['error_rate']:.2%}", flush=True)
+
+
+def main():
+    has_gunicorn = importlib.util.find_spec('gunicorn') is not None
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--ducks', type=int, default=100)
+    parser.add_argument('--rates', default='10,50,100', help='Meldinger per sekund, kommaseparert')
+    parser.add_argument('--duration', type=float, default=20, help='Sekunder med last per rate')
+    parser.add_argument('--drain', type=float, default=10, help='Sekunder å vente på siste leveranser')
+    parser.add_argument('--mode', choices=('inbox', 'poll', 'stream'), default='inbox')
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn' if has_gunicorn else 'flask')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn-workere')
+    parser.add_argument('--threads', type=int, default=0, help='Tråder per worker (standard: ender + 32)')
+    parser.add_argument('--senders', type=int, default=16, help='Samtidige sendere i lastgeneratoren')
+    parser.add_argument('--duck-share', type=float, default=0.3, help='Andel duck-til-duck-meldinger')
+    parser.add_argument('--mms-share', type=float, default=0.1, help='Andel MMS blant webhooks')
+    parser.add_argument('--retry-share', type=float, default=0.02, help='Andel webhooks Twilio sender to ganger')
+    parser.add_argument('--slo', type=float, default=1.0, help='Krav til p99 leveringstid i sekunder')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Lagre resultatet som JSON')
+    parser.add_argument('--baseline', help='Sammenlign med et tidligere JSON-resultat')
+    args = parser.parse_args()
+    rates = [float(rate) for rate in args.rates.split(',')]
+
+    print(f"🦆 Relay-benchmark: {args.ducks} ender ({args.mode}), {args.server}"
+          f"{f' ({args.workers} worker(e))' if args.server == 'gunicorn' else ''}, "
+          f"{args.duration:g}s per rate, {args.duck_share:.0%} duck-til-duck, {args.mms_share:.0%} MMS, "
+          f"{args.retry_share:.0%} Twilio-retries", flush=True)
+    results = []
+    for rate in rates:
+        result = run_step(args, rate)
+        results.append(result)
+        print_step(result, args.slo)
+
+    passing = [result['rate'] for result in results if meets_slo(result, args.slo)]
+    capacity = max(passing) if passing else None
+    print(f"\n🎯 Kapasitet: {f'{capacity:g} meldinger/s' if capacity else 'ingen rate'} "
+          f"med p99 under {args.slo:g}s uten feil eller tap ({args.ducks} ender)", flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'steps': results, 'capacity': capacity}, f, indent=2)
+        print(f"💾 Lagret {args.json}", flush=True)
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+    return 0 if capacity == max(rates) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Test HomeAssistantMirror mot en lokal fake Home Assistant WebSocket-server.
+
+Serveren snakker nok av HA sin WebSocket-protokoll (auth, get_states,
+subscribe_events, call_service, ping) til å teste speilet uten ekte HA:
+- snapshot + state_changed holder speilet oppdatert
+- call_service går over socketen og gir state_changed tilbake
+- feil fra HA og ukjent token håndteres
+- speilet kobler til på nytt når serveren kaster ut klienten
+
+Kjør: python3 tests/test_ha_mirror.py  (krever websocket-client)
+"""
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.duck_ha_mirror import HomeAssistantMirror
+
+TOKEN = "test-token"
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeHomeAssistant(socketserver.ThreadingTCPServer):
+    """Minimal HA WebSocket-server (kun tekst-rammer, ingen fragmentering)."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _FakeHAHandler)
+        self.states = {
+            "sensor.m365_teams_status": {"entity_id": "sensor.m365_teams_status", "state": "Available", "attributes": {}},
+            "light.stue": {"entity_id": "light.stue", "state": "off", "attributes": {}},
+            "automation.ignored": {"entity_id": "automation.ignored", "state": "on", "attributes": {}},
+        }
+        self.clients = []
+        self.service_calls = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def set_state(self, entity_id, state, attributes=None):
+        new_state = {"entity_id": entity_id, "state": state, "attributes": attributes or {}}
+        with self.lock:
+            self.states[entity_id] = new_state
+            clients = list(self.clients)
+        for client in clients:
+            client.push_event(entity_id, new_state)
+
+    def drop_clients(self):
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for client in clients:
+            client.request.shutdown(socket.SHUT_RDWR)
+
+
+class _FakeHAHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        self.send_lock = threading.Lock()
+        self.subscription = None
+        if not self._handshake():
+            return
+        self.send({"type": "auth_required", "ha_version": "2025.1.0"})
+        auth = self.recv()
+        if not auth or auth.get("access_token") != TOKEN:
+            self.send({"type": "auth_invalid", "message": "Invalid access token"})
+            return
+        self.send({"type": "auth_ok", "ha_version": "2025.1.0"})
+        with self.server.lock:
+            self.server.clients.append(self)
+        while True:
+            msg = self.recv()
+            if msg is None:
+                return
+            self.dispatch(msg)
+
+    def dispatch(self, msg):
+        kind, msg_id = msg.get("type"), msg.get("id")
+        if kind == "ping":
+            self.send({"id": msg_id, "type": "pong"})
+        elif kind == "subscribe_events":
+            self.subscription = msg_id
+            self.send({"id": msg_id, "type": "result", "success": True, "result": None})
+        elif kind == "get_states":
+            with self.server.lock:
+                states = list(self.server.states.values())
+            self.send({"id": msg_id, "type": "result", "success": True, "result": states})
+        elif kind == "call_service":
+            self.server.service_calls.append(msg)
+            if msg["domain"] == "fail":
+                self.send({"id": msg_id, "type": "result", "success": False,
+                           "error": {"code": "not_found", "message": "Service not found."}})
+                return
+            self.send({"id": msg_id, "type": "result", "success": True, "result": {"context": {}}})
+            entity_id = msg.get("target", {}).get("entity_id")
+            if entity_id and msg["service"] in ("turn_on", "turn_off"):
+                self.server.set_state(entity_id, msg["service"][len("turn_"):])
+
+    def push_event(self, entity_id, new_state):
+        if self.subscription is not None:
+            self.send({"id": self.subscription, "type": "event", "event": {
+                "event_type": "state_changed",
+                "data": {"entity_id": entity_id, "new_state": new_state}}})
+
+    # ── WebSocket-rammer ─────────────────────────────────────
+
+    def _handshake(self):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                return False
+            data += chunk
+        lines = data.decode().split("\r\n")
+        if not lines[0].startswith("GET /api/websocket "):
+            self.request.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            return False
+        headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+        key = {k.lower(): v for k, v in headers.items()}["sec-websocket-key"]
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        self.request.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    def _read_exact(self, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = self.request.recv(n - len(buf))
+            if not chunk:
+                return None
+            buf += chunk
+        return buf
+
+    def recv(self):
+        try:
+            header = self._read_exact(2)
+            if header is None:
+                return None
+            opcode, length = header[0] & 0x0F, header[1] & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", self._read_exact(8))[0]
+            mask = self._read_exact(4) if header[1] & 0x80 else b"\0\0\0\0"
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._read_exact(length) or b""))
+        except OSError:
+            return None
+        if opcode == 0x8:  # close
+            return None
+        if opcode != 0x1:  # ping/pong på protokollnivå ignoreres
+            return self.recv()
+        return json.loads(payload.decode())
+
+    def send(self, msg):
+        payload = json.dumps(msg).encode()
+        if len(payload) < 126:
+            header = struct.pack(">BB", 0x81, len(payload))
+        elif len(payload) < 65536:
+            header = struct.pack(">BBH", 0x81, 126, len(payload))
+        else:
+            header = struct.pack(">BBQ", 0x81, 127, len(payload))
+        try:
+            with self.send_lock:
+                self.request.sendall(header + payload)
+        except OSError:
+            pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def main():
+    server = FakeHomeAssistant()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    failures = 0
+
+    def check(name, ok):
+        nonlocal failures
+        print(f"{'✅' if ok else '❌'} {name}", flush=True)
+        failures += 0 if ok else 1
+
+    # Lokal URL peker på en port ingen lytter på → speilet må falle tilbake til "cloud"
+    mirror = HomeAssistantMirror("http://127.0.0.1:9", server.url, TOKEN)
+    check("speilet starter", mirror.start())
+    check("tilkoblet innen 5 s", mirror.wait_connected(5))
+    check("tilkoblet via cloud-fallback", mirror.endpoint == "cloud")
+
+    start = time.perf_counter()
+    state = mirror.get_state("sensor.m365_teams_status")
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    check(f"snapshot lest fra minnet ({elapsed_us:.0f} µs)", state and state["state"] == "Available")
+    check("domener utenfor HA_MIRROR_DOMAINS speiles ikke", mirror.get_state("automation.ignored") is None)
+
+    server.set_state("sensor.m365_teams_status", "Busy")
+    check("state_changed oppdaterer speilet",
+          wait_for(lambda: mirror.get_state("sensor.m365_teams_status")["state"] == "Busy"))
+
+    result = mirror.call_service("light", "turn_on", "light.stue", {"brightness_pct": 40})
+    check("call_service over socketen", result and result.get("success"))
+    check("service_data og target sendt",
+          server.service_calls[-1]["service_data"] == {"brightness_pct": 40}
+          and server.service_calls[-1]["target"] == {"entity_id": "light.stue"})
+    check("state_changed etter service-kall", wait_for(lambda: mirror.get_state("light.stue")["state"] == "on"))
+
+    result = mirror.call_service("fail", "whatever")
+    check("feil fra HA returneres", result and not result["success"] and result["error"]["code"] == "not_found")
+
+    server.drop_clients()
+    check("frakobling oppdages", wait_for(lambda: not mirror.is_connected()))
+    check("get_state gir None mens frakoblet (REST-fallback)", mirror.get_state("light.stue") is None)
+    server.set_state("light.stue", "off")  # Endring mens speilet er frakoblet
+    check("kobler til på nytt", mirror.wait_connected(10))
+    check("nytt snapshot etter reconnect", wait_for(lambda: mirror.get_state("light.stue")["state"] == "off"))
+    check("to tilkoblinger telt", mirror.stats()["connects"] == 2)
+    mirror.stop()
+
+    bad = HomeAssistantMirror(server.url, "", "feil-token")
+    bad.start()
+    check("ugyldig token gir ingen tilkobling", not bad.wait_connected(1))
+    bad.stop()
+
+    server.shutdown()
+    print(f"\n{'🎉 Alle tester OK' if failures == 0 else f'❌ {failures} test(er) feilet'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
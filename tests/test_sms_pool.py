@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test SMSWorkerPool (src/duck_sms_pool.py) med simulerte SMS/MMS-jobber.
+
+Jobbene sover i stedet for å kalle VisionAnalyzer og OpenAI, så testen
+sjekker selve køen:
+- en treg MMS holder ikke igjen tekstmeldinger fra andre avsendere
+- en gruppemelding (mange avsendere samtidig) besvares parallelt
+- meldinger fra samme avsender behandles i rekkefølge, aldri samtidig
+- wait_for_capacity() venter når køen er full (backpressure)
+- samme meldings-id legges ikke i kø to ganger (relayen leverer på nytt)
+- stats() har kødybde og ventetid for kontrollpanelet
+
+Kjør: python3 tests/test_sms_pool.py
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.duck_sms_pool import SMSWorkerPool
+
+MMS_S = 2.0  # Bildeanalyse + AI-svar
+SMS_S = 0.3  # AI-svar på en tekstmelding
+
+
+class Recorder:
+    """Logger når hver jobb startet og sluttet, og om samme avsender overlappet."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.done = {}  # id -> ferdig-tidspunkt
+        self.order = {}  # avsender -> [id, ...] i behandlingsrekkefølge
+        self.active = {}  # avsender -> antall jobber som kjører nå
+        self.overlap = False
+
+    def job(self, sender, message_id, seconds):
+        with self.lock:
+            self.active[sender] = self.active.get(sender, 0) + 1
+            self.overlap |= self.active[sender] > 1
+            self.order.setdefault(sender, []).append(message_id)
+        time.sleep(seconds)
+        with self.lock:
+            self.active[sender] -= 1
+            self.done[message_id] = time.monotonic()
+
+
+def test_mms_does_not_block_others():
+    pool, rec = SMSWorkerPool(workers=4, max_queued=32), Recorder()
+    start = time.monotonic()
+    pool.submit('+4790000001', rec.job, '+4790000001', 'mms', MMS_S, item_id='mms')
+    for i in range(3):
+        sender = f"+479100000{i}"
+        pool.submit(sender, rec.job, sender, f"sms{i}", SMS_S, item_id=f"sms{i}")
+    pool.wait_idle(10)
+    slowest_sms = max(rec.done[f"sms{i}"] for i in range(3)) - start
+    ok = slowest_sms < MMS_S / 2
+    print(f"{'✅' if ok else '❌'} Tekstmeldinger ferdig etter {slowest_sms:.2f}s mens MMS tok {MMS_S:.0f}s")
+    return ok
+
+
+def test_group_burst_in_parallel():
+    pool, rec = SMSWorkerPool(workers=4, max_queued=32), Recorder()
+    start = time.monotonic()
+    for i in range(8):
+        sender = f"+479200000{i}"
+        pool.submit(sender, rec.job, sender, f"group{i}", SMS_S, item_id=f"group{i}")
+    pool.wait_idle(10)
+    elapsed = time.monotonic() - start
+    serial = 8 * SMS_S
+    ok = elapsed < serial / 2
+    print(f"{'✅' if ok else '❌'} 8 avsendere samtidig: {elapsed:.2f}s (etter hverandre: {serial:.1f}s)")
+    return ok
+
+
+def test_per_sender_order():
+    pool, rec = SMSWorkerPool(workers=4, max_queued=64), Recorder()
+    for i in range(10):
+        for sender in ('+4793000001', '+4793000002'):
+            pool.submit(sender, rec.job, sender, f"{sender}-{i}", 0.02, item_id=f"{sender}-{i}")
+    pool.wait_idle(10)
+    in_order = all(rec.order[s] == [f"{s}-{i}" for i in range(10)] for s in ('+4793000001', '+4793000002'))
+    ok = in_order and not rec.overlap
+    print(f"{'✅' if ok else '❌'} Samme avsender i rekkefølge og aldri samtidig "
+          f"(rekkefølge {'OK' if in_order else 'feil'}, overlapp {'ja' if rec.overlap else 'nei'})")
+    return ok
+
+
+def test_backpressure():
+    pool = SMSWorkerPool(workers=2, max_queued=4)
+    release = threading.Event()
+    for i in range(4):
+        pool.submit(f"+479400000{i}", release.wait, item_id=f"bp{i}")
+    full = not pool.wait_for_capacity(0.2)
+    stats_full = pool.stats()
+    release.set()
+    room = pool.wait_for_capacity(5)
+    pool.wait_idle(5)
+    stats = pool.stats()
+    ok = (full and room and stats_full['full'] and stats_full['busy'] == 2 and stats_full['queued'] == 2
+          and stats['backpressure_waits'] == 2 and stats['max_depth'] == 4)
+    print(f"{'✅' if ok else '❌'} Backpressure: full kø venter, plass når jobber er ferdige "
+          f"(busy {stats_full['busy']}, i kø {stats_full['queued']}, ventet {stats['backpressure_waits']}×)")
+    return ok
+
+
+def test_duplicate_ids():
+    pool, rec = SMSWorkerPool(workers=2, max_queued=8), Recorder()
+    first = pool.submit('+4795000001', rec.job, '+4795000001', 'SM1', 0.3, item_id='SM1')
+    again = pool.submit('+4795000001', rec.job, '+4795000001', 'SM1', 0.3, item_id='SM1')
+    pool.wait_idle(5)
+    after = pool.submit('+4795000001', rec.job, '+4795000001', 'SM1', 0.01, item_id='SM1')
+    pool.wait_idle(5)
+    ok = first and not again and after and rec.order['+4795000001'] == ['SM1', 'SM1'] \
+        and pool.stats()['duplicates'] == 1
+    print(f"{'✅' if ok else '❌'} Melding som leveres på nytt mens den er i kø, hoppes over")
+    return ok
+
+
+def test_failure_counted():
+    pool = SMSWorkerPool(workers=1, max_queued=8)
+
+    def boom():
+        raise RuntimeError("Twilio nede")
+
+    pool.submit('+4796000001', boom)
+    pool.submit('+4796000001', lambda: None)
+    pool.wait_idle(5)
+    stats = pool.stats()
+    ok = stats['failed'] == 1 and stats['processed'] == 2
+    print(f"{'✅' if ok else '❌'} En jobb som feiler stopper ikke køen til avsenderen")
+    return ok
+
+
+def main():
+    results = [
+        test_mms_does_not_block_others(),
+        test_group_burst_in_parallel(),
+        test_per_sender_order(),
+        test_backpressure(),
+        test_duplicate_ids(),
+        test_failure_counted(),
+    ]
+    print("✅ Alle tester OK" if all(results) else "❌ Noen tester feilet")
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
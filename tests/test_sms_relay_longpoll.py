@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Lasttest av SMS-relayen: vanlig polling mot long-poll (/inbox) og SSE (/stream).
+
+Relayen (sms-relay/app.py) kjøres lokalt i en tråd. Mange simulerte ender
+kobler seg til, og testen måler:
+- forespørsler per and per minutt når ingen meldinger kommer (tomgang)
+- leveringstid fra Twilio-webhook / duck-send til anda har meldingen
+
+Vanlig polling: /poll + /duck/poll hvert POLL_INTERVAL (som før).
+Long-poll: én /inbox-forespørsel som holdes til en melding kommer.
+
+Forventet: levering godt under ett sekund med long-poll og SSE, og minst
+ti ganger færre forespørsler i tomgang.
+
+Kjør: python3 tests/test_sms_relay_longpoll.py [--ducks 50] [--quick]
+      (krever flask og requests; --quick deler alle intervaller på 10)
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "sms-relay"))
+os.environ.setdefault('RELAY_DB_PATH', os.path.join(tempfile.mkdtemp(), 'relay_queue.db'))
+
+import app as relay  # noqa: E402
+
+POLL_INTERVAL = 10.0  # Som den gamle poll-løkka i chatgpt_voice.py
+LONG_POLL_WAIT = 55.0  # SMS_RELAY_LONG_POLL_S
+
+
+class RelayServer:
+    """Relayen på en tilfeldig port i en bakgrunnstråd."""
+
+    def __init__(self):
+        self.server = make_server('127.0.0.1', 0, relay.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class SimulatedDuck(threading.Thread):
+    """En and som henter meldinger på en av tre måter: poll, longpoll, sse."""
+
+    def __init__(self, base_url, index, mode, poll_interval, wait):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.mode = mode
+        self.number = f"+4790{mode[:2]}{index:04d}"
+        self.name = f"{mode}-duck-{index}"
+        self.poll_interval = poll_interval
+        self.wait = wait
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.requests = 0
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def register(self):
+        self.session.post(f"{self.base_url}/register", json={
+            'twilio_number': self.number, 'name': self.name, 'ip': '127.0.0.1'
+        }).raise_for_status()
+
+    def _received(self, message):
+        sent_at = float(json.loads(message['message'])['sent_at'])
+        with self.lock:
+            self.latencies.append(time.time() - sent_at)
+
+    def _ack(self, quoted, sms_ids, duck_ids):
+        """/inbox og /stream leverer minst én gang - bekreft det som er mottatt."""
+        if sms_ids or duck_ids:
+            self.session.post(f"{self.base_url}/ack/{quoted}", json={
+                'messages': sms_ids, 'duck': self.name, 'duck_messages': duck_ids
+            }).raise_for_status()
+
+    def run(self):
+        quoted = requests.utils.quote(self.number, safe='')
+        if self.mode == 'poll':
+            while not self.stop_event.wait(self.poll_interval):
+                for url in (f"{self.base_url}/poll/{quoted}", f"{self.base_url}/duck/poll/{self.name}"):
+                    self.requests += 1
+                    for message in self.session.get(url).json().get('messages', []):
+                        self._received(message)
+        elif self.mode == 'longpoll':
+            while not self.stop_event.is_set():
+                self.requests += 1
+                data = self.session.get(f"{self.base_url}/inbox/{quoted}",
+                                        params={'duck': self.name, 'wait': self.wait},
+                                        timeout=self.wait + 10).json()
+                for message in data['messages'] + data['duck_messages']:
+                    self._received(message)
+                self._ack(quoted, [m['id'] for m in data['messages']], [m['id'] for m in data['duck_messages']])
+        else:
+            self.requests += 1
+            ack_session = requests.Session()
+            with self.session.get(f"{self.base_url}/stream/{quoted}", params={'duck': self.name},
+                                  stream=True, timeout=60) as response:
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if self.stop_event.is_set():
+                        return
+                    if line and line.startswith('event: '):
+                        event = line[len('event: '):]
+                    elif line and line.startswith('data: '):
+                        message = json.loads(line[len('data: '):])
+                        self._received(message)
+                        ack_session.post(f"{self.base_url}/ack/{quoted}", json={
+                            'messages': [message['id']] if event == 'sms' else [],
+                            'duck': self.name,
+                            'duck_messages': [message['id']] if event == 'duck' else []
+                        })
+
+
+def send_sms(session, base_url, duck):
+    quoted = requests.utils.quote(duck.number, safe='')
+    session.post(f"{base_url}/webhook/sms/{quoted}", data={
+        'From': '+4712345678', 'To': duck.number, 'MessageSid': f"SM{time.time_ns()}",
+        'Body': json.dumps({'sent_at': time.time()})
+    }).raise_for_status()
+
+
+def send_duck_message(session, base_url, duck):
+    session.post(f"{base_url}/duck/send", json={
+        'from_duck': 'tester', 'to_duck': duck.name,
+        'message': json.dumps({'sent_at': time.time()})
+    }).raise_for_status()
+
+
+def run_mode(base_url, mode, ducks_count, poll_interval, wait, idle_s, messages):
+    ducks = [SimulatedDuck(base_url, i, mode, poll_interval, wait) for i in range(ducks_count)]
+    for duck in ducks:
+        duck.register()
+        duck.start()
+
+    # Tomgang: tell forespørsler uten meldinger
+    time.sleep(0.5)
+    before = sum(d.requests for d in ducks)
+    time.sleep(idle_s)
+    idle_requests = sum(d.requests for d in ducks) - before
+    per_duck_minute = idle_requests / ducks_count / (idle_s / 60)
+
+    # Levering: SMS og duck-meldinger til tilfeldige ender, spredt utover
+    sender = requests.Session()
+    for i in range(messages):
+        duck = ducks[(i * 7) % ducks_count]
+        (send_sms if i % 2 == 0 else send_duck_message)(sender, base_url, duck)
+        time.sleep(poll_interval * 1.5 / messages)
+
+    deadline = time.time() + poll_interval + 5
+    while time.time() < deadline and sum(len(d.latencies) for d in ducks) < messages:
+        time.sleep(0.05)
+    for duck in ducks:
+        duck.stop_event.set()
+
+    latencies = sorted(lat for d in ducks for lat in d.latencies)
+    result = {
+        'mode': mode,
+        'delivered': len(latencies),
+        'sent': messages,
+        'idle_req_per_duck_min': per_duck_minute,
+        'p50_s': statistics.median(latencies) if latencies else float('nan'),
+        'p95_s': latencies[int(len(latencies) * 0.95) - 1] if latencies else float('nan'),
+        'max_s': latencies[-1] if latencies else float('nan'),
+    }
+    print(f"  {mode:9s} levert {result['delivered']}/{messages}  "
+          f"tomgang {per_duck_minute:6.2f} req/and/min  "
+          f"p50 {result['p50_s']:.3f}s  p95 {result['p95_s']:.3f}s  maks {result['max_s']:.3f}s", flush=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--ducks', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--quick', action='store_true', help='Del intervallene på 10 (samme forhold)')
+    args = parser.parse_args()
+
+    scale = 10.0 if args.quick else 1.0
+    poll_interval = POLL_INTERVAL / scale
+    wait = LONG_POLL_WAIT / scale
+    idle_s = 2 * wait  # Minst to hele long-poll-runder
+
+    server = RelayServer()
+    print(f"🦆 Lasttest: {args.ducks} ender, poll hvert {poll_interval:g}s, long-poll {wait:g}s, "
+          f"tomgang {idle_s:g}s", flush=True)
+    results = {mode: run_mode(server.url, mode, args.ducks, poll_interval, wait, idle_s, args.messages)
+               for mode in ('poll', 'longpoll', 'sse')}
+    server.stop()
+
+    poll, longpoll, sse = results['poll'], results['longpoll'], results['sse']
+    reduction = poll['idle_req_per_duck_min'] / max(longpoll['idle_req_per_duck_min'], 1e-9)
+    print(f"\n📉 Tomgangstrafikk: {reduction:.1f}x færre forespørsler med long-poll", flush=True)
+
+    ok = True
+    for result in (longpoll, sse):
+        if result['delivered'] != result['sent']:
+            print(f"❌ {result['mode']}: {result['sent'] - result['delivered']} meldinger ble ikke levert")
+            ok = False
+        if not result['p95_s'] < 1.0:
+            print(f"❌ {result['mode']}: p95 leveringstid {result['p95_s']:.3f}s (skal være under 1s)")
+            ok = False
+    if reduction < 10:
+        print(f"❌ Tomgangstrafikken falt bare {reduction:.1f}x (skal være minst 10x)")
+        ok = False
+    print("✅ Alle krav oppfylt" if ok else "❌ Lasttesten feilet")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
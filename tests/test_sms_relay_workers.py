@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Lasttest av SMS-relayen med flere gunicorn-workere (delt tilstand i SQLite).
+
+For hvert antall workere startes relayen (sms-relay/app.py) med gunicorn
+mot en egen databasefil, og testen sjekker:
+- delt tilstand: ender registreres og venter på /inbox i tilfeldige workere,
+  mens webhooks og duck-meldinger kommer inn via andre workere
+- gjennomstrømning: klientprosesser kjører webhook → /inbox → /ack i løkke
+
+Forventet: alle meldinger levert med p95 under ett sekund for alle antall
+workere, og tilnærmet lineær økning i gjennomstrømning når maskinen har
+kjerner nok (minst to per worker - klientene trenger også CPU). Med for
+få kjerner sjekkes bare korrektheten.
+
+Kjør: python3 tests/test_sms_relay_workers.py [--workers 1,2,4] [--seconds 10]
+      (krever flask, requests og gunicorn)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+RELAY_DIR = Path(__file__).parent.parent / "sms-relay"
+THREADS = 64  # gthread-tråder per worker (som i README), flere enn ventende long-polls
+LONG_POLL_WAIT = 5
+
+
+class GunicornRelay:
+    """Relayen under gunicorn med N workere og egen databasefil."""
+
+    def __init__(self, workers):
+        self.workdir = tempfile.mkdtemp()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self.log_path = os.path.join(self.workdir, 'gunicorn.log')
+        env = dict(os.environ, RELAY_DB_PATH=os.path.join(self.workdir, 'relay_queue.db'))
+        with open(self.log_path, 'w') as log:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}",
+                 '--worker-class', 'gthread', '--workers', str(workers), '--threads', str(THREADS),
+                 '--timeout', '120', '--log-level', 'warning', 'app:app'],
+                cwd=RELAY_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log)
+        self._wait_until_up(workers)
+
+    def _wait_until_up(self, workers):
+        deadline = time.time() + 30
+        pids = set()
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                # Ny tilkobling hver gang, så flere workere svarer
+                pids.add(requests.get(f"{self.url}/status", timeout=2).json()['worker_pid'])
+                if len(pids) >= workers:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        if pids:
+            return  # Oppe, men ikke alle workere har svart ennå
+        self.stop()
+        raise RuntimeError(f"gunicorn startet ikke:\n{Path(self.log_path).read_text()[-2000:]}")
+
+    def worker_pids(self, samples=40):
+        return {requests.get(f"{self.url}/status", timeout=5).json()['worker_pid'] for _ in range(samples)}
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _number(prefix, index):
+    return f"+47{prefix}{index:05d}"
+
+
+def check_delivery(url, ducks_count, messages):
+    """Long-poll i tilfeldige workere, meldinger inn via tilfeldige workere."""
+    ducks = []
+    for i in range(ducks_count):
+        number, name = _number(91, i), f"worker-duck-{i}"
+        requests.post(f"{url}/register", json={'twilio_number': number, 'name': name, 'ip': '127.0.0.1'},
+                      timeout=5).raise_for_status()
+        ducks.append((number, name))
+
+    latencies = []
+    lock = threading.Lock()
+    stop_event = threading.Event()
+
+    def listen(number, name):
+        session = requests.Session()  # Én tilkobling - holdes av én worker
+        quoted = requests.utils.quote(number, safe='')
+        while not stop_event.is_set():
+            data = session.get(f"{url}/inbox/{quoted}", params={'duck': name, 'wait': LONG_POLL_WAIT},
+                               timeout=LONG_POLL_WAIT + 10).json()
+            now = time.time()
+            with lock:
+                for message in data['messages'] + data['duck_messages']:
+                    latencies.append(now - json.loads(message['message'])['sent_at'])
+            if data['count']:
+                session.post(f"{url}/ack/{quoted}", json={
+                    'messages': [m['id'] for m in data['messages']], 'duck': name,
+                    'duck_messages': [m['id'] for m in data['duck_messages']]
+                }, timeout=5)
+
+    threads = [threading.Thread(target=listen, args=duck, daemon=True) for duck in ducks]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+
+    for i in range(messages):
+        number, name = ducks[(i * 7) % ducks_count]
+        body = json.dumps({'sent_at': time.time()})
+        # Uten session: ny tilkobling per melding, så den lander i en tilfeldig worker
+        if i % 2 == 0:
+            requests.post(f"{url}/webhook/sms/{requests.utils.quote(number, safe='')}", data={
+                'From': '+4712345678', 'To': number, 'MessageSid': f"SM{time.time_ns()}", 'Body': body
+            }, timeout=5).raise_for_status()
+        else:
+            requests.post(f"{url}/duck/send", json={'from_duck': 'tester', 'to_duck': name, 'message': body},
+                          timeout=5).raise_for_status()
+        time.sleep(0.02)
+
+    deadline = time.time() + 5
+    while time.time() < deadline and len(latencies) < messages:
+        time.sleep(0.05)
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=LONG_POLL_WAIT + 2)
+
+    latencies.sort()
+    return {
+        'delivered': len(latencies),
+        'p50_s': statistics.median(latencies) if latencies else float('nan'),
+        'p95_s': latencies[int(len(latencies) * 0.95) - 1] if latencies else float('nan'),
+    }
+
+
+def client_loop(url, index, seconds):
+    """Én klientprosess: webhook → /inbox?wait=0 → /ack så fort som mulig."""
+    number, name = _number(92, index), f"load-duck-{index}"
+    quoted = requests.utils.quote(number, safe='')
+    requests.post(f"{url}/register", json={'twilio_number': number, 'name': name, 'ip': '127.0.0.1'},
+                  timeout=5).raise_for_status()
+    session = None
+    cycles = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if cycles % 10 == 0:
+            session = requests.Session()  # Ny tilkobling av og til, så lasten fordeles på workerne
+        session.post(f"{url}/webhook/sms/{quoted}", data={
+            'From': '+4712345678', 'To': number, 'MessageSid': f"SM{index}-{cycles}", 'Body': 'last'
+        }, timeout=10).raise_for_status()
+        data = session.get(f"{url}/inbox/{quoted}", params={'duck': name, 'wait': 0}, timeout=10).json()
+        session.post(f"{url}/ack/{quoted}", json={
+            'messages': [m['id'] for m in data['messages']], 'duck': name, 'duck_messages': []
+        }, timeout=10).raise_for_status()
+        cycles += 1
+    return cycles
+
+
+def measure_throughput(url, clients, seconds):
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(clients) as pool:
+        cycles = pool.starmap(client_loop, [(url, i, seconds) for i in range(clients)])
+    return 3 * sum(cycles) / seconds  # Tre forespørsler per runde
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', default='1,2,4', help='Kommaseparert liste')
+    parser.add_argument('--clients', type=int, default=8, help='Klientprosesser i gjennomstrømningstesten')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--ducks', type=int, default=40)
+    parser.add_argument('--messages', type=int, default=60)
+    args = parser.parse_args()
+    worker_counts = [int(n) for n in args.workers.split(',')]
+    cpus = os.cpu_count() or 1
+
+    print(f"🦆 Lasttest med gunicorn: workere {worker_counts}, {args.clients} klienter, "
+          f"{args.seconds:g}s per måling, {cpus} CPU", flush=True)
+    ok = True
+    throughput = {}
+    for workers in worker_counts:
+        relay = GunicornRelay(workers)
+        try:
+            pids = relay.worker_pids()
+            delivery = check_delivery(relay.url, args.ducks, args.messages)
+            throughput[workers] = measure_throughput(relay.url, args.clients, args.seconds)
+        finally:
+            relay.stop()
+        print(f"  {workers} worker(e) ({len(pids)} svarte): levert {delivery['delivered']}/{args.messages}  "
+              f"p50 {delivery['p50_s']:.3f}s  p95 {delivery['p95_s']:.3f}s  "
+              f"{throughput[workers]:7.0f} req/s", flush=True)
+        if delivery['delivered'] != args.messages:
+            print(f"❌ {workers} workere: {args.messages - delivery['delivered']} meldinger ble ikke levert")
+            ok = False
+        elif not delivery['p95_s'] < 1.0:
+            print(f"❌ {workers} workere: p95 leveringstid {delivery['p95_s']:.3f}s (skal være under 1s)")
+            ok = False
+
+    base_workers = worker_counts[0]
+    print("\n📈 Skalering:", flush=True)
+    for workers in worker_counts[1:]:
+        speedup = throughput[workers] / throughput[base_workers]
+        ideal = workers / base_workers
+        print(f"  {workers} workere: {speedup:.2f}x ({speedup / ideal:.0%} av lineært)", flush=True)
+        if cpus >= 2 * workers and speedup < 0.7 * ideal:
+            print(f"❌ {workers} workere skalerer bare {speedup:.2f}x (skal være minst {0.7 * ideal:.2f}x)")
+            ok = False
+    if cpus < 2 * max(worker_counts):
+        print(f"⚠️ Bare {cpus} CPU - skalering sjekkes ikke (trenger {2 * max(worker_counts)})", flush=True)
+
+    print("✅ Alle krav oppfylt" if ok else "❌ Lasttesten feilet")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())